@@ -36,6 +36,7 @@ from icepy4d import sfm
 from icepy4d import io
 from icepy4d import utils
 from icepy4d.metashape import metashape as MS
+from icepy4d.pipeline.stages import matching_options
 from icepy4d.utils import initialization
 
 # Define configuration file
@@ -168,6 +169,11 @@ logger = utils.get_logger()
 epoch_map = EpochDataMap(cfg.paths.image_dir, time_tolerance_sec=1200)
 epoches = Epoches(starting_epoch=cfg.proc.epoch_to_process[0])
 cams = cfg.cams
+feature_cache = matching.FeatureCache(cfg.paths.results_dir / "features_cache")
+prior_F = None  # fundamental matrix of the previous epoch, for guided matching
+image_loader = icecore.set_image_loader(icecore.ImageLoader())
+prefetch_epochs = 1  # number of next epochs whose images are decoded in background
+residuals_ts = icecore.ResidualTimeSeries(cfg.residuals_ts_fname)
 
 """ Big Loop over epoches """
 
@@ -182,14 +188,22 @@ for ep in cfg.proc.epoch_to_process:
     )
     iter += 1
     epochdir = cfg.paths.results_dir / epoch_map.get_timestamp_str(ep)
+
+    # Decode the images of the next epochs while this epoch is processed
+    for next_ep in cfg.proc.epoch_to_process[iter : iter + prefetch_epochs]:
+        image_loader.prefetch(
+            img.path for img in epoch_map.get_images(next_ep).values()
+        )
     match_dir = epochdir / "matching"
 
     # Load existing epcoh
     if cfg.proc.load_existing_results:
         try:
-            epoch = Epoch.read_pickle(
-                epochdir / f"{epoch_map.get_timestamp(ep)}.pickle"
-            )
+            epoch_path = epochdir / f"{epoch_map.get_timestamp(ep)}.h5"
+            if epoch_path.exists():
+                epoch = Epoch.read_h5(epoch_path)
+            else:
+                epoch = Epoch.read_pickle(epoch_path.with_suffix(".pickle"))
 
             # Compute reprojection error
             io.write_reprojection_error_to_file(cfg.residuals_fname, epoches[ep])
@@ -229,20 +243,25 @@ for ep in cfg.proc.epoch_to_process:
     # )
     # epoch.features = features_old[ep]
 
-    # Define matching parameters
-    matching_quality = matching.Quality.HIGH
-    tile_selection = matching.TileSelection.PRESELECTION
-    tiling_grid = [4, 3]
-    tiling_overlap = 200
-    geometric_verification = matching.GeometricVerification.PYDEGENSAC
-    geometric_verification_threshold = 1
-    geometric_verification_confidence = 0.9999
+    # Define matching parameters (read from the matching section of the config file)
+    match_opt = matching_options(cfg)
+    matching_quality = match_opt["quality"]
+    tile_selection = match_opt["tile_selection"]
+    tiling_grid = match_opt["grid"]
+    tiling_overlap = match_opt["overlap"]
+    geometric_verification = match_opt["geometric_verification"]
+    geometric_verification_threshold = match_opt["threshold"]
+    geometric_verification_confidence = match_opt["confidence"]
+    guided_matching = matching.GuidedMatching.NONE
+    keypoint_budget = None  # total keypoints per image, shared among the tiles
 
     # Create a new matcher object
-    matcher = matching.SuperGlueMatcher(cfg.matching)
+    matcher = matching.SuperGlueMatcher(cfg.matching, feature_cache=feature_cache)
     matcher.match(
         epoch.images[cams[0]].value,
         epoch.images[cams[1]].value,
+        image0_path=epoch.images[cams[0]].path,
+        image1_path=epoch.images[cams[1]].path,
         quality=matching_quality,
         tile_selection=tile_selection,
         grid=tiling_grid,
@@ -253,7 +272,12 @@ for ep in cfg.proc.epoch_to_process:
         geometric_verification=geometric_verification,
         threshold=geometric_verification_threshold,
         confidence=geometric_verification_confidence,
+        guided_matching=guided_matching,
+        prior_F=prior_F,
+        keypoint_budget=keypoint_budget,
     )
+    if matcher.F is not None:
+        prior_F = matcher.F
     timer.update("matching")
 
     # TODO: implement this as a method of Matcher class
@@ -413,6 +437,38 @@ for ep in cfg.proc.epoch_to_process:
 
     timer.update("relative orientation")
 
+    # Native bundle adjustment (Metashape-free alternative)
+    if cfg.proc.get("do_bundle_adjustment", False):
+        ba = sfm.BundleAdjustment.from_epoch(
+            epoch,
+            points=pts,
+            target_labels=valid_targets if cfg.proc.do_coregistration else None,
+            camera_prm_to_fix=cfg.metashape.camera_prm_to_fix,
+            # The a priori camera centers are in the world frame: use them only if the cameras were georeferenced
+            camera_centers=(
+                dict(zip(cams, cfg.georef.camera_centers_world))
+                if cfg.proc.do_coregistration
+                else None
+            ),
+            camera_accuracy=cfg.metashape.camera_accuracy,
+            gcp_accuracy=cfg.metashape.gcp_accuracy,
+            collimation_accuracy=cfg.metashape.collimation_accuracy,
+        )
+        ba.run()
+        timer.update("bundle adjustment")
+
+        if not cfg.proc.do_metashape_processing:
+            epoch.points.append_points(pts)
+            if cfg.proc.save_sparse_cloud:
+                epoch.points.to_point_cloud().write_ply(
+                    cfg.paths.results_dir
+                    / f"point_clouds/sparse_{epoch_map.get_timestamp(ep)}.ply"
+                )
+            epoches[ep].save_h5(f"{epochdir}/{epoch_map.get_timestamp(ep)}.h5")
+            io.write_reprojection_error_to_file(cfg.residuals_fname, epoches[ep])
+            residuals_ts.append(epoches[ep])
+            io.write_cameras_to_file(cfg.camera_estimated_fname, epoches[ep])
+
     # Metashape BBA and dense cloud
     if cfg.proc.do_metashape_processing:
         # If a metashape folder is already present,
@@ -514,8 +570,8 @@ for ep in cfg.proc.epoch_to_process:
         del ms_cfg, metashape, ms_reader
         gc.collect()
 
-        # Save epoch as a pickle object
-        epoches[ep].save_pickle(f"{epochdir}/{epoch_map.get_timestamp(ep)}.pickle")
+        # Save epoch to file
+        epoches[ep].save_h5(f"{epochdir}/{epoch_map.get_timestamp(ep)}.h5")
 
         # Save matches plot
         matches_fig_dir = "res/fig_for_paper/matches_fig"
@@ -523,6 +579,7 @@ for ep in cfg.proc.epoch_to_process:
 
         # Compute reprojection error and save to file
         io.write_reprojection_error_to_file(cfg.residuals_fname, epoches[ep])
+        residuals_ts.append(epoches[ep])
 
         # Save focal length to file
         io.write_cameras_to_file(cfg.camera_estimated_fname, epoches[ep])
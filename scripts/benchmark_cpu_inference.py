@@ -0,0 +1,95 @@
+"""
+Benchmark of the CPU inference mode of SuperGlueMatcher (int8 dynamic quantization of SuperGlue, early stopping of the Sinkhorn iterations and thread tuning) against the float32 baseline. For each mode, the matching time, the number of matches and the inlier ratio after geometric verification are reported, together with the accuracy change with respect to float32: the match agreement (fraction of the float32 matches also found by the mode, i.e., with both keypoints within AGREEMENT_TOLERANCE_PX pixels) and the difference in the number of matches and in the inlier ratio.
+
+Usage:
+    python scripts/benchmark_cpu_inference.py image0.jpg image1.jpg
+"""
+
+import logging
+import sys
+import time
+
+import cv2
+import numpy as np
+import torch
+from scipy.spatial import cKDTree
+
+from icepy4d.matching import GeometricVerification, Quality, TileSelection
+from icepy4d.matching.matchers import SuperGlueMatcher
+
+IMAGE0 = "assets/img/cam1/IMG_2658.jpg"
+IMAGE1 = "assets/img/cam2/IMG_1112.jpg"
+GRID = [4, 3]
+OVERLAP = 200
+TILE_SELECTION = TileSelection.PRESELECTION
+NUM_RUNS = 3
+
+# Maximum distance [px] between the keypoints of two matches to be considered the same match
+AGREEMENT_TOLERANCE_PX = 1.0
+
+LOG_LEVEL = logging.WARNING
+logging.basicConfig(
+    format="%(asctime)s | %(name)s | %(levelname)s: %(message)s",
+    level=LOG_LEVEL,
+)
+
+if len(sys.argv) == 3:
+    IMAGE0, IMAGE1 = sys.argv[1:3]
+
+image0 = cv2.imread(IMAGE0)
+image1 = cv2.imread(IMAGE1)
+print(f"Images: {image0.shape[:2]}, grid: {GRID}")
+
+
+def match_agreement(
+    ref0: np.ndarray, ref1: np.ndarray, mkpts0: np.ndarray, mkpts1: np.ndarray
+) -> float:
+    """Fraction of the reference matches (ref0, ref1) found in (mkpts0, mkpts1)."""
+    if len(ref0) == 0:
+        return float("nan")
+    if len(mkpts0) == 0:
+        return 0.0
+    tree = cKDTree(np.hstack([mkpts0, mkpts1]))
+    dist, _ = tree.query(np.hstack([ref0, ref1]), p=np.inf)
+    return float(np.mean(dist <= AGREEMENT_TOLERANCE_PX))
+
+
+modes = {
+    "float32": {"force_cpu": True},
+    "cpu_inference": {"cpu_inference": True},
+}
+baseline = None
+for mode, opt in modes.items():
+    matcher = SuperGlueMatcher(
+        {"weights": "outdoor", "max_keypoints": 4096, "warmup": True, **opt}
+    )
+    times = []
+    for _ in range(NUM_RUNS):
+        matcher.reset()
+        start = time.perf_counter()
+        matcher.match(
+            image0,
+            image1,
+            quality=Quality.HIGH,
+            tile_selection=TILE_SELECTION,
+            grid=GRID,
+            overlap=OVERLAP,
+            geometric_verification=GeometricVerification.PYDEGENSAC,
+            threshold=1.5,
+        )
+        times.append(time.perf_counter() - start)
+    stages = matcher.geometric_verification_stages
+    n_matches = stages[0].n_matches if stages else len(matcher.mkpts0)
+    inlier_ratio = len(matcher.mkpts0) / max(n_matches, 1)
+    print(
+        f"{mode:>14}: {np.median(times):.2f} s (median of {NUM_RUNS} runs, {torch.get_num_threads()} threads), {n_matches} matches, inlier ratio {inlier_ratio:.2f}"
+    )
+    if baseline is None:
+        baseline = (matcher.mkpts0, matcher.mkpts1, n_matches, inlier_ratio)
+        continue
+    agreement = match_agreement(
+        baseline[0], baseline[1], matcher.mkpts0, matcher.mkpts1
+    )
+    print(
+        f"{'':>14}  vs float32: match agreement {agreement:.1%}, {n_matches - baseline[2]:+d} matches, inlier ratio {inlier_ratio - baseline[3]:+.3f}"
+    )
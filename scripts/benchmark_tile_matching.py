@@ -0,0 +1,61 @@
+"""
+Benchmark of the batched tiled matching of SuperGlueMatcher against the sequential loop over the tile pairs (one SuperPoint+SuperGlue forward pass per tile pair).
+
+Usage:
+    python scripts/benchmark_tile_matching.py image0.jpg image1.jpg
+"""
+
+import logging
+import sys
+import time
+
+import cv2
+import numpy as np
+import torch
+
+from icepy4d.matching import GeometricVerification, Quality, TileSelection
+from icepy4d.matching.matchers import SuperGlueMatcher
+
+IMAGE0 = "assets/img/cam1/IMG_2658.jpg"
+IMAGE1 = "assets/img/cam2/IMG_1112.jpg"
+GRID = [4, 3]
+OVERLAP = 200
+TILE_SELECTION = TileSelection.PRESELECTION
+NUM_RUNS = 3
+
+LOG_LEVEL = logging.WARNING
+logging.basicConfig(
+    format="%(asctime)s | %(name)s | %(levelname)s: %(message)s",
+    level=LOG_LEVEL,
+)
+
+if len(sys.argv) == 3:
+    IMAGE0, IMAGE1 = sys.argv[1:3]
+
+image0 = cv2.imread(IMAGE0)
+image1 = cv2.imread(IMAGE1)
+matcher = SuperGlueMatcher(
+    {"weights": "outdoor", "max_keypoints": 4096, "force_cpu": True}
+)
+print(f"Images: {image0.shape[:2]}, grid: {GRID}, threads: {torch.get_num_threads()}")
+
+for batch_tiles in [False, True]:
+    times = []
+    for _ in range(NUM_RUNS):
+        matcher.reset()
+        start = time.perf_counter()
+        matcher.match(
+            image0,
+            image1,
+            quality=Quality.HIGH,
+            tile_selection=TILE_SELECTION,
+            grid=GRID,
+            overlap=OVERLAP,
+            geometric_verification=GeometricVerification.NONE,
+            batch_tiles=batch_tiles,
+        )
+        times.append(time.perf_counter() - start)
+    mode = "batched" if batch_tiles else "sequential"
+    print(
+        f"{mode:>10}: {np.median(times):.2f} s (median of {NUM_RUNS} runs), {len(matcher.mkpts0)} matches"
+    )
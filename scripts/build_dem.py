@@ -11,6 +11,12 @@ from icepy4d.utils.transformations import Rotrotranslation, belvedere_loc2utm
 PCD_DIR = "res/monthly_pcd/"
 PCD_PATTERN = "*"
 
+# DSM options (the DSMs are streamed tile by tile to tiled GeoTIFFs, without keeping them in memory)
+BUILD_DSM = True
+DSM_STEP = 0.1
+DSM_CRS = "EPSG:32632"
+DSM_DIR = "dsm"
+
 
 LOG_LEVEL = logging.INFO
 logging.basicConfig(
@@ -19,7 +25,7 @@ logging.basicConfig(
 )
 
 pcd_dir = (Path.cwd() / Path(PCD_DIR)).resolve()
-pcd_list = sorted(pcd_dir.glob("*"))
+pcd_list = sorted(p for p in pcd_dir.glob(PCD_PATTERN) if p.is_file())
 n = len(pcd_list)
 
 pcd_name = pcd_list[0]
@@ -35,9 +41,17 @@ for pcd_name in pcd_list:
     pcd.points = o3d.utility.Vector3dVector(pts_utm)
     o3d.io.write_point_cloud(str(pcd_dir / f"{pcd_name.stem}_utm.ply"), pcd)
 
-# # build dsm
-# dsm_out = pcd_dir / f"{pcd.stem}.tif"
-# dem = build_dsm(pts_utm, dsm_step=0.1, save_path=dsm_out)
+    # build dsm
+    if BUILD_DSM:
+        dsm_out = pcd_dir / DSM_DIR / f"{pcd_name.stem}_utm.tif"
+        build_dsm(
+            pts_utm,
+            dsm_step=DSM_STEP,
+            interp_method="idw",
+            save_path=dsm_out,
+            return_dsm=False,
+            crs=DSM_CRS,
+        )
 
 
 print("done")
@@ -0,0 +1,27 @@
+"""
+Report which stages of the ICEpy4D pipeline are found in the stage cache (hit) and which would be computed again (miss) for the epochs of a configuration file, without running the pipeline. Stages that are never cached (e.g., export) are reported as "run".
+
+Usage:
+    python scripts/pipeline_cache_report.py config/config_2022.yaml
+"""
+
+import sys
+
+from icepy4d.core import EpochDataMap
+from icepy4d.pipeline import build_pipeline, build_states, format_cache_table
+from icepy4d.utils import initialization
+
+CFG_FILE = "config/config_2022.yaml"
+
+if len(sys.argv) > 1:
+    CFG_FILE = sys.argv[1]
+
+cfg = initialization.parse_cfg(CFG_FILE, clean_results=False)
+pipeline = build_pipeline(cfg)
+if pipeline.cache is None:
+    sys.exit("The stage cache is disabled (pipeline.cache in the configuration file).")
+
+epoch_map = EpochDataMap(cfg.paths.image_dir, time_tolerance_sec=1200)
+states = build_states(cfg, epoch_map)
+print(f"Stage cache: {pipeline.cache.root} ({pipeline.cache.size() / 1024**2:.1f} MB)")
+print(format_cache_table(pipeline.cache_status(states)))
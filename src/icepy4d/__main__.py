@@ -1,15 +1,6 @@
-import icepy4d
-import importlib
-
-# Try importing ICEpy4D module.
-
-
-def main():
-    try:
-        importlib.import_module("icepy4d")
-    except:
-        raise ImportError("Unable to import ICEpy4D module")
+import sys
 
+from icepy4d.cli import main
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+Command line interface of ICEpy4D.
+
+Usage:
+    icepy4d run config/config_2022.yaml --epochs 0-99 --workers 4
+    icepy4d run config/config_2022.yaml --resume
+    icepy4d run config/config_2022.yaml --from-stage georef --to-stage export
+    icepy4d run config/config_2022.yaml --epochs 10,12,20-25 --dry-run
+"""
+
+import argparse
+import logging
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import List, Sequence
+
+from icepy4d.core import EpochDataMap
+from icepy4d.pipeline import build_pipeline, build_states, format_cache_table
+from icepy4d.pipeline.manifest import (
+    MANIFEST_DIR,
+    ManifestWriter,
+    build_manifest,
+    completed_epochs,
+    manifest_path,
+    mean_stage_times,
+    read_manifests,
+    write_manifest,
+)
+from icepy4d.pipeline.runner import FAILED, HIT, MISSING, UNCACHED
+from icepy4d.utils import initialization
+
+logger = logging.getLogger(__name__)
+
+# Maximum time difference between the images of the same epoch [s]
+TIME_TOLERANCE_SEC = 1200
+
+
+def parse_epochs(spec: str, num_epochs: int) -> List[int]:
+    """
+    parse_epochs Parse the epochs to process from a comma separated list of epoch ids and ranges (both ends included), e.g. "0-10,15,20-22", or "all".
+
+    Args:
+        spec (str): The epochs to process.
+        num_epochs (int): The number of epochs found in the image folder.
+
+    Raises:
+        ValueError: If the specification is invalid or an epoch does not exist.
+
+    Returns:
+        List[int]: The sorted ids of the epochs, without duplicates.
+    """
+    if spec.strip() == "all":
+        return list(range(num_epochs))
+    epochs = set()
+    for item in spec.split(","):
+        item = item.strip()
+        try:
+            if "-" in item:
+                first, last = (int(x) for x in item.split("-"))
+                if first > last:
+                    raise ValueError
+                epochs.update(range(first, last + 1))
+            else:
+                epochs.add(int(item))
+        except ValueError:
+            raise ValueError(f"Invalid epoch range {item!r} in {spec!r}.")
+    invalid = [ep for ep in epochs if not 0 <= ep < num_epochs]
+    if invalid:
+        raise ValueError(
+            f"Epochs {sorted(invalid)} do not exist (found {num_epochs} epochs)."
+        )
+    return sorted(epochs)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    build_parser Build the parser of the command line arguments.
+    """
+    parser = argparse.ArgumentParser(
+        prog="icepy4d",
+        description="ICEpy4D - Low-cost stereo photogrammetry for 4D glacier monitoring",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser(
+        "run", help="Process a batch of epochs with the ICEpy4D pipeline"
+    )
+    run_parser.add_argument("config", type=Path, help="Path of the configuration file")
+    run_parser.add_argument(
+        "-e",
+        "--epochs",
+        type=str,
+        default=None,
+        help="Epochs to process, as a comma separated list of ids and ranges (both ends included), e.g. '0-10,15' or 'all' (default: proc.epoch_to_process in the configuration file)",
+    )
+    run_parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes (default: pipeline.workers in the configuration file)",
+    )
+    run_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip the epochs completed by the previous runs (according to their manifests) and do not remove the existing result files",
+    )
+    run_parser.add_argument(
+        "--from-stage",
+        type=str,
+        default=None,
+        help="Compute the stages from this one on, restoring the previous ones from the stage cache",
+    )
+    run_parser.add_argument(
+        "--to-stage", type=str, default=None, help="Stop after this stage"
+    )
+    run_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print the stages that would be computed or restored from the cache and the estimated processing time, without running them",
+    )
+    run_parser.add_argument(
+        "--no-cache", action="store_true", help="Disable the stage cache"
+    )
+    return parser
+
+
+def format_plan(pipeline, cells: dict, times: dict) -> str:
+    """
+    format_plan Format the number of epochs to be computed and restored for each stage, with the estimated processing time (from the mean time of the stages in the previous runs).
+    """
+    width = max(len(name) for name in pipeline.stages)
+    lines = [f"{'stage':<{width}}  compute  cached  est. time [s]"]
+    total = 0.0
+    for name in pipeline.stages:
+        values = [s for (_, stage), s in cells.items() if stage == name]
+        run = sum(1 for s in values if s not in (HIT, MISSING))
+        cached = values.count(HIT)
+        estimate = "n/a"
+        if name in times:
+            total += run * times[name]
+            estimate = f"{run * times[name]:.1f}"
+        lines.append(f"{name:<{width}}  {run:>7}  {cached:>6}  {estimate:>13}")
+    lines.append(
+        f"Estimated processing time: {total / pipeline.workers:.1f} s with {pipeline.workers} workers (stages never timed before are not included)"
+    )
+    return "\n".join(lines)
+
+
+def run(args: argparse.Namespace) -> int:
+    """
+    run Run the pipeline on a batch of epochs and write the manifest of the run (in the runs folder of the results directory). The manifest is updated every time an epoch is finished.
+
+    Args:
+        args (argparse.Namespace): The arguments of the run command.
+
+    Returns:
+        int: The exit code (1 if any epoch failed, 0 otherwise).
+    """
+    start = datetime.now()
+    cfg = initialization.parse_cfg(args.config, clean_results=False)
+    if args.no_cache:
+        cfg.pipeline = {**(cfg.get("pipeline") or {}), "cache": False}
+    epoch_map = EpochDataMap(cfg.paths.image_dir, time_tolerance_sec=TIME_TOLERANCE_SEC)
+    if args.epochs is not None:
+        cfg.proc.epoch_to_process = parse_epochs(args.epochs, len(epoch_map))
+
+    pipeline = build_pipeline(cfg, workers=args.workers)
+    pipeline = pipeline.select(from_stage=args.from_stage, to_stage=args.to_stage)
+
+    manifests = read_manifests(cfg.paths.results_dir / MANIFEST_DIR)
+    epoch_ids = list(cfg.proc.epoch_to_process)
+    if args.resume:
+        done = set(completed_epochs(manifests, pipeline.stages))
+        logger.info(f"Resuming: {len(done & set(epoch_ids))} epochs already completed.")
+        epoch_ids = [ep for ep in epoch_ids if ep not in done]
+    states = build_states(cfg, epoch_map, epoch_ids)
+    info = dict(
+        stages=pipeline.stages,
+        config_file=args.config,
+        start=start,
+        args=vars(args),
+        workers=pipeline.workers,
+        epoch_ids=epoch_ids,
+    )
+
+    if args.dry_run:
+        if pipeline.cache is not None:
+            cells = pipeline.cache_status(states)
+        else:
+            cells = {node: UNCACHED for node in pipeline.task_graph(epoch_ids)}
+        print(pipeline)
+        print(format_cache_table(cells))
+        print(format_plan(pipeline, cells, mean_stage_times(manifests)))
+        manifest = build_manifest(dry_run=True, plan=list(cells.items()), **info)
+        path = manifest_path(cfg.paths.results_dir, start)
+        write_manifest(path, manifest)
+        logger.info(f"Run manifest written to {path}")
+        return 0
+
+    if "export" in pipeline.stages and not args.resume:
+        initialization.remove_result_files(cfg)
+    path = manifest_path(cfg.paths.results_dir, start)
+    writer = ManifestWriter(path, dry_run=False, **info)
+    writer.write()
+    report = pipeline.run(states, callback=writer)
+    logger.info(report)
+    writer.write(report, finished=True)
+    logger.info(f"Run manifest written to {path}")
+    return int(any(r.status == FAILED for r in report.results))
+
+
+def main(argv: Sequence[str] = None) -> int:
+    """
+    main Entry point of the icepy4d command.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        if args.command == "run":
+            return run(args)
+    except ValueError as err:
+        parser.error(str(err))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,21 @@
 from .containers import *  # noqa: F401
 from .constants import *  # noqa: F401
 from .epoch import EpochDataMap, Epoch, Epoches  # noqa: F401
+from .epoch_io import (  # noqa: F401
+    EpochReader,
+    read_epoch,
+    write_epoch,
+    convert_pickle_to_h5,
+)
 from .camera import Camera  # noqa: F401
 from .images import Image, ImageDS  # noqa: F401
+from .image_loader import ImageLoader, get_image_loader, set_image_loader  # noqa: F401
+from .image_index import ImageIndex  # noqa: F401
 from .features import Feature, Features  # noqa: F401
 from .point_cloud import PointCloud  # noqa: F401
 from .targets import Targets  # noqa: F401
 from .points import Point, Points  # noqa: F401
+from .residuals import ReprojectionResiduals, ResidualTimeSeries  # noqa: F401
 from .calibration import Calibration, read_opencv_calibration  # noqa: F401
 
 # # For backward compatibility. It must beintegrated in Epoches class
@@ -23,6 +23,7 @@ SOFTWARE.
 """
 
 
+import itertools
 import numpy as np
 import cv2
 import logging
@@ -35,6 +36,13 @@ from .calibration import read_opencv_calibration
 
 logger = logging.getLogger(__name__)
 
+# Source of the version numbers of the cameras (unique among all the instances, so that a version identifies a set of camera parameters)
+_VERSIONS = itertools.count(1)
+
+# Cached quantities that depend on the intrinsics (K and distortion) and on the extrinsics
+INTRINSICS_CACHE_KEYS = ("P", "undistortion_maps")
+EXTRINSICS_CACHE_KEYS = ("P", "rvec", "pose")
+
 
 class Camera:
     """Class to manage Pinhole Cameras.
@@ -45,6 +53,8 @@ class Camera:
         _K (np.ndarray): Calibration matrix (intrinsics).
         _dist (np.ndarray): Distortion vector in OpenCV format.
         _extrinsics (np.ndarray): Extrinsics matrix (transformation from world to camera).
+        _cache (dict): Quantities derived from the camera parameters (projection matrix, rotation vector, pose and undistortion maps), built lazily and invalidated by the update_* methods.
+        _version (int): Version of the camera parameters, changed every time they are updated.
 
     Note:
         All the Camera members are private in order to guarantee consistency
@@ -83,6 +93,8 @@ class Camera:
             FileNotFoundError: If `calib_path` is provided and file not found.
         """
 
+        self._cache = {}
+        self._version = next(_VERSIONS)
         self._w = width  # Image width [px]
         self._h = height  # Image height [px]g
         self._K = K  # Calibration matrix (Intrisics)
@@ -102,6 +114,23 @@ class Camera:
     def __repr__(self) -> str:
         return f"Camera (f={self._K[0,0]}, img_size={self._w, self._h}"
 
+    def __getstate__(self) -> dict:
+        """Do not pickle the cached quantities (they are rebuilt when needed)."""
+        state = self.__dict__.copy()
+        state["_cache"] = {}
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._cache = {}
+        self._version = next(_VERSIONS)
+
+    def _invalidate(self, keys: Tuple[str]) -> None:
+        """Remove the cached quantities that depend on the updated parameters and assign a new version to the camera."""
+        for key in keys:
+            self._cache.pop(key, None)
+        self._version = next(_VERSIONS)
+
     # Getters
     @property
     def width(self) -> np.ndarray:
@@ -145,12 +174,19 @@ class Camera:
         """
         return self._extrinsics
 
+    @property
+    def version(self) -> int:
+        """Get the version of the camera parameters, changed by update_K(), update_dist() and update_extrinsics(). It can be used as a key to cache quantities computed with the camera."""
+        return self._version
+
     @property
     def pose(self) -> np.ndarray:
         """Get Pose Matrix (i.e., transformation from camera to world) as:
         Pose = [ R' | C ]
         """
-        return self.extrinsics_to_pose()
+        if "pose" not in self._cache:
+            self._cache["pose"] = self._read_only(self.extrinsics_to_pose())
+        return self._cache["pose"]
 
     @property
     def C(self) -> np.ndarray:
@@ -160,8 +196,7 @@ class Camera:
             np.ndarray: A 3x1 matrix that represents the camera center of the camera. The matrix is represented as:
                 C = - R' * t
         """
-        pose = self.extrinsics_to_pose()
-        return pose[0:3, 3:4]
+        return self.pose[0:3, 3:4]
 
     @property
     def t(self) -> np.ndarray:
@@ -200,11 +235,87 @@ class Camera:
         Returns:
             numpy.ndarray: The projective matrix P = K [R|t], where K is the camera internal orientation matrix, and R and t are the rotation matrix and translation vector representing the camera external orientation, respectively.
         """
+        if "P" not in self._cache:
+            RT = np.zeros((3, 4))
+            RT[:, 0:3] = self.R
+            RT[:, 3:4] = self.t
+            self._cache["P"] = self._read_only(self.K @ RT)
+        return self._cache["P"]
+
+    @property
+    def rvec(self) -> np.ndarray:
+        """Get the rotation vector (Rodrigues) of the rotation from world to camera, as used by OpenCV (e.g., cv2.projectPoints).
+
+        Returns:
+            np.ndarray: A 3x1 rotation vector.
+        """
+        if "rvec" not in self._cache:
+            rvec, _ = cv2.Rodrigues(self.R)
+            self._cache["rvec"] = self._read_only(rvec)
+        return self._cache["rvec"]
+
+    @property
+    def tvec(self) -> np.ndarray:
+        """Get the translation vector from world to camera, as used by OpenCV (i.e., the same as t)."""
+        return self.t
+
+    def undistortion_maps(self, size: Tuple[int, int] = None) -> Tuple[np.ndarray]:
+        """Get the maps to undistort the images of the camera with cv2.remap (the undistorted image has the same camera matrix K). The maps are built once for each image size with cv2.initUndistortRectifyMap, in the fixed-point format (CV_16SC2) that is faster to remap, and they are kept until the intrinsics are updated.
+
+        Args:
+            size (Tuple[int, int], optional): The image size as (width, height). Defaults to None (the camera width and height).
+
+        Returns:
+            Tuple[np.ndarray]: The two maps for cv2.remap.
+        """
+        if size is None:
+            size = (int(self._w), int(self._h))
+        size = (int(size[0]), int(size[1]))
+        maps = self._cache.setdefault("undistortion_maps", {})
+        if size not in maps:
+            maps[size] = cv2.initUndistortRectifyMap(
+                self.K, self.dist, None, self.K, size, cv2.CV_16SC2
+            )
+        return maps[size]
+
+    def undistort_image(
+        self, image: np.ndarray, interpolation: int = cv2.INTER_LINEAR
+    ) -> np.ndarray:
+        """Undistort an image of the camera with a single cv2.remap on the cached undistortion maps (see undistortion_maps), so that undistorting many images of the same camera does not recompute the maps every time as cv2.undistort does.
+
+        Args:
+            image (np.ndarray): The image (with any number of channels).
+            interpolation (int, optional): The OpenCV interpolation method. Defaults to cv2.INTER_LINEAR.
+
+        Returns:
+            np.ndarray: The undistorted image.
+        """
+        if self.dist is None:
+            return image.copy()
+        h, w = image.shape[:2]
+        map1, map2 = self.undistortion_maps((w, h))
+        return cv2.remap(image, map1, map2, interpolation)
+
+    def undistort_points(self, points: np.ndarray) -> np.ndarray:
+        """Undistort image points of the camera (the undistorted points have the same camera matrix K).
+
+        Args:
+            points (np.ndarray): A nx2 array of image points.
+
+        Returns:
+            np.ndarray: A nx2 float32 array of undistorted image points.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+        if self.dist is None:
+            return points[:, 0, :].astype("float32")
+        und = cv2.undistortPoints(points, self.K, self.dist, None, self.K)
+        return und[:, 0, :].astype("float32")
 
-        RT = np.zeros((3, 4))
-        RT[:, 0:3] = self.R
-        RT[:, 3:4] = self.t
-        return self.K @ RT
+    @staticmethod
+    def _read_only(array: np.ndarray) -> np.ndarray:
+        """Mark a cached array as read-only, so that it cannot be modified in place by mistake."""
+        array.flags.writeable = False
+        return array
 
     # Setters
     def update_K(self, K: np.ndarray) -> None:
@@ -218,6 +329,7 @@ class Camera:
             None
         """
         self._K = K
+        self._invalidate(INTRINSICS_CACHE_KEYS)
 
     def update_dist(self, dist: np.ndarray) -> None:
         """
@@ -230,6 +342,7 @@ class Camera:
             None
         """
         self._dist = dist
+        self._invalidate(("undistortion_maps",))
 
     def update_extrinsics(self, extrinsics: np.ndarray) -> None:
         """
@@ -263,11 +376,13 @@ class Camera:
         ), "Extrinsics must be in homogeneous coordinates (last row of the matrix must be [0 0 0 1]."
 
         self._extrinsics = extrinsics
+        self._invalidate(EXTRINSICS_CACHE_KEYS)
 
     # Methods
     def reset_EO(self) -> None:
         """Reset camera External Orientation (EO), in such a way as to make camera reference system parallel to world reference system"""
         self._extrinsics = np.eye(4)
+        self._invalidate(EXTRINSICS_CACHE_KEYS)
 
     def read_calibration_from_file(self, path: Union[str, Path]) -> None:
         """
@@ -287,6 +402,7 @@ class Camera:
         self._height = h
         self._K = K
         self._dist = dist
+        self._invalidate(INTRINSICS_CACHE_KEYS)
 
     def extrinsics_to_pose(self, extrinsics: np.ndarray = None) -> np.ndarray:
         """
@@ -347,12 +463,10 @@ class Camera:
             points3d.shape[1] == 3
         ), "Wrong size of the input point array. Provide a nx3 numpy array."
 
-        rvec, _ = cv2.Rodrigues(self.R)
-        tvec = self.t
         m, jacobian = cv2.projectPoints(
             np.expand_dims(points3d, 1),
-            rvec,
-            tvec,
+            self.rvec,
+            self.tvec,
             self.K,
             self.dist,
         )
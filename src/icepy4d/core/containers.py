@@ -3,6 +3,7 @@ from typing import TypedDict
 from .camera import Camera
 from .features import Features
 from .images import Image
+from .points import Points
 
 
 # Define basic data containers
@@ -16,3 +17,7 @@ class CamerasDict(TypedDict):
 
 class ImagesDict(TypedDict):
     camera: Image
+
+
+class PointsDict(TypedDict):
+    epoch: Points
@@ -23,10 +23,11 @@ SOFTWARE.
 """
 import logging
 import pickle
+import time
 from datetime import datetime as dt
 from datetime import timedelta
 from pathlib import Path
-from typing import Dict, Union, List, Tuple
+from typing import Dict, Iterator, Union, List, Tuple
 import os
 
 import numpy as np
@@ -34,10 +35,13 @@ import numpy as np
 from .camera import Camera
 from .features import Features
 from .point_cloud import PointCloud
-from .images import Image, ImageDS
+from .images import Image
+from .image_index import ImageIndex, pair_timestamps
 from .targets import Targets
 from .points import Points
+from .residuals import ReprojectionResiduals
 from .constants import DATETIME_FMT
+from .epoch_io import write_epoch, read_epoch
 
 logger = logging.getLogger(__name__)
 
@@ -119,6 +123,9 @@ class EpochDataMap(dict):
         master_camera (str): The name of the master camera (optional).
         time_tolerance_sec (int): The maximum time difference allowed to consider two images taken by different cameras as simultaneous (this allows for considering a non-perfect time synchronization between different cameras). Default is 180 seconds (3 minutes).
         min_images (int): The minimum number of images required for an epoch to be included (optional).
+        use_index (bool): Store the timestamps and dimensions of the images of each camera in a persistent ImageIndex (image_index_<camera>.json in the image directory), so that on the following runs the EXIF is read only for new or modified images. Default is True.
+
+    Epoch ids are assigned in chronological order and are stable across runs: the ids are stored in the epoch_map.csv file in the image directory and, if the file exists, the epochs already listed keep their id and the new epochs get the following ids. The file is only appended to, unless it cannot be read (e.g., the cameras changed), in which case the epochs are renumbered and the file is rewritten.
 
     Attributes:
         _image_dir (Path): The path to the image directory.
@@ -126,6 +133,7 @@ class EpochDataMap(dict):
         _timetolerance (timedelta): The time tolerance for timestamp matching.
         _cams (List[str]): The list of camera names.
         _map (dict): The mapping of epoch data.
+        _indexes (Dict[str, ImageIndex]): The image index of each camera.
 
     Methods:
         __init__(self, image_dir: Union[str, Path], master_camera=None, time_tolerance_sec: timedelta = 180, min_images: int = 2):
@@ -158,6 +166,10 @@ class EpochDataMap(dict):
             Build the mapping of epoch data.
         _write_map(self, filename: str, sep: str = ",", header: bool = True) -> None:
             Write the mapping data to a CSV file.
+        update(self) -> List[int]:
+            Rescan the camera folders and append the new epochs to the map.
+        watch(self, poll_interval: float = 600, timeout: float = None, include_existing: bool = False) -> Iterator[Tuple[int, DotDict]]:
+            Poll the camera folders and yield the new epochs as soon as they are ready.
     """
 
     def __init__(
@@ -166,6 +178,7 @@ class EpochDataMap(dict):
         master_camera=None,
         time_tolerance_sec: timedelta = 180,
         min_images: int = 2,
+        use_index: bool = True,
     ):
         """
         Initialize the EpochDataMap with image directory, master camera, and time tolerance.
@@ -191,11 +204,16 @@ class EpochDataMap(dict):
         self._cams = sorted([f.name for f in os.scandir(self._image_dir) if f.is_dir()])
 
         # Build dict
+        self._use_index = use_index
+        self._indexes = {}
+        self._min_images = min_images
         self._map = {}
-        self._build_map(min_images)
+        self._pending = {}
+        self._map_file = self._image_dir / "epoch_map.csv"
+        new_ids = self._build_map(min_images)
 
-        # Write dict to file
-        self._write_map(self._image_dir / "epoch_map.csv")
+        # Write dict to file (append the new epochs if the file was read)
+        self._write_map(self._map_file, epochs=new_ids, append=new_ids is not None)
 
     def __getitem__(self, key):
         return self._map[key]
@@ -208,11 +226,13 @@ class EpochDataMap(dict):
 
     def __iter__(self):
         self._elem = 0
+        # Snapshot of the sorted epoch ids, so that they are not sorted at each step
+        self._keys = sorted(self._map)
         return self
 
     def __next__(self):
-        while self._elem < len(self._map):
-            file = self._map[self._elem]
+        while self._elem < len(self._keys):
+            file = self._map[self._keys[self._elem]]
             self._elem += 1
             return file
         else:
@@ -241,80 +261,299 @@ class EpochDataMap(dict):
         timestamp = parse_str_to_datetime(timestamp)
         timestamps = [x["timestamp"] for x in self._map.values()]
         idx = timestamps.index(timestamp)
-        return self._map[idx]["images"]
+        return list(self._map.values())[idx]["images"]
+
+    def _get_index(self, cam: str) -> ImageIndex:
+        if cam not in self._indexes:
+            index_file = (
+                self._image_dir / f"image_index_{cam}.json"
+                if self._use_index
+                else None
+            )
+            self._indexes[cam] = ImageIndex(self._image_dir / cam, index_file)
+        return self._indexes[cam]
+
+    def _get_image(self, cam: str, path: Path) -> Image:
+        entry = self._get_index(cam)[path.name]
+        return Image.from_metadata(
+            path,
+            date_time=dt.strptime(entry["timestamp"], DATETIME_FMT),
+            width=entry["width"],
+            height=entry["height"],
+        )
 
-    def _get_timestamps(self, folder: Union[str, Path]) -> Tuple[List[dt], List[Path]]:
-        imageDS = ImageDS(folder)
-        paths = list(imageDS.files)
-        timestamps = list(imageDS.timestamps.values())
-        return timestamps, paths
+    def _get_timestamps(
+        self, folder: Union[str, Path], sort: bool = False
+    ) -> Tuple[np.ndarray, List[Path]]:
+        return self._get_index(Path(folder).name).timestamps(sort=sort)
+
+    def _read_map_ids(self) -> Dict[str, int]:
+        """
+        Read the ids assigned to the epochs by the previous runs from the epoch_map.csv file, as a dictionary {name of the master camera image: epoch id}. Return an empty dictionary if the file does not exist or cannot be read.
+        """
+        if not self._map_file.exists():
+            return {}
+        columns = ["epoch", "date", "time"]
+        for cam in self._cams:
+            columns += [cam, f"{cam}_timestamp"]
+        col = columns.index(self._master_camera)
+        ids = {}
+        try:
+            with open(self._map_file, "r") as f:
+                if f.readline().rstrip("\n").split(",") != columns:
+                    raise ValueError("the cameras do not match")
+                for line in f:
+                    fields = line.rstrip("\n").split(",")
+                    if fields[col]:
+                        ids[fields[col]] = int(fields[0])
+        except (OSError, ValueError, IndexError) as err:
+            logger.warning(
+                f"Unable to read the epoch ids from {self._map_file} ({err}): epochs are renumbered"
+            )
+            return {}
+        return ids
 
-    def _build_map(self, min_images: int = None):
+    def _build_map(self, min_images: int = None) -> List[int]:
+        """
+        Build the mapping of epoch data, keeping the ids of the epochs listed in the epoch_map.csv file. Return the ids of the epochs not in the file, or None if the file could not be read (all the epochs are new).
+        """
         # Re-initialize map
         self._map = {}
 
-        # Build imageDS for master camera and get timestamps
-        timestamps, paths = self._get_timestamps(self._image_dir / self._master_camera)
+        # Get timestamps of master camera (sorted by time)
+        timestamps, paths = self._get_timestamps(
+            self._image_dir / self._master_camera, sort=True
+        )
 
-        # build mapping dict for master camera
-        for i, (ts, path) in enumerate(zip(timestamps, paths)):
-            img = Image(path)
-            self._map[i] = DotDict(
-                {
-                    "timestamp": ts,
-                    "images": {self._master_camera: img},
-                    "dt": {self._master_camera: timedelta(seconds=0)},
-                }
+        # build mapping list for master camera
+        epochs = []
+        for ts, path in zip(timestamps, paths):
+            img = self._get_image(self._master_camera, path)
+            epochs.append(
+                DotDict(
+                    {
+                        "timestamp": ts.item(),
+                        "images": {self._master_camera: img},
+                        "dt": {self._master_camera: timedelta(seconds=0)},
+                    }
+                )
             )
 
-        # Find closest timestamp for each camera
+        # Find closest timestamp for each camera, by binary search on the timestamps sorted in ascending order
         slave_cameras = set(self._cams)
         slave_cameras.discard(self._master_camera)
 
-        for cam in slave_cameras:
-            timestamps1, paths1 = self._get_timestamps(self._image_dir / cam)
-            for key, value in self._map.items():
-                ref_ts = value["timestamp"]
-                _, closest_idx, dt = find_closest_timestamp(
-                    ref_ts, timestamps1, self._timetolerance
-                )
-                if closest_idx is not None:
-                    self._map[key]["images"][cam] = Image(paths1[closest_idx])
-                    self._map[key]["dt"][cam] = dt
-        logger.info(f"Building EpochDataMap: found {len(self._map)} epochs")
+        for cam in sorted(slave_cameras):
+            timestamps1, paths1 = self._get_timestamps(self._image_dir / cam, sort=True)
+            closest, tdiffs = pair_timestamps(
+                timestamps, timestamps1, self._timetolerance
+            )
+            for value, idx, tdiff in zip(epochs, closest, tdiffs):
+                if idx > -1:
+                    value["images"][cam] = self._get_image(cam, paths1[idx])
+                    value["dt"][cam] = tdiff.item()
+        logger.info(f"Building EpochDataMap: found {len(epochs)} epochs")
+
+        # Remove epochs with less than min_images images. The epochs whose missing images may still arrive (e.g., not yet uploaded) are kept as pending, to be added by update() when they are complete.
+        if min_images is not None:
+            latest = self._latest_timestamps()
+            valid = []
+            for value in epochs:
+                if len(value["images"]) >= min_images:
+                    valid.append(value)
+                elif self._can_be_completed(value, latest):
+                    name = value["images"][self._master_camera].name
+                    self._pending[name] = value
+            logger.info(
+                f"Removed {len(epochs) - len(valid)} epochs with less than {min_images} images"
+            )
+            epochs = valid
+
+        # Assign the ids: the epochs of the previous runs keep their id, the new ones get the following ids in chronological order
+        known_ids = self._read_map_ids()
+        self._next_id = max(known_ids.values(), default=-1) + 1
+        new_ids = []
+        for value in epochs:
+            name = value["images"][self._master_camera].name
+            if name in known_ids:
+                self._map[known_ids[name]] = value
+            else:
+                self._map[self._next_id] = value
+                new_ids.append(self._next_id)
+                self._next_id += 1
+        self._map = dict(sorted(self._map.items()))
 
         # Get max dt for each epoch
         self._max_dt_sec = {
             ep: max(list(x["dt"].values())).seconds for ep, x in self._map.items()
         }
-        dtmax = np.array([x for x in self._max_dt_sec.values()])
-        logger.info(
-            f"Mean max dt: {np.mean(dtmax):.2f} seconds (max: {np.max(dtmax):.2f} seconds))"
+        if self._max_dt_sec:
+            dtmax = np.array([x for x in self._max_dt_sec.values()])
+            logger.info(
+                f"Mean max dt: {np.mean(dtmax):.2f} seconds (max: {np.max(dtmax):.2f} seconds))"
+            )
+
+        # Images of the master camera already assigned to an epoch (or pending)
+        self._master_names = {
+            value["images"][self._master_camera].name for value in self._map.values()
+        } | set(self._pending)
+
+        return new_ids if known_ids else None
+
+    def _latest_timestamps(self) -> Dict[str, dt]:
+        latest = {}
+        for cam in self._cams:
+            timestamps, _ = self._get_timestamps(self._image_dir / cam, sort=True)
+            latest[cam] = timestamps[-1].item() if len(timestamps) else None
+        return latest
+
+    def _can_be_completed(self, epoch_data: DotDict, latest: Dict[str, dt]) -> bool:
+        """
+        Check if the missing images of an epoch may still arrive, i.e., if the latest image of some camera without an image in the epoch (given in latest) is not later than the epoch timestamp plus the time tolerance (images are assumed to be uploaded in chronological order).
+        """
+        for cam in self._cams:
+            if cam in epoch_data["images"]:
+                continue
+            if latest[cam] is None or latest[cam] <= (
+                epoch_data["timestamp"] + self._timetolerance
+            ):
+                return True
+        return False
+
+    def update(self) -> List[int]:
+        """
+        Rescan the camera folders (reading only the new images) and append the new epochs to the map, without changing the ids of the existing epochs. A new image of the master camera becomes an epoch as soon as the images of all the cameras are available; if an image of some camera cannot arrive anymore (a later image of that camera is already available), the epoch is added if it has at least min_images images, otherwise it is discarded. Epochs are added in chronological order: an epoch still waiting for some images holds back the following ones. The new epochs are appended to the epoch_map.csv file.
+
+        Returns:
+            List[int]: The ids of the new epochs.
+        """
+        for cam in self._cams:
+            self._get_index(cam).update()
+
+        # New images of the master camera
+        timestamps, paths = self._get_timestamps(
+            self._image_dir / self._master_camera, sort=True
         )
+        for ts, path in zip(timestamps, paths):
+            if path.name in self._master_names:
+                continue
+            self._pending[path.name] = DotDict(
+                {
+                    "timestamp": ts.item(),
+                    "images": {
+                        self._master_camera: self._get_image(self._master_camera, path)
+                    },
+                    "dt": {self._master_camera: timedelta(seconds=0)},
+                }
+            )
+            self._master_names.add(path.name)
+
+        # Find closest timestamp of the pending epochs for each camera
+        for cam in self._cams:
+            waiting = [v for v in self._pending.values() if cam not in v["images"]]
+            if not waiting:
+                continue
+            timestamps1, paths1 = self._get_timestamps(self._image_dir / cam, sort=True)
+            closest, tdiffs = pair_timestamps(
+                [v["timestamp"] for v in waiting], timestamps1, self._timetolerance
+            )
+            for value, idx, tdiff in zip(waiting, closest, tdiffs):
+                if idx > -1:
+                    value["images"][cam] = self._get_image(cam, paths1[idx])
+                    value["dt"][cam] = tdiff.item()
+
+        # Add the ready epochs in chronological order
+        new_ids = []
+        min_images = self._min_images or 1
+        latest = self._latest_timestamps()
+        for name, value in sorted(
+            self._pending.items(), key=lambda x: x[1]["timestamp"]
+        ):
+            if len(value["images"]) < len(self._cams) and self._can_be_completed(
+                value, latest
+            ):
+                break
+            del self._pending[name]
+            if len(value["images"]) < min_images:
+                logger.info(
+                    f"Discarded epoch {value['timestamp']} with less than {min_images} images"
+                )
+                continue
+            self._map[self._next_id] = value
+            self._max_dt_sec[self._next_id] = max(value["dt"].values()).seconds
+            new_ids.append(self._next_id)
+            self._next_id += 1
+
+        if new_ids:
+            logger.info(f"Added {len(new_ids)} new epochs to EpochDataMap")
+            self._write_map(self._map_file, epochs=new_ids, append=True)
+        return new_ids
+
+    def watch(
+        self,
+        poll_interval: float = 600,
+        timeout: float = None,
+        include_existing: bool = False,
+    ) -> Iterator[Tuple[int, DotDict]]:
+        """
+        Poll the camera folders for new images and yield the new epochs as soon as they are ready (see update()), so that a processing loop can run in near real time while new images are uploaded.
 
-        # Remove epochs with less than min_images images
-        removed = 0
-        if min_images is not None:
-            for key, value in self._map.copy().items():
-                if len(value["images"]) < min_images:
-                    del self._map[key]
-                    removed += 1
-            logger.info(f"Removed {removed} epochs with less than {min_images} images")
-
-    def _write_map(self, filename: str, sep: str = ",", header: bool = True) -> None:
-        file = open(filename, "w")
+        Example:
+            >>> for ep, epoch_data in epoch_map.watch(poll_interval=3600):
+            ...     process(ep, epoch_data["images"])
+
+        Args:
+            poll_interval (float): The time (in seconds) between two rescans of the camera folders. Default is 600 seconds.
+            timeout (float): Stop watching if no new epoch is found for this time (in seconds). Default is None (watch forever).
+            include_existing (bool): Yield the epochs already in the map first. Default is False.
+
+        Yields:
+            Tuple[int, DotDict]: The id and the data (timestamp, images and time differences) of each new epoch.
+        """
+        if include_existing:
+            for ep in sorted(self._map):
+                yield ep, self._map[ep]
+
+        last_new = time.monotonic()
+        while True:
+            new_ids = self.update()
+            for ep in new_ids:
+                yield ep, self._map[ep]
+            if new_ids:
+                last_new = time.monotonic()
+            elif timeout is not None and time.monotonic() - last_new >= timeout:
+                logger.info(f"No new epochs in the last {timeout} s. Stop watching.")
+                return
+            time.sleep(poll_interval)
+
+    def _write_map(
+        self,
+        filename: str,
+        sep: str = ",",
+        header: bool = True,
+        epochs: List[int] = None,
+        append: bool = False,
+    ) -> None:
+        if append and Path(filename).exists():
+            header = False
+        else:
+            append = False
+        file = open(filename, "a" if append else "w")
         if header:
             columns = ["epoch", "date", "time"]
             for cam in self._cams:
                 columns.append(cam)
                 columns.append(f"{cam}_timestamp")
             file.write(f"{sep}".join(columns) + "\n")
-        for key, value in self._map.items():
+        for key in self._map if epochs is None else epochs:
             value = self._map[key]
             date = value["timestamp"].strftime("%Y-%m-%d")
             time = value["timestamp"].strftime("%H:%M:%S")
             str_2_add = []
             for cam in self._cams:
+                if cam not in value["images"]:
+                    str_2_add += ["", ""]
+                    continue
                 str_2_add.append(value["images"][cam].name)
                 str_2_add.append(
                     f"{value['images'][cam].date}_{value['images'][cam].time}"
@@ -384,11 +623,24 @@ class Epoch:
             logger.info("Epoch directory not provided. Using epoch timestamp.")
             self.epoch_dir = Path(str(self._timestamp).replace(" ", "_"))
         self.epoch_dir.mkdir(parents=True, exist_ok=True)
+        self._residuals = None
 
     @property
     def timestamp(self):
         return self._timestamp
 
+    @property
+    def residuals(self) -> ReprojectionResiduals:
+        """
+        Returns the reprojection residual engine of the epoch, which computes and caches the residuals of the 3D points in all the cameras.
+
+        Returns:
+            ReprojectionResiduals: The residual engine of the epoch.
+        """
+        if getattr(self, "_residuals", None) is None:
+            self._residuals = ReprojectionResiduals(self)
+        return self._residuals
+
     @property
     def date_str(self) -> str:
         """
@@ -443,6 +695,12 @@ class Epoch:
         yield self.features
         yield self.points
 
+    def __getstate__(self) -> dict:
+        """Do not pickle the cached residuals."""
+        state = self.__dict__.copy()
+        state.pop("_residuals", None)
+        return state
+
     def __hash__(self):
         """
         Computes the hash value of the Epoch object
@@ -499,6 +757,44 @@ class Epoch:
         except Exception as e:
             raise e(f"Unable to read Epoch from file {path}")
 
+    def save_h5(self, path: Union[str, Path], compression: str = None) -> bool:
+        """
+        Saves the Epoch object to a columnar HDF5 file (see icepy4d.core.epoch_io for the file layout).
+
+        Args:
+            path (Union[str, Path]): The path to the HDF5 file
+            compression (str, optional): HDF5 compression filter used for the feature descriptors (e.g., "gzip" or "lzf"). Defaults to None.
+
+        Returns:
+            bool: True if the object was successfully saved to file, False otherwise
+        """
+        try:
+            write_epoch(self, path, compression=compression)
+            return True
+        except (OSError, ValueError, TypeError) as err:
+            logger.error(f"Unable to save the Epoch to {path}: {err}")
+            return False
+
+    @staticmethod
+    def read_h5(
+        path: Union[str, Path],
+        include: List[str] = None,
+        read_descriptors: bool = True,
+    ):
+        """
+        Load a Epoch object (or only some of its data) from a HDF5 file written by Epoch.save_h5
+
+        Args:
+            path (Union[str, Path]): The path to the HDF5 file
+            include (List[str], optional): data to be read, among "cameras", "images", "features", "points" and "targets". The data that are not read are set to None. Defaults to None (read everything).
+            read_descriptors (bool, optional): read the feature descriptors. Defaults to True.
+
+        Returns:
+            Epoch: An Epoch object
+        """
+        logger.info(f"Loading epoch from {path}")
+        return read_epoch(path, include=include, read_descriptors=read_descriptors)
+
 
 class Epoches:
     """Class for storing all the epochs in ICEpy4D processing"""
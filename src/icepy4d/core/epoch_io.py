@@ -0,0 +1,507 @@
+"""
+MIT License
+
+Copyright (c) 2022 Francesco Ioli
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Columnar on-disk format for Epoch objects.
+
+An epoch is stored in a single HDF5 file organized as follows:
+
+    /                     attrs: format, version, timestamp, epoch_dir
+    /cameras/<cam>        datasets: K, dist, extrinsics; attrs: width, height
+    /images/<cam>         attrs: path, width, height, datetime
+    /features/<cam>       datasets: kpts (n,2), descr (n,m), scores (n,), track_ids (n,), epochs (n,); attrs: last_track_id, descriptor_size
+    /points               datasets: xyz (n,3), colors (n,3), track_ids (n,); attrs: last_track_id
+    /targets/im_coor/<i>  one dataset per column of the target table; attrs: columns
+    /targets/obj_coor     one dataset per column of the target table; attrs: columns
+
+Every group is read only when requested, so that, e.g., cameras and points can be loaded without reading the descriptors from disk.
+"""
+
+import logging
+import pickle
+from datetime import datetime as dt
+from pathlib import Path
+from typing import Dict, List, Union
+
+import h5py
+import numpy as np
+import pandas as pd
+
+from .camera import Camera
+from .constants import DATETIME_FMT
+from .features import NO_EPOCH, Features
+from .images import Image
+from .points import Points
+from .targets import Targets
+
+logger = logging.getLogger(__name__)
+
+EPOCH_FILE_FORMAT = "icepy4d-epoch"
+EPOCH_FILE_VERSION = 1
+EPOCH_FILE_SUFFIX = ".h5"
+EPOCH_GROUPS = ("cameras", "images", "features", "points", "targets")
+
+
+def _write_table(group: h5py.Group, name: str, table: pd.DataFrame) -> None:
+    """Write a pandas DataFrame as one dataset per column (string columns are stored as variable-length strings)."""
+    tab_group = group.create_group(name)
+    tab_group.attrs["columns"] = [str(c) for c in table.columns]
+    for col in table.columns:
+        values = table[col].to_numpy()
+        if values.dtype == object:
+            values = values.astype(str).astype(object)
+            tab_group.create_dataset(str(col), data=values, dtype=h5py.string_dtype())
+        else:
+            tab_group.create_dataset(str(col), data=values)
+
+
+def _read_table(group: h5py.Group) -> pd.DataFrame:
+    """Read a pandas DataFrame written by _write_table."""
+    data = {}
+    for col in group.attrs["columns"]:
+        dset = group[col]
+        if h5py.check_string_dtype(dset.dtype) is not None:
+            data[col] = dset.asstr()[()]
+        else:
+            data[col] = dset[()]
+    return pd.DataFrame(data, columns=list(group.attrs["columns"]))
+
+
+def write_epoch(
+    epoch,
+    path: Union[str, Path],
+    compression: str = None,
+) -> Path:
+    """
+    write_epoch Write an Epoch object to a columnar HDF5 file.
+
+    Args:
+        epoch (Epoch): Epoch object to be saved.
+        path (Union[str, Path]): Path of the output file (the file is overwritten if it exists).
+        compression (str, optional): HDF5 compression filter used for the feature descriptors (e.g., "gzip" or "lzf"). Defaults to None (no compression, fastest reading).
+
+    Returns:
+        Path: the path of the written file.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with h5py.File(path, "w") as f:
+        f.attrs["format"] = EPOCH_FILE_FORMAT
+        f.attrs["version"] = EPOCH_FILE_VERSION
+        f.attrs["timestamp"] = epoch.timestamp.strftime(DATETIME_FMT)
+        f.attrs["epoch_dir"] = str(epoch.epoch_dir)
+
+        cameras = getattr(epoch, "cameras", None)
+        if cameras:
+            grp = f.create_group("cameras")
+            for cam, camera in cameras.items():
+                g = grp.create_group(cam)
+                g.attrs["width"] = -1 if camera.width is None else int(camera.width)
+                g.attrs["height"] = -1 if camera.height is None else int(camera.height)
+                if camera.K is not None:
+                    g.create_dataset("K", data=np.asarray(camera.K, dtype=np.float64))
+                if camera.dist is not None:
+                    g.create_dataset(
+                        "dist", data=np.asarray(camera.dist, dtype=np.float64)
+                    )
+                g.create_dataset(
+                    "extrinsics", data=np.asarray(camera.extrinsics, dtype=np.float64)
+                )
+
+        images = getattr(epoch, "images", None)
+        if images:
+            grp = f.create_group("images")
+            for cam, image in images.items():
+                g = grp.create_group(cam)
+                g.attrs["path"] = str(image.path)
+                g.attrs["width"] = int(image._width) if image._width else -1
+                g.attrs["height"] = int(image._height) if image._height else -1
+                if image._date_time is not None:
+                    g.attrs["datetime"] = image._date_time.strftime(DATETIME_FMT)
+
+        features = getattr(epoch, "features", None)
+        if features:
+            grp = f.create_group("features")
+            for cam, feats in features.items():
+                g = grp.create_group(cam)
+                n = len(feats)
+                g.attrs["last_track_id"] = feats.last_track_id
+                g.attrs["descriptor_size"] = feats._descriptor_size
+                if hasattr(feats, "epoch"):
+                    g.attrs["epoch"] = feats.epoch
+                g.create_dataset("kpts", data=feats.kpts_to_numpy())
+                g.create_dataset("scores", data=feats._scores[:n])
+                g.create_dataset("track_ids", data=feats.track_ids)
+                g.create_dataset("epochs", data=feats._epochs[:n])
+                if feats._descr is not None and n > 0:
+                    descr = feats._descr[:n]
+                    g.create_dataset(
+                        "descr",
+                        data=descr,
+                        chunks=(min(n, 4096), descr.shape[1]),
+                        compression=compression,
+                    )
+
+        points = getattr(epoch, "points", None)
+        if points is not None:
+            g = f.create_group("points")
+            g.attrs["last_track_id"] = points.last_track_id
+            g.create_dataset("xyz", data=points.to_numpy())
+            g.create_dataset("colors", data=points.colors_to_numpy())
+            g.create_dataset("track_ids", data=points.track_ids)
+
+        targets = getattr(epoch, "targets", None)
+        if targets is not None:
+            grp = f.create_group("targets")
+            im_grp = grp.create_group("im_coor")
+            for i, table in enumerate(targets.im_coor):
+                _write_table(im_grp, str(i), table)
+            if isinstance(targets.obj_coor, pd.DataFrame):
+                _write_table(grp, "obj_coor", targets.obj_coor)
+            elif targets.obj_coor is not None:
+                logger.warning(
+                    "Target object coordinates are not stored as a DataFrame. They are not saved to file."
+                )
+
+    return path
+
+
+class EpochReader:
+    """
+    Class for reading an Epoch saved with write_epoch(). The file is opened once and every group (cameras, images, features, points, targets) is read only when the corresponding method is called.
+
+    Example:
+        with EpochReader("2022-05-01_14:01:15.h5") as reader:
+            cameras = reader.read_cameras()
+            points = reader.read_points()
+
+    Attributes:
+        path (Path): The path to the epoch file.
+        version (int): The version of the file format.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        """
+        __init__ Open an epoch file for reading.
+
+        Args:
+            path (Union[str, Path]): The path to the epoch file.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+            ValueError: If the file is not an epoch file or it was written with a newer (unsupported) version of the format.
+        """
+        self.path = Path(path)
+        if not self.path.exists():
+            msg = f"Input path {self.path} does not exist."
+            logger.error(msg)
+            raise FileNotFoundError(msg)
+        self._file = h5py.File(self.path, "r")
+        if self._file.attrs.get("format") != EPOCH_FILE_FORMAT:
+            self.close()
+            raise ValueError(f"{self.path} is not a valid epoch file.")
+        self.version = int(self._file.attrs["version"])
+        if self.version > EPOCH_FILE_VERSION:
+            self.close()
+            raise ValueError(
+                f"Epoch file {self.path} was written with version {self.version} of the format, while the maximum supported version is {EPOCH_FILE_VERSION}."
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def __repr__(self) -> str:
+        return f"EpochReader {self.path} (version {self.version})"
+
+    def close(self) -> None:
+        """Close the epoch file."""
+        if self._file:
+            self._file.close()
+
+    @property
+    def timestamp(self) -> dt:
+        """Timestamp of the epoch"""
+        return dt.strptime(self._file.attrs["timestamp"], DATETIME_FMT)
+
+    @property
+    def epoch_dir(self) -> Path:
+        """Directory of the epoch"""
+        return Path(self._file.attrs["epoch_dir"])
+
+    @property
+    def cams(self) -> List[str]:
+        """List of the camera names stored in the file"""
+        for grp in ["cameras", "features", "images"]:
+            if grp in self._file:
+                return list(self._file[grp].keys())
+        return []
+
+    def read_cameras(self) -> Dict[str, Camera]:
+        """
+        read_cameras Read the cameras (intrinsics, distortion and extrinsics).
+
+        Returns:
+            Dict[str, Camera]: dictionary mapping each camera name to its Camera object, or None if no cameras are stored.
+        """
+        if "cameras" not in self._file:
+            return None
+        cameras = {}
+        for cam, g in self._file["cameras"].items():
+            width = int(g.attrs["width"])
+            height = int(g.attrs["height"])
+            cameras[cam] = Camera(
+                width=None if width < 0 else width,
+                height=None if height < 0 else height,
+                K=g["K"][()] if "K" in g else None,
+                dist=g["dist"][()] if "dist" in g else None,
+                extrinsics=g["extrinsics"][()],
+            )
+        return cameras
+
+    def read_images(self) -> Dict[str, Image]:
+        """
+        read_images Read the images of the epoch. Image size and date are restored from the file, without reading the EXIF from the image files (that are not required to exist).
+
+        Returns:
+            Dict[str, Image]: dictionary mapping each camera name to its Image object, or None if no images are stored.
+        """
+        if "images" not in self._file:
+            return None
+        images = {}
+        for cam, g in self._file["images"].items():
+            width, height = int(g.attrs["width"]), int(g.attrs["height"])
+            images[cam] = Image.from_metadata(
+                g.attrs["path"],
+                date_time=(
+                    dt.strptime(g.attrs["datetime"], DATETIME_FMT)
+                    if "datetime" in g.attrs
+                    else None
+                ),
+                width=None if width < 0 else width,
+                height=None if height < 0 else height,
+            )
+        return images
+
+    def read_features(
+        self,
+        cams: List[str] = None,
+        read_descriptors: bool = True,
+    ) -> Dict[str, Features]:
+        """
+        read_features Read the features of some (or all) the cameras.
+
+        Args:
+            cams (List[str], optional): cameras to read. Defaults to None (all the cameras).
+            read_descriptors (bool, optional): read the descriptors. If False, the descriptors are not read from disk at all. Defaults to True.
+
+        Returns:
+            Dict[str, Features]: dictionary mapping each camera name to its Features object, or None if no features are stored.
+        """
+        if "features" not in self._file:
+            return None
+        grp = self._file["features"]
+        if cams is None:
+            cams = list(grp.keys())
+        features = {}
+        for cam in cams:
+            assert cam in grp, f"Features of camera {cam} not found in {self.path}"
+            g = grp[cam]
+            feats = Features()
+            feats._descriptor_size = int(g.attrs["descriptor_size"])
+            descr = None
+            if read_descriptors and "descr" in g:
+                descr = g["descr"][()]
+            feats._append_rows(
+                g["kpts"][()],
+                g["track_ids"][()],
+                descr=descr,
+                scores=g["scores"][()],
+                epochs=g["epochs"][()] if "epochs" in g else NO_EPOCH,
+            )
+            feats._last_id = int(g.attrs["last_track_id"])
+            if "epoch" in g.attrs:
+                feats.epoch = np.int32(g.attrs["epoch"])
+            features[cam] = feats
+        return features
+
+    def read_points(self) -> Points:
+        """
+        read_points Read the 3D points.
+
+        Returns:
+            Points: Points object, or None if no points are stored.
+        """
+        if "points" not in self._file:
+            return None
+        g = self._file["points"]
+        points = Points()
+        points._append_rows(g["xyz"][()], g["track_ids"][()], g["colors"][()])
+        points._last_id = int(g.attrs["last_track_id"])
+        return points
+
+    def read_targets(self) -> Targets:
+        """
+        read_targets Read the targets.
+
+        Returns:
+            Targets: Targets object, or None if no targets are stored.
+        """
+        if "targets" not in self._file:
+            return None
+        grp = self._file["targets"]
+        targets = Targets()
+        im_grp = grp["im_coor"]
+        targets.im_coor = [
+            _read_table(im_grp[k]) for k in sorted(im_grp.keys(), key=int)
+        ]
+        if "obj_coor" in grp:
+            targets.obj_coor = _read_table(grp["obj_coor"])
+        return targets
+
+    def read_epoch(self, include: List[str] = None, read_descriptors: bool = True):
+        """
+        read_epoch Build an Epoch object from the file.
+
+        Args:
+            include (List[str], optional): groups to be read, among "cameras", "images", "features", "points" and "targets". The groups that are not read are set to None. Defaults to None (all the groups).
+            read_descriptors (bool, optional): read the feature descriptors. Defaults to True.
+
+        Returns:
+            Epoch: The Epoch object.
+        """
+        from .epoch import Epoch
+
+        if include is None:
+            include = EPOCH_GROUPS
+        for grp in include:
+            assert (
+                grp in EPOCH_GROUPS
+            ), f"Invalid group {grp}. It must be one of {EPOCH_GROUPS}"
+
+        # The Epoch is not initialized with Epoch.__init__ to avoid creating the epoch directory when reading.
+        epoch = Epoch.__new__(Epoch)
+        epoch._timestamp = self.timestamp
+        epoch.epoch_dir = self.epoch_dir
+        epoch.point_cloud = None
+        epoch.cameras = self.read_cameras() if "cameras" in include else None
+        epoch.images = self.read_images() if "images" in include else None
+        epoch.features = (
+            self.read_features(read_descriptors=read_descriptors)
+            if "features" in include
+            else None
+        )
+        points = self.read_points() if "points" in include else None
+        epoch.points = points if points is not None else Points()
+        epoch.targets = self.read_targets() if "targets" in include else None
+        return epoch
+
+
+def read_epoch(
+    path: Union[str, Path],
+    include: List[str] = None,
+    read_descriptors: bool = True,
+):
+    """
+    read_epoch Read an Epoch object (or only some of its groups) from a file written by write_epoch().
+
+    Args:
+        path (Union[str, Path]): The path to the epoch file.
+        include (List[str], optional): groups to be read, among "cameras", "images", "features", "points" and "targets". Defaults to None (all the groups).
+        read_descriptors (bool, optional): read the feature descriptors. Defaults to True.
+
+    Returns:
+        Epoch: The Epoch object.
+    """
+    with EpochReader(path) as reader:
+        return reader.read_epoch(include=include, read_descriptors=read_descriptors)
+
+
+def convert_pickle_to_h5(
+    pickle_path: Union[str, Path],
+    h5_path: Union[str, Path] = None,
+    overwrite: bool = False,
+    compression: str = None,
+) -> Path:
+    """
+    convert_pickle_to_h5 Convert an Epoch saved with Epoch.save_pickle() to the columnar HDF5 format.
+
+    Args:
+        pickle_path (Union[str, Path]): The path to the pickle file.
+        h5_path (Union[str, Path], optional): The path of the output file. Defaults to None (same path of the pickle file, with .h5 suffix).
+        overwrite (bool, optional): overwrite the output file if it already exists. Defaults to False.
+        compression (str, optional): HDF5 compression filter used for the feature descriptors. Defaults to None.
+
+    Returns:
+        Path: the path of the output file.
+
+    Raises:
+        ValueError: If the pickle file does not contain an Epoch object.
+    """
+    pickle_path = Path(pickle_path)
+    assert pickle_path.exists(), f"Input path {pickle_path} does not exists"
+    if h5_path is None:
+        h5_path = pickle_path.with_suffix(EPOCH_FILE_SUFFIX)
+    h5_path = Path(h5_path)
+    if h5_path.exists() and not overwrite:
+        logger.info(f"{h5_path} already exists. Skipping conversion.")
+        return h5_path
+
+    with open(pickle_path, "rb") as inp:
+        epoch = pickle.load(inp)
+    if not hasattr(epoch, "timestamp") or not hasattr(epoch, "epoch_dir"):
+        raise ValueError(f"{pickle_path} does not contain an Epoch object.")
+    write_epoch(epoch, h5_path, compression=compression)
+    logger.info(f"Epoch {pickle_path} converted to {h5_path}")
+    return h5_path
+
+
+def convert_pickles_in_dir(
+    results_dir: Union[str, Path],
+    pattern: str = "*/*.pickle",
+    overwrite: bool = False,
+    compression: str = None,
+) -> List[Path]:
+    """
+    convert_pickles_in_dir Convert all the Epoch pickle files found in a results directory (by default, one subfolder per epoch) to the columnar HDF5 format. Files that cannot be read as an Epoch are skipped.
+
+    Args:
+        results_dir (Union[str, Path]): The results directory.
+        pattern (str, optional): glob pattern of the pickle files, relative to results_dir. Defaults to "*/*.pickle".
+        overwrite (bool, optional): overwrite the existing output files. Defaults to False.
+        compression (str, optional): HDF5 compression filter used for the feature descriptors. Defaults to None.
+
+    Returns:
+        List[Path]: the paths of the converted files.
+    """
+    converted = []
+    for path in sorted(Path(results_dir).glob(pattern)):
+        try:
+            converted.append(
+                convert_pickle_to_h5(path, overwrite=overwrite, compression=compression)
+            )
+        except (ValueError, AttributeError, pickle.UnpicklingError) as err:
+            logger.warning(f"Unable to convert {path}: {err}")
+    return converted
@@ -22,6 +22,7 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import itertools
 import pickle
 import numpy as np
 import logging
@@ -29,11 +30,13 @@ import time
 
 from typing import Union, List, Tuple
 from pathlib import Path
-from itertools import compress
 from matplotlib import pyplot as plt
 
 logger = logging.getLogger(__name__)
 
+# Source of the version numbers of the features (unique among all the instances, so that a version identifies a state of one object)
+_VERSIONS = itertools.count(1)
+
 
 def float32_type_check(
     array: np.ndarray, cast_integers: bool = False, verbose: bool = False
@@ -205,14 +208,29 @@ class Feature:
             return None
 
 
+# Value stored in the epoch column of Features for features without an epoch
+NO_EPOCH = np.int32(-1)
+
+# Minimum number of rows allocated when the Features storage grows
+MIN_CAPACITY = 1024
+
+
 class Features:
     """
     Features class represents a collection of several Feature objects detected in an image.
 
+    Features are stored in a columnar layout, i.e., as contiguous numpy arrays of keypoints coordinates, descriptors, scores, track_ids and epochs, together with a dictionary that maps each track_id to its row in the arrays. The arrays are over-allocated so that appending new features is amortized, and they are exported without copying by kpts_to_numpy(), descr_to_numpy() and scores_to_numpy(). Feature objects are built only when a single feature is accessed (e.g., features[track_id]).
+
     Attributes:
-        _values (dict): A dictionary that maps feature IDs to Feature objects.
+        _xy (np.ndarray): (capacity, 2) float32 array with the xy coordinates of the keypoints.
+        _descr (np.ndarray): (capacity, descriptor_size) float32 array with the descriptors (one per row). None if no descriptor was ever appended.
+        _scores (np.ndarray): (capacity,) float32 array with the scores. NaN if the score of a feature is not available.
+        _track_ids (np.ndarray): (capacity,) int32 array with the track_id of the features.
+        _epochs (np.ndarray): (capacity,) int32 array with the epoch of the features. NO_EPOCH if the epoch of a feature is not available.
+        _index (dict): A dictionary that maps the track_ids to the rows of the arrays.
+        _n (int): The number of features stored (i.e., the number of valid rows of the arrays).
         _last_id (int): The last assigned feature ID.
-        _iter (int): An iterator used to iterate over the feature IDs.
+        _iter (int): An iterator used to iterate over the features.
         _descriptor_size (int): The size of the feature descriptors in the collection.
 
     Note:
@@ -220,13 +238,11 @@ class Features:
     """
 
     def __init__(self):
-        self._values = {}
-        self._last_id = -1
-        self._iter = 0
-        self._descriptor_size = 256
         """
         __init__ Initialize Features object
         """
+        self._descriptor_size = 256
+        self.reset_fetures()
 
     def __len__(self) -> int:
         """
@@ -235,7 +251,7 @@ class Features:
         Returns:
             int: number of features
         """
-        return len(self._values)
+        return self._n
 
     def __getitem__(self, track_id: np.int32) -> Feature:
         """
@@ -247,11 +263,11 @@ class Features:
         Returns:
             Feature: requested Feature object
         """
-        if track_id in list(self._values.keys()):
-            return self._values[track_id]
-        else:
+        row = self._index.get(track_id)
+        if row is None:
             logger.warning(f"Feature with track id {track_id} not available.")
             return None
+        return self._build_feature(row)
 
     def __contains__(self, track_id: np.int32) -> bool:
         """
@@ -263,10 +279,7 @@ class Features:
         Returns:
             bool: True if the feature is present.
         """
-        if track_id in list(self._values.keys()):
-            return True
-        else:
-            return False
+        return track_id in self._index
 
     def __delitem__(self, track_id: np.int32) -> bool:
         """
@@ -277,12 +290,17 @@ class Features:
 
         Returns:
             bool: True if the item was present and deleted, False otherwise.
+
+        Note:
+            Deleting a feature compacts the storage arrays (O(n)). To remove many features at once, use filter_feature_by_mask() or filter_feature_by_index().
         """
         if track_id not in self:
             logger.warning(f"Feature with track_id {track_id} not present")
             return False
         else:
-            del self._values[track_id]
+            keep = np.ones(self._n, dtype=bool)
+            keep[self._index[track_id]] = False
+            self._keep_rows(np.flatnonzero(keep))
             return True
 
     def __iter__(self):
@@ -291,7 +309,7 @@ class Features:
 
     def __next__(self):
         while self._iter < len(self):
-            f = self._values[self._iter]
+            f = self._build_feature(self._iter)
             self._iter += 1
             return f
         else:
@@ -301,12 +319,36 @@ class Features:
     def __repr__(self) -> str:
         return f"Features with {len(self)} features"
 
+    def __getstate__(self) -> dict:
+        """Pickle only the valid rows of the storage arrays. The track_id index is rebuilt when unpickling."""
+        state = self.__dict__.copy()
+        for key in ["_xy", "_descr", "_scores", "_track_ids", "_epochs"]:
+            if state[key] is not None:
+                state[key] = state[key][: self._n].copy()
+        del state["_index"]
+        del state["_sorted_rows"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        if "_values" in state:
+            # Features pickled with the former storage (a dict of Feature objects)
+            self._descriptor_size = state.get("_descriptor_size", 256)
+            self.reset_fetures()
+            self._append_feature_objects(state["_values"])
+            self._last_id = state.get("_last_id", self._last_id)
+            if "epoch" in state:
+                self.epoch = state["epoch"]
+            return
+        self.__dict__.update(state)
+        self._rebuild_index()
+        self._touch()
+
     @property
     def num_features(self):
         """
         num_features Number of features stored in Features object
         """
-        return len(self._values)
+        return self._n
 
     @property
     def last_track_id(self):
@@ -315,6 +357,20 @@ class Features:
         """
         return self._last_id
 
+    @property
+    def version(self) -> int:
+        """
+        version Version of the features, changed by every in-place modification (e.g., appended or filtered features). It can be used as a key to cache quantities computed from the features.
+        """
+        return self._version
+
+    @property
+    def track_ids(self) -> np.ndarray:
+        """
+        track_ids Get the track_id of all the features as a (n,) int32 numpy array (view of the internal storage, do not modify it in place).
+        """
+        return self._track_ids[: self._n]
+
     def get_track_ids(self) -> Tuple[np.int32]:
         """
         get_track_ids Get a ordered tuple of track_id of all the features
@@ -322,7 +378,171 @@ class Features:
         Returns:
             tuple: tuple of size (n,) with track_ids
         """
-        return tuple([np.int32(x) for x in self._values.keys()])
+        return tuple(self._track_ids[: self._n])
+
+    def take(self, track_ids: Union[np.ndarray, List[np.int32]]) -> np.ndarray:
+        """
+        take Get the rows of the storage arrays (i.e., the position in the arrays returned by the *_to_numpy() methods) of a set of track_ids, with a single vectorized lookup.
+
+        Args:
+            track_ids (Union[np.ndarray, List[np.int32]]): track_ids to look for.
+
+        Returns:
+            np.ndarray: (n,) int64 array with the row of each track_id, or -1 if the track_id is not present.
+        """
+        track_ids = np.asarray(track_ids).reshape(-1)
+        if self._n == 0 or len(track_ids) == 0:
+            return np.full(len(track_ids), -1, dtype=np.int64)
+        if self._sorted_rows is None:
+            self._sorted_rows = np.argsort(self._track_ids[: self._n], kind="stable")
+        sorted_ids = self._track_ids[: self._n][self._sorted_rows]
+        pos = np.searchsorted(sorted_ids, track_ids)
+        pos = np.minimum(pos, self._n - 1)
+        found = sorted_ids[pos] == track_ids
+        return np.where(found, self._sorted_rows[pos], -1).astype(np.int64)
+
+    def contains_many(self, track_ids: Union[np.ndarray, List[np.int32]]) -> np.ndarray:
+        """
+        contains_many Check which of a set of track_ids are present in the Features object, with a single vectorized lookup.
+
+        Args:
+            track_ids (Union[np.ndarray, List[np.int32]]): track_ids to check.
+
+        Returns:
+            np.ndarray: (n,) boolean array, True if the corresponding track_id is present.
+        """
+        return self.take(track_ids) > -1
+
+    def _reserve(self, n_new: int) -> None:
+        """
+        _reserve Make room for n_new additional rows in the storage arrays. The capacity is (at least) doubled every time the arrays must grow, so that appending features is amortized O(1) per feature.
+
+        Args:
+            n_new (int): number of rows to be appended.
+        """
+        required = self._n + n_new
+        capacity = len(self._track_ids)
+        if required <= capacity:
+            return
+        new_capacity = max(required, 2 * capacity, MIN_CAPACITY)
+
+        def grow(array: np.ndarray) -> np.ndarray:
+            new = np.empty((new_capacity,) + array.shape[1:], dtype=array.dtype)
+            new[: self._n] = array[: self._n]
+            return new
+
+        self._xy = grow(self._xy)
+        self._scores = grow(self._scores)
+        self._track_ids = grow(self._track_ids)
+        self._epochs = grow(self._epochs)
+        if self._descr is not None:
+            self._descr = grow(self._descr)
+
+    def _append_rows(
+        self,
+        xy: np.ndarray,
+        track_ids: np.ndarray,
+        descr: np.ndarray = None,
+        scores: np.ndarray = None,
+        epochs: Union[np.ndarray, np.int32] = NO_EPOCH,
+    ) -> None:
+        """
+        _append_rows Append new rows to the storage arrays. Inputs are assumed to be already validated.
+
+        Args:
+            xy (np.ndarray): nx2 float32 array with keypoints coordinates.
+            track_ids (np.ndarray): (n,) int32 array with the track_ids (not present yet in Features).
+            descr (np.ndarray, optional): nxm float32 array with the descriptors (one per row). Defaults to None.
+            scores (np.ndarray, optional): (n,) float32 array with the scores. Defaults to None.
+            epochs (Union[np.ndarray, np.int32], optional): epoch of the features (scalar or (n,) array). Defaults to NO_EPOCH.
+        """
+        n_new = len(track_ids)
+        if n_new == 0:
+            return
+        self._reserve(n_new)
+        start, stop = self._n, self._n + n_new
+
+        if descr is not None and self._descr is None:
+            # First descriptors appended: allocate the descriptor column,
+            # previous features have no descriptor.
+            self._descr = np.full(
+                (len(self._track_ids), descr.shape[1]), np.nan, dtype=np.float32
+            )
+        if self._descr is not None:
+            self._descr[start:stop] = np.nan if descr is None else descr
+
+        self._xy[start:stop] = xy
+        self._track_ids[start:stop] = track_ids
+        self._scores[start:stop] = np.nan if scores is None else scores
+        self._epochs[start:stop] = epochs
+        self._index.update(zip(track_ids.tolist(), range(start, stop)))
+        self._sorted_rows = None
+        self._n = stop
+        self._last_id = int(track_ids[-1])
+        self._touch()
+
+    def _append_feature_objects(self, features: dict) -> None:
+        """
+        _append_feature_objects Append a dictionary {track_id: Feature} to the storage arrays (used for reading Features pickled with the former dict-based storage).
+        """
+        if not features:
+            return
+        feats = list(features.values())
+        xy = np.array([[f._x, f._y] for f in feats], dtype=np.float32)
+        track_ids = np.array(list(features.keys()), dtype=np.int32)
+        scores = np.array(
+            [np.nan if f._score is None else f._score for f in feats],
+            dtype=np.float32,
+        )
+        epochs = np.array(
+            [NO_EPOCH if f.epoch is None else f.epoch for f in feats], dtype=np.int32
+        )
+        descr = None
+        if all(f._descr is not None for f in feats):
+            descr = np.stack([f._descr.reshape(-1) for f in feats])
+            self._descriptor_size = descr.shape[1]
+        self._append_rows(xy, track_ids, descr, scores, epochs)
+
+    def _keep_rows(self, rows: np.ndarray) -> None:
+        """
+        _keep_rows Keep only the given rows of the storage arrays (sorted array of integer indexes) and rebuild the track_id index.
+        """
+        self._xy = self._xy[rows]
+        self._scores = self._scores[rows]
+        self._track_ids = self._track_ids[rows]
+        self._epochs = self._epochs[rows]
+        if self._descr is not None:
+            self._descr = self._descr[rows]
+        self._n = len(rows)
+        self._rebuild_index()
+        self._touch()
+
+    def _rebuild_index(self) -> None:
+        """_rebuild_index Rebuild the dictionary mapping track_ids to rows."""
+        self._index = dict(zip(self._track_ids[: self._n].tolist(), range(self._n)))
+        self._sorted_rows = None
+
+    def _touch(self) -> None:
+        """_touch Assign a new version to the features (to be called after every in-place modification)."""
+        self._version = next(_VERSIONS)
+
+    def _build_feature(self, row: int) -> Feature:
+        """
+        _build_feature Build a Feature object from a row of the storage arrays.
+        """
+        descr = None
+        if self._descr is not None and not np.isnan(self._descr[row, 0]):
+            descr = self._descr[row].copy()
+        score = self._scores[row]
+        epoch = self._epochs[row]
+        return Feature(
+            self._xy[row, 0],
+            self._xy[row, 1],
+            track_id=self._track_ids[row],
+            descr=descr,
+            score=None if np.isnan(score) else score,
+            epoch=None if epoch == NO_EPOCH else epoch,
+        )
 
     def append_feature(self, new_feature: Feature) -> None:
         """
@@ -334,15 +554,22 @@ class Features:
         assert isinstance(
             new_feature, Feature
         ), "Invalid input feature. It must be Feature object"
-        self._last_id += 1
-        self._values[self._last_id] = new_feature
-        if new_feature.descr is not None:
-            if len(self) > 0:
+        descr = new_feature._descr
+        if descr is not None:
+            descr = descr.reshape(1, -1)
+            if self._descr is not None and len(self) > 0:
                 assert (
-                    self._descriptor_size == new_feature.descr.shape[0]
+                    self._descriptor_size == descr.shape[1]
                 ), "Descriptor size of the new feature does not match with that of the existing feature"
             else:
-                self._descriptor_size = new_feature.descr.shape[0]
+                self._descriptor_size = descr.shape[1]
+        self._append_rows(
+            new_feature.xy,
+            np.array([self._last_id + 1], dtype=np.int32),
+            descr=descr,
+            scores=new_feature._score,
+            epochs=NO_EPOCH if new_feature.epoch is None else new_feature.epoch,
+        )
 
     def set_last_track_id(self, last_track_id: np.int32) -> None:
         """
@@ -386,48 +613,44 @@ class Features:
             return None
         x = float32_type_check(x, cast_integers=True)
         y = float32_type_check(y, cast_integers=True)
-        xx = x.flatten()
-        yy = y.flatten()
+        xy = np.stack((x.flatten(), y.flatten()), axis=1)
 
         if descr is not None:
             assert descr.shape[0] in [
                 128,
                 256,
             ], "invalid shape of the descriptor array. It must be of size mxn (m: descriptor size [128, 256], n: number of features"
-            if len(self) > 0:
+            if len(self) > 0 and self._descr is not None:
                 assert (
                     self._descriptor_size == descr.shape[0]
                 ), "Descriptor size of the new feature does not match with that of the existing feature"
             else:
                 self._descriptor_size = descr.shape[0]
             descr = float32_type_check(descr.T)
-        else:
-            descr = [None for _ in range(len(xx))]
 
         if track_ids is None:
-            ids = range(self._last_id + 1, self._last_id + len(xx) + 1)
+            ids = np.arange(
+                self._last_id + 1, self._last_id + len(xy) + 1, dtype=np.int32
+            )
         else:
             assert isinstance(
                 track_ids, list
             ), "Invalid track_ids input. It must be a list of integers of the same size of the input arrays."
             assert len(track_ids) == len(
-                xx
+                xy
             ), "invalid size of track_id input. It must be a list of the same size of the input arrays."
 
-            try:
-                for id in track_ids:
-                    if id in list(self._values.keys()):
-                        msg = f"Feature with track_id {id} is already present in Features object. Ignoring input track_id and assigning progressive track_ids."
-                        logger.error(msg)
-                        raise ValueError(msg)
-                ids = track_ids
-            except ValueError:
-                ids = range(self._last_id + 1, self._last_id + len(xx) + 1)
+            ids = np.array(track_ids, dtype=np.int32)
+            duplicated = self.contains_many(ids)
+            if np.any(duplicated):
+                msg = f"Feature with track_id {ids[duplicated][0]} is already present in Features object. Ignoring input track_id and assigning progressive track_ids."
+                logger.error(msg)
+                ids = np.arange(
+                    self._last_id + 1, self._last_id + len(xy) + 1, dtype=np.int32
+                )
 
         if scores is not None:
-            scores = float32_type_check(scores)  # .squeeze()
-        else:
-            scores = [None for _ in range(len(xx))]
+            scores = float32_type_check(scores).reshape(-1)
 
         if epoch is not None:
             msg = "Invalid input argument epoch. It must be an integer number."
@@ -438,18 +661,13 @@ class Features:
             assert isinstance(epoch, np.int32), msg
             self.epoch = epoch
 
-        for t_id, x, y, d, s in zip(ids, xx, yy, descr, scores):
-            if s is not None:
-                score_val = s[0] if s.shape == (1,) else s
-            self._values[t_id] = Feature(
-                x,
-                y,
-                track_id=t_id,
-                descr=d,
-                score=score_val,
-                epoch=epoch,
-            )
-            self._last_id = t_id
+        self._append_rows(
+            xy,
+            ids,
+            descr=descr,
+            scores=scores,
+            epochs=NO_EPOCH if epoch is None else epoch,
+        )
 
     def to_numpy(
         self,
@@ -467,19 +685,12 @@ class Features:
         Returns:
             dict: dictionary containing the following keys (depending on the input arguments): ["kpts", "descr", "scores"]
         """
-        kpts = np.empty((len(self), 2), dtype=np.float32)
-        for i, v in enumerate(self._values.values()):
-            kpts[i, :] = np.float32(v.xy)
-
-        if get_descr and get_score:
-            descr = self.descr_to_numpy()
-            scores = self.scores_to_numpy()
-            return {"kpts": kpts, "descr": descr, "scores": scores}
-        elif get_descr:
-            descr = self.descr_to_numpy()
-            return {"kpts": kpts, "descr": descr}
-        else:
-            return {"kpts": kpts}
+        out = {"kpts": self.kpts_to_numpy()}
+        if get_descr:
+            out["descr"] = self.descr_to_numpy()
+        if get_score:
+            out["scores"] = self.scores_to_numpy()
+        return out
 
     def kpts_to_numpy(self) -> np.ndarray:
         """
@@ -487,11 +698,11 @@ class Features:
 
         Returns:
             np.ndarray: nx2 numpy array containing xy coordinates of all keypoints
+
+        Note:
+            The returned array is a view of the internal storage (no copy is made). Copy it before modifying it in place.
         """
-        kpts = np.empty((len(self), 2))
-        for i, v in enumerate(self._values.values()):
-            kpts[i, :] = v.xy
-        return np.float32(kpts)
+        return self._xy[: self._n]
 
     def descr_to_numpy(self) -> np.ndarray:
         """
@@ -499,14 +710,14 @@ class Features:
 
         Returns:
             np.ndarray: mxn numpy array containing the descriptors of all the features (where m is the dimension of the descriptor that can be either 128 or 256)
+
+        Note:
+            The returned array is a (transposed) view of the internal storage (no copy is made). Copy it before modifying it in place.
         """
-        assert any(
-            [self._values[i].descr is not None for i in list(self._values.keys())]
+        assert self._descr is not None and not np.all(
+            np.isnan(self._descr[: self._n, 0])
         ), "Descriptors non availble"
-        descr = np.empty((self._descriptor_size, len(self)), dtype=np.float32)
-        for i, v in enumerate(self._values.values()):
-            descr[:, i : i + 1] = v.descr.reshape(-1, 1)
-        return np.float32(descr)
+        return self._descr[: self._n].T
 
     def scores_to_numpy(self) -> np.ndarray:
         """
@@ -514,14 +725,13 @@ class Features:
 
         Returns:
             np.ndarray: nx1 array with scores
+
+        Note:
+            The returned array is a view of the internal storage (no copy is made). Copy it before modifying it in place.
         """
-        assert any(
-            [self._values[i].score is not None for i in list(self._values.keys())]
-        ), "Scores non availble"
-        score = np.empty(len(self), dtype=np.float32)
-        for i, v in enumerate(self._values.values()):
-            score[i] = v.score
-        return np.float32(score)
+        scores = self._scores[: self._n]
+        assert not np.all(np.isnan(scores)), "Scores non availble"
+        return scores
 
     def get_features_as_dict(self, get_track_id: bool = False) -> dict:
         """
@@ -546,9 +756,17 @@ class Features:
 
     def reset_fetures(self):
         """Reset Features instance"""
-        self._values = {}
+        self._xy = np.empty((0, 2), dtype=np.float32)
+        self._descr = None
+        self._scores = np.empty(0, dtype=np.float32)
+        self._track_ids = np.empty(0, dtype=np.int32)
+        self._epochs = np.empty(0, dtype=np.int32)
+        self._index = {}
+        self._sorted_rows = None
+        self._n = 0
         self._last_id = -1
         self._iter = 0
+        self._touch()
 
     def filter_feature_by_mask(self, inlier_mask: List[bool]) -> None:
         """
@@ -565,9 +783,7 @@ class Features:
             self
         ), "Invalid shape of input argument for inlier_mask. It must be a boolean vector with the same lenght as the number of features stored in the Features object."
 
-        feat_idx = list(self._values.keys())
-        indexes = list(compress(feat_idx, inlier_mask))
-        self.filter_feature_by_index(indexes)
+        self._keep_rows(np.flatnonzero(inlier_mask))
 
     def filter_feature_by_index(self, indexes: List[np.int32]) -> None:
         """
@@ -576,8 +792,8 @@ class Features:
         Args:
             indexes (List[int]): List with the index of the features to keep.
         """
-        for k in set(self._values.keys()) - set(indexes):
-            del self._values[k]
+        keep = np.isin(self._track_ids[: self._n], np.asarray(list(indexes)))
+        self._keep_rows(np.flatnonzero(keep))
 
     def get_feature_by_index(self, indexes: List[np.int32]) -> dict:
         """
@@ -589,7 +805,10 @@ class Features:
         Returns:
             dict: dictionary containing the selected features with track_id as keys and Feature object as values {track_id: Feature}
         """
-        return {k: v for k, v in self._values.items() if v.track_id in indexes}
+        rows = np.flatnonzero(
+            np.isin(self._track_ids[: self._n], np.asarray(list(indexes)))
+        )
+        return {self._track_ids[r]: self._build_feature(r) for r in rows}
 
     def save_as_txt(
         self,
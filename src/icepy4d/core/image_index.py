@@ -0,0 +1,276 @@
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+import exifread
+import numpy as np
+
+from .constants import DATETIME_FMT
+
+logger = logging.getLogger(__name__)
+logging.getLogger("exifread").setLevel(logging.WARNING)
+
+# Version of the image index file (increase it when the format of the entries changes)
+IMAGE_INDEX_VERSION = 1
+
+# Minimum number of images to read the EXIF in parallel (below it, starting the worker processes is slower than reading them serially)
+MIN_IMAGES_PARALLEL = 64
+
+# Number of images sent at once to each worker process
+EXIF_CHUNK_SIZE = 32
+
+# EXIF date format
+EXIF_DATETIME_FMT = "%Y:%m:%d %H:%M:%S"
+
+
+def read_image_metadata(path: Union[str, Path]) -> dict:
+    """
+    read_image_metadata Read the timestamp and the size of an image from its EXIF, parsing only the tags needed (the EXIF parser stops at the first date tag and it does not read maker notes and thumbnails).
+
+    Args:
+        path (Union[str, Path]): The path of the image.
+
+    Returns:
+        dict: dictionary with keys "timestamp" (datetime as a string in DATETIME_FMT format), "width" and "height" (the values are None if not available).
+    """
+    metadata = {"timestamp": None, "width": None, "height": None}
+    try:
+        with open(path, "rb") as f:
+            exif = exifread.process_file(
+                f, details=False, stop_tag="DateTime", extract_thumbnail=False
+            )
+            if "Image DateTime" not in exif or "Image ImageWidth" not in exif:
+                # Date or size are not in the main IFD: read the EXIF IFD too
+                f.seek(0)
+                exif = exifread.process_file(f, details=False, extract_thumbnail=False)
+    except OSError:
+        logger.error(f"Unable to read the EXIF of image {path}")
+        return metadata
+
+    for date_tag in ["Image DateTime", "EXIF DateTimeOriginal"]:
+        if date_tag in exif:
+            try:
+                timestamp = datetime.strptime(
+                    exif[date_tag].printable, EXIF_DATETIME_FMT
+                )
+            except ValueError:
+                continue
+            metadata["timestamp"] = timestamp.strftime(DATETIME_FMT)
+            break
+    for w_tag, h_tag in [
+        ("Image ImageWidth", "Image ImageLength"),
+        ("EXIF ExifImageWidth", "EXIF ExifImageLength"),
+    ]:
+        if w_tag in exif and h_tag in exif:
+            metadata["width"] = int(exif[w_tag].values[0])
+            metadata["height"] = int(exif[h_tag].values[0])
+            break
+    return metadata
+
+
+def pair_timestamps(
+    ref_timestamps: np.ndarray,
+    timestamps: np.ndarray,
+    time_tolerance: timedelta = timedelta(seconds=60),
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    pair_timestamps Find the closest timestamp to each reference timestamp by binary search on the sorted timestamps (O(n log n) instead of O(n^2) for a linear search of each reference timestamp).
+
+    Args:
+        ref_timestamps (np.ndarray): The reference timestamps (datetime64 array).
+        timestamps (np.ndarray): The timestamps to search, sorted in ascending order (datetime64 array).
+        time_tolerance (timedelta, optional): The maximum time difference allowed to consider a timestamp as close. Defaults to 60 seconds.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The index of the closest timestamp for each reference timestamp (-1 if no timestamp is closer than the time tolerance) and the absolute time differences (timedelta64 array).
+    """
+    ref_timestamps = np.asarray(ref_timestamps, dtype="datetime64[us]")
+    timestamps = np.asarray(timestamps, dtype="datetime64[us]")
+    if len(timestamps) == 0:
+        return np.full(len(ref_timestamps), -1), np.full(
+            len(ref_timestamps), np.timedelta64("NaT")
+        )
+    right = np.clip(np.searchsorted(timestamps, ref_timestamps), 1, len(timestamps) - 1)
+    left = right - 1
+    if len(timestamps) == 1:
+        left = right = np.zeros_like(right)
+    dt_left = np.abs(ref_timestamps - timestamps[left])
+    dt_right = np.abs(timestamps[right] - ref_timestamps)
+    closest = np.where(dt_right < dt_left, right, left)
+    tdiffs = np.minimum(dt_left, dt_right)
+    closest[tdiffs >= np.timedelta64(time_tolerance)] = -1
+    return closest, tdiffs
+
+
+class ImageIndex:
+    """
+    Persistent index of the images of a folder, with their file size, modification time, timestamp and dimensions (from EXIF). The index is stored in a JSON file and it is updated incrementally: on rescan, the EXIF is read only for new or modified files, in parallel.
+
+    Attributes:
+        folder (Path): The image folder.
+        index_file (Path): The file where the index is stored (None if the index is not persistent).
+    """
+
+    def __init__(
+        self,
+        folder: Union[str, Path],
+        index_file: Union[str, Path] = None,
+        ext: str = None,
+        num_workers: int = None,
+    ) -> None:
+        """
+        __init__ Load the index from file (if available) and update it with the images currently in the folder.
+
+        Args:
+            folder (Union[str, Path]): The image folder.
+            index_file (Union[str, Path], optional): The file where the index is stored. Defaults to None (the index is not persistent).
+            ext (str, optional): Image extension for filtering files. If None is provided, all files in the folder are indexed. Defaults to None.
+            num_workers (int, optional): The number of processes used to read the EXIF. Defaults to None (number of CPUs).
+
+        Raises:
+            IsADirectoryError: If the folder does not exist.
+        """
+        self.folder = Path(folder)
+        if not self.folder.is_dir():
+            msg = f"Error: invalid input path {self.folder}"
+            logger.error(msg)
+            raise IsADirectoryError(msg)
+        self.index_file = Path(index_file) if index_file is not None else None
+        self._ext = ext
+        self._num_workers = num_workers or os.cpu_count()
+        self._entries: Dict[str, dict] = {}
+        self._load()
+        self.update()
+
+    def __repr__(self) -> str:
+        return f"ImageIndex({self.folder}) with {len(self)} images."
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def __getitem__(self, name: str) -> dict:
+        return self._entries[name]
+
+    @property
+    def names(self) -> List[str]:
+        """The names of the indexed images, sorted alphabetically."""
+        return sorted(self._entries)
+
+    def update(self) -> Tuple[int, int]:
+        """
+        update Rescan the folder: read the EXIF of new or modified images, remove deleted images from the index and save it.
+
+        Returns:
+            Tuple[int, int]: The number of images (re)read and the number of images removed from the index.
+        """
+        files = {}
+        for entry in os.scandir(self.folder):
+            if not entry.is_file() or entry.name == self._index_file_name:
+                continue
+            if self._ext is not None and not entry.name.endswith(f".{self._ext}"):
+                continue
+            stat = entry.stat()
+            files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+
+        removed = [name for name in self._entries if name not in files]
+        for name in removed:
+            del self._entries[name]
+        to_read = [
+            name
+            for name, (size, mtime) in files.items()
+            if name not in self._entries
+            or self._entries[name]["size"] != size
+            or self._entries[name]["mtime"] != mtime
+        ]
+        for name, metadata in zip(to_read, self._read_metadata(to_read)):
+            size, mtime = files[name]
+            self._entries[name] = {"size": size, "mtime": mtime, **metadata}
+
+        if to_read or removed:
+            logger.info(
+                f"Image index of {self.folder}: {len(to_read)} images read, {len(removed)} removed"
+            )
+            self.save()
+        return len(to_read), len(removed)
+
+    def paths(self) -> List[Path]:
+        """Return the paths of the indexed images, sorted alphabetically."""
+        return [self.folder / name for name in self.names]
+
+    def timestamps(self, sort: bool = True) -> Tuple[np.ndarray, List[Path]]:
+        """
+        timestamps Return the timestamps of the images (images without a timestamp are skipped).
+
+        Args:
+            sort (bool, optional): Sort the images by timestamp (otherwise they are sorted by name). Defaults to True.
+
+        Returns:
+            Tuple[np.ndarray, List[Path]]: The timestamps (datetime64 array) and the paths of the images.
+        """
+        names = [n for n in self.names if self._entries[n]["timestamp"] is not None]
+        timestamps = np.array(
+            [
+                datetime.strptime(self._entries[n]["timestamp"], DATETIME_FMT)
+                for n in names
+            ],
+            dtype="datetime64[us]",
+        )
+        if sort:
+            order = np.argsort(timestamps, kind="stable")
+            timestamps = timestamps[order]
+            names = [names[i] for i in order]
+        return timestamps, [self.folder / n for n in names]
+
+    def save(self) -> None:
+        """Write the index to file (if the index is persistent)."""
+        if self.index_file is None:
+            return
+        data = {
+            "version": IMAGE_INDEX_VERSION,
+            "folder": str(self.folder.resolve()),
+            "images": self._entries,
+        }
+        tmp = self.index_file.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.index_file)
+
+    @property
+    def _index_file_name(self) -> str:
+        if self.index_file is None or self.index_file.parent.resolve() != (
+            self.folder.resolve()
+        ):
+            return None
+        return self.index_file.name
+
+    def _load(self) -> None:
+        if self.index_file is None or not self.index_file.exists():
+            return
+        try:
+            with open(self.index_file, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as err:
+            logger.warning(f"Unable to read image index {self.index_file}: {err}")
+            return
+        if data.get("version") != IMAGE_INDEX_VERSION or data.get("folder") != str(
+            self.folder.resolve()
+        ):
+            logger.info(f"Image index {self.index_file} is outdated. Rebuilding it.")
+            return
+        self._entries = data["images"]
+
+    def _read_metadata(self, names: List[str]) -> List[dict]:
+        paths = [self.folder / name for name in names]
+        if len(paths) < MIN_IMAGES_PARALLEL or self._num_workers < 2:
+            return [read_image_metadata(p) for p in paths]
+        with ProcessPoolExecutor(max_workers=self._num_workers) as executor:
+            return list(
+                executor.map(read_image_metadata, paths, chunksize=EXIF_CHUNK_SIZE)
+            )
@@ -0,0 +1,259 @@
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple, Union
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Default maximum size (in bytes) of the decoded images kept in memory (about 10 full-resolution 6000x4000 RGB images)
+DEFAULT_MAX_BYTES = 768 * 1024**2
+
+# Default number of threads used to decode images in background (OpenCV releases the GIL while decoding)
+DEFAULT_NUM_WORKERS = 2
+
+# OpenCV flags to decode images at reduced resolution, indexed by (color, reduction factor)
+REDUCED_FLAGS = {
+    (True, 1): cv2.IMREAD_COLOR,
+    (True, 2): cv2.IMREAD_REDUCED_COLOR_2,
+    (True, 4): cv2.IMREAD_REDUCED_COLOR_4,
+    (True, 8): cv2.IMREAD_REDUCED_COLOR_8,
+    (False, 1): cv2.IMREAD_GRAYSCALE,
+    (False, 2): cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    (False, 4): cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    (False, 8): cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def decode_image(
+    path: Union[str, Path], color: bool = True, reduction: int = 1
+) -> np.ndarray:
+    """
+    decode_image Read an image with OpenCV, optionally decoding it at reduced resolution (the JPEG decoder skips the computation of the discarded pixels, so this is much faster than reading the full image and downsampling it).
+
+    Args:
+        path (Union[str, Path]): The path of the image.
+        color (bool, optional): Read the image as color (RGB) or grayscale. Defaults to True.
+        reduction (int, optional): The reduction factor of the image size (1, 2, 4 or 8). Defaults to 1 (full resolution).
+
+    Returns:
+        np.ndarray: The image as a NumPy array, or None if the image cannot be read.
+
+    Raises:
+        ValueError: If the reduction factor is not valid.
+    """
+    if (color, reduction) not in REDUCED_FLAGS:
+        raise ValueError(
+            f"Invalid reduction factor {reduction}. It must be 1, 2, 4 or 8."
+        )
+    image = cv2.imread(str(path), REDUCED_FLAGS[(color, reduction)])
+    if image is None:
+        logger.error(f"Impossible to load image {path}")
+        return None
+    if color:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    return image
+
+
+class ImageLoader:
+    """
+    Image loading service shared by all the consumers of the images of an epoch (matching, triangulation, homography warping, etc.), so that each image is decoded once.
+
+    Decoded images are kept in an LRU cache bounded by the total size (in bytes) of the arrays. Images can be decoded in background by a pool of threads (e.g., those of the next epoch while the current one is processed) with prefetch(); get() waits for an image that is being decoded instead of decoding it again. Cached arrays are read-only, as they are shared by all the consumers: copy them before modifying them in place.
+
+    Attributes:
+        max_bytes (int): The maximum size (in bytes) of the decoded images kept in memory.
+        hits (int): The number of images found in the cache (or being decoded).
+        misses (int): The number of images decoded on request.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        num_workers: int = DEFAULT_NUM_WORKERS,
+    ) -> None:
+        """
+        __init__ Initialize the image loader.
+
+        Args:
+            max_bytes (int, optional): The maximum size (in bytes) of the decoded images kept in memory. Defaults to DEFAULT_MAX_BYTES.
+            num_workers (int, optional): The number of threads used to decode images in background. Defaults to DEFAULT_NUM_WORKERS.
+        """
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(
+            max_workers=num_workers, thread_name_prefix="ImageLoader"
+        )
+        self._cache: Dict[tuple, np.ndarray] = OrderedDict()
+        self._cache_bytes = 0
+        self._pending: Dict[tuple, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self) -> str:
+        return f"ImageLoader with {len(self._cache)} images in memory ({self._cache_bytes / 1024**2:.1f} MB of {self.max_bytes / 1024**2:.1f} MB)"
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def __contains__(self, path: Union[str, Path]) -> bool:
+        return self._key(path) in self._cache
+
+    @property
+    def cache_bytes(self) -> int:
+        """The size (in bytes) of the decoded images currently in memory."""
+        return self._cache_bytes
+
+    @staticmethod
+    def _key(path: Union[str, Path], color: bool = True, reduction: int = 1) -> tuple:
+        return (str(Path(path).resolve()), color, reduction)
+
+    def get(
+        self, path: Union[str, Path], color: bool = True, reduction: int = 1
+    ) -> np.ndarray:
+        """
+        get Get a decoded image, from the cache if available, otherwise decoding it (or waiting for its prefetching to complete).
+
+        Args:
+            path (Union[str, Path]): The path of the image.
+            color (bool, optional): Read the image as color (RGB) or grayscale. Defaults to True.
+            reduction (int, optional): The reduction factor of the image size (1, 2, 4 or 8). Defaults to 1 (full resolution).
+
+        Returns:
+            np.ndarray: The image as a read-only NumPy array, or None if the image cannot be read.
+        """
+        key = self._key(path, color, reduction)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            future = self._pending.get(key)
+            if future is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if future is not None:
+            return future.result()
+        return self._load(key)
+
+    def prefetch(
+        self,
+        paths: Iterable[Union[str, Path]],
+        color: bool = True,
+        reduction: int = 1,
+    ) -> List[Future]:
+        """
+        prefetch Decode images in background, so that they are already in memory when they are requested with get().
+
+        Args:
+            paths (Iterable[Union[str, Path]]): The paths of the images.
+            color (bool, optional): Read the images as color (RGB) or grayscale. Defaults to True.
+            reduction (int, optional): The reduction factor of the image size (1, 2, 4 or 8). Defaults to 1 (full resolution).
+
+        Returns:
+            List[Future]: The futures of the images being decoded (images already in memory are skipped).
+        """
+        futures = []
+        for path in paths:
+            key = self._key(path, color, reduction)
+            with self._lock:
+                if key in self._cache:
+                    continue
+                if key in self._pending:
+                    futures.append(self._pending[key])
+                    continue
+                future = self._executor.submit(self._load, key)
+                self._pending[key] = future
+            futures.append(future)
+        return futures
+
+    def evict(self, path: Union[str, Path]) -> None:
+        """
+        evict Remove all the decoded versions of an image from the cache (e.g., after the image file has been modified).
+
+        Args:
+            path (Union[str, Path]): The path of the image.
+        """
+        path = str(Path(path).resolve())
+        with self._lock:
+            for key in [k for k in self._cache if k[0] == path]:
+                self._cache_bytes -= self._cache.pop(key).nbytes
+
+    def clear(self) -> None:
+        """Remove all the decoded images from the cache."""
+        with self._lock:
+            self._cache.clear()
+            self._cache_bytes = 0
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        shutdown Stop the background threads.
+
+        Args:
+            wait (bool, optional): Wait for the pending prefetches to complete. Defaults to True.
+        """
+        if not wait:
+            # Cancel the prefetches not started yet (shutdown(cancel_futures=True) requires Python 3.9)
+            with self._lock:
+                for key, future in list(self._pending.items()):
+                    if future.cancel():
+                        del self._pending[key]
+        self._executor.shutdown(wait=wait)
+
+    def _load(self, key: Tuple[str, bool, int]) -> np.ndarray:
+        try:
+            image = decode_image(*key)
+            if image is not None:
+                image.flags.writeable = False
+                self._put(key, image)
+            return image
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def _put(self, key: Tuple[str, bool, int], image: np.ndarray) -> None:
+        if image.nbytes > self.max_bytes:
+            logger.warning(
+                f"Image {key[0]} ({image.nbytes / 1024**2:.1f} MB) is larger than the image cache. It is not cached."
+            )
+            return
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return
+            self._cache[key] = image
+            self._cache_bytes += image.nbytes
+            while self._cache_bytes > self.max_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= evicted.nbytes
+
+
+# Process-wide image loader used by Image.value (None to read images synchronously and store them in the Image objects)
+_IMAGE_LOADER: ImageLoader = None
+
+
+def get_image_loader() -> ImageLoader:
+    """Return the process-wide image loader, or None if it is not set."""
+    return _IMAGE_LOADER
+
+
+def set_image_loader(loader: ImageLoader) -> ImageLoader:
+    """
+    set_image_loader Set the process-wide image loader used by Image.value. If an image loader was already set, its threads are stopped.
+
+    Args:
+        loader (ImageLoader): The image loader, or None to read images synchronously (and store them in the Image objects, as done without image loader).
+
+    Returns:
+        ImageLoader: The image loader.
+    """
+    global _IMAGE_LOADER
+    if _IMAGE_LOADER is not None and _IMAGE_LOADER is not loader:
+        _IMAGE_LOADER.shutdown(wait=False)
+    _IMAGE_LOADER = loader
+    return loader
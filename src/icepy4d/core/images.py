@@ -33,6 +33,7 @@ import numpy as np
 
 
 from .camera import Camera
+from .image_loader import decode_image, get_image_loader
 from .sensor_width_database import SensorWidthDatabase
 from .constants import DATE_FMT, DATETIME_FMT, TIME_FMT
 
@@ -135,6 +136,35 @@ class Image:
         self._date_time = None
         self.read_exif()
 
+    @classmethod
+    def from_metadata(
+        cls,
+        path: Union[str, Path],
+        date_time: datetime = None,
+        width: int = None,
+        height: int = None,
+    ) -> "Image":
+        """
+        from_metadata Create an Image object from known metadata (e.g., from an image index or an epoch file), without reading the EXIF from the image file (that is not required to exist). The full EXIF is read only if needed (e.g., by get_intrinsics_from_exif()).
+
+        Args:
+            path (Union[str, Path]): path to the image
+            date_time (datetime, optional): The date and time the image was taken. Defaults to None.
+            width (int, optional): The width of the image in pixels. Defaults to None.
+            height (int, optional): The height of the image in pixels. Defaults to None.
+
+        Returns:
+            Image: The Image object.
+        """
+        image = cls.__new__(cls)
+        image._path = Path(path)
+        image._value_array = None
+        image._exif_data = None
+        image._width = width
+        image._height = height
+        image._date_time = date_time
+        return image
+
     def __repr__(self) -> str:
         """Returns a string representation of the image"""
         return f"Image {self._path}"
@@ -190,6 +220,8 @@ class Image:
         Returns:
             dict: Dictionary containing Exif information
         """
+        if self._exif_data is None:
+            self.read_exif()
         return self._exif_data
 
     @property
@@ -249,12 +281,31 @@ class Image:
     @property
     def value(self) -> np.ndarray:
         """
-        Returns the image (pixel values) as numpy array
+        Returns the image (pixel values) as numpy array. If a process-wide image loader is set (see set_image_loader()), the image is read through it (and shared with the other consumers, as a read-only array) instead of being stored in the Image object.
         """
         if self._value_array is not None:
             return self._value_array
+        loader = get_image_loader()
+        if loader is not None:
+            return loader.get(self._path)
         else:
-            return self.read_image(self._path)
+            return self.read_image()
+
+    def get_reduced(self, reduction: int, col: bool = True) -> np.ndarray:
+        """
+        get_reduced Returns the image decoded at reduced resolution (e.g., to build image pyramids or previews), without decoding the full-resolution image.
+
+        Args:
+            reduction (int): The reduction factor of the image size (1, 2, 4 or 8).
+            col (bool, optional): Read the image as color (RGB) or grayscale. Defaults to True.
+
+        Returns:
+            np.ndarray: The reduced image as numpy array.
+        """
+        loader = get_image_loader()
+        if loader is not None:
+            return loader.get(self._path, color=col, reduction=reduction)
+        return decode_image(self._path, color=col, reduction=reduction)
 
     def read_image(
         self,
@@ -398,12 +449,8 @@ class Image:
         """
         self.read_image()
 
-        und_imge = cv2.undistort(
-            cv2.cvtColor(self._value_array, cv2.COLOR_RGB2BGR),
-            camera.K,
-            camera.dist,
-            None,
-            camera.K,
+        und_imge = camera.undistort_image(
+            cv2.cvtColor(self._value_array, cv2.COLOR_RGB2BGR)
         )
         if out_path is not None:
             cv2.imwrite(out_path, und_imge)
@@ -22,6 +22,7 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import itertools
 import pickle
 import numpy as np
 import logging
@@ -37,6 +38,9 @@ from .point_cloud import PointCloud
 
 logger = logging.getLogger(__name__)
 
+# Source of the version numbers of the points (unique among all the instances, so that a version identifies a state of one object)
+_VERSIONS = itertools.count(1)
+
 
 def float32_type_check(
     array: np.ndarray, cast_integers: bool = False, verbose: bool = False
@@ -169,26 +173,34 @@ class Point:
         return camera.project_point(self.coordinates.reshape(1, 3))
 
 
+# Minimum number of rows allocated when the Points storage grows
+MIN_CAPACITY = 1024
+
+
 class Points:
     """
     Points class represents a collection of several 3D Point objects.
 
+    Points are stored in a columnar layout, i.e., as contiguous numpy arrays of coordinates, colors and track_ids, together with a dictionary that maps each track_id to its row in the arrays (O(1) lookup by track_id). Point objects are built only when a single point is accessed by its track_id (e.g., points[track_id]), while slices, boolean masks or arrays of row indexes (e.g., points[mask]) return a new Points object.
+
     Attributes:
-        _values (dict): A dictionary that maps Point IDs to Point objects.
+        _xyz (np.ndarray): (capacity, 3) float32 array with the XYZ coordinates of the points.
+        _colors (np.ndarray): (capacity, 3) float32 array with the colors of the points as float values in the range [0,1].
+        _track_ids (np.ndarray): (capacity,) int32 array with the track_id of the points.
+        _index (dict): A dictionary that maps the track_ids to the rows of the arrays.
+        _n (int): The number of points stored (i.e., the number of valid rows of the arrays).
         _last_id (int): The last assigned Point ID.
-        _iter (int): An iterator used to iterate over the point IDs.
+        _iter (int): An iterator used to iterate over the points.
 
     Note:
         Use getters and setters methods to access to the features stored in Points object.
     """
 
     def __init__(self):
-        self._values = {}
-        self._last_id = -1
-        self._iter = 0
         """
         __init__ Initialize Points object.
         """
+        self.reset_points()
 
     def __len__(self) -> int:
         """
@@ -197,23 +209,27 @@ class Points:
         Returns:
             int: number of features
         """
-        return len(self._values)
+        return self._n
 
-    def __getitem__(self, track_id: np.int32) -> Point:
+    def __getitem__(
+        self, key: Union[np.int32, slice, np.ndarray, List]
+    ) -> Union[Point, "Points"]:
         """
-        __getitem__ Get Point object by calling Features instance with [] based on track_id (e.g., features[track_id] to get first Feature object)
+        __getitem__ Get Point object by calling Points instance with [] based on track_id (e.g., points[track_id]). If a slice, a boolean mask or an array of row indexes is given instead (e.g., points[mask] or points[:100]), a new Points object with the selected rows is returned.
 
         Args:
-            track_id (int): track_id of the feature to extract
+            key (Union[int, slice, np.ndarray, List]): track_id of the point to extract or rows to select.
 
         Returns:
-            Feature: requested Feature object
+            Union[Point, Points]: requested Point object or Points object with the selected rows.
         """
-        if track_id in list(self._values.keys()):
-            return self._values[track_id]
-        else:
-            logging.warning(f"Feature with track id {track_id} not available.")
+        if isinstance(key, (slice, np.ndarray, list)):
+            return self._select_rows(key)
+        row = self._index.get(key)
+        if row is None:
+            logging.warning(f"Feature with track id {key} not available.")
             return None
+        return self._build_point(row)
 
     def __contains__(self, track_id: np.int32) -> bool:
         """
@@ -225,10 +241,7 @@ class Points:
         Returns:
             bool: True if the feature is present.
         """
-        if track_id in list(self._values.keys()):
-            return True
-        else:
-            return False
+        return track_id in self._index
 
     def __delitem__(self, track_id: np.int32) -> bool:
         """
@@ -239,12 +252,17 @@ class Points:
 
         Returns:
             bool: True if the item was present and deleted, False otherwise.
+
+        Note:
+            Deleting a point compacts the storage arrays (O(n)). To remove many points at once, use filter_point_by_mask() or filter_points_by_index().
         """
         if track_id not in self:
             logging.warning(f"Feature with track_id {track_id} not present")
             return False
         else:
-            del self._values[track_id]
+            keep = np.ones(self._n, dtype=bool)
+            keep[self._index[track_id]] = False
+            self._keep_rows(np.flatnonzero(keep))
             return True
 
     def __iter__(self):
@@ -253,7 +271,7 @@ class Points:
 
     def __next__(self):
         while self._iter < len(self):
-            f = self._values[self._iter]
+            f = self._build_point(self._iter)
             self._iter += 1
             return f
         else:
@@ -263,12 +281,39 @@ class Points:
     def __repr__(self):
         return f"Points object with {len(self)} points"
 
+    def __getstate__(self) -> dict:
+        """Pickle only the valid rows of the storage arrays. The track_id index is rebuilt when unpickling."""
+        state = self.__dict__.copy()
+        for key in ["_xyz", "_colors", "_track_ids"]:
+            state[key] = state[key][: self._n].copy()
+        del state["_index"]
+        del state["_sorted_rows"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        if "_values" in state:
+            # Points pickled with the former storage (a dict of Point objects)
+            self.reset_points()
+            values = state["_values"]
+            if values:
+                pts = list(values.values())
+                self._append_rows(
+                    np.array([[p._X, p._Y, p._Z] for p in pts], dtype=np.float32),
+                    np.array(list(values.keys()), dtype=np.int32),
+                    np.array([p._color for p in pts], dtype=np.float32),
+                )
+            self._last_id = state.get("_last_id", self._last_id)
+            return
+        self.__dict__.update(state)
+        self._rebuild_index()
+        self._touch()
+
     @property
     def num_points(self):
         """
         num_features Number of points stored in Features object
         """
-        return len(self._values)
+        return self._n
 
     @property
     def last_track_id(self):
@@ -277,6 +322,20 @@ class Points:
         """
         return self._last_id
 
+    @property
+    def version(self) -> int:
+        """
+        version Version of the points, changed by every in-place modification (e.g., appended, filtered or transformed points). It can be used as a key to cache quantities computed from the points.
+        """
+        return self._version
+
+    @property
+    def track_ids(self) -> np.ndarray:
+        """
+        track_ids Get the track_id of all the points as a (n,) int32 numpy array (view of the internal storage, do not modify it in place).
+        """
+        return self._track_ids[: self._n]
+
     def get_track_ids(self) -> Tuple[np.int32]:
         """
         get_track_it Get a ordered tuple of track_id of all the points
@@ -284,7 +343,141 @@ class Points:
         Returns:
             tuple: tuple of size (n,) with track_ids
         """
-        return tuple([np.int32(x) for x in self._values.keys()])
+        return tuple(self._track_ids[: self._n])
+
+    def take(self, track_ids: Union[np.ndarray, List[np.int32]]) -> np.ndarray:
+        """
+        take Get the rows of the storage arrays (i.e., the position in the arrays returned by the *_to_numpy() methods) of a set of track_ids, with a single vectorized lookup.
+
+        Args:
+            track_ids (Union[np.ndarray, List[np.int32]]): track_ids to look for.
+
+        Returns:
+            np.ndarray: (n,) int64 array with the row of each track_id, or -1 if the track_id is not present.
+        """
+        track_ids = np.asarray(track_ids).reshape(-1)
+        if self._n == 0 or len(track_ids) == 0:
+            return np.full(len(track_ids), -1, dtype=np.int64)
+        if self._sorted_rows is None:
+            self._sorted_rows = np.argsort(self._track_ids[: self._n], kind="stable")
+        sorted_ids = self._track_ids[: self._n][self._sorted_rows]
+        pos = np.searchsorted(sorted_ids, track_ids)
+        pos = np.minimum(pos, self._n - 1)
+        found = sorted_ids[pos] == track_ids
+        return np.where(found, self._sorted_rows[pos], -1).astype(np.int64)
+
+    def contains_many(self, track_ids: Union[np.ndarray, List[np.int32]]) -> np.ndarray:
+        """
+        contains_many Check which of a set of track_ids are present in the Points object, with a single vectorized lookup.
+
+        Args:
+            track_ids (Union[np.ndarray, List[np.int32]]): track_ids to check.
+
+        Returns:
+            np.ndarray: (n,) boolean array, True if the corresponding track_id is present.
+        """
+        return self.take(track_ids) > -1
+
+    def _reserve(self, n_new: int) -> None:
+        """
+        _reserve Make room for n_new additional rows in the storage arrays. The capacity is (at least) doubled every time the arrays must grow, so that appending points is amortized O(1) per point.
+
+        Args:
+            n_new (int): number of rows to be appended.
+        """
+        required = self._n + n_new
+        capacity = len(self._track_ids)
+        if required <= capacity:
+            return
+        new_capacity = max(required, 2 * capacity, MIN_CAPACITY)
+
+        def grow(array: np.ndarray) -> np.ndarray:
+            new = np.empty((new_capacity,) + array.shape[1:], dtype=array.dtype)
+            new[: self._n] = array[: self._n]
+            return new
+
+        self._xyz = grow(self._xyz)
+        self._colors = grow(self._colors)
+        self._track_ids = grow(self._track_ids)
+
+    def _append_rows(
+        self,
+        xyz: np.ndarray,
+        track_ids: np.ndarray,
+        colors: np.ndarray = None,
+    ) -> None:
+        """
+        _append_rows Append new rows to the storage arrays. Inputs are assumed to be already validated.
+
+        Args:
+            xyz (np.ndarray): nx3 float32 array with XYZ coordinates.
+            track_ids (np.ndarray): (n,) int32 array with the track_ids (not present yet in Points).
+            colors (np.ndarray, optional): nx3 float32 array with colors in the range [0,1]. Defaults to None (black).
+        """
+        n_new = len(track_ids)
+        if n_new == 0:
+            return
+        self._reserve(n_new)
+        start, stop = self._n, self._n + n_new
+        self._xyz[start:stop] = xyz
+        self._colors[start:stop] = 0.0 if colors is None else colors
+        self._track_ids[start:stop] = track_ids
+        self._index.update(zip(track_ids.tolist(), range(start, stop)))
+        self._sorted_rows = None
+        self._n = stop
+        self._last_id = int(track_ids[-1])
+        self._touch()
+
+    def _keep_rows(self, rows: np.ndarray) -> None:
+        """
+        _keep_rows Keep only the given rows of the storage arrays (array of integer indexes) and rebuild the track_id index.
+        """
+        self._xyz = self._xyz[rows]
+        self._colors = self._colors[rows]
+        self._track_ids = self._track_ids[rows]
+        self._n = len(self._track_ids)
+        self._rebuild_index()
+        self._touch()
+
+    def _rebuild_index(self) -> None:
+        """_rebuild_index Rebuild the dictionary mapping track_ids to rows."""
+        self._index = dict(zip(self._track_ids[: self._n].tolist(), range(self._n)))
+        self._sorted_rows = None
+
+    def _touch(self) -> None:
+        """_touch Assign a new version to the points (to be called after every in-place modification)."""
+        self._version = next(_VERSIONS)
+
+    def _select_rows(self, rows: Union[slice, np.ndarray, List]) -> "Points":
+        """
+        _select_rows Build a new Points object with the rows selected by a slice, a boolean mask or an array of row indexes.
+        """
+        if not isinstance(rows, slice):
+            rows = np.asarray(rows)
+            if rows.dtype == bool:
+                assert len(rows) == len(
+                    self
+                ), "Invalid shape of the boolean mask. It must have the same lenght as the number of points stored in the Points object."
+                rows = np.flatnonzero(rows)
+        new = Points()
+        new._xyz = self._xyz[: self._n][rows].copy()
+        new._colors = self._colors[: self._n][rows].copy()
+        new._track_ids = self._track_ids[: self._n][rows].copy()
+        new._n = len(new._track_ids)
+        new._rebuild_index()
+        if new._n > 0:
+            new._last_id = int(new._track_ids[-1])
+        return new
+
+    def _build_point(self, row: int) -> Point:
+        """
+        _build_point Build a Point object from a row of the storage arrays.
+        """
+        return Point(
+            self._xyz[row].copy(),
+            track_id=self._track_ids[row],
+            color=self._colors[row].copy(),
+        )
 
     def append_point(self, new_point: Point) -> None:
         """
@@ -296,8 +489,48 @@ class Points:
         assert isinstance(
             new_point, Point
         ), "Invalid input feature. It must be Point object"
-        self._last_id += 1
-        self._values[self._last_id] = new_point
+        self._append_rows(
+            new_point.coordinates.reshape(1, 3),
+            np.array([self._last_id + 1], dtype=np.int32),
+            new_point.color.reshape(1, 3),
+        )
+
+    def append_points(self, points: "Points") -> None:
+        """
+        append_points append all the points of another Points object (vectorized concatenation). Track_ids must not be already present in the current Points object.
+
+        Args:
+            points (Points): Points object to be appended.
+
+        Raises:
+            ValueError: if some of the track_ids of the incoming points are already present.
+        """
+        assert isinstance(points, Points), "Invalid input. It must be Points object"
+        if len(points) == 0:
+            return
+        duplicated = self.contains_many(points.track_ids)
+        if np.any(duplicated):
+            raise ValueError(
+                f"Points with track_ids {points.track_ids[duplicated][:10]} are already present in Points object."
+            )
+        self._append_rows(points.to_numpy(), points.track_ids, points.colors_to_numpy())
+
+    @classmethod
+    def concatenate(cls, points_list: List["Points"]) -> "Points":
+        """
+        concatenate Concatenate several Points objects into a new Points object.
+
+        Args:
+            points_list (List[Points]): list of Points objects with unique track_ids.
+
+        Returns:
+            Points: new Points object with all the points.
+        """
+        new = cls()
+        new._reserve(sum(len(p) for p in points_list))
+        for points in points_list:
+            new.append_points(points)
+        return new
 
     def set_last_track_id(self, last_track_id: np.int32) -> None:
         """
@@ -339,7 +572,9 @@ class Points:
         coordinates = float32_type_check(coordinates, cast_integers=True)
 
         if track_ids is None:
-            ids = range(self._last_id + 1, self._last_id + len(coordinates) + 1)
+            ids = np.arange(
+                self._last_id + 1, self._last_id + len(coordinates) + 1, dtype=np.int32
+            )
         else:
             assert isinstance(track_ids, list) or isinstance(
                 track_ids, tuple
@@ -348,24 +583,21 @@ class Points:
                 coordinates
             ), "invalid size of track_id input. It must be a list of the same size of the input arrays."
 
-            try:
-                for id in track_ids:
-                    if id in list(self._values.keys()):
-                        msg = f"Feature with track_id {id} is already present in Features object. Ignoring input track_id and assigning progressive track_ids."
-                        logging.error(msg)
-                        raise ValueError(msg)
-                ids = track_ids
-            except ValueError:
-                ids = range(self._last_id + 1, self._last_id + len(coordinates) + 1)
+            ids = np.array(track_ids, dtype=np.int32)
+            duplicated = self.contains_many(ids)
+            if np.any(duplicated):
+                msg = f"Feature with track_id {ids[duplicated][0]} is already present in Features object. Ignoring input track_id and assigning progressive track_ids."
+                logging.error(msg)
+                ids = np.arange(
+                    self._last_id + 1,
+                    self._last_id + len(coordinates) + 1,
+                    dtype=np.int32,
+                )
 
         if colors is not None:
-            colors = np.float32(colors)
-        else:
-            colors = [None for _ in range(len(coordinates))]
+            colors = np.float32(colors).reshape(-1, 3)
 
-        for id, coor, col in zip(ids, coordinates, colors):
-            self._values[id] = Point(coor, id, color=col)
-            self._last_id = id
+        self._append_rows(coordinates, ids, colors)
 
     def to_numpy(self) -> np.ndarray:
         """
@@ -373,12 +605,11 @@ class Points:
 
         Returns:
             np.ndarray: nx3 numpy array of type np.float32 with XYZ coordinates
-        """
-        pts = np.empty((len(self), 3), dtype=np.float32)
-        for i, v in enumerate(self._values.values()):
-            pts[i, :] = np.float32(v.coordinates)
 
-        return pts
+        Note:
+            The returned array is a view of the internal storage (no copy is made). Copy it before modifying it in place.
+        """
+        return self._xyz[: self._n]
 
     def colors_to_numpy(self, as_uint8: bool = False) -> np.ndarray:
         """
@@ -389,18 +620,12 @@ class Points:
             as_uint8 (bool, optional): Convert RGB colors to integers numbers at 8bit (np.uint8) with values ranging between 0 and 255. Defaults to False.
 
         Returns:
-            np.ndarray: nx3 numpy array with RGB colors (either in as floating numbers or integers ranging between [0, 255])
+            np.ndarray: nx3 numpy array with RGB colors (either in as floating numbers or integers ranging between [0, 255]). Float colors are a view of the internal storage (no copy is made).
         """
         if as_uint8:
-            cols = np.empty((len(self), 3), dtype=np.uint8)
-            for i, v in enumerate(self._values.values()):
-                cols[i, :] = np.uint8(v.color * 255)
+            return (self._colors[: self._n] * 255).astype(np.uint8)
         else:
-            cols = np.empty((len(self), 3), dtype=np.float32)
-            for i, v in enumerate(self._values.values()):
-                cols[i, :] = np.float32(v.color)
-
-        return cols
+            return self._colors[: self._n]
 
     def to_point_cloud(self) -> PointCloud:
         """
@@ -409,15 +634,55 @@ class Points:
         Returns:
             PointCloud: PointCloud object
         """
-
-        pcd = PointCloud(points3d=self.to_numpy(), points_col=self.colors_to_numpy())
+        # Open3D Vector3dVector has a fast (single memcpy) path only for
+        # float64 C-contiguous arrays
+        pcd = PointCloud(
+            points3d=self.to_numpy().astype(np.float64),
+            points_col=self.colors_to_numpy().astype(np.float64),
+        )
         return pcd
 
+    def transform(self, T: np.ndarray) -> None:
+        """
+        transform Apply a rigid (or similarity) transformation to all the points in place.
+
+        Args:
+            T (np.ndarray): 4x4 (or 3x4) transformation matrix in homogeneous coordinates.
+        """
+        assert isinstance(T, np.ndarray) and T.shape in [
+            (3, 4),
+            (4, 4),
+        ], "Invalid transformation matrix. It must be a 4x4 or 3x4 numpy array."
+        xyz = self._xyz[: self._n].astype(np.float64)
+        self._xyz[: self._n] = xyz @ T[:3, :3].T + T[:3, 3]
+        self._touch()
+
+    def set_coordinates(self, coordinates: np.ndarray) -> None:
+        """
+        set_coordinates Replace the coordinates of all the points in place (e.g., with the coordinates refined by a bundle adjustment), keeping their track_ids and colors.
+
+        Args:
+            coordinates (np.ndarray): nx3 array with the new XYZ coordinates, in the same order as to_numpy().
+        """
+        coordinates = np.asarray(coordinates)
+        assert coordinates.shape == (
+            self._n,
+            3,
+        ), "Invalid shape of coordinates array. It must be a nx3 numpy array with a row for each point."
+        self._xyz[: self._n] = coordinates
+        self._touch()
+
     def reset_points(self):
         """Reset Points instance"""
-        self._values = {}
+        self._xyz = np.empty((0, 3), dtype=np.float32)
+        self._colors = np.empty((0, 3), dtype=np.float32)
+        self._track_ids = np.empty(0, dtype=np.int32)
+        self._index = {}
+        self._sorted_rows = None
+        self._n = 0
         self._last_id = -1
         self._iter = 0
+        self._touch()
 
     def filter_point_by_mask(
         self, inlier_mask: List[bool], verbose: bool = False
@@ -429,6 +694,7 @@ class Points:
             inlier_mask (List[bool]): boolean mask with True value in correspondance of the points to keep. inlier_mask must have the same length as the total number of features.
             verbose (bool): log number of filtered features. Defaults to False.
         """
+        inlier_mask = np.asarray(inlier_mask)
         assert np.array_equal(
             inlier_mask, inlier_mask.astype(bool)
         ), "Invalid type of input argument for inlier_mask. It must be a boolean vector with the same lenght as the number of points stored in the Points object."
@@ -436,9 +702,12 @@ class Points:
             self
         ), "Invalid shape of input argument for inlier_mask. It must be a boolean vector with the same lenght as the number of points stored in the Points object."
 
-        feat_idx = list(self._values.keys())
-        indexes = [feat_idx[i] for i, x in enumerate(inlier_mask) if x]
-        self.filter_points_by_index(indexes, verbose=verbose)
+        n_old = len(self)
+        self._keep_rows(np.flatnonzero(inlier_mask))
+        if verbose:
+            logging.info(
+                f"Points filtered: {n_old-len(self)}/{n_old} removed. New Points size: {len(self)}."
+            )
 
     def filter_points_by_index(
         self, indexes: List[np.int32], verbose: bool = False
@@ -451,14 +720,15 @@ class Points:
             verbose (bool): log number of filtered points. Defaults to False.
 
         """
-        new_dict = {k: v for k, v in self._values.items() if v.track_id in indexes}
+        n_old = len(self)
+        keep = np.isin(self._track_ids[: self._n], np.asarray(list(indexes)))
+        self._keep_rows(np.flatnonzero(keep))
         if verbose:
             logging.info(
-                f"Points filtered: {len(self)-len(new_dict)}/{len(self)} removed. New Points size: {len(new_dict)}."
+                f"Points filtered: {n_old-len(self)}/{n_old} removed. New Points size: {len(self)}."
             )
-        last_id = list(new_dict.keys())[-1]
-        self._values = new_dict
-        self._last_id = last_id
+        if len(self) > 0:
+            self._last_id = int(self._track_ids[self._n - 1])
 
     def get_points_by_index(self, indexes: List[np.int32]) -> dict:
         """
@@ -470,7 +740,10 @@ class Points:
         Returns:
             dict: dictionary containing the selected points with track_id as keys and Point object as values {track_id: Point}
         """
-        return {k: v for k, v in self._values.items() if v.track_id in indexes}
+        rows = np.flatnonzero(
+            np.isin(self._track_ids[: self._n], np.asarray(list(indexes)))
+        )
+        return {self._track_ids[r]: self._build_point(r) for r in rows}
 
     def save_as_txt(
         self,
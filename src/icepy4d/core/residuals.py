@@ -0,0 +1,399 @@
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+import h5py
+import numpy as np
+
+from .camera import Camera
+from .constants import DATETIME_FMT
+
+logger = logging.getLogger(__name__)
+
+# Statistics of the residuals written to the CSV file (same as pandas.DataFrame.describe)
+DESCRIBE_STATS = ["count", "mean", "std", "min", "25%", "50%", "75%", "max"]
+
+# Statistics of the residual norms stored in the time-series file for each camera
+SUMMARY_STATS = ["count", "mean", "rms", "median", "p95", "max"]
+
+
+@dataclass
+class CameraResiduals:
+    """
+    Reprojection residuals of the 3D points in one camera.
+
+    Attributes:
+        track_ids (np.ndarray): The track_id of the points observed by the camera (n,).
+        observed (np.ndarray): The image coordinates of the features (nx2).
+        projected (np.ndarray): The image coordinates of the projected points (nx2).
+        residuals (np.ndarray): The residuals as projected - observed (nx2).
+        norm (np.ndarray): The norm of the residuals (n,).
+    """
+
+    track_ids: np.ndarray
+    observed: np.ndarray
+    projected: np.ndarray
+    residuals: np.ndarray
+    norm: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.track_ids)
+
+
+def compute_camera_residuals(camera: Camera, points, features) -> CameraResiduals:
+    """
+    compute_camera_residuals Project in one batch the 3D points observed in a camera (i.e., with a feature with the same track_id) and compute their residuals with respect to the features.
+
+    Args:
+        camera (Camera): The camera.
+        points (Points): The 3D points.
+        features (Features): The features of the camera.
+
+    Returns:
+        CameraResiduals: The residuals of the points observed by the camera, sorted as the features.
+    """
+    rows = points.take(features.track_ids)
+    valid = rows > -1
+    track_ids = features.track_ids[valid].copy()
+    observed = features.kpts_to_numpy()[valid].astype(np.float64)
+    if len(track_ids) == 0:
+        projected = np.empty((0, 2))
+    else:
+        xyz = points.to_numpy()[rows[valid]].astype(np.float64)
+        projected = camera.project_point(xyz).astype(np.float64)
+    residuals = projected - observed
+    return CameraResiduals(
+        track_ids=track_ids,
+        observed=observed,
+        projected=projected,
+        residuals=residuals,
+        norm=np.linalg.norm(residuals, axis=1),
+    )
+
+
+def describe(values: np.ndarray) -> np.ndarray:
+    """
+    describe Compute the statistics of DESCRIBE_STATS (ignoring NaN values) of each column of a 2D array, with the same definitions as pandas.DataFrame.describe.
+
+    Args:
+        values (np.ndarray): The (n, m) array.
+
+    Returns:
+        np.ndarray: The (len(DESCRIBE_STATS), m) array of statistics.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    stats = np.full((len(DESCRIBE_STATS), values.shape[1]), np.nan)
+    count = np.count_nonzero(~np.isnan(values), axis=0)
+    stats[0] = count
+    valid = count > 0
+    if not valid.any():
+        return stats
+    v = values[:, valid]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        stats[1, valid] = np.nanmean(v, axis=0)
+        stats[2, valid] = np.where(
+            count[valid] > 1, np.nanstd(v, axis=0, ddof=1), np.nan
+        )
+    stats[3:, valid] = np.nanpercentile(v, [0, 25, 50, 75, 100], axis=0)
+    return stats
+
+
+class ReprojectionResiduals:
+    """
+    Reprojection residuals of the 3D points of an Epoch in all its cameras. The residuals of each camera are computed in one batch and cached: they are recomputed only if the camera parameters, the features of the camera or the 3D points change (see Camera.version, Points.version and Features.version). Note that modifications made directly on the arrays returned by Points.to_numpy() or Features.kpts_to_numpy() are not tracked.
+
+    The cached residuals are used to compute the statistics, to export them to file, to plot them and to find the outliers. Use Epoch.residuals to get the (cached) ReprojectionResiduals object of an Epoch.
+    """
+
+    def __init__(self, epoch) -> None:
+        """
+        __init__ Initialize the residual engine of an Epoch.
+
+        Args:
+            epoch (Epoch): The epoch.
+        """
+        self._epoch = epoch
+        self._cache: Dict[str, Tuple[tuple, CameraResiduals]] = {}
+        self._table = None
+
+    def __repr__(self) -> str:
+        return f"ReprojectionResiduals of {self._epoch!r}"
+
+    @property
+    def cams(self) -> List[str]:
+        """The cameras with both camera parameters and features."""
+        cameras = self._epoch.cameras or {}
+        features = self._epoch.features or {}
+        return [cam for cam in cameras if cam in features]
+
+    def get(self, cam: str) -> CameraResiduals:
+        """
+        get Get the residuals of one camera, computing them only if the camera parameters, its features or the 3D points have changed since the last call.
+
+        Args:
+            cam (str): The camera name.
+
+        Returns:
+            CameraResiduals: The residuals of the points observed by the camera.
+        """
+        camera = self._epoch.cameras[cam]
+        features = self._epoch.features[cam]
+        points = self._epoch.points
+        key = (camera.version, features.version, points.version)
+        cached = self._cache.get(cam)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        residuals = compute_camera_residuals(camera, points, features)
+        self._cache[cam] = (key, residuals)
+        return residuals
+
+    def compute(self) -> Dict[str, CameraResiduals]:
+        """
+        compute Get the residuals of all the cameras.
+
+        Returns:
+            Dict[str, CameraResiduals]: dictionary mapping each camera name to its residuals.
+        """
+        return {cam: self.get(cam) for cam in self.cams}
+
+    def clear(self) -> None:
+        """Clear the cached residuals."""
+        self._cache = {}
+        self._table = None
+
+    def table(self) -> Tuple[np.ndarray, List[str], np.ndarray]:
+        """
+        table Get the residuals of all the cameras as a table with one row per 3D point observed by at least one camera.
+
+        Returns:
+            Tuple[np.ndarray, List[str], np.ndarray]: The track_ids of the rows (n,), the names of the columns (x_<cam>, y_<cam> and norm_<cam> for each camera and global_norm, the mean of the norms in all the cameras observing the point) and the (n, m) array of the residuals (NaN where a camera does not observe a point).
+        """
+        residuals = self.compute()
+        key = tuple((cam, self._cache[cam][0]) for cam in residuals)
+        if self._table is not None and self._table[0] == key:
+            return self._table[1]
+        if residuals:
+            track_ids = np.unique(
+                np.concatenate([r.track_ids for r in residuals.values()])
+            )
+        else:
+            track_ids = np.empty(0, dtype=np.int32)
+        columns = []
+        values = np.full((len(track_ids), 3 * len(residuals) + 1), np.nan)
+        for i, (cam, res) in enumerate(residuals.items()):
+            rows = np.searchsorted(track_ids, res.track_ids)
+            values[rows, 3 * i : 3 * i + 2] = res.residuals
+            values[rows, 3 * i + 2] = res.norm
+            columns.extend([f"x_{cam}", f"y_{cam}", f"norm_{cam}"])
+        columns.append("global_norm")
+        with np.errstate(invalid="ignore"):
+            if residuals:
+                counts = np.count_nonzero(~np.isnan(values[:, 2:-1:3]), axis=1)
+                values[:, -1] = np.nansum(values[:, 2:-1:3], axis=1) / counts
+        self._table = (key, (track_ids, columns, values))
+        return track_ids, columns, values
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        stats Compute the statistics of the residuals (see DESCRIBE_STATS) of each column of the residual table (including the track_id column, for compatibility with the former export).
+
+        Returns:
+            Dict[str, Dict[str, float]]: dictionary mapping each statistic to a dictionary with the value of each column.
+        """
+        track_ids, columns, values = self.table()
+        columns = ["track_id"] + columns
+        values = np.column_stack([track_ids.astype(np.float64), values])
+        stats = describe(values)
+        return {
+            stat: dict(zip(columns, stats[i].tolist()))
+            for i, stat in enumerate(DESCRIBE_STATS)
+        }
+
+    def summary(self) -> Dict[str, float]:
+        """
+        summary Compute a compact summary of the residual norms of each camera and of the global norm (see SUMMARY_STATS), e.g. to be stored in a time series.
+
+        Returns:
+            Dict[str, float]: dictionary mapping <stat>_<cam> (and <stat>_global) to its value.
+        """
+        norms = {cam: res.norm for cam, res in self.compute().items()}
+        _, _, values = self.table()
+        norms["global"] = values[:, -1]
+        summary = {}
+        for name, norm in norms.items():
+            n = len(norm)
+            summary[f"count_{name}"] = float(n)
+            if n == 0:
+                for stat in SUMMARY_STATS[1:]:
+                    summary[f"{stat}_{name}"] = np.nan
+                continue
+            median, p95 = np.percentile(norm, [50, 95])
+            summary[f"mean_{name}"] = float(norm.mean())
+            summary[f"rms_{name}"] = float(np.sqrt(np.mean(norm**2)))
+            summary[f"median_{name}"] = float(median)
+            summary[f"p95_{name}"] = float(p95)
+            summary[f"max_{name}"] = float(norm.max())
+        return summary
+
+    def outliers(self, threshold: float, cam: str = None) -> np.ndarray:
+        """
+        outliers Find the 3D points with a reprojection error larger than a threshold.
+
+        Args:
+            threshold (float): The threshold on the norm of the residuals [px].
+            cam (str, optional): Check the residuals of this camera only. Defaults to None (check the global norm, i.e. the mean of the norms in all the cameras).
+
+        Returns:
+            np.ndarray: The track_ids of the outliers.
+        """
+        if cam is not None:
+            res = self.get(cam)
+            return res.track_ids[res.norm > threshold]
+        track_ids, _, values = self.table()
+        return track_ids[values[:, -1] > threshold]
+
+    def filter_outliers(self, threshold: float, cam: str = None) -> np.ndarray:
+        """
+        filter_outliers Remove from the Epoch the 3D points with a reprojection error larger than a threshold (see outliers()).
+
+        Args:
+            threshold (float): The threshold on the norm of the residuals [px].
+            cam (str, optional): Check the residuals of this camera only. Defaults to None (check the global norm).
+
+        Returns:
+            np.ndarray: The track_ids of the removed points.
+        """
+        outliers = self.outliers(threshold, cam)
+        if len(outliers):
+            points = self._epoch.points
+            keep = ~np.isin(points.track_ids, outliers)
+            points.filter_point_by_mask(keep)
+            logger.info(
+                f"Removed {len(outliers)} points with reprojection error larger than {threshold} px"
+            )
+        return outliers
+
+    def write_stats(self, path: Union[str, Path], sep: str = ",") -> None:
+        """
+        write_stats Append the statistics of the residuals (see stats()) as a new line of a CSV file, with the epoch timestamp as first field. The header is written if the file does not exist.
+
+        Args:
+            path (Union[str, Path]): The path of the CSV file.
+            sep (str, optional): The separator. Defaults to ",".
+        """
+        path = Path(path)
+        stats = self.stats()
+        items = [(stat, col) for stat in DESCRIBE_STATS for col in stats[stat]]
+        if not path.exists():
+            with open(path, "w") as f:
+                header = sep.join(["ep"] + [f"{stat}-{col}" for stat, col in items])
+                f.write(header + "\n")
+        with open(path, "a") as f:
+            line = sep.join(
+                [str(self._epoch.timestamp)]
+                + [str(stats[stat][col]) for stat, col in items]
+            )
+            f.write(line + "\n")
+
+    def plot(self, cam: str, image: np.ndarray = None, title: str = None) -> None:
+        """
+        plot Plot the projections of the 3D points on the image of a camera, colored by the norm of the residuals (see visualization.plot_projection_error).
+
+        Args:
+            cam (str): The camera name.
+            image (np.ndarray, optional): The image (RGB). Defaults to None (read the image of the epoch).
+            title (str, optional): The title of the plot. Defaults to None (camera name and epoch).
+        """
+        from ..visualization import plot_projection_error
+
+        res = self.get(cam)
+        if image is None:
+            image = self._epoch.images[cam].value
+        if title is None:
+            title = f"{cam} - {self._epoch}"
+        plot_projection_error(
+            res.projected, res.norm, image, title=title, convert_BRG2RGB=False
+        )
+
+
+class ResidualTimeSeries:
+    """
+    Columnar time series of the reprojection residual summaries of the epochs (see ReprojectionResiduals.summary()), stored in a HDF5 file with one extendible dataset per column. Epochs are appended one by one, so the file can be written while the epochs are processed and read back as arrays without parsing text.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        """
+        __init__ Initialize the time series.
+
+        Args:
+            path (Union[str, Path]): The path of the HDF5 file (created when the first epoch is appended).
+        """
+        self.path = Path(path)
+
+    def __repr__(self) -> str:
+        return f"ResidualTimeSeries({self.path})"
+
+    def __len__(self) -> int:
+        if not self.path.exists():
+            return 0
+        with h5py.File(self.path, "r") as f:
+            return len(f["timestamp"])
+
+    def append(self, epoch, summary: Dict[str, float] = None) -> None:
+        """
+        append Append the residual summary of an epoch. Columns not present yet are created (and set to NaN for the previous epochs); columns not present in the summary are set to NaN.
+
+        Args:
+            epoch (Epoch): The epoch.
+            summary (Dict[str, float], optional): The summary to store. Defaults to None (epoch.residuals.summary()).
+        """
+        if summary is None:
+            summary = epoch.residuals.summary()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with h5py.File(self.path, "a") as f:
+            if "timestamp" not in f:
+                f.create_dataset(
+                    "timestamp",
+                    shape=(0,),
+                    maxshape=(None,),
+                    dtype=h5py.string_dtype(),
+                    chunks=True,
+                )
+                f.create_group("columns")
+            n = len(f["timestamp"])
+            f["timestamp"].resize((n + 1,))
+            f["timestamp"][n] = epoch.timestamp.strftime(DATETIME_FMT)
+            columns = f["columns"]
+            for name in summary:
+                if name not in columns:
+                    columns.create_dataset(
+                        name,
+                        data=np.full(n, np.nan),
+                        maxshape=(None,),
+                        chunks=True,
+                    )
+            for name, dset in columns.items():
+                dset.resize((n + 1,))
+                dset[n] = summary.get(name, np.nan)
+
+    def read(self) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        read Read the time series.
+
+        Returns:
+            Tuple[np.ndarray, Dict[str, np.ndarray]]: The timestamps of the epochs (datetime64 array) and a dictionary mapping each column to its values.
+        """
+        if not self.path.exists():
+            return np.empty(0, dtype="datetime64[us]"), {}
+        with h5py.File(self.path, "r") as f:
+            timestamps = np.array(
+                [
+                    datetime.strptime(ts.decode(), DATETIME_FMT)
+                    for ts in f["timestamp"][:]
+                ],
+                dtype="datetime64[us]",
+            )
+            columns = {name: dset[:] for name, dset in f["columns"].items()}
+        return timestamps, columns
@@ -2,7 +2,6 @@ import numpy as np
 import logging
 from pathlib import Path
 from typing import Union
-import pandas as pd
 
 from icepy4d.thirdparty.transformations import euler_from_matrix
 from icepy4d.core.epoch import Epoch
@@ -67,7 +66,8 @@ def write_reprojection_error_to_file(
     keypoints in each camera. The statistics include the mean, standard
     deviation, minimum, 25th percentile, median, 75th percentile, and maximum
     of the reprojection errors for each camera and a global norm computed as
-    the mean of all cameras' reprojection errors.
+    the mean of all cameras' reprojection errors. The residuals are computed
+    (and cached) by the residual engine of the epoch (see Epoch.residuals).
 
     Args:
         output_path (Union[Path, str]): The path to the output CSV file.
@@ -82,42 +82,7 @@ def write_reprojection_error_to_file(
 
     """
 
-    cams = list(epoch.cameras.keys())
-    output_path = Path(output_path)
-
-    residuals = pd.DataFrame()
-    for cam_key, camera in epoch.cameras.items():
-        feat = epoch.features[cam_key]
-        projections = camera.project_point(epoch.points.to_numpy())
-        res = projections - feat.kpts_to_numpy()
-        res_norm = np.linalg.norm(res, axis=1)
-        residuals["track_id"] = feat.get_track_ids()
-        residuals[f"x_{cam_key}"] = res[:, 0]
-        residuals[f"y_{cam_key}"] = res[:, 1]
-        residuals[f"norm_{cam_key}"] = res_norm
-
-    # Compute global norm as mean of all cameras
-    residuals["global_norm"] = np.mean(
-        residuals[[f"norm_{x}" for x in cams]].to_numpy(), axis=1
-    )
-    res_stas = residuals.describe()
-    res_stas_s = res_stas.stack()
-
-    if not output_path.exists():
-        with open(output_path, "w") as f:
-            header_line = (
-                "ep"
-                + sep
-                + f"{sep}".join([f"{x[0]}-{x[1]}" for x in res_stas_s.index.to_list()])
-            )
-            f.write(header_line + "\n")
-    with open(output_path, "a") as f:
-        line = (
-            str(epoch.timestamp)
-            + sep
-            + f"{sep}".join([str(x) for x in res_stas_s.to_list()])
-        )
-        f.write(line + "\n")
+    epoch.residuals.write_stats(output_path, sep=sep)
 
 
 """
@@ -1,3 +1,25 @@
-from .enums import Quality, GeometricVerification, TileSelection  # noqa: F401
-from .geometric_verification import geometric_verification  # noqa: F401
+from .enums import (  # noqa: F401
+    Quality,
+    GeometricVerification,
+    GuidedMatching,
+    TileSelection,
+)
+from .geometric_verification import (  # noqa: F401
+    geometric_verification,
+    register_estimator,
+    verify_matches,
+)
+from .feature_cache import FeatureCache  # noqa: F401
+from .guided_matching import (  # noqa: F401
+    epipolar_distance,
+    epipolar_filter,
+    fundamental_from_cameras,
+)
+from .model_registry import (  # noqa: F401
+    clear_models,
+    get_model,
+    quantize_model,
+    register_model,
+    set_num_threads,
+)
 from .matchers import *  # noqa: F401
@@ -16,6 +16,10 @@ class GeometricVerification(Enum):
     NONE = 1
     PYDEGENSAC = 2
     MAGSAC = 3
+    USAC_DEFAULT = 4
+    USAC_ACCURATE = 5
+    USAC_PROSAC = 6
+    LO_RANSAC = 7
 
 
 class Quality(Enum):
@@ -25,3 +29,11 @@ class Quality(Enum):
     MEDIUM = 2
     HIGH = 3
     HIGHEST = 4
+
+
+class GuidedMatching(Enum):
+    """Enumeration for guided matching modes, constrained by a prior fundamental matrix."""
+
+    NONE = 1
+    FILTER = 2  # filter the matches by their epipolar distance after matching
+    MASK = 3  # restrict the candidate matches to an epipolar band before matching
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FEATURE_CACHE_VERSION = 2
+FEATURE_KEYS = ("keypoints", "descriptors", "scores")
+
+
+class FeatureCache:
+    """
+    Two-tier cache of local features (keypoints, descriptors and scores) extracted from images, so that the detector is run only once per image (or image tile), even if the image is matched several times.
+
+    Features are stored in an in-memory LRU cache, bounded by the total size of the cached arrays, and optionally on disk, where they persist across runs. Each entry is a separate .npz file written atomically (temporary file + os.replace), so that several processes can share the same cache directory. Entries are identified by a key computed with FeatureCache.make_key() from the image path, its modification time and size, the detector configuration and the geometry of the processed image (e.g., its size after resizing and the tile limits).
+
+    Attributes:
+        cache_dir (Path): The directory of the on-disk cache (None if the cache is in-memory only).
+        max_memory (int): The maximum size (in bytes) of the features kept in memory.
+        hits (int): The number of cache hits.
+        misses (int): The number of cache misses.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Union[str, Path] = None,
+        max_memory: int = 512 * 1024**2,
+    ) -> None:
+        """
+        __init__ Initialize the feature cache.
+
+        Args:
+            cache_dir (Union[str, Path], optional): The directory where the on-disk cache is stored. Defaults to None (in-memory cache only).
+            max_memory (int, optional): The maximum size (in bytes) of the features kept in memory. Defaults to 512 MB.
+        """
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_memory = max_memory
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self) -> str:
+        return f"FeatureCache with {len(self._memory)} entries in memory ({self._memory_size / 1024**2:.1f} MB), disk: {self.cache_dir}"
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+    def __contains__(self, key: str) -> bool:
+        if key in self._memory:
+            return True
+        path = self._disk_path(key)
+        return path is not None and path.exists()
+
+    def _disk_path(self, key: str) -> Path:
+        if self.cache_dir is None:
+            return None
+        return self.cache_dir / key[:2] / f"{key}.npz"
+
+    @staticmethod
+    def make_key(
+        image_path: Union[str, Path],
+        config: dict,
+        **params,
+    ) -> str:
+        """
+        make_key Build the cache key of the features extracted from an image.
+
+        Args:
+            image_path (Union[str, Path]): The path of the image file. Its modification time and size are part of the key, so that the features are re-extracted if the file changes.
+            config (dict): The configuration of the detector (e.g., keypoint threshold and maximum number of keypoints).
+            **params: Any other parameter that affects the extracted features (e.g., the shape of the resized image or the limits of the tile).
+
+        Returns:
+            str: The cache key.
+        """
+        image_path = Path(image_path).resolve()
+        stat = image_path.stat()
+        key = {
+            "version": FEATURE_CACHE_VERSION,
+            "path": str(image_path),
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "config": config,
+            "params": params,
+        }
+        key = json.dumps(key, sort_keys=True, default=str)
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def get(self, key: str) -> Dict[str, np.ndarray]:
+        """
+        get Get the features stored with a given key, looking first in memory and then on disk. Features found on disk are moved to the memory cache.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            Dict[str, np.ndarray]: dictionary with keys "keypoints" (nx2), "descriptors" (mxn) and "scores" (n,), or None if the key is not in the cache.
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+        features = self._read_from_disk(key)
+        with self._lock:
+            if features is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._put_in_memory(key, features)
+        return features
+
+    def put(self, key: str, features: Dict[str, np.ndarray]) -> None:
+        """
+        put Store the features extracted from an image.
+
+        Args:
+            key (str): The cache key.
+            features (Dict[str, np.ndarray]): dictionary with keys "keypoints" (nx2), "descriptors" (mxn) and "scores" (n,).
+        """
+        features = {k: np.asarray(features[k]) for k in FEATURE_KEYS}
+        self._put_in_memory(key, features)
+        self._write_to_disk(key, features)
+
+    def clear(self, disk: bool = False) -> None:
+        """
+        clear Remove all the features from the memory cache (and from the disk cache if disk is True).
+        """
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+        if disk and self.cache_dir is not None:
+            for path in self.cache_dir.glob("*/*.npz"):
+                path.unlink(missing_ok=True)
+
+    def _put_in_memory(self, key: str, features: Dict[str, np.ndarray]) -> None:
+        size = sum(v.nbytes for v in features.values())
+        if size > self.max_memory:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+            self._memory[key] = features
+            self._memory_size += size
+            while self._memory_size > self.max_memory:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= sum(v.nbytes for v in evicted.values())
+
+    def _read_from_disk(self, key: str) -> Dict[str, np.ndarray]:
+        path = self._disk_path(key)
+        if path is None or not path.exists():
+            return None
+        try:
+            with np.load(path) as f:
+                return {k: f[k] for k in FEATURE_KEYS}
+        except (OSError, ValueError, KeyError) as err:
+            logger.warning(f"Unable to read cached features {path}: {err}")
+            return None
+
+    def _write_to_disk(self, key: str, features: Dict[str, np.ndarray]) -> None:
+        path = self._disk_path(key)
+        if path is None or path.exists():
+            return
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, **features)
+        os.replace(tmp, path)
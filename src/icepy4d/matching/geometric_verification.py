@@ -1,13 +1,303 @@
-import importlib
 import logging
+import time
+from dataclasses import dataclass
+from multiprocessing import Pool
+from typing import Callable, Dict, List, Tuple
 
 import cv2
 import numpy as np
 
 from .enums import GeometricVerification
 
+try:
+    import pydegensac
+except ImportError:
+    pydegensac = None
+
 logger = logging.getLogger(__name__)
 
+# Minimum number of matches to estimate a fundamental matrix (8-point algorithm)
+MIN_MATCHES = 8
+
+# Number of hypotheses after which the PROSAC sampling pool covers all the matches
+PROSAC_GROWTH_ITERS = 1000
+
+# Maximum number of elements (hypotheses x matches) scored at once by LO-RANSAC
+LO_RANSAC_CHUNK_SIZE = 2**21
+
+# Registry of the estimators of the fundamental matrix, indexed by method
+ESTIMATORS: Dict[GeometricVerification, Callable] = {}
+
+
+def register_estimator(method: GeometricVerification) -> Callable:
+    """
+    register_estimator Decorator to register a function as the estimator of the fundamental matrix used by geometric_verification() for a given method.
+
+    The estimator must have the signature estimator(mkpts0, mkpts1, threshold, confidence, max_iters, mconf=None, **kwargs) and return a tuple (F, inlMask), where F is the 3x3 fundamental matrix (or None if the estimation failed) and inlMask is a boolean array of the inliers.
+
+    Args:
+        method (GeometricVerification): The method implemented by the estimator.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        ESTIMATORS[method] = func
+        return func
+
+    return decorator
+
+
+@dataclass
+class VerificationStage:
+    """Statistics of a stage of geometric verification."""
+
+    name: str
+    n_matches: int
+    n_inliers: int
+    time: float
+
+    @property
+    def inlier_ratio(self) -> float:
+        return self.n_inliers / self.n_matches if self.n_matches else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.n_inliers}/{self.n_matches} inliers ({self.inlier_ratio:.1%}) in {self.time:.3f} s"
+
+
+def _prosac_order(mconf: np.ndarray, n: int) -> np.ndarray:
+    """Order of the matches by decreasing match confidence (identity if mconf is None)."""
+    if mconf is None or len(mconf) != n:
+        return np.arange(n)
+    return np.argsort(-np.asarray(mconf), kind="stable")
+
+
+@register_estimator(GeometricVerification.PYDEGENSAC)
+def pydegensac_estimator(
+    mkpts0: np.ndarray,
+    mkpts1: np.ndarray,
+    threshold: float = 1,
+    confidence: float = 0.9999,
+    max_iters: int = 10000,
+    mconf: np.ndarray = None,
+    laf_consistensy_coef: float = -1.0,
+    error_type: str = "sampson",
+    symmetric_error_check: bool = True,
+    enable_degeneracy_check: bool = True,
+    **kwargs,
+) -> Tuple[np.ndarray, np.ndarray]:
+    if pydegensac is None:
+        raise ImportError("Pydegensac not available.")
+    F, inlMask = pydegensac.findFundamentalMatrix(
+        mkpts0,
+        mkpts1,
+        px_th=threshold,
+        conf=confidence,
+        max_iters=max_iters,
+        laf_consistensy_coef=laf_consistensy_coef,
+        error_type=error_type,
+        symmetric_error_check=symmetric_error_check,
+        enable_degeneracy_check=enable_degeneracy_check,
+    )
+    return F, np.asarray(inlMask, dtype=bool)
+
+
+def _opencv_estimator(flag: int, sort_by_confidence: bool = False) -> Callable:
+    def estimator(
+        mkpts0: np.ndarray,
+        mkpts1: np.ndarray,
+        threshold: float = 1,
+        confidence: float = 0.9999,
+        max_iters: int = 10000,
+        mconf: np.ndarray = None,
+        **kwargs,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # USAC_PROSAC expects the matches sorted by decreasing quality
+        order = _prosac_order(mconf if sort_by_confidence else None, len(mkpts0))
+        F, inliers = cv2.findFundamentalMat(
+            mkpts0[order], mkpts1[order], flag, threshold, confidence, max_iters
+        )
+        inlMask = np.zeros(len(mkpts0), dtype=bool)
+        if F is None or inliers is None:
+            return None, inlMask
+        inlMask[order] = inliers.ravel() > 0
+        return F[:3], inlMask
+
+    return estimator
+
+
+for _method, _flag, _sort in [
+    (GeometricVerification.MAGSAC, cv2.USAC_MAGSAC, False),
+    (GeometricVerification.USAC_DEFAULT, cv2.USAC_DEFAULT, False),
+    (GeometricVerification.USAC_ACCURATE, cv2.USAC_ACCURATE, False),
+    (GeometricVerification.USAC_PROSAC, cv2.USAC_PROSAC, True),
+]:
+    register_estimator(_method)(_opencv_estimator(_flag, _sort))
+
+
+def _normalization_matrix(points: np.ndarray) -> np.ndarray:
+    centroid = points.mean(axis=0)
+    scale = np.sqrt(2) / max(np.mean(np.linalg.norm(points - centroid, axis=1)), 1e-12)
+    return np.array(
+        [
+            [scale, 0, -scale * centroid[0]],
+            [0, scale, -scale * centroid[1]],
+            [0, 0, 1],
+        ]
+    )
+
+
+def _eight_point(x0: np.ndarray, x1: np.ndarray) -> np.ndarray:
+    """
+    Batched (normalized) 8-point algorithm.
+
+    Args:
+        x0 (np.ndarray): Normalized points on image 0 (B x n x 2), n >= 8.
+        x1 (np.ndarray): Normalized points on image 1 (B x n x 2).
+
+    Returns:
+        np.ndarray: The rank-2 fundamental matrices in normalized coordinates (B x 3 x 3).
+    """
+    u0, v0 = x0[..., 0], x0[..., 1]
+    u1, v1 = x1[..., 0], x1[..., 1]
+    ones = np.ones_like(u0)
+    A = np.stack([u1 * u0, u1 * v0, u1, v1 * u0, v1 * v0, v1, u0, v0, ones], axis=-1)
+    F = np.linalg.svd(A)[2][:, -1].reshape(-1, 3, 3)
+    U, S, Vt = np.linalg.svd(F)
+    S[:, 2] = 0
+    return U @ (S[..., None] * Vt)
+
+
+def sampson_error(F: np.ndarray, x0: np.ndarray, x1: np.ndarray) -> np.ndarray:
+    """
+    sampson_error Compute the squared Sampson error of a set of correspondences for one or several fundamental matrices.
+
+    Args:
+        F (np.ndarray): The fundamental matrices (B x 3 x 3) or a single 3x3 matrix.
+        x0 (np.ndarray): The points on image 0 in homogeneous coordinates (n x 3).
+        x1 (np.ndarray): The points on image 1 in homogeneous coordinates (n x 3).
+
+    Returns:
+        np.ndarray: The squared Sampson error (B x n, or n if F is a single matrix).
+    """
+    Fx0 = F @ x0.T
+    Ftx1 = np.swapaxes(F, -1, -2) @ x1.T
+    x1Fx0 = np.sum(x1.T * Fx0, axis=-2)
+    denom = Fx0[..., 0, :] ** 2 + Fx0[..., 1, :] ** 2
+    denom += Ftx1[..., 0, :] ** 2 + Ftx1[..., 1, :] ** 2
+    return x1Fx0**2 / np.maximum(denom, 1e-12)
+
+
+@register_estimator(GeometricVerification.LO_RANSAC)
+def lo_ransac_estimator(
+    mkpts0: np.ndarray,
+    mkpts1: np.ndarray,
+    threshold: float = 1,
+    confidence: float = 0.9999,
+    max_iters: int = 10000,
+    mconf: np.ndarray = None,
+    lo_iters: int = 5,
+    seed: int = 0,
+    **kwargs,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    lo_ransac_estimator Estimate the fundamental matrix with a pure NumPy LO-RANSAC. Hypotheses are generated and scored in vectorized batches with the normalized 8-point algorithm and the Sampson error. Every time a better model is found, it is refined by least squares on its inliers (local optimization) and the number of iterations is adapted to the inlier ratio, so that the loop exits as soon as the required confidence is reached. If the match confidence is given, minimal samples are drawn PROSAC-style from a pool of the most confident matches that grows progressively to all the matches.
+
+    Args:
+        mkpts0 (np.ndarray): The matched points on image 0 (nx2).
+        mkpts1 (np.ndarray): The matched points on image 1 (nx2).
+        threshold (float, optional): The maximum Sampson distance (in pixels) of the inliers. Defaults to 1.
+        confidence (float, optional): The required confidence of the result. Defaults to 0.9999.
+        max_iters (int, optional): The maximum number of hypotheses. Defaults to 10000.
+        mconf (np.ndarray, optional): The match confidence, used for PROSAC sampling. Defaults to None (uniform sampling).
+        lo_iters (int, optional): The maximum number of local optimization steps. Defaults to 5.
+        seed (int, optional): The seed of the random generator. Defaults to 0.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The fundamental matrix and the boolean mask of the inliers.
+    """
+    n = len(mkpts0)
+    inlMask = np.zeros(n, dtype=bool)
+    if n < MIN_MATCHES:
+        return None, inlMask
+
+    rng = np.random.default_rng(seed)
+    order = _prosac_order(mconf, n)
+    pts0 = np.asarray(mkpts0, dtype=np.float64)[order]
+    pts1 = np.asarray(mkpts1, dtype=np.float64)[order]
+    T0, T1 = _normalization_matrix(pts0), _normalization_matrix(pts1)
+    x0 = np.hstack([pts0, np.ones((n, 1))]) @ T0.T
+    x1 = np.hstack([pts1, np.ones((n, 1))]) @ T1.T
+    h0 = np.hstack([pts0, np.ones((n, 1))])
+    h1 = np.hstack([pts1, np.ones((n, 1))])
+    th2 = threshold**2
+
+    def denormalize(F: np.ndarray) -> np.ndarray:
+        return T1.T @ F @ T0
+
+    def local_optimization(inliers: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        F, count = None, 0
+        for _ in range(lo_iters):
+            if inliers.sum() < MIN_MATCHES:
+                break
+            F_lo = denormalize(
+                _eight_point(x0[None, inliers, :2], x1[None, inliers, :2])[0]
+            )
+            inliers_lo = sampson_error(F_lo, h0, h1) <= th2
+            if inliers_lo.sum() <= count:
+                break
+            F, inliers, count = F_lo, inliers_lo, inliers_lo.sum()
+        return F, inliers
+
+    best_F, best_inliers, best_count = None, inlMask, 0
+    batch_size = int(np.clip(LO_RANSAC_CHUNK_SIZE // n, 1, 256))
+    n_iters, it = max_iters, 0
+    while it < n_iters:
+        b = min(batch_size, n_iters - it)
+
+        # Draw minimal samples without replacement from the (PROSAC) pool
+        pool = np.minimum(
+            n,
+            np.maximum(
+                2 * MIN_MATCHES,
+                np.ceil(n * (it + np.arange(1, b + 1)) / PROSAC_GROWTH_ITERS),
+            ),
+        ).astype(int)
+        if mconf is None:
+            pool[:] = n
+        keys = rng.random((b, pool.max()))
+        keys[np.arange(pool.max())[None] >= pool[:, None]] = np.inf
+        samples = np.argpartition(keys, MIN_MATCHES - 1, axis=1)[:, :MIN_MATCHES]
+        it += b
+
+        # Estimate and score the hypotheses
+        F = T1.T @ _eight_point(x0[samples, :2], x1[samples, :2]) @ T0
+        counts = np.sum(sampson_error(F, h0, h1) <= th2, axis=1)
+        best = int(np.argmax(counts))
+        if counts[best] <= best_count:
+            continue
+
+        inliers = sampson_error(F[best], h0, h1) <= th2
+        F_lo, inliers_lo = local_optimization(inliers)
+        if F_lo is not None and inliers_lo.sum() >= counts[best]:
+            best_F, best_inliers = F_lo, inliers_lo
+        else:
+            best_F, best_inliers = F[best], inliers
+        best_count = best_inliers.sum()
+
+        # Adaptive number of iterations
+        w = best_count / n
+        if w >= 1:
+            break
+        n_iters = min(
+            max_iters,
+            int(np.ceil(np.log(1 - confidence) / np.log1p(-(w**MIN_MATCHES)))),
+        )
+
+    if best_F is None:
+        return None, inlMask
+    inlMask[order] = best_inliers
+    return best_F / np.linalg.norm(best_F), inlMask
+
+
 def geometric_verification(
     mkpts0: np.ndarray = None,
     mkpts1: np.ndarray = None,
@@ -19,12 +309,13 @@ def geometric_verification(
     error_type: str = "sampson",
     symmetric_error_check: bool = True,
     enable_degeneracy_check: bool = True,
-) -> dict:
+    mconf: np.ndarray = None,
+) -> Tuple[np.ndarray, np.ndarray]:
     """
     Computes the fundamental matrix and inliers between the two images using geometric verification.
 
     Args:
-        method (str): The method used for geometric verification. Can be one of ['pydegensac', 'opencv'].
+        method (GeometricVerification): The method used for geometric verification. It must be one of the methods in the ESTIMATORS registry (PYDEGENSAC, MAGSAC, USAC_DEFAULT, USAC_ACCURATE, USAC_PROSAC, LO_RANSAC).
         threshold (float): Pixel error threshold for considering a correspondence an inlier.
         confidence (float): The required confidence level in the results.
         max_iters (int): The maximum number of iterations for estimating the fundamental matrix.
@@ -32,17 +323,17 @@ def geometric_verification(
         error_type (str): The error function used for computing the residuals in the RANSAC loop.
         symmetric_error_check (bool): If True, performs an additional check on the residuals in the opposite direction.
         enable_degeneracy_check (bool): If True, enables the check for degeneracy using SVD.
+        mconf (np.ndarray): The match confidence, used to sort the matches for PROSAC sampling (USAC_PROSAC and LO_RANSAC). Defaults to None.
 
     Returns:
-        np.ndarray: A Boolean array that masks the correspondences that were identified as inliers.
-
-    TODO: allow input parameters for both pydegensac and MAGSAC.
+        Tuple[np.ndarray, np.ndarray]: The fundamental matrix and a Boolean array that masks the correspondences that were identified as inliers. If the estimation fails, all the correspondences are kept.
 
     """
 
     assert isinstance(
         method, GeometricVerification
-    ), "Invalid method. It must be a GeometricVerification enum in GeometricVerification.PYDEGENSAC or GeometricVerification.MAGSAC."
+    ), "Invalid method. It must be a GeometricVerification enum."
+    assert method in ESTIMATORS, f"No estimator registered for {method}."
 
     F = None
     inlMask = np.ones(len(mkpts0), dtype=bool)
@@ -51,52 +342,143 @@ def geometric_verification(
         logger.warning("Not enough matches to perform geometric verification.")
         return F, inlMask
 
-    if method == GeometricVerification.PYDEGENSAC:
-        try:
-            pydegensac = importlib.import_module("pydegensac")
-            fallback = False
-        except:
-            logger.error(
-                "Pydegensac not available. Using MAGSAC++ (OpenCV) for geometric verification."
-            )
-            fallback = True
-
-    if method == GeometricVerification.PYDEGENSAC and not fallback:
-        try:
-            F, inlMask = pydegensac.findFundamentalMatrix(
-                mkpts0,
-                mkpts1,
-                px_th=threshold,
-                conf=confidence,
-                max_iters=max_iters,
-                laf_consistensy_coef=laf_consistensy_coef,
-                error_type=error_type,
-                symmetric_error_check=symmetric_error_check,
-                enable_degeneracy_check=enable_degeneracy_check,
-            )
-            logger.info(
-                f"Pydegensac found {inlMask.sum()} inliers ({inlMask.sum()*100/len(mkpts0):.2f}%)"
-            )
-        except Exception as err:
-            # Fall back to MAGSAC++ if pydegensac fails
-            logger.error(
-                f"{err}. Unable to perform geometric verification with Pydegensac. Trying using MAGSAC++ (OpenCV) instead."
-            )
-            fallback = True
+    if method == GeometricVerification.PYDEGENSAC and pydegensac is None:
+        logger.error(
+            "Pydegensac not available. Using MAGSAC++ (OpenCV) for geometric verification."
+        )
+        method = GeometricVerification.MAGSAC
 
-    if method == GeometricVerification.MAGSAC or fallback:
-        try:
-            F, inliers = cv2.findFundamentalMat(
-                mkpts0, mkpts1, cv2.USAC_MAGSAC, 0.5, 0.999, 100000
-            )
-            inlMask = (inliers > 0).squeeze()
-            logger.info(
-                f"MAGSAC++ found {inlMask.sum()} inliers ({inlMask.sum()*100/len(mkpts0):.2f}%)"
+    kwargs = dict(
+        threshold=threshold,
+        confidence=confidence,
+        max_iters=max_iters,
+        mconf=mconf,
+        laf_consistensy_coef=laf_consistensy_coef,
+        error_type=error_type,
+        symmetric_error_check=symmetric_error_check,
+        enable_degeneracy_check=enable_degeneracy_check,
+    )
+    try:
+        F, inlMask = ESTIMATORS[method](mkpts0, mkpts1, **kwargs)
+    except Exception as err:
+        if method == GeometricVerification.MAGSAC:
+            logger.error(f"{err}. Unable to perform geometric verification.")
+            return None, np.ones(len(mkpts0), dtype=bool)
+        # Fall back to MAGSAC++ if the estimator fails
+        logger.error(
+            f"{err}. Unable to perform geometric verification with {method.name}. Trying using MAGSAC++ (OpenCV) instead."
+        )
+        return geometric_verification(
+            mkpts0,
+            mkpts1,
+            GeometricVerification.MAGSAC,
+            threshold,
+            confidence,
+            max_iters,
+        )
+
+    if F is None:
+        logger.warning(f"{method.name} failed to estimate the fundamental matrix.")
+        return None, np.ones(len(mkpts0), dtype=bool)
+
+    logger.info(
+        f"{method.name} found {inlMask.sum()} inliers ({inlMask.sum()*100/len(mkpts0):.2f}%)"
+    )
+
+    return F, inlMask
+
+
+def _verify_group(args: tuple) -> np.ndarray:
+    mkpts0, mkpts1, mconf, kwargs = args
+    return geometric_verification(mkpts0, mkpts1, mconf=mconf, **kwargs)[1]
+
+
+def verify_matches(
+    mkpts0: np.ndarray,
+    mkpts1: np.ndarray,
+    method: GeometricVerification = GeometricVerification.PYDEGENSAC,
+    threshold: float = 1,
+    confidence: float = 0.9999,
+    max_iters: int = 10000,
+    mconf: np.ndarray = None,
+    tile_ids: np.ndarray = None,
+    n_workers: int = 1,
+    **kwargs,
+) -> Tuple[np.ndarray, np.ndarray, List[VerificationStage]]:
+    """
+    verify_matches Run geometric verification in stages. If tile_ids is given, the matches of each tile pair are first verified independently (in parallel worker processes if n_workers > 1), which removes most of the outliers with small RANSAC problems. Then the surviving matches are verified globally.
+
+    Args:
+        mkpts0 (np.ndarray): The matched points on image 0 (nx2).
+        mkpts1 (np.ndarray): The matched points on image 1 (nx2).
+        method (GeometricVerification, optional): The estimator. Defaults to GeometricVerification.PYDEGENSAC.
+        threshold (float, optional): Pixel error threshold for considering a correspondence an inlier. Defaults to 1.
+        confidence (float, optional): The required confidence level in the results. Defaults to 0.9999.
+        max_iters (int, optional): The maximum number of iterations. Defaults to 10000.
+        mconf (np.ndarray, optional): The match confidence, used for PROSAC sampling. Defaults to None.
+        tile_ids (np.ndarray, optional): The id of the tile pair each match comes from (n,). Tile pairs with less than MIN_MATCHES matches are left to the global check. Defaults to None (global verification only).
+        n_workers (int, optional): The number of worker processes for the per-tile verification. Defaults to 1.
+        **kwargs: Additional parameters of geometric_verification().
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, List[VerificationStage]]: The fundamental matrix, the Boolean mask of the inliers and the statistics of each stage.
+    """
+    gv_kwargs = dict(
+        method=method,
+        threshold=threshold,
+        confidence=confidence,
+        max_iters=max_iters,
+        **kwargs,
+    )
+    n = len(mkpts0)
+    inlMask = np.ones(n, dtype=bool)
+    stages = []
+
+    if tile_ids is not None and n > 0:
+        start = time.perf_counter()
+        _, inverse, counts = np.unique(
+            tile_ids, return_inverse=True, return_counts=True
+        )
+        groups = [
+            np.flatnonzero(inverse == i) for i in np.flatnonzero(counts >= MIN_MATCHES)
+        ]
+        tasks = [
+            (
+                mkpts0[idx],
+                mkpts1[idx],
+                mconf[idx] if mconf is not None else None,
+                gv_kwargs,
             )
-        except Exception as err:
-            logger.error(
-                f"{err}. Unable to perform geometric verification with MAGSAC++."
+            for idx in groups
+        ]
+        if n_workers > 1 and len(tasks) > 1:
+            with Pool(processes=min(n_workers, len(tasks))) as pool:
+                masks = pool.map(_verify_group, tasks)
+        else:
+            masks = [_verify_group(task) for task in tasks]
+        for idx, mask in zip(groups, masks):
+            inlMask[idx] = mask
+        stages.append(
+            VerificationStage(
+                "tiles", n, int(inlMask.sum()), time.perf_counter() - start
             )
-            inlMask = np.ones(len(mkpts0), dtype=bool)
+        )
 
-    return F, inlMask
+    start = time.perf_counter()
+    idx = np.flatnonzero(inlMask)
+    F, mask = geometric_verification(
+        mkpts0[idx],
+        mkpts1[idx],
+        mconf=mconf[idx] if mconf is not None else None,
+        **gv_kwargs,
+    )
+    inlMask[idx] = mask
+    stages.append(
+        VerificationStage(
+            "global", len(idx), int(inlMask.sum()), time.perf_counter() - start
+        )
+    )
+    for stage in stages:
+        logger.info(f"Geometric verification - {stage}")
+
+    return F, inlMask, stages
@@ -0,0 +1,110 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Default half-width (in pixels) of the epipolar band used by guided matching
+EPIPOLAR_THRESHOLD = 20
+
+# Maximum number of elements of the distance matrix computed at once by epipolar_band_mask
+EPIPOLAR_MASK_CHUNK_SIZE = 2**24
+
+
+def _skew(v: np.ndarray) -> np.ndarray:
+    x, y, z = np.asarray(v, dtype=np.float64).flatten()
+    return np.array([[0, -z, y], [z, 0, -x], [-y, x, 0]])
+
+
+def _to_homogeneous(points: np.ndarray) -> np.ndarray:
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    return np.hstack([points, np.ones((len(points), 1))])
+
+
+def fundamental_from_cameras(camera0, camera1) -> np.ndarray:
+    """
+    fundamental_from_cameras Compute the fundamental matrix between two calibrated cameras with known exterior orientation (e.g., the cameras of the previous epoch), such that x1' * F * x0 = 0. Lens distortion is neglected.
+
+    Args:
+        camera0 (Camera): The first camera.
+        camera1 (Camera): The second camera.
+
+    Returns:
+        np.ndarray: The 3x3 fundamental matrix, normalized to unit Frobenius norm.
+    """
+    R = camera1.R @ camera0.R.T
+    t = camera1.t - R @ camera0.t
+    F = np.linalg.inv(camera1.K).T @ _skew(t) @ R @ np.linalg.inv(camera0.K)
+    return F / np.linalg.norm(F)
+
+
+def epipolar_distance(F: np.ndarray, pts0: np.ndarray, pts1: np.ndarray) -> np.ndarray:
+    """
+    epipolar_distance Compute the symmetric epipolar distance of a set of correspondences, i.e. the maximum between the distance of pts1 from the epipolar lines of pts0 in image 1 and the distance of pts0 from the epipolar lines of pts1 in image 0.
+
+    Args:
+        F (np.ndarray): The 3x3 fundamental matrix (x1' * F * x0 = 0).
+        pts0 (np.ndarray): The points on image 0 (nx2).
+        pts1 (np.ndarray): The corresponding points on image 1 (nx2).
+
+    Returns:
+        np.ndarray: The epipolar distance (in pixels) of each correspondence (n,).
+    """
+    x0, x1 = _to_homogeneous(pts0), _to_homogeneous(pts1)
+    l1 = x0 @ F.T  # epipolar lines in image 1
+    l0 = x1 @ F  # epipolar lines in image 0
+    algebraic = np.abs(np.sum(x1 * l1, axis=1))
+    d1 = algebraic / np.linalg.norm(l1[:, :2], axis=1)
+    d0 = algebraic / np.linalg.norm(l0[:, :2], axis=1)
+    return np.maximum(d0, d1)
+
+
+def epipolar_filter(
+    F: np.ndarray, pts0: np.ndarray, pts1: np.ndarray, threshold: float
+) -> np.ndarray:
+    """
+    epipolar_filter Select the correspondences whose symmetric epipolar distance is within a threshold.
+
+    Args:
+        F (np.ndarray): The 3x3 fundamental matrix (x1' * F * x0 = 0).
+        pts0 (np.ndarray): The points on image 0 (nx2).
+        pts1 (np.ndarray): The corresponding points on image 1 (nx2).
+        threshold (float): The maximum epipolar distance (in pixels).
+
+    Returns:
+        np.ndarray: Boolean mask of the correspondences within the epipolar band (n,).
+    """
+    if len(pts0) == 0:
+        return np.zeros(0, dtype=bool)
+    return epipolar_distance(F, pts0, pts1) <= threshold
+
+
+def epipolar_band_mask(
+    F: np.ndarray, pts0: np.ndarray, pts1: np.ndarray, threshold: float
+) -> np.ndarray:
+    """
+    epipolar_band_mask Compute which pairs of points of two images are compatible with the epipolar geometry, i.e. the candidate correspondences whose symmetric epipolar distance is within a threshold. The distance matrix is computed in chunks of rows to bound the memory usage.
+
+    Args:
+        F (np.ndarray): The 3x3 fundamental matrix (x1' * F * x0 = 0).
+        pts0 (np.ndarray): The points on image 0 (mx2).
+        pts1 (np.ndarray): The points on image 1 (nx2).
+        threshold (float): The maximum epipolar distance (in pixels).
+
+    Returns:
+        np.ndarray: Boolean matrix (mxn), True where the pair (pts0[i], pts1[j]) is a candidate correspondence.
+    """
+    x0, x1 = _to_homogeneous(pts0), _to_homogeneous(pts1)
+    l1 = x0 @ F.T  # epipolar lines of pts0 in image 1 (mx3)
+    l1 /= np.linalg.norm(l1[:, :2], axis=1, keepdims=True)
+    l0 = x1 @ F  # epipolar lines of pts1 in image 0 (nx3)
+    l0 /= np.linalg.norm(l0[:, :2], axis=1, keepdims=True)
+
+    mask = np.zeros((len(x0), len(x1)), dtype=bool)
+    chunk = max(1, EPIPOLAR_MASK_CHUNK_SIZE // max(len(x1), 1))
+    for start in range(0, len(x0), chunk):
+        stop = start + chunk
+        d1 = np.abs(l1[start:stop] @ x1.T)  # distance of pts1 from the lines
+        d0 = np.abs(x0[start:stop] @ l0.T)  # distance of pts0 from the lines
+        mask[start:stop] = np.maximum(d0, d1) <= threshold
+    return mask
@@ -1,7 +1,6 @@
 import logging
 import os
 from abc import ABC, abstractmethod
-from copy import deepcopy
 from dataclasses import dataclass
 from itertools import product
 from pathlib import Path
@@ -17,10 +16,25 @@ import numpy as np
 import torch
 from easydict import EasyDict as edict
 
-from icepy4d.matching.enums import GeometricVerification, Quality, TileSelection
-from icepy4d.matching.geometric_verification import geometric_verification
-from icepy4d.matching.tiling import Tiler
-from icepy4d.thirdparty.SuperGlue.models.matching import Matching
+from icepy4d.matching.enums import (
+    GeometricVerification,
+    GuidedMatching,
+    Quality,
+    TileSelection,
+)
+from icepy4d.matching.feature_cache import FeatureCache
+from icepy4d.matching.guided_matching import (
+    EPIPOLAR_THRESHOLD,
+    epipolar_band_mask,
+    epipolar_filter,
+    fundamental_from_cameras,
+)
+from icepy4d.matching.geometric_verification import (
+    VerificationStage,
+    verify_matches,
+)
+from icepy4d.matching.model_registry import get_model, set_num_threads
+from icepy4d.matching.tiling import MIN_KEYPOINTS_PER_TILE, Tiler
 from icepy4d.thirdparty.SuperGlue.models.utils import make_matching_plot
 from icepy4d.utils import AverageTimer, timeit
 
@@ -46,6 +60,93 @@ class FeaturesBase:
     scores: np.ndarray = None
 
 
+@dataclass
+class Preselection:
+    """
+    Matches found on downsampled images by the preselection stage. They are used to select the tile pairs to match and to share the keypoint budget among the tiles (they are not used by geometric verification nor by guided matching).
+
+    Attributes:
+        keypoints0 (np.ndarray): The matched keypoints on image 0 (nx2), scaled to the coordinates of the input images.
+        keypoints1 (np.ndarray): The matched keypoints on image 1 (nx2), scaled to the coordinates of the input images.
+        mconf (np.ndarray): The match confidence (n,).
+        n_down (int): The number of pyramid levels used to downsample the images.
+    """
+
+    keypoints0: np.ndarray
+    keypoints1: np.ndarray
+    mconf: np.ndarray
+    n_down: int
+
+    def __len__(self) -> int:
+        return len(self.keypoints0)
+
+
+def preselection_pyramid_levels(image_height: int) -> int:
+    """
+    Number of pyramid levels (i.e., halvings of the image size) used to downsample an image for the preselection stage.
+    """
+    if image_height > 8000:
+        return 4
+    elif image_height > 4000:
+        return 3
+    elif image_height > 2000:
+        return 2
+    else:
+        return 1
+
+
+def _reduction_levels(shape: Tuple[int, ...], reduced_shape: Tuple[int, ...]) -> int:
+    """
+    Number of halvings of the image size from shape to reduced_shape (up to 3, as with cv2.IMREAD_REDUCED_*, which rounds the size up or down depending on the image format), or None if reduced_shape is not a reduction of shape by a power of two.
+    """
+    for levels in range(4):
+        factor = 2**levels
+        if all(
+            n // factor <= r <= -(-n // factor)
+            for n, r in zip(shape[:2], reduced_shape[:2])
+        ):
+            return levels
+    return None
+
+
+def points_in_tiles(points: np.ndarray, lims: dict) -> np.ndarray:
+    """
+    Check which tiles contain each point (tile borders excluded).
+
+    Args:
+        points (np.ndarray): The points (nx2).
+        lims (dict): The limits of the tiles as [xmin, ymin, xmax, ymax], indexed by the tile id.
+
+    Returns:
+        np.ndarray: Boolean array (n_points x n_tiles), with the tiles in the order of lims.
+    """
+    rects = np.array(list(lims.values()), dtype=np.float64).reshape(-1, 4)
+    points = np.asarray(points).reshape(-1, 1, 2)
+    return np.all(points > rects[None, :, :2], axis=2) & np.all(
+        points < rects[None, :, 2:], axis=2
+    )
+
+
+def count_matches_in_tile_pairs(
+    kpts0: np.ndarray, kpts1: np.ndarray, t0_lims: dict, t1_lims: dict
+) -> np.ndarray:
+    """
+    Count the matches falling in each pair of tiles, as a 2D histogram of the matches over the tiles of the two images. As tiles may overlap, a match can be counted in more than one tile pair.
+
+    Args:
+        kpts0 (np.ndarray): The matched keypoints on image 0 (nx2).
+        kpts1 (np.ndarray): The matched keypoints on image 1 (nx2).
+        t0_lims (dict): The limits of the tiles of image 0.
+        t1_lims (dict): The limits of the tiles of image 1.
+
+    Returns:
+        np.ndarray: The number of matches in each tile pair (n_tiles0 x n_tiles1), with the tiles in the order of t0_lims and t1_lims.
+    """
+    in0 = points_in_tiles(kpts0, t0_lims).astype(np.int32)
+    in1 = points_in_tiles(kpts1, t1_lims).astype(np.int32)
+    return in0.T @ in1
+
+
 class ImageMatcherABC(ABC):
     def __init__(self, opt: dict = {}) -> None:
         self._opt = edict(opt)
@@ -90,7 +191,18 @@ class ImageMatcherBase(ImageMatcherABC):
         self._descriptors1 = None  # descriptors of mkpts on image 1
         self._scores0 = None  # scores of mkpts on image 0
         self._scores1 = None  # scores of mkpts on image 1
-        self._mconf = None  # match confidence (i.e., scores0 of the valid matches)
+        self._mconf = None  # match confidence of the valid matches (e.g., SuperGlue matching scores)
+        self._image_paths = (None, None)  # paths of the images being matched
+        self._preselection = None  # matches on downsampled images (if computed)
+        self._preselection_images = None  # images already downsampled for the preselection (if given)
+        self._F = None  # fundamental matrix estimated by geometric verification
+        self._gv_stages = []  # statistics of the geometric verification stages
+        self._match_tile_ids = None  # tile pair of each match (matching by tiles)
+        self._guided_matching = GuidedMatching.NONE
+        self._prior_F = None  # prior fundamental matrix for guided matching
+        self._epipolar_threshold = EPIPOLAR_THRESHOLD
+        self._image_shapes = (None, None)  # shapes of the input images
+        self.timer = AverageTimer()
 
     def reset(self):
         """Reset the matcher by clearing the features and matches"""
@@ -101,11 +213,27 @@ class ImageMatcherBase(ImageMatcherABC):
         self._scores0 = None
         self._scores1 = None
         self._mconf = None
+        self._preselection = None
 
     @property
     def device(self):
         return self._device
 
+    @property
+    def F(self) -> np.ndarray:
+        """The fundamental matrix estimated by geometric verification in the last call of match() (None if geometric verification was not run). It can be used as prior_F for guided matching of the next epoch."""
+        return self._F
+
+    @property
+    def geometric_verification_stages(self) -> List[VerificationStage]:
+        """The statistics (number of matches, inliers and time) of each stage of geometric verification in the last call of match()."""
+        return self._gv_stages
+
+    @property
+    def preselection(self) -> Preselection:
+        """The matches found by the preselection stage in the last call of match(), in the coordinates of the input images (None if no preselection was run)."""
+        return self._preselection
+
     @property
     def mkpts0(self):
         return self._mkpts0
@@ -204,13 +332,19 @@ class ImageMatcherBase(ImageMatcherABC):
             image1: The second input image as a NumPy array.
             quality: The quality level for resizing images (default: Quality.HIGH).
             tile_selection: The method for selecting tiles for matching (default: TileSelection.NONE).
-            **kwargs: Additional keyword arguments for customization.
+            **kwargs: Additional keyword arguments for customization. image0_path and image1_path (default: None) are the paths of the image files, used by matchers with a feature cache to identify the images. preselection_images (default: None) are the two images already downsampled for the preselection stage (e.g., decoded at reduced resolution with Image.get_reduced()), used instead of downsampling image0 and image1 with an image pyramid. guided_matching (default: GuidedMatching.NONE) constrains the matches to the epipolar band of half-width epipolar_threshold (default: EPIPOLAR_THRESHOLD pixels) given by a prior fundamental matrix prior_F or by the cameras prior_cameras (e.g., those of the previous epoch). For geometric verification, max_iters (default: 10000) is the maximum number of RANSAC iterations; if tile_verification is True (default: False) and matching was performed by tiles, the matches of each tile pair are verified first, in gv_workers (default: 1) worker processes.
 
         Returns:
             A boolean indicating the success of the matching process.
 
         """
         self.timer = AverageTimer()
+        self._image_paths = (kwargs.get("image0_path"), kwargs.get("image1_path"))
+        self._preselection = None
+        self._preselection_images = kwargs.get("preselection_images")
+        self._set_guidance(image0, image1, **kwargs)
+        self._gv_stages = []
+        self._match_tile_ids = None
 
         # Get kwargs
         do_viz_matches = kwargs.get("do_viz_matches", False)
@@ -220,9 +354,13 @@ class ImageMatcherBase(ImageMatcherABC):
         )
         threshold = kwargs.get("threshold", 1)
         confidence = kwargs.get("confidence", 0.9999)
+        max_iters = kwargs.get("max_iters", 10000)
+        tile_verification = kwargs.get("tile_verification", False)
+        gv_workers = kwargs.get("gv_workers", 1)
 
         # Resize images if needed
         image0_, image1_ = self._resize_images(quality, image0, image1)
+        self.timer.update("resize")
 
         # Perform matching (on tiles or full images)
         if tile_selection == TileSelection.NONE:
@@ -237,6 +375,7 @@ class ImageMatcherBase(ImageMatcherABC):
 
         # Retrieve original image coordinates if matching was performed on up/down-sampled images
         features0, features1 = self._resize_features(quality, features0, features1)
+        self._resize_preselection(quality)
 
         # Store features as class members
         try:
@@ -251,15 +390,22 @@ class ImageMatcherBase(ImageMatcherABC):
         self.timer.update("matching")
         logger.info("Matching done!")
 
+        # Remove the matches outside the epipolar band of the prior geometry
+        self._apply_guidance_filter()
+
         # Perform geometric verification
         logger.info("Performing geometric verification...")
         if gv_method is not GeometricVerification.NONE:
-            F, inlMask = geometric_verification(
+            F, inlMask, self._gv_stages = verify_matches(
                 self._mkpts0,
                 self._mkpts1,
                 method=gv_method,
                 confidence=confidence,
                 threshold=threshold,
+                max_iters=max_iters,
+                mconf=self._mconf,
+                tile_ids=self._match_tile_ids if tile_verification else None,
+                n_workers=gv_workers,
             )
             self._F = F
             self._filter_matches_by_mask(inlMask)
@@ -294,6 +440,56 @@ class ImageMatcherBase(ImageMatcherABC):
 
         return True
 
+    def preselect(
+        self,
+        image0: np.ndarray,
+        image1: np.ndarray,
+        reduced: Tuple[np.ndarray, np.ndarray] = None,
+    ) -> Preselection:
+        """
+        Run the preselection stage: match downsampled versions of the two images to get a sparse set of matches, which are used to select the tile pairs to match and to share the keypoint budget among the tiles. The preselection time is recorded in the matcher timer.
+
+        Args:
+            image0 (np.ndarray): The first image.
+            image1 (np.ndarray): The second image.
+            reduced (Tuple[np.ndarray, np.ndarray], optional): The two images already downsampled by a power of two (e.g., decoded at reduced resolution with cv2.IMREAD_REDUCED_*), so that only the remaining pyramid levels are computed. They are ignored if their size does not match the size of image0 and image1. Defaults to None.
+
+        Returns:
+            Preselection: The matches found on the downsampled images, scaled to the coordinates of image0 and image1.
+        """
+        n_down = preselection_pyramid_levels(image0.shape[0])
+        i0, i1, levels = image0, image1, 0
+        if reduced is not None:
+            levels = _reduction_levels(image0.shape, reduced[0].shape)
+            if levels is None or levels > n_down or levels != _reduction_levels(
+                image1.shape, reduced[1].shape
+            ):
+                logger.warning(
+                    "The reduced images do not match the images to preselect. They are not used."
+                )
+                levels = 0
+            else:
+                i0, i1 = [
+                    cv2.cvtColor(i, cv2.COLOR_RGB2GRAY) if i.ndim > 2 and image.ndim == 2 else i
+                    for i, image in zip(reduced, (image0, image1))
+                ]
+        for _ in range(n_down - levels):
+            i0 = cv2.pyrDown(i0)
+            i1 = cv2.pyrDown(i1)
+        f0, f1, mtc, mconf = self._match_images(i0, i1)
+        vld = mtc > -1
+        scale = 2**n_down
+        preselection = Preselection(
+            keypoints0=f0.keypoints[vld] * scale,
+            keypoints1=f1.keypoints[mtc[vld]] * scale,
+            mconf=np.asarray(mconf),
+            n_down=n_down,
+        )
+        self.timer.update("preselection")
+        logger.info(f"Preselection found {len(preselection)} matches")
+
+        return preselection
+
     def _tile_selection(
         self,
         image0: np.ndarray,
@@ -303,7 +499,7 @@ class ImageMatcherBase(ImageMatcherABC):
         method: TileSelection = TileSelection.PRESELECTION,
     ) -> List[Tuple[int, int]]:
         """
-        Selects tile pairs for matching based on the specified method.
+        Selects tile pairs for matching based on the specified method. With TileSelection.PRESELECTION, the matches found by the preselection stage are stored and made available as self.preselection.
 
         Args:
             image0 (np.ndarray): The first image.
@@ -316,13 +512,6 @@ class ImageMatcherBase(ImageMatcherABC):
             List[Tuple[int, int]]: The selected tile pairs.
 
         """
-
-        def points_in_rect(points: np.ndarray, rect: np.ndarray) -> np.ndarray:
-            logic = np.all(points > rect[:2], axis=1) & np.all(
-                points < rect[2:], axis=1
-            )
-            return logic
-
         # default parameters
         min_matches_per_tile = 2
 
@@ -338,60 +527,22 @@ class ImageMatcherBase(ImageMatcherABC):
         elif method == TileSelection.PRESELECTION:
             # Match tiles by preselection running matching on downsampled images
             logger.info("Matching tiles by preselection tile selection")
-            if image0.shape[0] > 8000:
-                n_down = 4
-            if image0.shape[0] > 4000:
-                n_down = 3
-            elif image0.shape[0] > 2000:
-                n_down = 2
-            else:
-                n_down = 1
-
-            # Run inference on downsampled images
-            i0 = deepcopy(image0)
-            i1 = deepcopy(image1)
-            for _ in range(n_down):
-                i0 = cv2.pyrDown(i0)
-                i1 = cv2.pyrDown(i1)
-            f0, f1, mtc, _ = self._match_images(i0, i1)
-            vld = mtc > -1
-            kp0 = f0.keypoints[vld]
-            kp1 = f1.keypoints[mtc[vld]]
-            for _ in range(n_down):
-                kp0 *= 2
-                kp1 *= 2
+            self._preselection = self.preselect(
+                image0, image1, reduced=self._preselection_images
+            )
 
             # Select tile pairs where there are enough matches
-            tile_pairs = []
-            all_pairs = sorted(product(t0_lims.keys(), t1_lims.keys()))
-            for tidx0, tidx1 in all_pairs:
-                lim0 = t0_lims[tidx0]
-                lim1 = t1_lims[tidx1]
-                ret0 = points_in_rect(kp0, lim0)
-                ret1 = points_in_rect(kp1, lim1)
-                ret = ret0 & ret1
-                if sum(ret) > min_matches_per_tile:
-                    tile_pairs.append((tidx0, tidx1))
-            self.timer.update("preselection")
-
-            # Debug...
-            # c = "r"
-            # s = 5
-            # fig, axes = plt.subplots(1, 2)
-            # for ax, img, kp in zip(axes, [image0, image1], [kp0, kp1]):
-            #     ax.imshow(cv2.cvtColor(img, cv2.COLOR_BAYER_BG2BGR))
-            #     ax.scatter(kp[:, 0], kp[:, 1], s=s, c=c)
-            #     ax.axis("off")
-            # for lim0, lim1 in zip(t0_lims.values(), t1_lims.values()):
-            #     axes[0].axvline(lim0[0])
-            #     axes[0].axhline(lim0[1])
-            #     axes[1].axvline(lim1[0])
-            #     axes[1].axhline(lim1[1])
-            # # axes[1].get_yaxis().set_visible(False)
-            # fig.tight_layout()
-            # plt.show()
-            # fig.savefig("preselection.png")
-            # plt.close()
+            counts = count_matches_in_tile_pairs(
+                self._preselection.keypoints0,
+                self._preselection.keypoints1,
+                t0_lims,
+                t1_lims,
+            )
+            ids0, ids1 = list(t0_lims.keys()), list(t1_lims.keys())
+            tile_pairs = sorted(
+                (ids0[i], ids1[j])
+                for i, j in zip(*np.nonzero(counts > min_matches_per_tile))
+            )
 
         return tile_pairs
 
@@ -494,6 +645,62 @@ class ImageMatcherBase(ImageMatcherABC):
 
         return features0, features1
 
+    def _set_guidance(self, image0: np.ndarray, image1: np.ndarray, **kwargs) -> None:
+        """
+        Set up guided matching from the match() kwargs guided_matching, prior_F, prior_cameras and epipolar_threshold. Guided matching is disabled (with a warning) if neither a prior fundamental matrix nor prior cameras are given.
+        """
+        self._F = None
+        self._image_shapes = (image0.shape[:2], image1.shape[:2])
+        self._guided_matching = kwargs.get("guided_matching", GuidedMatching.NONE)
+        self._epipolar_threshold = kwargs.get("epipolar_threshold", EPIPOLAR_THRESHOLD)
+        self._prior_F = kwargs.get("prior_F", None)
+        prior_cameras = kwargs.get("prior_cameras", None)
+        assert isinstance(
+            self._guided_matching, GuidedMatching
+        ), "Invalid guided_matching. It must be a GuidedMatching enum."
+        if self._guided_matching == GuidedMatching.NONE:
+            self._prior_F = None
+            return
+        if self._prior_F is None and prior_cameras is not None:
+            self._prior_F = fundamental_from_cameras(*prior_cameras)
+        if self._prior_F is None:
+            logger.warning(
+                "Guided matching requires prior_F or prior_cameras. Running unconstrained matching."
+            )
+            self._guided_matching = GuidedMatching.NONE
+            return
+        self._prior_F = np.asarray(self._prior_F, dtype=np.float64)
+        logger.info(
+            f"Guided matching ({self._guided_matching.name}) with epipolar threshold {self._epipolar_threshold} px"
+        )
+
+    def _apply_guidance_filter(self) -> None:
+        """
+        Remove the matches whose symmetric epipolar distance from the prior geometry exceeds the epipolar threshold (only if guided matching is enabled).
+        """
+        if self._guided_matching == GuidedMatching.NONE or self._mkpts0 is None:
+            return
+        mask = epipolar_filter(
+            self._prior_F, self._mkpts0, self._mkpts1, self._epipolar_threshold
+        )
+        logger.info(
+            f"Guided matching kept {mask.sum()} matches within the epipolar band out of {len(mask)}"
+        )
+        self._filter_matches_by_mask(mask)
+        self.timer.update("guided_matching")
+
+    def _resize_preselection(self, quality: Quality) -> None:
+        """
+        Scale the preselection matches (if any) from the resized images to the original images, based on the specified quality.
+        """
+        if self._preselection is None:
+            return
+        self._resize_features(
+            quality,
+            FeaturesBase(keypoints=self._preselection.keypoints0),
+            FeaturesBase(keypoints=self._preselection.keypoints1),
+        )
+
     def _filter_matches_by_mask(self, inlMask: np.ndarray) -> None:
         """
         Filter matches based on the specified mask.
@@ -513,6 +720,8 @@ class ImageMatcherBase(ImageMatcherABC):
             self._scores1 = self._scores1[inlMask]
         if self._mconf is not None:
             self._mconf = self._mconf[inlMask]
+        if self._match_tile_ids is not None:
+            self._match_tile_ids = self._match_tile_ids[inlMask]
 
     def _viz_matches_mpl(
         self,
@@ -560,9 +769,68 @@ NMS_RADIUS = 3
 SUPERGLUE_DESC_DIM = 256
 SINKHORN_ITERATIONS = 20
 
+# Parameters for batched tile inference: approximate peak memory required by
+# SuperPoint per pixel of a tile, fraction of the available memory that can be
+# used by a mini-batch and maximum number of tiles per mini-batch
+SUPERPOINT_BYTES_PER_PIXEL = 1024
+TILE_BATCH_MEMORY_FRACTION = 0.5
+MAX_TILE_BATCH_SIZE = 16
+
+# Options of the CPU inference mode (enabled with the option "cpu_inference"): int8
+# dynamic quantization and early stopping of the Sinkhorn iterations. The number of
+# intra-op threads is left unchanged (e.g., as set for each pipeline worker)
+CPU_INFERENCE_OPTIONS = {
+    "force_cpu": True,
+    "quantize": True,
+    "sinkhorn_tolerance": 1e-3,
+    "num_threads": None,
+    "num_interop_threads": 1,
+}
+
+
+def available_memory(device: str) -> int:
+    """
+    Get the memory (in bytes) currently available on a device.
+
+    Args:
+        device (str): The device ("cpu" or "cuda").
+
+    Returns:
+        int: The available memory in bytes, or None if it cannot be determined.
+    """
+    if device.startswith("cuda"):
+        try:
+            free, _ = torch.cuda.mem_get_info(device)
+            return int(free)
+        except (RuntimeError, AttributeError):
+            return None
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def tile_batch_size_by_memory(tile_shape: Tuple[int, int], device: str) -> int:
+    """
+    Compute the number of tiles of a given size that can be processed by SuperPoint in a single forward pass, given the memory available on the device.
+
+    Args:
+        tile_shape (Tuple[int, int]): The size of the tiles (height, width).
+        device (str): The device ("cpu" or "cuda").
+
+    Returns:
+        int: The batch size (between 1 and MAX_TILE_BATCH_SIZE).
+    """
+    memory = available_memory(device)
+    if memory is None:
+        return 1
+    tile_bytes = tile_shape[0] * tile_shape[1] * SUPERPOINT_BYTES_PER_PIXEL
+    batch_size = int(memory * TILE_BATCH_MEMORY_FRACTION // tile_bytes)
+    return int(np.clip(batch_size, 1, MAX_TILE_BATCH_SIZE))
+
 
 class SuperGlueMatcher(ImageMatcherBase):
-    def __init__(self, opt: dict) -> None:
+    def __init__(self, opt: dict, feature_cache: FeatureCache = None) -> None:
         """Initializes a SuperGlueMatcher object with the given options dictionary.
 
         The options dictionary should contain the following keys:
@@ -572,9 +840,20 @@ class SuperGlueMatcher(ImageMatcherBase):
         - 'max_keypoints': maximum number of keypoints to extract with the SuperPoint detector. Default value is 0.001.
         - 'match_threshold': threshold for the SuperGlue feature matcher
         - 'force_cpu': whether to force using the CPU for inference
+        - 'num_threads': number of CPU threads used by PyTorch. Default value is None (torch.get_num_threads() is left unchanged).
+        - 'warmup': whether to run a dummy inference when the networks are loaded. Default value is False.
+        - 'compile': compile the networks with torch.jit ("jit") or torch.compile ("compile"). Default value is None.
+        - 'sinkhorn_iterations': maximum number of Sinkhorn iterations. Default value is SINKHORN_ITERATIONS.
+        - 'sinkhorn_tolerance': stop the Sinkhorn iterations when the marginals have converged within this tolerance. Default value is None (run all the iterations).
+        - 'quantize': apply dynamic int8 quantization to the SuperGlue MLPs and attention projections (CPU only). Default value is False.
+        - 'num_interop_threads': number of CPU threads used by PyTorch for inter-op parallelism. Default value is None (PyTorch default).
+        - 'cpu_inference': use CPU_INFERENCE_OPTIONS as default values of the options above. Default value is False.
+
+        The networks are taken from the process-wide model registry (see icepy4d.matching.model_registry), so they are loaded only once per process for each configuration.
 
         Args:
             opt (dict): a dictionary of options for configuring the SuperGlueMatcher object
+            feature_cache (FeatureCache, optional): a cache of the SuperPoint features. If given, the features of each image (or image tile) are extracted only once and reused when the same image is matched again, provided that the image paths are passed to match() as image0_path and image1_path. Defaults to None.
 
         Raises:
             KeyError: if one or more required options are missing from the options dictionary
@@ -584,8 +863,21 @@ class SuperGlueMatcher(ImageMatcherBase):
         opt = self._build_superglue_config(opt)
         super().__init__(opt)
 
-        # initialize the Matching object with given configuration
-        self.matcher = Matching(self._opt).eval().to(self._device)
+        # get the Matching object with given configuration from the model registry
+        if (
+            self._opt.num_threads is not None
+            or self._opt.num_interop_threads is not None
+        ):
+            set_num_threads(self._opt.num_threads, self._opt.num_interop_threads)
+        self.matcher = get_model(
+            "matching",
+            {"superpoint": self._opt.superpoint, "superglue": self._opt.superglue},
+            self._device,
+            warmup=self._opt.warmup,
+            compile=self._opt.compile,
+            quantize=self._opt.quantize,
+        )
+        self.feature_cache = feature_cache
 
     def _build_superglue_config(self, opt: dict) -> dict:
         def_opt = {
@@ -596,7 +888,15 @@ class SuperGlueMatcher(ImageMatcherBase):
             "force_cpu": False,
             "nms_radius": NMS_RADIUS,
             "sinkhorn_iterations": SINKHORN_ITERATIONS,
+            "sinkhorn_tolerance": None,
+            "quantize": False,
+            "num_threads": None,
+            "num_interop_threads": None,
+            "warmup": False,
+            "compile": None,
         }
+        if opt.get("cpu_inference", False):
+            def_opt.update(CPU_INFERENCE_OPTIONS)
         opt = {**def_opt, **opt}
         required_keys = [
             "weights",
@@ -616,14 +916,185 @@ class SuperGlueMatcher(ImageMatcherBase):
             "superglue": {
                 "weights": opt["weights"],
                 "sinkhorn_iterations": opt["sinkhorn_iterations"],
+                "sinkhorn_tolerance": opt["sinkhorn_tolerance"],
                 "match_threshold": opt["match_threshold"],
             },
             "force_cpu": opt["force_cpu"],
+            "quantize": opt["quantize"],
+            "num_threads": opt["num_threads"],
+            "num_interop_threads": opt["num_interop_threads"],
+            "warmup": opt["warmup"],
+            "compile": opt["compile"],
         }
 
     def _frame2tensor(self, frame, device):
         return torch.from_numpy(frame / 255.0).float()[None, None].to(device)
 
+    def _use_feature_cache(self) -> bool:
+        return self.feature_cache is not None and any(
+            p is not None for p in self._image_paths
+        )
+
+    def _feature_cache_key(
+        self, image_idx: int, shape: Tuple[int, int], crop: List[int] = None
+    ) -> str:
+        """
+        Build the key of the features of an image (or of a tile of it) in the feature cache. The shape of the (resized) image is part of the key, so that features extracted at different matching qualities or on the downsampled images used for the tile preselection are not mixed up.
+
+        Returns:
+            str: The cache key, or None if the feature cache is disabled or the image path is unknown.
+        """
+        path = self._image_paths[image_idx]
+        if self.feature_cache is None or path is None:
+            return None
+        return FeatureCache.make_key(
+            path,
+            dict(self._opt["superpoint"]),
+            shape=[int(x) for x in shape[:2]],
+            crop=None if crop is None else [int(x) for x in crop],
+        )
+
+    def _extract_features(self, image: np.ndarray, image_idx: int) -> dict:
+        """
+        Run SuperPoint on a grayscale image, reading the features from the feature cache if available.
+
+        Args:
+            image (np.ndarray): The grayscale image.
+            image_idx (int): The index of the image in the pair being matched (0 or 1).
+
+        Returns:
+            dict: The SuperPoint prediction (keypoints, scores and descriptors as tensors on the device).
+        """
+        key = self._feature_cache_key(image_idx, image.shape)
+        if key is not None:
+            cached = self.feature_cache.get(key)
+            if cached is not None:
+                return self._features_to_tensors(cached)
+        with torch.inference_mode():
+            pred = self.matcher.superpoint(
+                {"image": self._frame2tensor(image, self._device)}
+            )
+        pred = {k: v[0] for k, v in pred.items()}
+        if key is not None:
+            self.feature_cache.put(key, {k: v.cpu().numpy() for k, v in pred.items()})
+        return pred
+
+    def _features_to_tensors(self, features: dict) -> dict:
+        return {k: torch.from_numpy(v).to(self._device) for k, v in features.items()}
+
+    def _use_epipolar_mask(self) -> bool:
+        return self._guided_matching == GuidedMatching.MASK
+
+    def _epipolar_mask(
+        self,
+        kpts0: torch.Tensor,
+        image_shape0: Tuple[int, int],
+        kpts1: torch.Tensor,
+        image_shape1: Tuple[int, int],
+        offset0: Tuple[int, int] = (0, 0),
+        offset1: Tuple[int, int] = (0, 0),
+    ) -> torch.Tensor:
+        """
+        Compute the candidate correspondences between the keypoints of two images (or tiles) that lie within the epipolar band of the prior fundamental matrix. Keypoints are brought back to the coordinates of the input images of match() (before resizing) to evaluate the epipolar distance.
+
+        Args:
+            kpts0 (torch.Tensor): The keypoints of the first image (nx2).
+            image_shape0 (Tuple[int, int]): The shape of the (resized) first image the keypoints were extracted from (the full image, also for tiles).
+            kpts1 (torch.Tensor): The keypoints of the second image (mx2).
+            image_shape1 (Tuple[int, int]): The shape of the (resized) second image.
+            offset0 (Tuple[int, int], optional): The position (x, y) of the tile in the first image. Defaults to (0, 0).
+            offset1 (Tuple[int, int], optional): The position (x, y) of the tile in the second image. Defaults to (0, 0).
+
+        Returns:
+            torch.Tensor: Boolean mask (nxm) of the candidate correspondences, or None if guided matching with epipolar mask is disabled.
+        """
+        if not self._use_epipolar_mask():
+            return None
+        scale0 = self._image_shapes[0][1] / image_shape0[1]
+        scale1 = self._image_shapes[1][1] / image_shape1[1]
+        pts0 = (kpts0.cpu().numpy() + np.asarray(offset0[:2])) * scale0
+        pts1 = (kpts1.cpu().numpy() + np.asarray(offset1[:2])) * scale1
+        mask = epipolar_band_mask(self._prior_F, pts0, pts1, self._epipolar_threshold)
+        return torch.from_numpy(mask).to(self._device)
+
+    def _match_features(
+        self,
+        pred0: dict,
+        shape0: Tuple[int, int],
+        pred1: dict,
+        shape1: Tuple[int, int],
+        mask: torch.Tensor = None,
+    ) -> dict:
+        """
+        Run SuperGlue on the SuperPoint features of two images (or tiles).
+
+        Args:
+            pred0 (dict): The SuperPoint prediction of the first image (tensors on the device).
+            shape0 (Tuple[int, int]): The size (height, width) of the first image.
+            pred1 (dict): The SuperPoint prediction of the second image (tensors on the device).
+            shape1 (Tuple[int, int]): The size (height, width) of the second image.
+            mask (torch.Tensor, optional): Boolean mask (n0xn1) of the candidate correspondences (e.g., from the epipolar band of a prior geometry). Keypoints without any candidate are not given to SuperGlue and the other pairs are excluded from the optimal transport. Defaults to None (all pairs are candidates).
+
+        Returns:
+            dict: the SuperPoint+SuperGlue prediction (as numpy arrays), with the same keys as the output of Matching.
+        """
+        keep0 = keep1 = None
+        sub0, sub1 = pred0, pred1
+        if mask is not None:
+            keep0 = torch.nonzero(mask.any(1)).squeeze(1)
+            keep1 = torch.nonzero(mask.any(0)).squeeze(1)
+            sub0 = self._select_keypoints(pred0, keep0)
+            sub1 = self._select_keypoints(pred1, keep1)
+        data = {
+            # SuperGlue uses only the image size to normalize the keypoints
+            "image0": torch.zeros(1, 1, 1, 1).expand(1, 1, *shape0[:2]),
+            "image1": torch.zeros(1, 1, 1, 1).expand(1, 1, *shape1[:2]),
+            **{k + "0": [v] for k, v in sub0.items()},
+            **{k + "1": [v] for k, v in sub1.items()},
+        }
+        if mask is not None:
+            data["mask"] = mask[keep0][:, keep1][None]
+        with torch.inference_mode():
+            pred_tensor = self.matcher(data)
+        pred_tensor = {k: v[0] for k, v in pred_tensor.items()}
+        if mask is not None:
+            pred_tensor = self._restore_keypoint_indices(
+                pred_tensor, keep0, keep1, len(mask), mask.shape[1]
+            )
+        pred = {k + "0": v for k, v in pred0.items()}
+        pred.update({k + "1": v for k, v in pred1.items()})
+        pred.update(pred_tensor)
+        return {k: v.cpu().numpy() for k, v in pred.items()}
+
+    @staticmethod
+    def _select_keypoints(pred: dict, idx: torch.Tensor) -> dict:
+        return {
+            "keypoints": pred["keypoints"][idx],
+            "scores": pred["scores"][idx],
+            "descriptors": pred["descriptors"][:, idx],
+        }
+
+    @staticmethod
+    def _restore_keypoint_indices(
+        pred: dict, keep0: torch.Tensor, keep1: torch.Tensor, n0: int, n1: int
+    ) -> dict:
+        """
+        Map the matches of SuperGlue, run on the subsets keep0 and keep1 of the keypoints, back to the indices of all the keypoints (keypoints not given to SuperGlue are unmatched).
+        """
+        out = {}
+        for i, (keep, other, n) in enumerate([(keep0, keep1, n0), (keep1, keep0, n1)]):
+            matches = pred[f"matches{i}"].long()
+            full = matches.new_full((n,), -1)
+            full[keep] = torch.where(
+                matches > -1, other[matches.clamp(min=0)], matches.new_tensor(-1)
+            )
+            scores = pred[f"matching_scores{i}"]
+            full_scores = scores.new_zeros((n,))
+            full_scores[keep] = scores
+            out[f"matches{i}"] = full.to(pred[f"matches{i}"].dtype)
+            out[f"matching_scores{i}"] = full_scores
+        return out
+
     def _match_images(
         self,
         image0: np.ndarray,
@@ -647,12 +1118,21 @@ class SuperGlueMatcher(ImageMatcherBase):
         if len(image1.shape) > 2:
             image1 = cv2.cvtColor(image1, cv2.COLOR_RGB2GRAY)
 
-        tensor0 = self._frame2tensor(image0, self._device)
-        tensor1 = self._frame2tensor(image1, self._device)
-
-        with torch.inference_mode():
-            pred_tensor = self.matcher({"image0": tensor0, "image1": tensor1})
-        pred = {k: v[0].cpu().numpy() for k, v in pred_tensor.items()}
+        if self._use_feature_cache() or self._use_epipolar_mask():
+            pred0 = self._extract_features(image0, 0)
+            pred1 = self._extract_features(image1, 1)
+            mask = self._epipolar_mask(
+                pred0["keypoints"], image0.shape, pred1["keypoints"], image1.shape
+            )
+            pred = self._match_features(
+                pred0, image0.shape, pred1, image1.shape, mask=mask
+            )
+        else:
+            tensor0 = self._frame2tensor(image0, self._device)
+            tensor1 = self._frame2tensor(image1, self._device)
+            with torch.inference_mode():
+                pred_tensor = self.matcher({"image0": tensor0, "image1": tensor1})
+            pred = {k: v[0].cpu().numpy() for k, v in pred_tensor.items()}
 
         # Create FeaturesBase objects and matching array
         features0 = FeaturesBase(
@@ -667,9 +1147,9 @@ class SuperGlueMatcher(ImageMatcherBase):
         )
         matches0 = pred["matches0"]
 
-        # Create a match confidence array
+        # Create a match confidence array (SuperGlue matching scores)
         valid = matches0 > -1
-        mconf = features0.scores[valid]
+        mconf = pred["matching_scores0"][valid]
 
         logger.info("Matching completed.")
 
@@ -689,7 +1169,7 @@ class SuperGlueMatcher(ImageMatcherBase):
             image0: The first input image as a NumPy array.
             image1: The second input image as a NumPy array.
             tile_selection: The method for selecting tile pairs to match (default: TileSelection.PRESELECTION).
-            **kwargs: Additional keyword arguments for customization.
+            **kwargs: Additional keyword arguments for customization. Besides the tiling parameters (grid, overlap, origin), batch_tiles (default: True) runs SuperPoint once per tile, stacking tiles of the same size in mini-batches of tile_batch_size tiles (default: None, computed from the available memory); if False, SuperPoint+SuperGlue are run on one tile pair at a time. keypoint_budget (default: None) is the total number of keypoints of each image, shared among its matched tiles by their score budget_score ("preselection", the number of preselection matches in the tile, or "texture", the mean gradient magnitude of the tile; default: "preselection" if available, otherwise "texture"), with at least min_keypoints_per_tile keypoints (default: MIN_KEYPOINTS_PER_TILE) per tile. The keypoints of each tile are still limited by max_keypoints.
 
         Returns:
             A tuple containing:
@@ -710,6 +1190,9 @@ class SuperGlueMatcher(ImageMatcherBase):
         overlap = kwargs.get("overlap", 0)
         origin = kwargs.get("origin", [0, 0])
         do_viz_tiles = kwargs.get("do_viz_tiles", False)
+        batch_tiles = kwargs.get("batch_tiles", True)
+        tile_batch_size = kwargs.get("tile_batch_size", None)
+        keypoint_budget = kwargs.get("keypoint_budget", None)
 
         # Convert images to grayscale if needed
         if len(image0.shape) > 2:
@@ -727,64 +1210,74 @@ class SuperGlueMatcher(ImageMatcherBase):
             image0, image1, t0_lims, t1_lims, tile_selection
         )
 
-        # Initialize empty array for storing matched keypoints, descriptors and scores
-        mkpts0_full = np.array([], dtype=np.float32).reshape(0, 2)
-        mkpts1_full = np.array([], dtype=np.float32).reshape(0, 2)
-        descriptors0_full = np.array([], dtype=np.float32).reshape(256, 0)
-        descriptors1_full = np.array([], dtype=np.float32).reshape(256, 0)
-        scores0_full = np.array([], dtype=np.float32)
-        scores1_full = np.array([], dtype=np.float32)
-        conf_full = np.array([], dtype=np.float32)
-
-        # Match each tile pair
-        for tidx0, tidx1 in tile_pairs:
-            logger.info(f" - Matching tile pair ({tidx0}, {tidx1})")
+        # Share the keypoint budget among the tiles to match
+        budgets = None
+        if keypoint_budget is not None:
+            budgets = [
+                self._tile_keypoint_budget(
+                    image,
+                    lims,
+                    sorted({pair[i] for pair in tile_pairs}),
+                    keypoint_budget,
+                    i,
+                    score=kwargs.get("budget_score", None),
+                    min_keypoints=kwargs.get(
+                        "min_keypoints_per_tile", MIN_KEYPOINTS_PER_TILE
+                    ),
+                )
+                for i, (image, lims) in enumerate(
+                    [(image0, t0_lims), (image1, t1_lims)]
+                )
+            ]
+
+        # Run SuperPoint+SuperGlue on all the tile pairs
+        if not batch_tiles and self._use_epipolar_mask():
+            logger.info("Guided matching with epipolar mask requires batch_tiles.")
+            batch_tiles = True
+        if not batch_tiles and budgets is not None:
+            logger.info("Matching with a keypoint budget requires batch_tiles.")
+            batch_tiles = True
+        if batch_tiles:
+            preds = self._match_tile_pairs_batched(
+                image0,
+                image1,
+                t0_lims,
+                t1_lims,
+                tile_pairs,
+                tile_batch_size,
+                budgets=budgets,
+            )
+        else:
+            preds = self._match_tile_pairs_sequential(
+                image0, image1, t0_lims, t1_lims, tile_pairs
+            )
 
+        # Collect matches, descriptors and scores of each tile pair, to be concatenated once at the end
+        mkpts0_list, mkpts1_list = [], []
+        descriptors0_list, descriptors1_list = [], []
+        scores0_list, scores1_list = [], []
+        conf_list = []
+        tile_ids_list = []
+        for pair_idx, ((tidx0, tidx1), pred) in enumerate(zip(tile_pairs, preds)):
             lim0 = t0_lims[tidx0]
             lim1 = t1_lims[tidx1]
-            tile0 = self._tiler.extract_patch(image0, lim0)
-            tile1 = self._tiler.extract_patch(image1, lim1)
-
-            # Run SuperGlue on a pair of tiles
-            tensor0 = self._frame2tensor(tile0, self._device)
-            tensor1 = self._frame2tensor(tile1, self._device)
-            with torch.inference_mode():
-                pred_tensor = self.matcher({"image0": tensor0, "image1": tensor1})
-            pred = {k: v[0].cpu().numpy() for k, v in pred_tensor.items()}
 
             # Get matches, descriptors and scores
             kpts0, kpts1 = pred["keypoints0"], pred["keypoints1"]
-            descriptors0, descriptors1 = (
-                pred["descriptors0"],
-                pred["descriptors1"],
-            )
-            scores0, scores1 = pred["scores0"], pred["scores1"]
-            matches0, _ = (
-                pred["matches0"],
-                pred["matches1"],
-            )
-            conf = pred["matching_scores0"]
+            matches0 = pred["matches0"]
             valid = matches0 > -1
+            idx1 = matches0[valid]
             mkpts0 = kpts0[valid]
-            mkpts1 = kpts1[matches0[valid]]
-            descriptors0 = descriptors0[:, valid]
-            descriptors1 = descriptors1[:, matches0[valid]]
-            scores0 = scores0[valid]
-            scores1 = scores1[matches0[valid]]
-            conf = conf[valid]
-
-            # Append matches to full array
-            mkpts0_full = np.vstack(
-                (mkpts0_full, mkpts0 + np.array(lim0[0:2]).astype("float32"))
-            )
-            mkpts1_full = np.vstack(
-                (mkpts1_full, mkpts1 + np.array(lim1[0:2]).astype("float32"))
-            )
-            descriptors0_full = np.hstack((descriptors0_full, descriptors0))
-            descriptors1_full = np.hstack((descriptors1_full, descriptors1))
-            scores0_full = np.concatenate((scores0_full, scores0))
-            scores1_full = np.concatenate((scores1_full, scores1))
-            conf_full = np.concatenate((conf_full, conf))
+            mkpts1 = kpts1[idx1]
+
+            mkpts0_list.append(mkpts0 + np.array(lim0[0:2]).astype("float32"))
+            mkpts1_list.append(mkpts1 + np.array(lim1[0:2]).astype("float32"))
+            descriptors0_list.append(pred["descriptors0"][:, valid])
+            descriptors1_list.append(pred["descriptors1"][:, idx1])
+            scores0_list.append(pred["scores0"][valid])
+            scores1_list.append(pred["scores1"][idx1])
+            conf_list.append(pred["matching_scores0"][valid])
+            tile_ids_list.append(np.full(len(mkpts0), pair_idx))
 
             # Visualize matches on tile
             save_dir = kwargs.get("save_dir", ".")
@@ -792,13 +1285,30 @@ class SuperGlueMatcher(ImageMatcherBase):
             save_dir.mkdir(parents=True, exist_ok=True)
             if do_viz_tiles is True:
                 self._viz_matches_mpl(
-                    tile0,
-                    tile1,
+                    self._tiler.extract_patch(image0, lim0),
+                    self._tiler.extract_patch(image1, lim1),
                     mkpts0,
                     mkpts1,
                     save_dir / f"matches_tile_{tidx0}-{tidx1}.png",
                     hide_fig=True,
                 )
+        self.timer.update("tile_matching")
+
+        def concatenate(arrays: list, empty_shape: tuple, axis: int = 0) -> np.ndarray:
+            if not arrays:
+                return np.empty(empty_shape, dtype=np.float32)
+            return np.concatenate(arrays, axis=axis).astype(np.float32, copy=False)
+
+        mkpts0_full = concatenate(mkpts0_list, (0, 2))
+        mkpts1_full = concatenate(mkpts1_list, (0, 2))
+        descriptors0_full = concatenate(descriptors0_list, (SUPERGLUE_DESC_DIM, 0), 1)
+        descriptors1_full = concatenate(descriptors1_list, (SUPERGLUE_DESC_DIM, 0), 1)
+        scores0_full = concatenate(scores0_list, (0,))
+        scores1_full = concatenate(scores1_list, (0,))
+        conf_full = concatenate(conf_list, (0,))
+        tile_ids_full = (
+            np.concatenate(tile_ids_list) if tile_ids_list else np.empty(0, int)
+        )
 
         logger.info("Restoring full image coordinates of matches...")
 
@@ -813,6 +1323,8 @@ class SuperGlueMatcher(ImageMatcherBase):
         mkpts1_full = mkpts1_full[unique_idx]
         descriptors1_full = descriptors1_full[:, unique_idx]
         scores1_full = scores1_full[unique_idx]
+        conf_full = conf_full[unique_idx]
+        self._match_tile_ids = tile_ids_full[unique_idx]
 
         # Create features
         features0 = FeaturesBase(
@@ -825,14 +1337,201 @@ class SuperGlueMatcher(ImageMatcherBase):
         # Create a 1-to-1 matching array
         matches0 = np.arange(mkpts0_full.shape[0])
 
-        # Create a match confidence array
+        # Create a match confidence array (SuperGlue matching scores)
         valid = matches0 > -1
-        mconf = features0.scores[valid]
+        mconf = conf_full[valid]
 
         logger.info("Matching by tile completed.")
 
         return features0, features1, matches0, mconf
 
+    def _tile_keypoint_budget(
+        self,
+        image: np.ndarray,
+        lims: dict,
+        tile_ids: List[int],
+        budget: int,
+        image_idx: int,
+        score: str = None,
+        min_keypoints: int = MIN_KEYPOINTS_PER_TILE,
+    ) -> dict:
+        """
+        Share the keypoint budget of an image among its tiles to match.
+
+        Args:
+            image (np.ndarray): The grayscale image.
+            lims (dict): The limits of the tiles.
+            tile_ids (List[int]): The tiles to match.
+            budget (int): The total number of keypoints of the image.
+            image_idx (int): The index of the image in the pair being matched (0 or 1).
+            score (str, optional): The score used to share the budget: "preselection" (number of preselection matches in the tile) or "texture" (mean gradient magnitude of the tile). Defaults to None ("preselection" if the preselection is available, otherwise "texture").
+            min_keypoints (int, optional): The minimum number of keypoints of each tile. Defaults to MIN_KEYPOINTS_PER_TILE.
+
+        Returns:
+            dict: The maximum number of keypoints of each tile, indexed by the tile id.
+        """
+        if score is None:
+            score = "preselection" if self._preselection is not None else "texture"
+        if score not in ["preselection", "texture"]:
+            raise ValueError(
+                f"Invalid budget score {score}. It must be 'preselection' or 'texture'."
+            )
+        lims = {i: lims[i] for i in tile_ids}
+        if score == "preselection" and self._preselection is None:
+            logger.warning(
+                "Preselection not available. Sharing the keypoint budget by texture."
+            )
+            score = "texture"
+        if score == "preselection":
+            kpts = getattr(self._preselection, f"keypoints{image_idx}")
+            scores = dict(zip(lims.keys(), points_in_tiles(kpts, lims).sum(axis=0)))
+        else:
+            scores = None
+        budgets = self._tiler.keypoint_budget(
+            image, budget, limits=lims, scores=scores, min_keypoints=min_keypoints
+        )
+        logger.info(
+            f"Keypoint budget of image {image_idx} shared by {score}: {budgets}"
+        )
+        return budgets
+
+    @staticmethod
+    def _top_keypoints(pred: dict, max_keypoints: int) -> dict:
+        """Keep the max_keypoints keypoints with the highest score (as SuperPoint does with its max_keypoints option)."""
+        if len(pred["scores"]) <= max_keypoints:
+            return pred
+        idx = torch.topk(pred["scores"], max_keypoints).indices
+        return SuperGlueMatcher._select_keypoints(pred, idx)
+
+    def _match_tile_pairs_sequential(
+        self,
+        image0: np.ndarray,
+        image1: np.ndarray,
+        t0_lims: dict,
+        t1_lims: dict,
+        tile_pairs: List[Tuple[int, int]],
+    ):
+        """
+        Run SuperPoint+SuperGlue on one tile pair at a time.
+
+        Yields:
+            dict: the SuperPoint+SuperGlue prediction of each tile pair (as numpy arrays), in the order of tile_pairs.
+        """
+        for tidx0, tidx1 in tile_pairs:
+            logger.info(f" - Matching tile pair ({tidx0}, {tidx1})")
+            tile0 = self._tiler.extract_patch(image0, t0_lims[tidx0])
+            tile1 = self._tiler.extract_patch(image1, t1_lims[tidx1])
+            tensor0 = self._frame2tensor(tile0, self._device)
+            tensor1 = self._frame2tensor(tile1, self._device)
+            with torch.inference_mode():
+                pred_tensor = self.matcher({"image0": tensor0, "image1": tensor1})
+            yield {k: v[0].cpu().numpy() for k, v in pred_tensor.items()}
+
+    def _extract_tiles_features(
+        self,
+        image: np.ndarray,
+        lims: dict,
+        tile_ids: List[int],
+        batch_size: int = None,
+        image_idx: int = None,
+    ) -> dict:
+        """
+        Run SuperPoint on a set of tiles of an image, stacking tiles of the same size in mini-batches processed with a single forward pass. If the feature cache is enabled, the features of the tiles already in the cache are read from it and only the other tiles are processed.
+
+        Args:
+            image (np.ndarray): The grayscale image.
+            lims (dict): The limits of the tiles.
+            tile_ids (List[int]): The tiles to process.
+            batch_size (int, optional): The maximum number of tiles per mini-batch. Defaults to None (computed from the memory available on the device).
+            image_idx (int, optional): The index of the image in the pair being matched (0 or 1), used to look up the feature cache. Defaults to None (feature cache not used).
+
+        Returns:
+            dict: dictionary mapping each tile to a tuple with its SuperPoint prediction (keypoints, scores and descriptors as tensors on the device) and its size (height, width).
+        """
+        features = {}
+        keys = {}
+        if image_idx is not None:
+            for i in tile_ids:
+                keys[i] = self._feature_cache_key(image_idx, image.shape, lims[i])
+                cached = self.feature_cache.get(keys[i]) if keys[i] else None
+                if cached is not None:
+                    tile_shape = self._tiler.extract_patch(image, lims[i]).shape
+                    features[i] = (self._features_to_tensors(cached), tile_shape)
+            tile_ids = [i for i in tile_ids if i not in features]
+
+        tiles = {i: self._tiler.extract_patch(image, lims[i]) for i in tile_ids}
+        tiles_by_shape = {}
+        for i, tile in tiles.items():
+            tiles_by_shape.setdefault(tile.shape, []).append(i)
+
+        for shape, ids in tiles_by_shape.items():
+            bs = batch_size or tile_batch_size_by_memory(shape, self._device)
+            for start in range(0, len(ids), bs):
+                chunk = ids[start : start + bs]
+                batch = np.stack([tiles[i] for i in chunk])
+                tensor = torch.from_numpy(batch / 255.0).float()[:, None]
+                with torch.inference_mode():
+                    pred = self.matcher.superpoint({"image": tensor.to(self._device)})
+                for j, i in enumerate(chunk):
+                    features[i] = ({k: v[j] for k, v in pred.items()}, shape)
+                    if keys.get(i) is not None:
+                        self.feature_cache.put(
+                            keys[i], {k: v[j].cpu().numpy() for k, v in pred.items()}
+                        )
+        return features
+
+    def _match_tile_pairs_batched(
+        self,
+        image0: np.ndarray,
+        image1: np.ndarray,
+        t0_lims: dict,
+        t1_lims: dict,
+        tile_pairs: List[Tuple[int, int]],
+        batch_size: int = None,
+        budgets: List[dict] = None,
+    ):
+        """
+        Run SuperPoint on the tiles in mini-batches (each tile is processed only once, even if it belongs to several tile pairs) and then SuperGlue on each tile pair. If budgets (the maximum number of keypoints of each tile of the two images) is given, only the keypoints with the highest scores of each tile are matched.
+
+        Note:
+            SuperGlue is still run on one tile pair at a time, because tile pairs have a different number of keypoints and SuperGlue does not support padding.
+
+        Yields:
+            dict: the SuperPoint+SuperGlue prediction of each tile pair (as numpy arrays), in the order of tile_pairs.
+        """
+        use_cache = self._use_feature_cache()
+        feats0 = self._extract_tiles_features(
+            image0,
+            t0_lims,
+            sorted({t for t, _ in tile_pairs}),
+            batch_size,
+            image_idx=0 if use_cache else None,
+        )
+        feats1 = self._extract_tiles_features(
+            image1,
+            t1_lims,
+            sorted({t for _, t in tile_pairs}),
+            batch_size,
+            image_idx=1 if use_cache else None,
+        )
+        if budgets is not None:
+            feats0, feats1 = [
+                {i: (self._top_keypoints(p, budget[i]), s) for i, (p, s) in f.items()}
+                for f, budget in zip([feats0, feats1], budgets)
+            ]
+        for tidx0, tidx1 in tile_pairs:
+            logger.info(f" - Matching tile pair ({tidx0}, {tidx1})")
+            (pred0, shape0), (pred1, shape1) = feats0[tidx0], feats1[tidx1]
+            mask = self._epipolar_mask(
+                pred0["keypoints"],
+                image0.shape,
+                pred1["keypoints"],
+                image1.shape,
+                offset0=t0_lims[tidx0],
+                offset1=t1_lims[tidx1],
+            )
+            yield self._match_features(pred0, shape0, pred1, shape1, mask=mask)
+
     def viz_matches(
         self,
         image0: np.ndarray,
@@ -1094,12 +1793,27 @@ class LOFTRMatcher(ImageMatcherBase):
 
 class LightGlueMatcher(ImageMatcherBase):
     def __init__(self, opt: dict = {}) -> None:
-        """Initializes a LightGlueMatcher with Kornia"""
+        """Initializes a LightGlueMatcher with Kornia.
 
+        Besides 'features' and 'force_cpu', the options dictionary can contain 'depth_confidence' and 'width_confidence' (early stopping and point pruning of LightGlue), 'quantize', 'num_threads' and 'num_interop_threads' (see SuperGlueMatcher). With 'cpu_inference', CPU_INFERENCE_OPTIONS are used as default values.
+        """
+        if opt.get("cpu_inference", False):
+            opt = {**CPU_INFERENCE_OPTIONS, **opt}
         self._localfeatures = opt.get("features", "superpoint")
         super().__init__(opt)
 
-        self.matcher = KF.LightGlue(features=self._localfeatures).to(self.device).eval()
+        if (
+            opt.get("num_threads") is not None
+            or opt.get("num_interop_threads") is not None
+        ):
+            set_num_threads(opt.get("num_threads"), opt.get("num_interop_threads"))
+        config = {"features": self._localfeatures}
+        for key in ["depth_confidence", "width_confidence"]:
+            if key in opt:
+                config[key] = opt[key]
+        self.matcher = get_model(
+            "lightglue", config, self.device, quantize=opt.get("quantize", False)
+        )
 
     def _img_to_tensor(self, image: np.ndarray) -> torch.Tensor:
         image = K.image_to_tensor(np.array(image), False).float() / 255.0
@@ -1119,6 +1833,11 @@ class LightGlueMatcher(ImageMatcherBase):
         **kwargs,
     ):
         self.timer = AverageTimer()
+        self._preselection = None
+        self._preselection_images = kwargs.get("preselection_images")
+        self._set_guidance(image0, image1, **kwargs)
+        self._gv_stages = []
+        self._match_tile_ids = None
 
         # Get kwargs
         do_viz_matches = kwargs.get("do_viz_matches", False)
@@ -1128,22 +1847,24 @@ class LightGlueMatcher(ImageMatcherBase):
         )
         threshold = kwargs.get("threshold", 1)
         confidence = kwargs.get("confidence", 0.9999)
+        max_iters = kwargs.get("max_iters", 10000)
+        tile_verification = kwargs.get("tile_verification", False)
+        gv_workers = kwargs.get("gv_workers", 1)
 
         # Resize images if needed
         image0_, image1_ = self._resize_images(quality, image0, image1)
+        self.timer.update("resize")
 
         # Extract local features
         if self._localfeatures == "superpoint":
-            
-            from icepy4d.thirdparty.SuperGlue.models.superpoint import SuperPoint
-            
+
             def _frame2tensor(frame, device):
                 if frame.ndim == 3:
                     frame = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
                 return torch.from_numpy(frame / 255.0).float()[None, None].to(device)
 
             with torch.inference_mode():
-                extractor  = SuperPoint(config={}).eval().to(self._device)
+                extractor = get_model("superpoint", {}, self._device)
                 pred = {}
                 pred0 = extractor({"image": _frame2tensor(image0_, self._device)})
                 pred = {**pred, **{k + "0": v for k, v in pred0.items()}}
@@ -1169,6 +1890,7 @@ class LightGlueMatcher(ImageMatcherBase):
 
         # Retrieve original image coordinates if matching was performed on up/down-sampled images
         features0, features1 = self._resize_features(quality, features0, features1)
+        self._resize_preselection(quality)
 
         # Store features as class members
         self._mkpts0 = features0.keypoints
@@ -1177,6 +1899,9 @@ class LightGlueMatcher(ImageMatcherBase):
         self.timer.update("matching")
         logger.info("Matching done!")
 
+        # Remove the matches outside the epipolar band of the prior geometry
+        self._apply_guidance_filter()
+
         if do_viz_matches is True:
             save_dir = Path(save_dir)
             save_dir.mkdir(parents=True, exist_ok=True)
@@ -1187,12 +1912,16 @@ class LightGlueMatcher(ImageMatcherBase):
         # Perform geometric verification
         logger.info("Performing geometric verification...")
         if gv_method is not GeometricVerification.NONE:
-            F, inlMask = geometric_verification(
+            F, inlMask, self._gv_stages = verify_matches(
                 self._mkpts0,
                 self._mkpts1,
                 method=gv_method,
                 confidence=confidence,
                 threshold=threshold,
+                max_iters=max_iters,
+                mconf=self._mconf,
+                tile_ids=self._match_tile_ids if tile_verification else None,
+                n_workers=gv_workers,
             )
             self._F = F
             self._filter_matches_by_mask(inlMask)
@@ -1253,83 +1982,6 @@ class LightGlueMatcher(ImageMatcherBase):
 
         return features0, features1, matches0, mconf
 
-    def _tile_selection(
-        self,
-        image0: np.ndarray,
-        image1: np.ndarray,
-        t0_lims: dict[int, np.ndarray],
-        t1_lims: dict[int, np.ndarray],
-        method: TileSelection = TileSelection.PRESELECTION,
-    ) -> List[Tuple[int, int]]:
-        """
-        Selects tile pairs for matching based on the specified method.
-
-        Args:
-            image0 (np.ndarray): The first image.
-            image1 (np.ndarray): The second image.
-            t0_lims (dict[int, np.ndarray]): The limits of tiles in image0.
-            t1_lims (dict[int, np.ndarray]): The limits of tiles in image1.
-            method (TileSelection, optional): The tile selection method. Defaults to TileSelection.PRESELECTION.
-
-        Returns:
-            List[Tuple[int, int]]: The selected tile pairs.
-
-        """
-
-        def points_in_rect(points: np.ndarray, rect: np.ndarray) -> np.ndarray:
-            logic = np.all(points > rect[:2], axis=1) & np.all(
-                points < rect[2:], axis=1
-            )
-            return logic
-
-        # default parameters
-        min_matches_per_tile = 2
-
-        # Select tile pairs to match
-        if method == TileSelection.EXHAUSTIVE:
-            logger.info("Matching tiles exaustively")
-            tile_pairs = sorted(product(t0_lims.keys(), t1_lims.keys()))
-        elif method == TileSelection.GRID:
-            logger.info("Matching tiles by regular grid")
-            tile_pairs = sorted(zip(t0_lims.keys(), t1_lims.keys()))
-        elif method == TileSelection.PRESELECTION:
-            logger.info("Matching tiles by preselection tile selection")
-            if image0.shape[0] > 8000:
-                n_down = 4
-            if image0.shape[0] > 4000:
-                n_down = 3
-            elif image0.shape[0] > 2000:
-                n_down = 2
-            else:
-                n_down = 1
-
-            i0 = deepcopy(image0)
-            i1 = deepcopy(image1)
-            for _ in range(n_down):
-                i0 = cv2.pyrDown(i0)
-                i1 = cv2.pyrDown(i1)
-            f0, f1, mtc, _ = self._match_images(i0, i1)
-            vld = mtc > -1
-            kp0 = f0.keypoints[vld]
-            kp1 = f1.keypoints[mtc[vld]]
-            for _ in range(n_down):
-                kp0 *= 2
-                kp1 *= 2
-
-            tile_pairs = []
-            all_pairs = sorted(product(t0_lims.keys(), t1_lims.keys()))
-            for tidx0, tidx1 in all_pairs:
-                lim0 = t0_lims[tidx0]
-                lim1 = t1_lims[tidx1]
-                ret0 = points_in_rect(kp0, lim0)
-                ret1 = points_in_rect(kp1, lim1)
-                ret = ret0 & ret1
-                if sum(ret) > min_matches_per_tile:
-                    tile_pairs.append((tidx0, tidx1))
-            self.timer.update("preselection")
-
-        return tile_pairs
-
     def _match_tiles(
         self,
         image0: np.ndarray,
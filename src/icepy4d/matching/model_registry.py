@@ -0,0 +1,262 @@
+import json
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+import kornia.feature as KF
+import torch
+from torch import nn
+
+from icepy4d.thirdparty.SuperGlue.models.matching import Matching
+from icepy4d.thirdparty.SuperGlue.models.superglue import SuperGlue
+from icepy4d.thirdparty.SuperGlue.models.superpoint import SuperPoint
+
+logger = logging.getLogger(__name__)
+
+# Size (height, width) of the dummy images used to warm up the models (kept small, because SuperPoint may detect a keypoint in most pixels of a dummy image)
+WARMUP_IMAGE_SIZE = (120, 160)
+
+# Number of dummy keypoints used to warm up SuperGlue
+WARMUP_NUM_KEYPOINTS = 512
+
+# Builders of the models (config -> torch.nn.Module) and their warm-up functions (net, device -> None)
+_BUILDERS: Dict[str, Callable] = {}
+_WARMUPS: Dict[str, Callable] = {}
+
+# Loaded models, indexed by (model, config, device, compile, quantize)
+_MODELS: Dict[Tuple[str, str, str, str, bool], torch.nn.Module] = {}
+_LOCK = threading.Lock()
+
+
+def register_model(name: str, builder: Callable, warmup: Callable = None) -> None:
+    """
+    register_model Register a model type in the model registry.
+
+    Args:
+        name (str): The name of the model type (e.g., "superpoint").
+        builder (Callable): Function that builds the model from a configuration dictionary.
+        warmup (Callable, optional): Function warmup(net, device) that runs the model on a dummy input. Defaults to None (no warm-up).
+    """
+    _BUILDERS[name] = builder
+    _WARMUPS[name] = warmup
+
+
+def _dummy_image(device: str) -> torch.Tensor:
+    return torch.rand(1, 1, *WARMUP_IMAGE_SIZE, device=device)
+
+
+def _dummy_superglue_input(device: str) -> dict:
+    n = WARMUP_NUM_KEYPOINTS
+    data = {}
+    for i in ["0", "1"]:
+        data["image" + i] = _dummy_image(device)
+        data["keypoints" + i] = torch.rand(1, n, 2, device=device) * torch.tensor(
+            WARMUP_IMAGE_SIZE[::-1], device=device
+        )
+        data["scores" + i] = torch.rand(1, n, device=device)
+        data["descriptors" + i] = torch.nn.functional.normalize(
+            torch.rand(1, 256, n, device=device), dim=1
+        )
+    return data
+
+
+def _warmup_superpoint(net: torch.nn.Module, device: str) -> None:
+    net({"image": _dummy_image(device)})
+
+
+def _warmup_superglue(net: torch.nn.Module, device: str) -> None:
+    net(_dummy_superglue_input(device))
+
+
+def _warmup_matching(net: torch.nn.Module, device: str) -> None:
+    # Run SuperPoint and SuperGlue separately, to control the number of keypoints
+    net.superpoint({"image": _dummy_image(device)})
+    net(_dummy_superglue_input(device))
+
+
+register_model("superpoint", lambda config: SuperPoint(config), _warmup_superpoint)
+register_model("superglue", lambda config: SuperGlue(config), _warmup_superglue)
+register_model("matching", lambda config: Matching(config), _warmup_matching)
+register_model("lightglue", lambda config: KF.LightGlue(**config))
+
+
+def _model_key(
+    model: str, config: dict, device: str, compile: str, quantize: bool
+) -> tuple:
+    config = json.dumps(config, sort_keys=True, default=str)
+    return (model, config, device, compile, quantize)
+
+
+class PointwiseLinear(nn.Module):
+    """A 1x1 Conv1d implemented as a Linear layer (on the channel dimension), so that it can be dynamically quantized."""
+
+    def __init__(self, conv: nn.Conv1d) -> None:
+        super().__init__()
+        self.linear = nn.Linear(
+            conv.in_channels, conv.out_channels, bias=conv.bias is not None
+        )
+        self.linear.weight.data = conv.weight.data[..., 0].clone()
+        if conv.bias is not None:
+            self.linear.bias.data = conv.bias.data.clone()
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.linear(x.transpose(1, 2)).transpose(1, 2).contiguous()
+
+
+def _replace_pointwise_convs(module: nn.Module) -> None:
+    for name, child in module.named_children():
+        if (
+            isinstance(child, nn.Conv1d)
+            and child.kernel_size == (1,)
+            and child.groups == 1
+        ):
+            setattr(module, name, PointwiseLinear(child))
+        else:
+            _replace_pointwise_convs(child)
+
+
+def quantize_model(net: torch.nn.Module) -> torch.nn.Module:
+    """
+    quantize_model Apply dynamic int8 quantization to the Linear layers of a network (for CPU inference). The 1x1 convolutions used by SuperGlue for its MLPs and attention projections are converted to Linear layers first, so that they are quantized as well. Other layers (e.g., the convolutions of SuperPoint) are left in float32.
+
+    Args:
+        net (torch.nn.Module): The network, in eval mode.
+
+    Returns:
+        torch.nn.Module: The quantized network. If quantization is not supported, the original network is returned.
+    """
+    try:
+        _replace_pointwise_convs(net)
+        return torch.ao.quantization.quantize_dynamic(
+            net, {nn.Linear}, dtype=torch.qint8
+        )
+    except Exception as err:
+        logger.warning(f"Unable to quantize the model: {err}. Using float32.")
+        return net
+
+
+def _compile_model(model: torch.nn.Module, compile: str) -> torch.nn.Module:
+    if compile is None:
+        return model
+    try:
+        if compile == "jit":
+            return torch.jit.script(model)
+        elif compile == "compile":
+            return torch.compile(model)
+        else:
+            raise ValueError(
+                f"Invalid compile mode {compile}. It must be None, 'jit' or 'compile'."
+            )
+    except ValueError:
+        raise
+    except Exception as err:
+        logger.warning(
+            f"Unable to compile the model with {compile}: {err}. Using eager mode."
+        )
+        return model
+
+
+def get_model(
+    model: str,
+    config: dict = None,
+    device: str = "cpu",
+    warmup: bool = False,
+    compile: str = None,
+    quantize: bool = False,
+) -> torch.nn.Module:
+    """
+    get_model Get a network from the process-wide model registry. The network is built, loaded and moved to the device only the first time it is requested with a given configuration; later calls return the same instance, already in eval mode.
+
+    Args:
+        model (str): The model type. One of "superpoint", "superglue", "matching" (SuperPoint+SuperGlue) and "lightglue", or any model added with register_model().
+        config (dict, optional): The configuration of the model (e.g., the weights and the detector/matcher parameters). Defaults to None (empty configuration).
+        device (str, optional): The device where the model runs. Defaults to "cpu".
+        warmup (bool, optional): Run a forward pass on a dummy input after loading, so that lazy initializations (and compilation) happen before the first real inference. Defaults to False.
+        compile (str, optional): Compile the model with torch.jit.script ("jit") or torch.compile ("compile"). If compilation fails, the eager model is used. Defaults to None (eager mode).
+        quantize (bool, optional): Apply dynamic int8 quantization to the Linear (and 1x1 Conv1d) layers. Only supported on CPU. Defaults to False.
+
+    Returns:
+        torch.nn.Module: The network, in eval mode.
+
+    Raises:
+        KeyError: If the model type is not registered.
+    """
+    if model not in _BUILDERS:
+        raise KeyError(
+            f"Invalid model {model}. Available models are: {', '.join(_BUILDERS)}"
+        )
+    config = dict(config or {})
+    if quantize and str(device) != "cpu":
+        logger.warning("Quantized models can run only on CPU. Using float32.")
+        quantize = False
+    key = _model_key(model, config, str(device), compile, quantize)
+    with _LOCK:
+        if key in _MODELS:
+            return _MODELS[key]
+
+        start = time.perf_counter()
+        net = _BUILDERS[model](config).eval().to(device)
+        if quantize:
+            net = quantize_model(net)
+        net = _compile_model(net, compile)
+        logger.info(
+            f"Loaded {model} model on {device} in {time.perf_counter() - start:.3f} s"
+        )
+
+        if warmup:
+            warmup_model(net, model, device)
+
+        _MODELS[key] = net
+        return net
+
+
+def warmup_model(net: torch.nn.Module, model: str, device: str) -> None:
+    """
+    warmup_model Run a forward pass of a network on a dummy input and log the time.
+
+    Args:
+        net (torch.nn.Module): The network.
+        model (str): The model type, used to build the dummy input.
+        device (str): The device where the network runs.
+    """
+    warmup = _WARMUPS.get(model)
+    if warmup is None:
+        logger.info(f"No warm-up available for {model} model. Skipping warm-up.")
+        return
+    start = time.perf_counter()
+    with torch.inference_mode():
+        warmup(net, device)
+    logger.info(f"Warmed up {model} model in {time.perf_counter() - start:.3f} s")
+
+
+def loaded_models() -> List[tuple]:
+    """Return the keys (model, config, device, compile, quantize) of the models currently loaded in the registry."""
+    with _LOCK:
+        return list(_MODELS.keys())
+
+
+def clear_models() -> None:
+    """Remove all the models from the registry (e.g., to free GPU memory)."""
+    with _LOCK:
+        _MODELS.clear()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def set_num_threads(num_threads: int, num_interop_threads: int = None) -> None:
+    """
+    set_num_threads Pin the number of CPU threads used by PyTorch for inference.
+
+    Args:
+        num_threads (int): The number of threads used for intra-op parallelism, or None to leave it unchanged.
+        num_interop_threads (int, optional): The number of threads used for inter-op parallelism. It can be set only once per process, before any parallel work is started. Defaults to None (unchanged).
+    """
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads is not None:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError as err:
+            logger.warning(f"Unable to set the number of inter-op threads: {err}")
+    logger.info(f"PyTorch is using {torch.get_num_threads()} threads")
@@ -3,6 +3,50 @@ from typing import Dict, List
 import matplotlib.pyplot as plt
 import numpy as np
 
+# Minimum number of keypoints assigned to each tile by the keypoint budget, so that low-texture tiles (e.g., on snow or ice) are still covered
+MIN_KEYPOINTS_PER_TILE = 128
+
+# Downsampling factor of the image used to compute the texture score of the tiles
+TEXTURE_DOWNSAMPLING = 4
+
+
+def allocate_keypoint_budget(
+    scores: Dict[int, float],
+    budget: int,
+    min_keypoints: int = MIN_KEYPOINTS_PER_TILE,
+) -> Dict[int, int]:
+    """
+    Share a global keypoint budget among tiles, proportionally to a score of each tile (e.g., its texture or the number of preselection matches in it). Each tile gets at least min_keypoints keypoints (or an equal share of the budget, if the budget is too small) and the allocations sum up to the budget.
+
+    Args:
+        scores (Dict[int, float]): The score of each tile, indexed by the tile id. Negative scores are treated as 0.
+        budget (int): The total number of keypoints to share among the tiles.
+        min_keypoints (int, optional): The minimum number of keypoints of each tile. Defaults to MIN_KEYPOINTS_PER_TILE.
+
+    Returns:
+        Dict[int, int]: The number of keypoints of each tile, indexed by the tile id.
+    """
+    if not scores:
+        return {}
+    ids = list(scores.keys())
+    n = len(ids)
+    min_keypoints = min(min_keypoints, budget // n)
+    remaining = budget - n * min_keypoints
+
+    weights = np.clip(np.array([scores[i] for i in ids], dtype=np.float64), 0, None)
+    if weights.sum() > 0:
+        weights = weights / weights.sum()
+    else:
+        weights = np.full(n, 1 / n)
+    shares = remaining * weights
+    alloc = np.floor(shares).astype(int)
+
+    # Assign the keypoints left by rounding to the tiles with the largest remainders
+    left = remaining - alloc.sum()
+    alloc[np.argsort(alloc - shares, kind="stable")[:left]] += 1
+
+    return {int(i): int(min_keypoints + a) for i, a in zip(ids, alloc)}
+
 
 class Tiler:
     """
@@ -120,6 +164,79 @@ class Tiler:
 
         return self._limits, self._origin
 
+    def texture_scores(
+        self,
+        image: np.ndarray,
+        limits: Dict[int, tuple] = None,
+        downsampling: int = TEXTURE_DOWNSAMPLING,
+    ) -> Dict[int, float]:
+        """
+        Compute a cheap texture score of each tile, as the mean gradient magnitude of a downsampled version of the image within the tile. Tiles on uniform areas (e.g., snow or sky) get low scores.
+
+        Parameters:
+        - image (np.ndarray): The grayscale image.
+        - limits (Dict[int, tuple], default=None): The limits of the tiles as [xmin, ymin, xmax, ymax]. If None, the limits computed by compute_limits_by_grid() are used.
+        - downsampling (int, default=TEXTURE_DOWNSAMPLING): The downsampling factor of the image.
+
+        Returns:
+        Dict[int, float]: The texture score of each tile, indexed by the tile id.
+        """
+        if limits is None:
+            limits = self._limits
+        if image.ndim > 2:
+            image = image.mean(axis=2)
+        small = image[::downsampling, ::downsampling].astype(np.float32)
+        gy, gx = np.gradient(small)
+        magnitude = np.hypot(gx, gy)
+
+        # Integral image, to sum the gradient magnitude within each tile in constant time
+        integral = np.zeros((small.shape[0] + 1, small.shape[1] + 1))
+        integral[1:, 1:] = magnitude.cumsum(0).cumsum(1)
+
+        scores = {}
+        for idx, lim in limits.items():
+            x0, y0 = (int(v) // downsampling for v in lim[:2])
+            x1 = min(int(np.ceil(lim[2] / downsampling)), small.shape[1])
+            y1 = min(int(np.ceil(lim[3] / downsampling)), small.shape[0])
+            area = max((x1 - x0) * (y1 - y0), 1)
+            total = (
+                integral[y1, x1]
+                - integral[y0, x1]
+                - integral[y1, x0]
+                + integral[y0, x0]
+            )
+            scores[int(idx)] = float(total / area)
+        return scores
+
+    def keypoint_budget(
+        self,
+        image: np.ndarray,
+        budget: int,
+        limits: Dict[int, tuple] = None,
+        scores: Dict[int, float] = None,
+        min_keypoints: int = MIN_KEYPOINTS_PER_TILE,
+    ) -> Dict[int, int]:
+        """
+        Share a global keypoint budget among the tiles of an image (see allocate_keypoint_budget()).
+
+        Parameters:
+        - image (np.ndarray): The grayscale image.
+        - budget (int): The total number of keypoints of the image.
+        - limits (Dict[int, tuple], default=None): The limits of the tiles. If None, the limits computed by compute_limits_by_grid() are used.
+        - scores (Dict[int, float], default=None): The score of each tile. If None, the texture score computed by texture_scores() is used.
+        - min_keypoints (int, default=MIN_KEYPOINTS_PER_TILE): The minimum number of keypoints of each tile.
+
+        Returns:
+        Dict[int, int]: The maximum number of keypoints of each tile, indexed by the tile id.
+        """
+        if limits is None:
+            limits = self._limits
+        if scores is None:
+            scores = self.texture_scores(image, limits)
+        return allocate_keypoint_budget(
+            {i: scores[i] for i in limits}, budget, min_keypoints
+        )
+
     def extract_patch(self, image: np.ndarray, limits: List[int]) -> np.ndarray:
         """Extract image patch
         Parameters
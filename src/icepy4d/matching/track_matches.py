@@ -5,7 +5,7 @@ import torch
 import cv2
 import logging
 
-from icepy4d.thirdparty.SuperGlue.models.matching import Matching
+from icepy4d.matching.model_registry import get_model
 from icepy4d.thirdparty.SuperGlue.models.utils import (
     make_matching_plot,
     AverageTimer,
@@ -107,7 +107,7 @@ def track_matches(pairs, maskBB, prevs, track_id, opt):
             "match_threshold": opt.match_threshold,
         },
     }
-    matching = Matching(config).eval().to(device)
+    matching = get_model("matching", config, device)
 
     # Create the output directories if they do not exist already.
     output_dir = Path(opt.output_dir)
@@ -0,0 +1,13 @@
+from .cache import StageCache  # noqa: F401
+from .runner import (  # noqa: F401
+    EpochState,
+    Pipeline,
+    PipelineReport,
+    SkipEpoch,
+    Stage,
+    StageResult,
+    format_cache_table,
+    memory_limit,
+    neighbors,
+)
+from .stages import build_pipeline, build_states  # noqa: F401
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Version of the cache (increase it when the format of the keys or of the entries changes, to invalidate all the cached stages)
+CACHE_VERSION = 1
+
+# File storing the hashes of the input files, with their size and modification time (so that the files are hashed again only when they change)
+FILE_HASH_INDEX = "file_hashes.json"
+
+# Size of the chunks read when hashing a file [bytes]
+HASH_CHUNK_SIZE = 4 * 1024**2
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    return str(obj)
+
+
+def config_subtree(cfg: dict, keys: Iterable[str]) -> Dict[str, Any]:
+    """
+    config_subtree Extract the values of the given (dotted) keys from the configuration, e.g. "matching" or "georef.camera_centers_world". Missing keys are None.
+    """
+    values = {}
+    for key in keys:
+        value = cfg
+        for part in key.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        values[key] = value
+    return values
+
+
+def hash_file(path: Union[str, Path]) -> str:
+    """
+    hash_file Compute the SHA-256 hash of the content of a file.
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class StageCache:
+    """
+    StageCache Content-addressed store of the state of the epochs after each pipeline stage. Every entry is saved as a pickle file named after its key, i.e. the hash of everything the stage depends on (see Pipeline.stage_keys()).
+
+    Args:
+        root (Union[str, Path]): The directory of the cache.
+    """
+
+    def __init__(self, root: Union[str, Path]) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._file_hashes = {}
+        self._index_changed = False
+        index = self.root / FILE_HASH_INDEX
+        if index.exists():
+            try:
+                with open(index, "r") as f:
+                    self._file_hashes = json.load(f)
+            except (OSError, ValueError) as err:
+                logger.warning(f"Unable to read file hash index {index}: {err}")
+
+    def __repr__(self) -> str:
+        return f"StageCache({self.root})"
+
+    def __getstate__(self) -> dict:
+        """Do not send the file hash index to the worker processes (they only read and write entries)."""
+        state = self.__dict__.copy()
+        state["_file_hashes"] = {}
+        return state
+
+    def __contains__(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.pickle"
+
+    def file_hash(self, path: Union[str, Path]) -> str:
+        """
+        file_hash Get the hash of the content of a file. The hash is computed again only if the size or the modification time of the file changed since the last call.
+        """
+        path = Path(path).resolve()
+        stat = path.stat()
+        entry = self._file_hashes.get(str(path))
+        if entry is not None and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return entry[2]
+        digest = hash_file(path)
+        self._file_hashes[str(path)] = [stat.st_size, stat.st_mtime_ns, digest]
+        self._index_changed = True
+        return digest
+
+    def save_index(self) -> None:
+        """
+        save_index Write the file hash index to disk (if it changed).
+        """
+        if not self._index_changed:
+            return
+        tmp = self.root / f"{FILE_HASH_INDEX}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._file_hashes, f)
+        os.replace(tmp, self.root / FILE_HASH_INDEX)
+        self._index_changed = False
+
+    @staticmethod
+    def key(*parts: Any) -> str:
+        """
+        key Compute the key of an entry as the SHA-256 hash of the JSON serialization of parts (numpy arrays, paths and datetimes are supported).
+        """
+        data = json.dumps(
+            [CACHE_VERSION, *parts], sort_keys=True, default=_json_default
+        )
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def get(self, key: str) -> Tuple[Any, Dict[str, Any]]:
+        """
+        get Read an entry.
+
+        Args:
+            key (str): The key of the entry.
+
+        Returns:
+            Tuple[Any, Dict[str, Any]]: The epoch and the data of the EpochState saved after the stage.
+        """
+        with open(self._path(key), "rb") as f:
+            return pickle.load(f)
+
+    def put(self, key: str, epoch: Any, data: Dict[str, Any]) -> None:
+        """
+        put Save an entry. The file is written atomically, so that concurrent workers never read a partial entry.
+
+        Args:
+            key (str): The key of the entry.
+            epoch (Any): The epoch of the EpochState.
+            data (Dict[str, Any]): The data of the EpochState.
+        """
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump((epoch, data), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def size(self) -> int:
+        """
+        size Get the total size of the cached entries [bytes].
+        """
+        return sum(p.stat().st_size for p in self.root.glob("*/*.pickle"))
+
+    def clear(self) -> None:
+        """
+        clear Remove all the entries (the file hash index is kept).
+        """
+        for folder in self.root.iterdir():
+            if folder.is_dir():
+                shutil.rmtree(folder)
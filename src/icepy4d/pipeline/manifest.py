@@ -0,0 +1,183 @@
+import json
+import logging
+import os
+import time
+from dataclasses import asdict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Union
+
+import numpy as np
+
+from .cache import _json_default, hash_file
+from .runner import DONE, FAILED, SKIPPED, PipelineReport, StageResult
+
+logger = logging.getLogger(__name__)
+
+# Directory (relative to the results directory) where the run manifests are written
+MANIFEST_DIR = "runs"
+
+# Version of the manifest format
+MANIFEST_VERSION = 1
+
+
+def manifest_path(results_dir: Union[str, Path], start: datetime) -> Path:
+    """
+    manifest_path Get the path of the manifest of a run started at the given time, e.g. results_dir/runs/run_20221021_103015.json.
+    """
+    return Path(results_dir) / MANIFEST_DIR / f"run_{start:%Y%m%d_%H%M%S}.json"
+
+
+def build_manifest(
+    report: PipelineReport = None,
+    stages: Sequence[str] = (),
+    config_file: Union[str, Path] = None,
+    start: datetime = None,
+    **info: Any,
+) -> Dict[str, Any]:
+    """
+    build_manifest Build the machine-readable summary of a run: configuration, status of every epoch, time spent in each stage (total and mean of the computed stages) and the result of every stage.
+
+    Args:
+        report (PipelineReport, optional): The report returned by Pipeline.run(). Defaults to None (e.g., for a dry run).
+        stages (Sequence[str], optional): The names of the stages of the pipeline, in order. Defaults to ().
+        config_file (Union[str, Path], optional): The configuration file, whose hash is stored to identify the configuration. Defaults to None.
+        start (datetime, optional): The time the run started. Defaults to None (now).
+        **info: Other entries of the manifest (e.g., the command line arguments).
+
+    Returns:
+        Dict[str, Any]: The manifest.
+    """
+    end = datetime.now()
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "start": start or end,
+        "end": end,
+        "config_file": str(config_file) if config_file else None,
+        "config_hash": hash_file(config_file) if config_file else None,
+        "stages": list(stages),
+        **info,
+    }
+    if report is None:
+        return manifest
+
+    summary = {}
+    for name in stages:
+        results = [r for r in report.results if r.stage == name]
+        computed = [r.elapsed for r in results if r.status == DONE and not r.cached]
+        summary[name] = {
+            "computed": len(computed),
+            "cached": sum(1 for r in results if r.status == DONE and r.cached),
+            "skipped": sum(1 for r in results if r.status == SKIPPED),
+            "failed": sum(1 for r in results if r.status == FAILED),
+            "elapsed": sum(computed),
+            "mean_elapsed": float(np.mean(computed)) if computed else None,
+        }
+    epochs = dict.fromkeys(r.epoch_id for r in report.results)
+    manifest.update(
+        elapsed=report.elapsed,
+        epochs={ep: report.status(ep) for ep in epochs},
+        stage_summary=summary,
+        results=[asdict(r) for r in report.results],
+    )
+    return manifest
+
+
+def write_manifest(path: Union[str, Path], manifest: Dict[str, Any]) -> None:
+    """
+    write_manifest Write a manifest to a JSON file. The file is replaced atomically, so that a run interrupted while writing leaves the previous version of the manifest.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, default=_json_default)
+    os.replace(tmp, path)
+    logger.debug(f"Run manifest written to {path}")
+
+
+class ManifestWriter:
+    """
+    Callback of Pipeline.run() that rewrites the manifest of the run every time an epoch is finished (i.e., all its stages have a result), so that the manifest of a run that is killed still records the completed epochs and --resume can skip them.
+
+    Args:
+        path (Union[str, Path]): The path of the manifest.
+        stages (Sequence[str]): The names of the stages of the pipeline, in order.
+        **info: The other entries of the manifest (see build_manifest()).
+    """
+
+    def __init__(
+        self, path: Union[str, Path], stages: Sequence[str], **info: Any
+    ) -> None:
+        self.path = Path(path)
+        self.stages = list(stages)
+        self.info = info
+        self.results: List[StageResult] = []
+        self._pending: Dict[int, int] = {}
+        self._t0 = time.perf_counter()
+
+    def __call__(self, result: StageResult) -> None:
+        self.results.append(result)
+        left = self._pending.get(result.epoch_id, len(self.stages)) - 1
+        self._pending[result.epoch_id] = left
+        if left == 0:
+            report = PipelineReport(self.results, time.perf_counter() - self._t0)
+            self.write(report, finished=False)
+
+    def write(self, report: PipelineReport = None, finished: bool = False) -> None:
+        """
+        write Write the manifest with the results of the given report (default: no results).
+        """
+        manifest = build_manifest(
+            report, stages=self.stages, finished=finished, **self.info
+        )
+        write_manifest(self.path, manifest)
+
+
+def read_manifests(folder: Union[str, Path]) -> List[Dict[str, Any]]:
+    """
+    read_manifests Read all the manifests in a folder, from the oldest to the newest run. The files that cannot be read are skipped with a warning.
+    """
+    manifests = []
+    for path in sorted(Path(folder).glob("run_*.json")):
+        try:
+            with open(path, "r") as f:
+                manifests.append(json.load(f))
+        except (OSError, ValueError) as err:
+            logger.warning(f"Unable to read run manifest {path}: {err}")
+    return manifests
+
+
+def mean_stage_times(manifests: Sequence[Dict[str, Any]]) -> Dict[str, float]:
+    """
+    mean_stage_times Compute the mean time spent [s] to compute each stage of an epoch in previous runs (the stages restored from the cache and the dry runs are not considered).
+    """
+    times = {}
+    for manifest in manifests:
+        for r in manifest.get("results", []):
+            if r["status"] == DONE and not r["cached"]:
+                times.setdefault(r["stage"], []).append(r["elapsed"])
+    return {name: float(np.mean(t)) for name, t in times.items()}
+
+
+def completed_epochs(
+    manifests: Sequence[Dict[str, Any]], stages: Sequence[str]
+) -> List[int]:
+    """
+    completed_epochs Get the epochs for which all the given stages were completed in the most recent run that processed them.
+
+    Args:
+        manifests (Sequence[Dict[str, Any]]): The manifests, from the oldest to the newest run (see read_manifests()).
+        stages (Sequence[str]): The stages that must be completed.
+
+    Returns:
+        List[int]: The ids of the completed epochs, sorted.
+    """
+    done = {}
+    for manifest in manifests:
+        results = {}
+        for r in manifest.get("results", []):
+            results.setdefault(r["epoch_id"], {})[r["stage"]] = r["status"]
+        for ep, statuses in results.items():
+            done[ep] = all(statuses.get(name) == DONE for name in stages)
+    return sorted(ep for ep, ok in done.items() if ok)
@@ -0,0 +1,816 @@
+import _thread
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from icepy4d.pipeline.cache import StageCache, config_subtree
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Status of a stage of an epoch
+PENDING = "pending"
+DONE = "done"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+# Cache status of a stage of an epoch, before running the pipeline (see Pipeline.cache_status())
+HIT = "hit"  # restored from the cache
+MISS = "miss"  # computed and saved in the cache
+UNCACHED = "run"  # computed, never cached (Stage.cacheable is False)
+MISSING = "missing"  # not in the cache, but required to start from a later stage (the epoch is skipped)
+
+# Interval between two checks of the resident memory of a stage with a memory limit [s]
+MEMORY_POLL_INTERVAL = 0.05
+
+# Start method of the worker processes ("spawn" is safe with CUDA and with multi-threaded libraries as PyTorch and OpenCV, that do not survive a fork)
+DEFAULT_START_METHOD = "spawn"
+
+# A node of the task graph: (epoch_id, stage name)
+Node = Tuple[int, str]
+
+
+class SkipEpoch(Exception):
+    """Raised by a stage to stop the processing of the current epoch (e.g., not enough targets for georeferencing). The remaining stages of the epoch are skipped."""
+
+
+@dataclass
+class EpochState:
+    """
+    The state of one epoch moved through the stages of the pipeline (and between the worker processes, so everything in it must be picklable).
+
+    Attributes:
+        epoch_id (int): The id of the epoch.
+        cfg (Any): The configuration of the processing (e.g., the EasyDict returned by parse_cfg()).
+        epoch (Any): The Epoch object, once created by a stage. Defaults to None.
+        data (Dict[str, Any]): The intermediate results shared between the stages (e.g., the matches before geometric verification).
+    """
+
+    epoch_id: int
+    cfg: Any = None
+    epoch: Any = None
+    data: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class Stage:
+    """
+    A processing stage, run once for every epoch.
+
+    Attributes:
+        name (str): The unique name of the stage.
+        func (Callable[[EpochState, Dict[int, EpochState]], None]): The function running the stage. It receives the state of the epoch (that it updates in place) and the states of the linked epochs (see links), by epoch id. It must be a module-level function, to be sent to the worker processes.
+        requires (Tuple[str, ...]): The stages of the same epoch that must be completed before this stage. Defaults to ().
+        links (Callable[[int, Sequence[int]], Iterable[Tuple[int, str]]]): Ordering constraints with other epochs (e.g., tracking or pose smoothing). Given the position of the epoch in the list of processed epochs and the list itself, it returns the (epoch_id, stage) pairs that must be completed before this stage (see neighbors()). Defaults to None (independent epochs).
+        memory_limit (int): The maximum resident memory [MB] of the process while running the stage. The stage fails with a MemoryError if it uses more (see memory_limit()). Defaults to None (no limit).
+        in_main_process (bool): Run the stage in the main process (e.g., for writing files shared by all the epochs). Defaults to False.
+        config_keys (Tuple[str, ...]): The (dotted) keys of the configuration the stage depends on, e.g. "matching" or "georef.camera_centers_world". They are part of the cache key of the stage. Defaults to ().
+        inputs (Callable[[EpochState], Iterable[Path]]): Given the initial state of an epoch, it returns the files read by the stage (e.g., the images), whose content is part of the cache key of the stage. Defaults to None.
+        cacheable (bool): Save the state after the stage in the cache and restore it on the following runs. It must be False for stages with side effects (e.g., writing the results). Defaults to True.
+    """
+
+    name: str
+    func: Callable[[EpochState, Dict[int, EpochState]], None]
+    requires: Tuple[str, ...] = ()
+    links: Callable[[int, Sequence[int]], Iterable[Tuple[int, str]]] = None
+    memory_limit: Optional[int] = None
+    in_main_process: bool = False
+    config_keys: Tuple[str, ...] = ()
+    inputs: Callable[[EpochState], Iterable[Path]] = None
+    cacheable: bool = True
+
+
+@dataclass
+class StageResult:
+    """
+    The outcome of a stage of an epoch.
+
+    Attributes:
+        epoch_id (int): The id of the epoch.
+        stage (str): The name of the stage.
+        status (str): DONE, SKIPPED or FAILED.
+        elapsed (float): The time spent in the stage [s].
+        max_rss (float): The peak resident memory [MB] of the process that ran the stage, measured at the end of the stage (None if not available).
+        message (str): The reason why the stage was skipped or failed.
+        cached (bool): True if the state after the stage was restored from the cache, False if it was computed and saved in the cache, None if the stage is not cached.
+    """
+
+    epoch_id: int
+    stage: str
+    status: str
+    elapsed: float = 0.0
+    max_rss: float = None
+    message: str = ""
+    cached: bool = None
+
+
+@dataclass
+class PipelineReport:
+    """
+    The outcome of Pipeline.run().
+
+    Attributes:
+        results (List[StageResult]): The result of every stage of every epoch, in order of completion.
+        elapsed (float): The total processing time [s].
+        states (Dict[int, EpochState]): The final state of the epochs (only if run() was called with keep_states=True).
+    """
+
+    results: List[StageResult]
+    elapsed: float
+    states: Dict[int, EpochState] = field(default_factory=dict)
+
+    def __str__(self) -> str:
+        epochs = list(dict.fromkeys(r.epoch_id for r in self.results))
+        counts = {s: len(self.epochs_with_status(s)) for s in (DONE, SKIPPED, FAILED)}
+        msg = f"Processed {len(epochs)} epochs in {self.elapsed:.1f} s: " + ", ".join(
+            f"{n} {s}" for s, n in counts.items()
+        )
+        for r in self.results:
+            if r.status == FAILED:
+                msg += f"\n  epoch {r.epoch_id} - {r.stage} failed: {r.message}"
+        return msg
+
+    def status(self, epoch_id: int) -> str:
+        """
+        status Get the status of an epoch: FAILED if any stage failed, SKIPPED if any stage was skipped, DONE otherwise.
+        """
+        statuses = {r.status for r in self.results if r.epoch_id == epoch_id}
+        for status in (FAILED, SKIPPED):
+            if status in statuses:
+                return status
+        return DONE
+
+    def epochs_with_status(self, status: str) -> List[int]:
+        """
+        epochs_with_status Get the ids of the epochs with the given status (see status()).
+        """
+        epochs = dict.fromkeys(r.epoch_id for r in self.results)
+        return [ep for ep in epochs if self.status(ep) == status]
+
+    def cache_report(self) -> str:
+        """
+        cache_report Get a table with the cache status of each stage of each epoch: hit (restored from the cache), miss (computed and saved in the cache), run (not cached), or the status of the stage if it was skipped or failed.
+        """
+        cells = {}
+        for r in self.results:
+            if r.status != DONE:
+                cells[(r.epoch_id, r.stage)] = r.status
+            else:
+                cells[(r.epoch_id, r.stage)] = {True: HIT, False: MISS}.get(
+                    r.cached, UNCACHED
+                )
+        return format_cache_table(cells)
+
+    def stage_times(self) -> Dict[str, float]:
+        """
+        stage_times Get the total time spent in each stage [s], summed over the epochs.
+        """
+        times = {}
+        for r in self.results:
+            times[r.stage] = times.get(r.stage, 0.0) + r.elapsed
+        return times
+
+
+def neighbors(stage: str, *offsets: int) -> Callable:
+    """
+    neighbors Build the links of a stage to the same (or another) stage of the neighbouring epochs, in the order of processing.
+
+    Args:
+        stage (str): The name of the stage of the neighbouring epochs that must be completed first.
+        *offsets (int): The offsets of the neighbouring epochs (e.g., -1 for the previous epoch). Offsets outside the processed epochs are ignored.
+
+    Returns:
+        Callable: A function to be used as Stage.links.
+
+    Example:
+        >>> Stage("match", match, requires=("load",), links=neighbors("verify", -1))
+    """
+
+    def links(position: int, epoch_ids: Sequence[int]) -> List[Tuple[int, str]]:
+        return [
+            (epoch_ids[position + k], stage)
+            for k in offsets
+            if k != 0 and 0 <= position + k < len(epoch_ids)
+        ]
+
+    return links
+
+
+def format_cache_table(cells: Dict[Node, str]) -> str:
+    """
+    format_cache_table Format the cache status of the stages (see Pipeline.cache_status()) as a table with one row per epoch and one column per stage, followed by the number of hits and misses.
+    """
+    epoch_ids = list(dict.fromkeys(ep for ep, _ in cells))
+    stages = list(dict.fromkeys(name for _, name in cells))
+    width = max(
+        [len(name) for name in stages] + [len(FAILED), len(SKIPPED), len(MISSING)]
+    )
+    lines = [f"{'epoch':>8}  " + "  ".join(f"{name:>{width}}" for name in stages)]
+    for ep in epoch_ids:
+        lines.append(
+            f"{ep:>8}  "
+            + "  ".join(f"{cells.get((ep, name), ''):>{width}}" for name in stages)
+        )
+    values = list(cells.values())
+    summary = f"{values.count(HIT)} hits, {values.count(MISS)} misses, {values.count(UNCACHED)} not cached"
+    if MISSING in values:
+        summary += f", {values.count(MISSING)} missing"
+    lines.append(summary)
+    return "\n".join(lines)
+
+
+def _filter_links(links: Callable, stages: Sequence[str]) -> Optional[Callable]:
+    """Drop the links to the stages that are not in the pipeline."""
+    if links is None:
+        return None
+
+    def filtered(position: int, epoch_ids: Sequence[int]) -> List[Tuple[int, str]]:
+        return [(ep, name) for ep, name in links(position, epoch_ids) if name in stages]
+
+    return filtered
+
+
+def _max_rss() -> Optional[float]:
+    if resource is None:
+        return None
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _current_rss() -> Optional[float]:
+    """The current resident memory [MB] of the process (None if not available, e.g. on platforms without /proc)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024**2
+
+
+@contextmanager
+def memory_limit(limit: Optional[int]):
+    """
+    memory_limit Context manager limiting the resident memory of the current process to limit MB. A watcher thread checks the resident memory every MEMORY_POLL_INTERVAL seconds and, if it exceeds the limit, interrupts the code in the with block with a MemoryError (raised as soon as the running operation returns to the interpreter). The resident memory is used instead of the address space (RLIMIT_AS), because libraries such as PyTorch and CUDA reserve large virtual ranges that are never used. Nothing is changed in the process, so there is nothing to restore on exit. It has no effect if limit is None, outside the main thread or on platforms where the resident memory is not available.
+    """
+    if (
+        limit is None
+        or threading.current_thread() is not threading.main_thread()
+        or _current_rss() is None
+    ):
+        yield
+        return
+    exceeded = threading.Event()
+    stop = threading.Event()
+
+    def watch():
+        while not stop.wait(MEMORY_POLL_INTERVAL):
+            if _current_rss() > limit:
+                exceeded.set()
+                _thread.interrupt_main()
+                return
+
+    watcher = threading.Thread(target=watch, name="memory-limit", daemon=True)
+    watcher.start()
+    try:
+        try:
+            yield
+        finally:
+            stop.set()
+            watcher.join()
+    except KeyboardInterrupt:
+        if exceeded.is_set():
+            raise MemoryError(f"resident memory above {limit} MB")
+        raise
+
+
+def _run_stages(
+    stages: List[Tuple[str, Callable, Optional[int], Optional[str], bool]],
+    state: EpochState,
+    linked: Dict[int, EpochState],
+    cache: StageCache = None,
+) -> Tuple[EpochState, List[StageResult]]:
+    """Run a chain of stages of one epoch (in a worker or in the main process), given as (name, func, memory limit, cache key, cache hit). The state after the last cache hit is restored from the cache, the other stages are run (and their result cached). The chain stops at the first stage that is skipped or fails."""
+    results = []
+    restore = max((i for i, s in enumerate(stages) if s[4]), default=-1)
+    if restore >= 0:
+        start = time.perf_counter()
+        try:
+            epoch, data = cache.get(stages[restore][3])
+        except Exception as err:
+            logger.warning(
+                f"Unable to read stage {stages[restore][0]} of epoch {state.epoch_id} from the cache ({err}). Recomputing it."
+            )
+            restore = -1
+        else:
+            # The initial data of the epoch (e.g., the paths) are the current ones
+            state.epoch, state.data = epoch, {**data, **state.data}
+            for i, (name, *_) in enumerate(stages[: restore + 1]):
+                elapsed = time.perf_counter() - start if i == restore else 0.0
+                results.append(
+                    StageResult(state.epoch_id, name, DONE, elapsed, cached=True)
+                )
+
+    for name, func, limit, key, _ in stages[restore + 1 :]:
+        start = time.perf_counter()
+        status, message = DONE, ""
+        try:
+            with memory_limit(limit):
+                func(state, linked)
+        except SkipEpoch as err:
+            status, message = SKIPPED, str(err)
+        except MemoryError as err:
+            status = FAILED
+            message = f"MemoryError (memory limit {limit} MB): {err}"
+        except Exception as err:
+            status, message = FAILED, f"{type(err).__name__}: {err}"
+            logger.debug(traceback.format_exc())
+        cached = None
+        if status == DONE and cache is not None and key is not None:
+            try:
+                cache.put(key, state.epoch, state.data)
+                cached = False
+            except Exception as err:
+                logger.warning(f"Unable to cache stage {name}: {err}")
+        results.append(
+            StageResult(
+                state.epoch_id,
+                name,
+                status,
+                time.perf_counter() - start,
+                _max_rss(),
+                message,
+                cached,
+            )
+        )
+        if status != DONE:
+            break
+    return state, results
+
+
+def _init_worker(log_level: int, initializer: Callable, initargs: tuple) -> None:
+    logging.basicConfig(
+        level=log_level,
+        format="%(asctime)s | [%(processName)s] [%(levelname)-8s] %(message)s",
+    )
+    if initializer is not None:
+        initializer(*initargs)
+
+
+class Pipeline:
+    """
+    Pipeline Run a DAG of processing stages over many epochs. Every epoch goes through the same stages; epochs that are not linked by ordering constraints (see Stage.links) are processed in parallel in a pool of worker processes.
+
+    The consecutive stages of an epoch that are ready are sent to a worker at once, so that independent epochs are processed entirely in one worker (the state of the epoch is pickled once per chain, not per stage).
+
+    Args:
+        stages (List[Stage]): The stages run for each epoch.
+        workers (int, optional): The number of worker processes. If 1, all the stages run in the main process. Defaults to 1.
+        memory_limits (Dict[str, int], optional): The maximum memory [MB] of each stage, by stage name. It overrides Stage.memory_limit. Defaults to None.
+        start_method (str, optional): The start method of the worker processes. Defaults to DEFAULT_START_METHOD.
+        initializer (Callable, optional): A function called at the start of each worker process (e.g., for limiting the number of threads). Defaults to None.
+        initargs (tuple, optional): The arguments of initializer. Defaults to ().
+        cache (StageCache, optional): The cache of the stages. If given, the state of each epoch after each cacheable stage is saved under a key hashing everything the stage depends on (see stage_keys()); on the following runs, the stages whose key did not change are restored instead of being computed. Defaults to None (no cache).
+        from_stage (str, optional): Compute the stages from this one on, even if they are in the cache. The previous stages are restored from the cache (the epochs for which they are not available are skipped). It requires a cache. Defaults to None (the first stage).
+    """
+
+    def __init__(
+        self,
+        stages: List[Stage],
+        workers: int = 1,
+        memory_limits: Dict[str, int] = None,
+        start_method: str = DEFAULT_START_METHOD,
+        initializer: Callable = None,
+        initargs: tuple = (),
+        cache: StageCache = None,
+        from_stage: str = None,
+    ) -> None:
+        names = [s.name for s in stages]
+        if len(set(names)) != len(names):
+            raise ValueError("Stage names must be unique.")
+        for s in stages:
+            for r in s.requires:
+                if r not in names:
+                    raise ValueError(f"Stage {s.name} requires unknown stage {r}.")
+        assert workers >= 1, "The number of workers must be at least 1."
+
+        self._stages = {s.name: s for s in stages}
+        self._order = self._sort(stages)
+        self.workers = workers
+        self.memory_limits = dict(memory_limits or {})
+        for name in self.memory_limits:
+            if name not in self._stages:
+                raise ValueError(f"Memory limit given for unknown stage {name}.")
+        self.start_method = start_method
+        self.initializer = initializer
+        self.initargs = initargs
+        self.cache = cache
+        if from_stage is not None:
+            if from_stage not in self._stages:
+                raise ValueError(f"Unknown stage {from_stage}.")
+            if cache is None:
+                raise ValueError(
+                    "Starting from a later stage requires the stage cache."
+                )
+        self.from_stage = from_stage
+
+    def __repr__(self) -> str:
+        stages = " -> ".join(self._order)
+        if self.from_stage is not None:
+            stages = stages.replace(self.from_stage, f"[{self.from_stage}")
+        return f"Pipeline({stages}, workers={self.workers})"
+
+    def select(self, from_stage: str = None, to_stage: str = None) -> "Pipeline":
+        """
+        select Get a pipeline running only part of the stages, with the same options.
+
+        Args:
+            from_stage (str, optional): The first stage to compute (see the from_stage argument of Pipeline). Defaults to None (the first stage).
+            to_stage (str, optional): The last stage to run: the following stages (in topological order) are dropped. Defaults to None (the last stage).
+
+        Raises:
+            ValueError: If a stage is unknown or if from_stage comes after to_stage.
+
+        Returns:
+            Pipeline: The new pipeline.
+        """
+        for name in (from_stage, to_stage):
+            if name is not None and name not in self._stages:
+                raise ValueError(f"Unknown stage {name}.")
+        order = self._order
+        if to_stage is not None:
+            order = order[: order.index(to_stage) + 1]
+        if from_stage is not None and from_stage not in order:
+            raise ValueError(f"Stage {from_stage} comes after stage {to_stage}.")
+        stages = [
+            replace(
+                self._stages[name], links=_filter_links(self._stages[name].links, order)
+            )
+            for name in order
+        ]
+        return Pipeline(
+            stages,
+            workers=self.workers,
+            memory_limits={k: v for k, v in self.memory_limits.items() if k in order},
+            start_method=self.start_method,
+            initializer=self.initializer,
+            initargs=self.initargs,
+            cache=self.cache,
+            from_stage=from_stage,
+        )
+
+    @property
+    def stages(self) -> List[str]:
+        """The names of the stages, in topological order."""
+        return list(self._order)
+
+    @staticmethod
+    def _sort(stages: List[Stage]) -> List[str]:
+        """Sort the stages topologically (keeping the given order among independent stages)."""
+        order, done = [], set()
+        while len(order) < len(stages):
+            ready = [
+                s.name
+                for s in stages
+                if s.name not in done and all(r in done for r in s.requires)
+            ]
+            if not ready:
+                raise ValueError("The stages have circular dependencies.")
+            order.append(ready[0])
+            done.add(ready[0])
+        return order
+
+    def memory_limit(self, stage: str) -> Optional[int]:
+        """
+        memory_limit Get the memory limit [MB] of a stage (None if not limited).
+        """
+        return self.memory_limits.get(stage, self._stages[stage].memory_limit)
+
+    def task_graph(self, epoch_ids: Sequence[int]) -> Dict[Node, List[Node]]:
+        """
+        task_graph Build the graph of the tasks for the given epochs.
+
+        Args:
+            epoch_ids (Sequence[int]): The ids of the epochs, in order of processing.
+
+        Raises:
+            ValueError: If the epoch ids are not unique, if a link refers to an unknown stage or if the links make the graph cyclic.
+
+        Returns:
+            Dict[Node, List[Node]]: The (epoch_id, stage) nodes that must be completed before each node. Links to epochs that are not processed are dropped.
+        """
+        epoch_ids = list(epoch_ids)
+        if len(set(epoch_ids)) != len(epoch_ids):
+            raise ValueError("Epoch ids must be unique.")
+        processed = set(epoch_ids)
+        graph = {}
+        for pos, ep in enumerate(epoch_ids):
+            for name in self._order:
+                stage = self._stages[name]
+                deps = [(ep, r) for r in stage.requires]
+                if stage.links is not None:
+                    for other, other_stage in stage.links(pos, epoch_ids):
+                        if other_stage not in self._stages:
+                            raise ValueError(
+                                f"Stage {name} is linked to unknown stage {other_stage}."
+                            )
+                        if other in processed and other != ep:
+                            deps.append((other, other_stage))
+                graph[(ep, name)] = deps
+        self._topological_order(graph)
+        return graph
+
+    @staticmethod
+    def _topological_order(graph: Dict[Node, List[Node]]) -> List[Node]:
+        indegree = {node: len(deps) for node, deps in graph.items()}
+        dependents = {node: [] for node in graph}
+        for node, deps in graph.items():
+            for d in deps:
+                dependents[d].append(node)
+        queue = [node for node, n in indegree.items() if n == 0]
+        order = []
+        while queue:
+            node = queue.pop()
+            order.append(node)
+            for d in dependents[node]:
+                indegree[d] -= 1
+                if indegree[d] == 0:
+                    queue.append(d)
+        if len(order) != len(graph):
+            raise ValueError("The links between the epochs make the task graph cyclic.")
+        return order
+
+    def stage_keys(self, states: List[EpochState]) -> Dict[Node, str]:
+        """
+        stage_keys Compute the cache key of each stage of each epoch, as the hash of the stage name and function, of the values of its Stage.config_keys, of the content of its Stage.inputs and of the keys of the stages it depends on (in the same epoch and in the linked epochs). Therefore, a change of the images or of the configuration invalidates the stage and all the stages downstream. Changes of the code of the stages are not detected (clear the cache).
+
+        Args:
+            states (List[EpochState]): The initial states of the epochs, in order of processing.
+
+        Returns:
+            Dict[Node, str]: The key of each (epoch_id, stage) node.
+        """
+        assert self.cache is not None, "The pipeline has no cache."
+        graph = self.task_graph([s.epoch_id for s in states])
+        by_id = {s.epoch_id: s for s in states}
+        keys = {}
+        for node in self._topological_order(graph):
+            ep, name = node
+            stage = self._stages[name]
+            state = by_id[ep]
+            files = []
+            if stage.inputs is not None:
+                files = [self.cache.file_hash(p) for p in stage.inputs(state)]
+            keys[node] = self.cache.key(
+                name,
+                f"{stage.func.__module__}.{stage.func.__qualname__}",
+                config_subtree(state.cfg or {}, stage.config_keys),
+                files,
+                [keys[dep] for dep in graph[node]],
+            )
+        self.cache.save_index()
+        return keys
+
+    def cache_status(
+        self, states: List[EpochState], keys: Dict[Node, str] = None
+    ) -> Dict[Node, str]:
+        """
+        cache_status Predict which stages will be restored from the cache (HIT), computed and cached (MISS) or computed and not cached (UNCACHED). For each epoch, the stages are restored up to the first stage that is not in the cache (or not cacheable), from the state saved after the last of them. With from_stage, the stages before it must be restored: those not available are MISSING (and the epoch is skipped).
+
+        Args:
+            states (List[EpochState]): The initial states of the epochs, in order of processing.
+            keys (Dict[Node, str], optional): The keys returned by stage_keys(). Defaults to None (computed).
+
+        Returns:
+            Dict[Node, str]: The cache status of each (epoch_id, stage) node.
+        """
+        if self.cache is None:
+            return {
+                (s.epoch_id, name): UNCACHED for s in states for name in self._order
+            }
+        if keys is None:
+            keys = self.stage_keys(states)
+        first = self._order.index(self.from_stage) if self.from_stage else None
+        status = {}
+        for s in states:
+            prefix = True
+            for i, name in enumerate(self._order):
+                stage = self._stages[name]
+                node = (s.epoch_id, name)
+                prefix = prefix and stage.cacheable and keys[node] in self.cache
+                if first is not None and i >= first:
+                    prefix = False
+                if prefix:
+                    status[node] = HIT
+                elif first is not None and i < first:
+                    status[node] = MISSING
+                else:
+                    status[node] = MISS if stage.cacheable else UNCACHED
+        return status
+
+    def run(
+        self,
+        states: List[EpochState],
+        keep_states: bool = False,
+        callback: Callable[[StageResult], None] = None,
+    ) -> PipelineReport:
+        """
+        run Process the epochs.
+
+        Args:
+            states (List[EpochState]): The initial states of the epochs, in order of processing.
+            keep_states (bool, optional): Return the final states of the epochs in the report. If False, the state of an epoch is released as soon as it is no more needed by the linked epochs. Defaults to False.
+            callback (Callable[[StageResult], None], optional): A function called in the main process with the result of each stage, as soon as it is available. Defaults to None.
+
+        Returns:
+            PipelineReport: The results of all the stages.
+        """
+        start = time.perf_counter()
+        epoch_ids = [s.epoch_id for s in states]
+        graph = self.task_graph(epoch_ids)
+        keys, hits, missing = {}, set(), {}
+        if self.cache is not None:
+            keys = self.stage_keys(states)
+            cache_status = self.cache_status(states, keys)
+            hits = {node for node, s in cache_status.items() if s == HIT}
+            for (ep, name), s in cache_status.items():
+                if s == MISSING:
+                    missing.setdefault(ep, name)
+            logger.info(f"{len(hits)} stages of {len(graph)} found in the cache.")
+        states = {s.epoch_id: s for s in states}
+        status = {node: PENDING for node in graph}
+        # Number of pending nodes of the other epochs that need the state of each epoch
+        readers = {ep: 0 for ep in epoch_ids}
+        for node, deps in graph.items():
+            for other, _ in deps:
+                if other != node[0]:
+                    readers[other] += 1
+        results = []
+        busy = set()
+        final = {}
+
+        def complete(state: EpochState, stage_results: List[StageResult]) -> None:
+            ep = state.epoch_id
+            states[ep] = state
+            busy.discard(ep)
+            for r in stage_results:
+                self._set_status(graph, status, readers, (ep, r.stage), r.status)
+                results.append(r)
+                if callback is not None:
+                    callback(r)
+                if r.status == FAILED:
+                    logger.error(f"Epoch {ep} - stage {r.stage} failed: {r.message}")
+                elif r.status == SKIPPED:
+                    logger.warning(f"Epoch {ep} - stage {r.stage} skipped: {r.message}")
+            if stage_results and stage_results[-1].status != DONE:
+                for name in self._order:
+                    if status[(ep, name)] == PENDING:
+                        msg = f"stage {stage_results[-1].stage} {stage_results[-1].status}"
+                        r = StageResult(ep, name, SKIPPED, message=msg)
+                        self._set_status(graph, status, readers, (ep, name), SKIPPED)
+                        results.append(r)
+                        if callback is not None:
+                            callback(r)
+            self._release(epoch_ids, states, status, readers, final, keep_states)
+
+        for ep, name in missing.items():
+            message = f"stage {name} is not in the cache"
+            complete(states[ep], [StageResult(ep, name, SKIPPED, message=message)])
+
+        executor = None
+        if self.workers > 1:
+            executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+                initializer=_init_worker,
+                initargs=(
+                    logging.getLogger().getEffectiveLevel(),
+                    self.initializer,
+                    self.initargs,
+                ),
+            )
+        futures = {}
+        try:
+            while any(s == PENDING for s in status.values()):
+                submitted = False
+                for ep in epoch_ids:
+                    if ep in busy or len(futures) >= self.workers and executor:
+                        continue
+                    chain, in_main = self._ready_chain(ep, graph, status, hits)
+                    if not chain:
+                        continue
+                    tasks = [
+                        (
+                            name,
+                            self._stages[name].func,
+                            self.memory_limit(name),
+                            (
+                                keys.get((ep, name))
+                                if self._stages[name].cacheable
+                                else None
+                            ),
+                            (ep, name) in hits,
+                        )
+                        for name in chain
+                    ]
+                    linked = {
+                        other: states[other]
+                        for name in chain
+                        if (ep, name) not in hits
+                        for other, _ in graph[(ep, name)]
+                        if other != ep
+                    }
+                    busy.add(ep)
+                    submitted = True
+                    if executor is None or in_main:
+                        complete(*_run_stages(tasks, states[ep], linked, self.cache))
+                    else:
+                        future = executor.submit(
+                            _run_stages, tasks, states[ep], linked, self.cache
+                        )
+                        futures[future] = (ep, chain)
+                if not futures:
+                    if not submitted:
+                        raise RuntimeError(
+                            "No stage can be run: deadlock in the task graph."
+                        )
+                    continue
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    ep, chain = futures.pop(future)
+                    try:
+                        complete(*future.result())
+                    except Exception as err:
+                        # The worker died (e.g., killed by the OS) or the state could not be pickled
+                        message = f"{type(err).__name__}: {err}"
+                        complete(
+                            states[ep],
+                            [StageResult(ep, chain[0], FAILED, message=message)],
+                        )
+        finally:
+            if executor is not None:
+                # The pending futures are cancelled here, as shutdown(cancel_futures=True) requires Python 3.9
+                for future in futures:
+                    future.cancel()
+                executor.shutdown(wait=True)
+
+        report = PipelineReport(results, time.perf_counter() - start, final)
+        logger.info(str(report))
+        if self.cache is not None:
+            logger.info(f"Stage cache:\n{report.cache_report()}")
+        return report
+
+    def _ready_chain(
+        self,
+        ep: int,
+        graph: Dict[Node, List[Node]],
+        status: Dict[Node, str],
+        hits: set = frozenset(),
+    ) -> Tuple[List[str], bool]:
+        """Get the consecutive pending stages of an epoch that can be run now. A chain contains only stages to be run in the main process or only stages to be run in a worker. The stages restored from the cache (hits) do not wait for the linked epochs."""
+        chain = []
+        in_main = None
+        for name in self._order:
+            if status[(ep, name)] != PENDING:
+                continue
+            ready = all(
+                status[dep] != PENDING or (dep[0] == ep and dep[1] in chain)
+                for dep in graph[(ep, name)]
+                if dep[0] == ep or (ep, name) not in hits
+            )
+            if not ready:
+                break
+            stage_in_main = self._stages[name].in_main_process
+            if in_main is not None and stage_in_main != in_main:
+                break
+            in_main = stage_in_main
+            chain.append(name)
+        return chain, bool(in_main)
+
+    @staticmethod
+    def _set_status(graph, status, readers, node, value) -> None:
+        status[node] = value
+        for other, _ in graph[node]:
+            if other != node[0]:
+                readers[other] -= 1
+
+    def _release(self, epoch_ids, states, status, readers, final, keep_states) -> None:
+        """Drop the states of the completed epochs that are not needed anymore."""
+        for ep in epoch_ids:
+            if states.get(ep) is None or readers[ep] > 0:
+                continue
+            if all(status[(ep, name)] != PENDING for name in self._order):
+                if keep_states:
+                    final[ep] = states[ep]
+                states[ep] = None
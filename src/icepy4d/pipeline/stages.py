@@ -0,0 +1,614 @@
+import logging
+import os
+import shutil
+from copy import deepcopy
+from functools import wraps
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import numpy as np
+from easydict import EasyDict as edict
+
+from icepy4d import io
+from icepy4d import sfm
+from icepy4d.core import Epoch, EpochDataMap, Features, Points, ResidualTimeSeries
+from icepy4d.pipeline.cache import StageCache
+from icepy4d.pipeline.runner import EpochState, Pipeline, SkipEpoch, Stage, neighbors
+from icepy4d.utils import initialization
+
+logger = logging.getLogger(__name__)
+
+# Default matching parameters, used when they are not given in the matching section of the configuration (see matching_options())
+QUALITY = "high"
+TILE_SELECTION = "preselection"
+TILING_GRID = [4, 3]
+TILING_OVERLAP = 200
+GEOMETRIC_VERIFICATION = "pydegensac"
+GEOMETRIC_VERIFICATION_THRESHOLD = 1
+GEOMETRIC_VERIFICATION_CONFIDENCE = 0.9999
+GUIDED_MATCHING = "none"
+
+# Default directory of the stage cache (relative to the results directory)
+STAGE_CACHE_DIR = "stage_cache"
+
+# Half-width of the window of epochs (before and after) used for smoothing the pose of the camera to warp
+POSE_SMOOTHING_WINDOW = 2
+
+
+def _skip_if_loaded(func):
+    """The stages decorated are not run for the epochs read from disk by the load stage."""
+
+    @wraps(func)
+    def wrapper(state: EpochState, linked: Dict[int, EpochState]) -> None:
+        if state.data.get("loaded", False):
+            return
+        return func(state, linked)
+
+    return wrapper
+
+
+def _epoch_path(state: EpochState):
+    return state.data["epoch_dir"] / f"{state.data['timestamp']}.h5"
+
+
+def matching_options(cfg: edict) -> dict:
+    """
+    matching_options Read the parameters of the matching stages from the matching section of the configuration: quality ("low", "medium", "high" or "highest"), tile_selection ("none", "exhaustive", "grid" or "preselection"), tiling_grid, tiling_overlap, geometric_verification (a GeometricVerification method, e.g. "pydegensac", "magsac" or "lo_ransac"), geometric_verification_threshold, geometric_verification_confidence, guided_matching ("none", "filter" or "mask", using the fundamental matrix of the previous epoch as prior) and epipolar_threshold. The missing parameters take the default values defined in this module (and in icepy4d.matching.guided_matching for the epipolar threshold).
+
+    Returns:
+        dict: The parameters, with the quality, tile_selection, geometric_verification and guided_matching converted to the matching enums.
+    """
+    from icepy4d import matching
+    from icepy4d.matching.guided_matching import EPIPOLAR_THRESHOLD
+
+    opt = cfg.matching
+    return {
+        "quality": matching.Quality[str(opt.get("quality", QUALITY)).upper()],
+        "tile_selection": matching.TileSelection[
+            str(opt.get("tile_selection", TILE_SELECTION)).upper()
+        ],
+        "grid": list(opt.get("tiling_grid", TILING_GRID)),
+        "overlap": opt.get("tiling_overlap", TILING_OVERLAP),
+        "geometric_verification": matching.GeometricVerification[
+            str(opt.get("geometric_verification", GEOMETRIC_VERIFICATION)).upper()
+        ],
+        "threshold": opt.get(
+            "geometric_verification_threshold", GEOMETRIC_VERIFICATION_THRESHOLD
+        ),
+        "confidence": opt.get(
+            "geometric_verification_confidence", GEOMETRIC_VERIFICATION_CONFIDENCE
+        ),
+        "guided_matching": matching.GuidedMatching[
+            str(opt.get("guided_matching", GUIDED_MATCHING)).upper()
+        ],
+        "epipolar_threshold": opt.get("epipolar_threshold", EPIPOLAR_THRESHOLD),
+    }
+
+
+def _guided_matching_enabled(cfg: edict) -> bool:
+    """Whether the matching of each epoch is guided by the fundamental matrix of the previous epoch (read without importing the matching package)."""
+    opt = cfg.get("matching") or {}
+    return str(opt.get("guided_matching", GUIDED_MATCHING)).lower() != "none"
+
+
+def _load_inputs(state: EpochState) -> List[Path]:
+    """The files read by the load stage: the images, the calibration files, the target files and, if load_existing_results is enabled, the results of the epoch saved by a previous run."""
+    cfg = state.cfg
+    images = state.data["images"]
+    files = [images[cam].path for cam in cfg.cams]
+    if cfg.proc.load_existing_results:
+        path = _epoch_path(state)
+        files += [path, path.with_suffix(".pickle")]
+    files += [cfg.paths.calibration_dir / f"{cam}.txt" for cam in cfg.cams]
+    files += [
+        cfg.georef.target_dir / (images[cam].stem + cfg.georef.target_file_ext)
+        for cam in cfg.cams
+    ]
+    files.append(cfg.georef.target_dir / cfg.georef.target_world_file)
+    return [f for f in files if Path(f).exists()]
+
+
+def load(state: EpochState, linked: Dict[int, EpochState]) -> None:
+    """Read the epoch from disk (if load_existing_results is enabled and the epoch was already processed) or initialize a new epoch."""
+    cfg = state.cfg
+    if cfg.proc.load_existing_results:
+        path = _epoch_path(state)
+        try:
+            if path.exists():
+                state.epoch = Epoch.read_h5(path)
+            else:
+                state.epoch = Epoch.read_pickle(path.with_suffix(".pickle"))
+            state.data["loaded"] = True
+            return
+        except Exception:
+            logger.error(
+                f"Unable to load epoch {state.data['timestamp']} from file. Creating new epoch..."
+            )
+    state.epoch = initialization.initialize_epoch(
+        cfg=cfg,
+        epoch_timestamp=state.data["timestamp"],
+        images=state.data["images"],
+        epoch_dir=state.data["epoch_dir"],
+    )
+
+
+@_skip_if_loaded
+def match(state: EpochState, linked: Dict[int, EpochState]) -> None:
+    """Match the images of the first two cameras. If guided matching is enabled in the configuration, the fundamental matrix of the previous epoch (linked) is used as prior."""
+    from icepy4d import matching
+
+    cfg, epoch = state.cfg, state.epoch
+    cams = cfg.cams
+    opt = matching_options(cfg)
+    prior_F = None
+    for other in linked.values():
+        if other is not None and other.data.get("F") is not None:
+            prior_F = other.data["F"]
+
+    images = [epoch.images[cam] for cam in cams[:2]]
+    preselection_images = None
+    if (
+        opt["tile_selection"] == matching.TileSelection.PRESELECTION
+        and opt["quality"] == matching.Quality.HIGH
+    ):
+        # Decode the images for the preselection at reduced resolution (cv2.IMREAD_REDUCED_* supports factors up to 8), instead of downsampling the full-resolution images
+        levels = matching.preselection_pyramid_levels(images[0].value.shape[0])
+        preselection_images = tuple(
+            image.get_reduced(2 ** min(levels, 3), col=False) for image in images
+        )
+
+    matcher = matching.SuperGlueMatcher(
+        cfg.matching,
+        feature_cache=matching.FeatureCache(cfg.paths.results_dir / "features_cache"),
+    )
+    matcher.match(
+        images[0].value,
+        images[1].value,
+        image0_path=images[0].path,
+        image1_path=images[1].path,
+        preselection_images=preselection_images,
+        quality=opt["quality"],
+        tile_selection=opt["tile_selection"],
+        grid=opt["grid"],
+        overlap=opt["overlap"],
+        do_viz_matches=True,
+        do_viz_tiles=False,
+        save_dir=state.data["epoch_dir"] / "matching",
+        geometric_verification=matching.GeometricVerification.NONE,
+        guided_matching=opt["guided_matching"],
+        epipolar_threshold=opt["epipolar_threshold"],
+        prior_F=prior_F,
+    )
+    state.data["matches"] = {
+        "mkpts0": matcher.mkpts0,
+        "mkpts1": matcher.mkpts1,
+        "descriptors0": matcher.descriptors0,
+        "descriptors1": matcher.descriptors1,
+        "scores0": matcher.scores0,
+        "scores1": matcher.scores1,
+        "mconf": matcher.mconf,
+    }
+
+
+@_skip_if_loaded
+def verify(state: EpochState, linked: Dict[int, EpochState]) -> None:
+    """Reject the wrong matches by geometric verification and store the verified features in the epoch."""
+    from icepy4d import matching
+
+    cams = state.cfg.cams
+    opt = matching_options(state.cfg)
+    m = state.data.pop("matches")
+    F, inlMask = matching.geometric_verification(
+        m["mkpts0"],
+        m["mkpts1"],
+        method=opt["geometric_verification"],
+        threshold=opt["threshold"],
+        confidence=opt["confidence"],
+        mconf=m["mconf"],
+    )
+    state.data["F"] = F
+
+    f = {cam: Features() for cam in cams}
+    for i, cam in enumerate(cams[:2]):
+        mkpts = m[f"mkpts{i}"][inlMask]
+        descr = m[f"descriptors{i}"]
+        scores = m[f"scores{i}"]
+        f[cam].append_features_from_numpy(
+            x=mkpts[:, 0],
+            y=mkpts[:, 1],
+            descr=descr[:, inlMask] if descr is not None else None,
+            scores=scores[inlMask] if scores is not None else None,
+        )
+    state.epoch.features = f
+
+
+@_skip_if_loaded
+def relative_orientation(state: EpochState, linked: Dict[int, EpochState]) -> None:
+    """Estimate the relative orientation of the two cameras, scaled by the distance between the camera centers."""
+    cfg, epoch = state.cfg, state.epoch
+    cams = cfg.cams
+    relative_ori = sfm.RelativeOrientation(
+        [epoch.cameras[cams[0]], epoch.cameras[cams[1]]],
+        [
+            epoch.features[cams[0]].kpts_to_numpy(),
+            epoch.features[cams[1]].kpts_to_numpy(),
+        ],
+    )
+    relative_ori.estimate_pose(
+        threshold=cfg.matching.pydegensac_threshold,
+        confidence=0.999999,
+        scale_factor=np.linalg.norm(
+            cfg.georef.camera_centers_world[0] - cfg.georef.camera_centers_world[1]
+        ),
+    )
+    epoch.cameras[cams[1]] = relative_ori.cameras[1]
+
+
+@_skip_if_loaded
+def triangulate(state: EpochState, linked: Dict[int, EpochState]) -> None:
+    """Triangulate the tie points."""
+    epoch = state.epoch
+    cams = state.cfg.cams
+    triang = sfm.Triangulate(
+        [epoch.cameras[cams[0]], epoch.cameras[cams[1]]],
+        [
+            epoch.features[cams[0]].kpts_to_numpy(),
+            epoch.features[cams[1]].kpts_to_numpy(),
+        ],
+    )
+    state.data["points3d"] = triang.triangulate_two_views(
+        compute_colors=True, image=epoch.images[cams[1]].value, cam_id=1
+    )
+    state.data["colors"] = triang.colors
+
+
+@_skip_if_loaded
+def georef(state: EpochState, linked: Dict[int, EpochState]) -> None:
+    """Georeference the cameras and the tie points by absolute orientation on the targets (if do_coregistration is enabled)."""
+    cfg, epoch = state.cfg, state.epoch
+    cams = cfg.cams
+    points3d = state.data.pop("points3d")
+    valid_targets = []
+
+    if cfg.proc.do_coregistration:
+        valid_targets = epoch.targets.get_image_coor_by_label(
+            cfg.georef.targets_to_use, cam_id=0
+        )[1]
+        for id in range(1, len(cams)):
+            if (
+                valid_targets
+                != epoch.targets.get_image_coor_by_label(
+                    cfg.georef.targets_to_use, cam_id=id
+                )[1]
+            ):
+                raise SkipEpoch(f"Different targets found in image {id}")
+        if len(valid_targets) < 1:
+            raise SkipEpoch("Not enough targets found")
+        if valid_targets != cfg.georef.targets_to_use:
+            logger.warning(f"Not all targets found. Using onlys {valid_targets}")
+
+        image_coords = [
+            epoch.targets.get_image_coor_by_label(valid_targets, cam_id=id)[0]
+            for id, cam in enumerate(cams)
+        ]
+        obj_coords = epoch.targets.get_object_coor_by_label(valid_targets)[0]
+        try:
+            abs_ori = sfm.Absolute_orientation(
+                (epoch.cameras[cams[0]], epoch.cameras[cams[1]]),
+                points3d_final=obj_coords,
+                image_points=image_coords,
+                camera_centers_world=cfg.georef.camera_centers_world,
+            )
+            _ = abs_ori.estimate_transformation_linear(estimate_scale=True)
+            points3d = abs_ori.apply_transformation(points3d=points3d)
+        except ValueError as err:
+            raise SkipEpoch(f"{err}. Absolute orientation failed.")
+        for i, cam in enumerate(cams):
+            epoch.cameras[cam] = abs_ori.cameras[i]
+
+    pts = Points()
+    pts.append_points_from_numpy(
+        points3d,
+        track_ids=epoch.features[cams[0]].get_track_ids(),
+        colors=state.data.pop("colors"),
+    )
+    state.data["points"] = pts
+    state.data["valid_targets"] = valid_targets
+
+
+@_skip_if_loaded
+def bundle_adjustment(state: EpochState, linked: Dict[int, EpochState]) -> None:
+    """Refine the cameras and the tie points with the native bundle adjustment (if do_bundle_adjustment is enabled) and/or with Metashape (if do_metashape_processing is enabled)."""
+    cfg, epoch = state.cfg, state.epoch
+    valid_targets = state.data["valid_targets"]
+
+    if cfg.proc.get("do_bundle_adjustment", False):
+        ba = sfm.BundleAdjustment.from_epoch(
+            epoch,
+            points=state.data["points"],
+            target_labels=valid_targets if cfg.proc.do_coregistration else None,
+            camera_prm_to_fix=cfg.metashape.camera_prm_to_fix,
+            # The a priori camera centers are in the world frame: use them only if the cameras were georeferenced
+            camera_centers=(
+                dict(zip(cfg.cams, cfg.georef.camera_centers_world))
+                if cfg.proc.do_coregistration
+                else None
+            ),
+            camera_accuracy=cfg.metashape.camera_accuracy,
+            gcp_accuracy=cfg.metashape.gcp_accuracy,
+            collimation_accuracy=cfg.metashape.collimation_accuracy,
+        )
+        ba.run()
+
+    if cfg.proc.do_metashape_processing:
+        state.data["points"] = _metashape_bundle_adjustment(state, valid_targets)
+
+
+def _metashape_bundle_adjustment(state: EpochState, valid_targets: List[str]) -> Points:
+    """Run the bundle adjustment in Metashape, update the cameras of the epoch and triangulate again the tie points."""
+    from icepy4d.metashape import metashape as MS
+
+    cfg, epoch = state.cfg, state.epoch
+    cams = cfg.cams
+    epochdir = state.data["epoch_dir"]
+
+    # If a metashape folder is already present, delete it and start a new project
+    metashape_path = epochdir / "metashape"
+    if metashape_path.exists() and cfg.metashape.force_overwrite_projects:
+        logger.warning(f"Removing old Metashape project in {metashape_path}")
+        shutil.rmtree(metashape_path, ignore_errors=True)
+
+    io.write_bundler_out(
+        export_dir=epochdir,
+        im_dict={cam: epoch.images[cam].path for cam in cams},
+        cameras=epoch.cameras,
+        features=epoch.features,
+        points=state.data["points"],
+        targets=epoch.targets,
+        targets_to_use=valid_targets,
+        targets_enabled=[True for el in valid_targets],
+    )
+    ms_cfg = MS.build_metashape_cfg(cfg, epoch.timestamp)
+    metashape = MS.MetashapeProject(
+        [epoch.images[cam].path for cam in cams], ms_cfg, timer=None
+    )
+    metashape.run_full_workflow()
+
+    ms_reader = MS.MetashapeReader(metashape_dir=metashape_path, num_cams=len(cams))
+    ms_reader.read_icepy4d_outputs()
+    ms_label = list(ms_reader.extrinsics.keys())
+    for cam_idx, cam in enumerate(cams):
+        label = ms_label[ms_label.index(epoch.images[cam].stem)]
+        epoch.cameras[cam].update_K(ms_reader.K[cam_idx])
+        epoch.cameras[cam].update_extrinsics(ms_reader.extrinsics[label])
+
+    triang = sfm.Triangulate(
+        [epoch.cameras[cams[0]], epoch.cameras[cams[1]]],
+        [
+            epoch.features[cams[0]].kpts_to_numpy(),
+            epoch.features[cams[1]].kpts_to_numpy(),
+        ],
+    )
+    points3d = triang.triangulate_two_views(
+        compute_colors=True, image=epoch.images[cams[1]].value, cam_id=1
+    )
+    pts = Points()
+    pts.append_points_from_numpy(
+        points3d,
+        track_ids=epoch.features[cams[0]].get_track_ids(),
+        colors=triang.colors,
+    )
+    return pts
+
+
+def export(state: EpochState, linked: Dict[int, EpochState]) -> None:
+    """Save the epoch and the point cloud and append the reprojection errors and the cameras to the result files shared by all the epochs (this stage runs in the main process)."""
+    cfg, epoch = state.cfg, state.epoch
+    if not state.data.get("loaded", False):
+        epoch.points.append_points(state.data.pop("points"))
+        if cfg.proc.save_sparse_cloud:
+            epoch.points.to_point_cloud().write_ply(
+                cfg.paths.results_dir
+                / f"point_clouds/sparse_{state.data['timestamp']}.ply"
+            )
+        epoch.save_h5(_epoch_path(state))
+
+    io.write_reprojection_error_to_file(cfg.residuals_fname, epoch)
+    if not state.data.get("loaded", False):
+        ResidualTimeSeries(cfg.residuals_ts_fname).append(epoch)
+    io.write_cameras_to_file(cfg.camera_estimated_fname, epoch)
+
+
+def smooth_pose(state: EpochState, linked: Dict[int, EpochState]) -> None:
+    """Smooth the rotation of the camera to warp with the median of the Euler angles of the neighbouring epochs and warp its image on the reference camera."""
+    from icepy4d.thirdparty.transformations import euler_from_matrix, euler_matrix
+    from icepy4d.utils.homography import homography_warping
+
+    cfg, epoch = state.cfg, state.epoch
+    cam = cfg.proc.camera_to_warp
+    reference_id = cfg.proc.get("warp_reference_epoch")
+    window = [
+        s.epoch
+        for ep, s in linked.items()
+        if s is not None and s.epoch is not None and ep != reference_id
+    ]
+    window.append(epoch)
+    angles = np.stack([euler_from_matrix(e.cameras[cam].R) for e in window], axis=1)
+    cam_to_warp = deepcopy(epoch.cameras[cam])
+    extrinsics = cam_to_warp.extrinsics.copy()
+    extrinsics[:3, :3] = euler_matrix(*np.median(angles, axis=1))[:3, :3]
+    cam_to_warp.update_extrinsics(extrinsics)
+    state.data["smoothed_camera"] = cam_to_warp
+
+    if reference_id is None or reference_id == state.epoch_id:
+        reference = epoch
+    elif linked.get(reference_id) is not None:
+        reference = linked[reference_id].epoch
+    else:
+        raise SkipEpoch(f"Reference epoch {reference_id} not available")
+    _ = homography_warping(
+        cam_0=reference.cameras[cam],
+        cam_1=cam_to_warp,
+        image=epoch.images[cam].value,
+        undistort=True,
+        out_path=cfg.paths.results_dir / "warped" / epoch.images[cam].name,
+    )
+
+
+def init_worker(num_threads: int) -> None:
+    """Limit the number of threads of each worker process, so that the workers do not oversubscribe the CPU."""
+    import cv2
+
+    cv2.setNumThreads(num_threads)
+    try:
+        import torch
+
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+
+
+def build_states(
+    cfg: edict, epoch_map: EpochDataMap, epoch_ids: Sequence[int] = None
+) -> List[EpochState]:
+    """
+    build_states Build the initial states of the epochs to be processed by the pipeline.
+
+    Args:
+        cfg (edict): The configuration returned by parse_cfg().
+        epoch_map (EpochDataMap): The map of the epochs and of their images.
+        epoch_ids (Sequence[int], optional): The ids of the epochs to process. Defaults to None (cfg.proc.epoch_to_process).
+
+    Returns:
+        List[EpochState]: The states of the epochs, in order of processing.
+    """
+    if epoch_ids is None:
+        epoch_ids = cfg.proc.epoch_to_process
+    return [
+        EpochState(
+            epoch_id=ep,
+            cfg=cfg,
+            data={
+                "timestamp": epoch_map.get_timestamp(ep),
+                "images": epoch_map.get_images(ep),
+                "epoch_dir": cfg.paths.results_dir / epoch_map.get_timestamp_str(ep),
+            },
+        )
+        for ep in epoch_ids
+    ]
+
+
+def build_pipeline(cfg: edict, workers: int = None) -> Pipeline:
+    """
+    build_pipeline Build the ICEpy4D processing pipeline: load -> match -> verify -> relative_orientation -> triangulate -> georef -> bundle_adjustment -> export (-> smooth_pose, if do_homography_warping is enabled).
+
+    If guided matching is enabled (cfg.matching.guided_matching), the matching of each epoch waits for the geometric verification of the previous one, whose fundamental matrix is used as prior. Otherwise, the epochs are matched independently. The pose smoothing of each epoch waits for the bundle adjustment of the POSE_SMOOTHING_WINDOW epochs before and after it (and of the reference epoch cfg.proc.warp_reference_epoch, if given).
+
+    The results of the stages are cached if cfg.pipeline.cache is enabled (in cfg.pipeline.cache_dir, relative to the results directory), so that only the stages whose images or configuration changed are run again (see Pipeline.stage_keys()).
+
+    Args:
+        cfg (edict): The configuration returned by parse_cfg(). The number of workers, the memory limits [MB] of the stages and the cache options are read from its (optional) pipeline section.
+        workers (int, optional): The number of worker processes. Defaults to None (cfg.pipeline.workers or 1).
+
+    Returns:
+        Pipeline: The pipeline.
+    """
+    pipeline_cfg = cfg.get("pipeline") or {}
+    if workers is None:
+        workers = pipeline_cfg.get("workers") or 1
+
+    stages = [
+        Stage(
+            "load",
+            load,
+            config_keys=(
+                "cams",
+                "proc.load_existing_results",
+                "georef.target_file_ext",
+                "georef.target_world_file",
+            ),
+            inputs=_load_inputs,
+        ),
+        Stage(
+            "match",
+            match,
+            requires=("load",),
+            links=neighbors("verify", -1) if _guided_matching_enabled(cfg) else None,
+            config_keys=("matching",),
+        ),
+        Stage("verify", verify, requires=("match",)),
+        Stage(
+            "relative_orientation",
+            relative_orientation,
+            requires=("verify",),
+            config_keys=(
+                "matching.pydegensac_threshold",
+                "georef.camera_centers_world",
+            ),
+        ),
+        Stage("triangulate", triangulate, requires=("relative_orientation",)),
+        Stage(
+            "georef",
+            georef,
+            requires=("triangulate",),
+            config_keys=("proc.do_coregistration", "georef"),
+        ),
+        Stage(
+            "bundle_adjustment",
+            bundle_adjustment,
+            requires=("georef",),
+            config_keys=(
+                "proc.do_bundle_adjustment",
+                "proc.do_metashape_processing",
+                "metashape",
+                "georef.camera_centers_world",
+            ),
+        ),
+        Stage(
+            "export",
+            export,
+            requires=("bundle_adjustment",),
+            in_main_process=True,
+            cacheable=False,
+        ),
+    ]
+    if cfg.proc.do_homography_warping:
+        reference_id = cfg.proc.get("warp_reference_epoch")
+        offsets = [
+            k
+            for k in range(-POSE_SMOOTHING_WINDOW, POSE_SMOOTHING_WINDOW + 1)
+            if k != 0
+        ]
+        window = neighbors("bundle_adjustment", *offsets)
+
+        def smoothing_links(position: int, epoch_ids: Sequence[int]):
+            links = window(position, epoch_ids)
+            if reference_id is not None:
+                links.append((reference_id, "bundle_adjustment"))
+            return links
+
+        stages.append(
+            Stage(
+                "smooth_pose",
+                smooth_pose,
+                requires=("bundle_adjustment",),
+                links=smoothing_links,
+                cacheable=False,
+            )
+        )
+
+    cache = None
+    if pipeline_cfg.get("cache", False):
+        cache_dir = Path(pipeline_cfg.get("cache_dir") or STAGE_CACHE_DIR)
+        if not cache_dir.is_absolute():
+            cache_dir = cfg.paths.results_dir / cache_dir
+        cache = StageCache(cache_dir)
+
+    return Pipeline(
+        stages,
+        workers=workers,
+        memory_limits=pipeline_cfg.get("memory_limits"),
+        initializer=init_worker,
+        initargs=(max(1, (os.cpu_count() or 1) // workers),),
+        cache=cache,
+    )
@@ -2,3 +2,5 @@
 from .absolute_orientation import Absolute_orientation, Space_resection
 from .two_view_geometry import RelativeOrientation
 from .triangulation import Triangulate
+from .track_triangulation import TrackTable, TriangulatedTracks, triangulate_tracks
+from .bundle_adjustment import BundleAdjustment, BundleAdjustmentResult
@@ -0,0 +1,483 @@
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+import cv2
+import numpy as np
+from scipy.optimize import least_squares
+from scipy.sparse import coo_matrix
+
+from ..core.camera import Camera
+from ..core.features import Features
+from ..core.points import Points
+from ..core.targets import Targets
+
+logger = logging.getLogger(__name__)
+
+# Interior orientation parameters that can be adjusted (with the Metashape names used in the camera_prm_to_fix option of the configuration file): focal length (fx and fy are scaled together), principal point, radial and tangential distortion
+INTRINSIC_PARAMS = ["F", "Cx", "Cy", "K1", "K2", "K3", "P1", "P2"]
+
+# Metashape parameters that are not part of the OpenCV camera model used by Camera (they are always fixed)
+UNSUPPORTED_PARAMS = ["B1", "B2", "K4"]
+
+# Position of the distortion parameters in the OpenCV distortion vector
+DIST_INDEX = {"K1": 0, "K2": 1, "P1": 2, "P2": 3, "K3": 4}
+
+# Default a priori accuracy of the tie point image observations [px] (as in Metashape)
+TIE_POINT_ACCURACY = 1.0
+
+# A priori accuracy of the baseline (distance between the first two camera centers), relative to its length, used to fix the scale of the datum without GCPs nor camera centers
+BASELINE_ACCURACY = 1e-6
+
+
+@dataclass
+class BundleAdjustmentResult:
+    """
+    Summary of a bundle adjustment.
+
+    Attributes:
+        success (bool): True if the solver converged.
+        message (str): The solver message.
+        num_iterations (int): The number of evaluations of the residuals.
+        initial_rms (float): RMS of the tie point reprojection errors before the adjustment [px].
+        final_rms (float): RMS of the tie point reprojection errors after the adjustment [px].
+        gcp_errors (Dict[str, np.ndarray]): Difference between the adjusted and the a priori coordinates of each GCP.
+        elapsed (float): The time spent by the solver [s].
+    """
+
+    success: bool
+    message: str
+    num_iterations: int
+    initial_rms: float
+    final_rms: float
+    gcp_errors: Dict[str, np.ndarray] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"Bundle adjustment {'converged' if self.success else 'failed'} in {self.elapsed:.2f} s "
+            f"({self.num_iterations} evaluations): tie point RMS {self.initial_rms:.3f} -> {self.final_rms:.3f} px"
+        )
+
+
+class BundleAdjustment:
+    """
+    Bundle adjustment of the cameras, the tie points and the ground control points (GCPs) of an epoch, as an alternative to the Metashape optimization.
+
+    The unknowns are the exterior orientation of each camera (rotation vector and camera center), the interior orientation parameters not listed in camera_prm_to_fix (each camera has its own calibration), the tie points and the GCPs. The observations are the image coordinates of the tie points and of the targets, the a priori coordinates of the GCPs and, optionally, of the camera centers, each weighted by its a priori accuracy. Without GCPs nor camera centers, the datum is defined by fixing the first camera and the length of the baseline to the second camera. The problem is solved with scipy.optimize.least_squares (Trust Region Reflective with the LSMR solver), with the sparsity pattern of the Jacobian, so that the cost of each iteration grows linearly with the number of observations.
+    """
+
+    def __init__(
+        self,
+        cameras: Dict[str, Camera],
+        features: Dict[str, Features],
+        points: Points,
+        targets: Targets = None,
+        target_labels: List[str] = None,
+        camera_prm_to_fix: List[str] = None,
+        camera_centers: Dict[str, np.ndarray] = None,
+        camera_accuracy: List[float] = None,
+        gcp_accuracy: List[float] = [0.01, 0.01, 0.01],
+        collimation_accuracy: float = 1.0,
+        tie_point_accuracy: float = TIE_POINT_ACCURACY,
+    ) -> None:
+        """
+        __init__ Set up the bundle adjustment.
+
+        Args:
+            cameras (Dict[str, Camera]): dictionary of the cameras (their order is the one used to read the image coordinates of the targets).
+            features (Dict[str, Features]): dictionary of the features of each camera (features and points with the same track_id are the observations of the tie points).
+            points (Points): The tie points.
+            targets (Targets, optional): The targets, used as GCPs. Defaults to None.
+            target_labels (List[str], optional): The labels of the targets to use as GCPs. Defaults to None (no GCPs).
+            camera_prm_to_fix (List[str], optional): The interior orientation parameters to fix, among ["F", "Cx", "Cy", "B1", "B2", "K1", "K2", "K3", "K4", "P1", "P2"]. Defaults to None (all the parameters are fixed).
+            camera_centers (Dict[str, np.ndarray], optional): A priori camera centers. Defaults to None (no prior on the camera centers).
+            camera_accuracy (List[float], optional): A priori accuracy [x, y, z] of the camera centers. Defaults to None (required if camera_centers is given).
+            gcp_accuracy (List[float], optional): A priori accuracy [x, y, z] of the GCPs. Defaults to [0.01, 0.01, 0.01].
+            collimation_accuracy (float, optional): A priori accuracy of the target image coordinates [px]. Defaults to 1.0.
+            tie_point_accuracy (float, optional): A priori accuracy of the tie point image coordinates [px]. Defaults to TIE_POINT_ACCURACY.
+
+        Raises:
+            ValueError: If a parameter to fix is unknown.
+        """
+        self.cameras = cameras
+        self.features = features
+        self.points = points
+        self.cams = [cam for cam in cameras if cam in features]
+
+        if camera_prm_to_fix is None:
+            camera_prm_to_fix = INTRINSIC_PARAMS + UNSUPPORTED_PARAMS
+        unknown = set(camera_prm_to_fix) - set(INTRINSIC_PARAMS + UNSUPPORTED_PARAMS)
+        if unknown:
+            raise ValueError(f"Unknown interior orientation parameters {unknown}")
+        unsupported = set(UNSUPPORTED_PARAMS) - set(camera_prm_to_fix)
+        if unsupported:
+            logger.warning(
+                f"Parameters {sorted(unsupported)} are not in the camera model and they are kept fixed."
+            )
+        self.free_params = [p for p in INTRINSIC_PARAMS if p not in camera_prm_to_fix]
+
+        # Tie point observations, sorted by camera
+        obs_cam, obs_point, obs_xy = [], [], []
+        for c, cam in enumerate(self.cams):
+            rows = points.take(features[cam].track_ids)
+            valid = rows > -1
+            obs_cam.append(np.full(np.count_nonzero(valid), c))
+            obs_point.append(rows[valid])
+            obs_xy.append(features[cam].kpts_to_numpy()[valid])
+        self._obs_cam = np.concatenate(obs_cam).astype(np.int64)
+        self._obs_point = np.concatenate(obs_point).astype(np.int64)
+        self._obs_xy = np.concatenate(obs_xy).astype(np.float64).reshape(-1, 2)
+        self._tie_sigma = float(tie_point_accuracy)
+
+        # GCP observations
+        self.gcp_labels = []
+        self._gcp_xyz = np.empty((0, 3))
+        gcp_cam, gcp_point, gcp_xy = [], [], []
+        if targets is not None and target_labels:
+            xyz, self.gcp_labels = targets.get_object_coor_by_label(target_labels)
+            self._gcp_xyz = np.asarray(xyz, dtype=np.float64)
+            for c, cam in enumerate(self.cams):
+                try:
+                    xy, labels = targets.get_image_coor_by_label(
+                        self.gcp_labels, cam_id=list(cameras).index(cam)
+                    )
+                except ValueError:
+                    continue
+                gcp_cam.append(np.full(len(labels), c))
+                gcp_point.append([self.gcp_labels.index(lab) for lab in labels])
+                gcp_xy.append(np.asarray(xy, dtype=np.float64).reshape(-1, 2))
+        self._gcp_cam = (
+            np.concatenate(gcp_cam).astype(np.int64)
+            if gcp_cam
+            else np.empty(0, np.int64)
+        )
+        self._gcp_point = (
+            np.concatenate(gcp_point).astype(np.int64)
+            if gcp_point
+            else np.empty(0, np.int64)
+        )
+        self._gcp_obs_xy = np.concatenate(gcp_xy) if gcp_xy else np.empty((0, 2))
+        self._gcp_sigma = np.asarray(gcp_accuracy, dtype=np.float64)
+        self._collimation_sigma = float(collimation_accuracy)
+
+        # Camera center priors
+        self._prior_cams = []
+        self._prior_centers = np.empty((0, 3))
+        if camera_centers is not None:
+            assert (
+                camera_accuracy is not None
+            ), "A priori accuracy of the camera centers is required."
+            self._prior_cams = [
+                c for c, cam in enumerate(self.cams) if cam in camera_centers
+            ]
+            self._prior_centers = np.array(
+                [
+                    np.asarray(camera_centers[self.cams[c]], dtype=float).reshape(3)
+                    for c in self._prior_cams
+                ]
+            ).reshape(-1, 3)
+            self._camera_sigma = np.asarray(camera_accuracy, dtype=np.float64)
+
+        # The datum is defined by the GCPs or by the camera centers: without them, the first camera is fixed (6 DOF) and the scale is fixed by the baseline between the first two cameras (7th DOF)
+        self._fix_first_camera = len(self._gcp_cam) == 0 and len(self._prior_cams) == 0
+        self._baseline = None
+        if self._fix_first_camera and self.num_cameras > 1:
+            baseline = np.linalg.norm(
+                self.cameras[self.cams[1]].C.ravel()
+                - self.cameras[self.cams[0]].C.ravel()
+            )
+            if baseline > 0:
+                self._baseline = float(baseline)
+            else:
+                logger.warning(
+                    "The first two cameras have the same center: the scale of the datum is not fixed."
+                )
+
+    @classmethod
+    def from_epoch(cls, epoch, **kwargs) -> "BundleAdjustment":
+        """
+        from_epoch Set up the bundle adjustment of the cameras, features, points and targets of an Epoch.
+
+        Args:
+            epoch (Epoch): The epoch.
+            **kwargs: The other arguments of BundleAdjustment.__init__.
+
+        Returns:
+            BundleAdjustment: The bundle adjustment.
+        """
+        return cls(
+            cameras=epoch.cameras,
+            features=epoch.features,
+            points=kwargs.pop("points", epoch.points),
+            targets=kwargs.pop("targets", epoch.targets),
+            **kwargs,
+        )
+
+    @property
+    def num_cameras(self) -> int:
+        return len(self.cams)
+
+    @property
+    def num_observations(self) -> int:
+        """Number of image observations (tie points and targets)."""
+        return len(self._obs_cam) + len(self._gcp_cam)
+
+    def _intrinsics(self, camera: Camera) -> Tuple[np.ndarray, float, np.ndarray]:
+        """Return the vector [f, cx, cy, k1, k2, k3, p1, p2], the aspect ratio fy/fx and the full distortion vector of a camera."""
+        K = camera.K
+        dist = (
+            np.zeros(5)
+            if camera.dist is None
+            else np.asarray(camera.dist, dtype=float).ravel()
+        )
+        if len(dist) < 5:
+            dist = np.concatenate([dist, np.zeros(5 - len(dist))])
+        values = {"F": K[0, 0], "Cx": K[0, 2], "Cy": K[1, 2]}
+        values.update({p: dist[i] for p, i in DIST_INDEX.items()})
+        return (
+            np.array([values[p] for p in INTRINSIC_PARAMS], dtype=float),
+            K[1, 1] / K[0, 0],
+            dist,
+        )
+
+    def _pack(self) -> np.ndarray:
+        """Build the vector of the unknowns from the current cameras, points and GCPs."""
+        x = []
+        for cam in self.cams:
+            camera = self.cameras[cam]
+            x.append(np.asarray(camera.rvec, dtype=float).ravel())
+            x.append(camera.C.ravel())
+        for cam in self.cams:
+            intr = self._intrinsics(self.cameras[cam])[0]
+            x.append(intr[[INTRINSIC_PARAMS.index(p) for p in self.free_params]])
+        x.append(self.points.to_numpy().astype(np.float64).ravel())
+        x.append(self._gcp_xyz.ravel())
+        return np.concatenate(x)
+
+    def _unpack(self, x: np.ndarray) -> Tuple[np.ndarray, ...]:
+        """Split the vector of the unknowns into exterior orientation (ncamx6), free intrinsics (ncamxnfree), points (nx3) and GCPs (mx3)."""
+        n_cam, n_free = self.num_cameras, len(self.free_params)
+        i = 6 * n_cam
+        eo = x[:i].reshape(n_cam, 6)
+        io = x[i : i + n_cam * n_free].reshape(n_cam, n_free)
+        i += n_cam * n_free
+        n_pts = len(self.points)
+        pts = x[i : i + 3 * n_pts].reshape(-1, 3)
+        gcps = x[i + 3 * n_pts :].reshape(-1, 3)
+        return eo, io, pts, gcps
+
+    def _camera_model(
+        self, c: int, eo: np.ndarray, io: np.ndarray
+    ) -> Tuple[np.ndarray, ...]:
+        """Return rvec, tvec, K and dist of camera c for the current unknowns."""
+        intr, aspect, dist = self._base_intrinsics[c]
+        intr = intr.copy()
+        intr[self._free_index] = io[c]
+        rvec = eo[c, :3]
+        R, _ = cv2.Rodrigues(rvec)
+        tvec = -R @ eo[c, 3:]
+        K = np.array(
+            [[intr[0], 0.0, intr[1]], [0.0, intr[0] * aspect, intr[2]], [0.0, 0.0, 1.0]]
+        )
+        dist = dist.copy()
+        for p, i in DIST_INDEX.items():
+            dist[i] = intr[INTRINSIC_PARAMS.index(p)]
+        return rvec, tvec, K, dist
+
+    def _project(
+        self, x: np.ndarray, cam_idx: np.ndarray, xyz: np.ndarray
+    ) -> np.ndarray:
+        """Project the points xyz (one per observation) in the cameras cam_idx (observations are sorted by camera)."""
+        eo, io, _, _ = self._unpack(x)
+        proj = np.empty((len(cam_idx), 2))
+        bounds = np.searchsorted(cam_idx, np.arange(self.num_cameras + 1))
+        for c in range(self.num_cameras):
+            start, stop = bounds[c], bounds[c + 1]
+            if start == stop:
+                continue
+            rvec, tvec, K, dist = self._camera_model(c, eo, io)
+            m, _ = cv2.projectPoints(
+                xyz[start:stop].reshape(-1, 1, 3), rvec, tvec, K, dist
+            )
+            proj[start:stop] = m[:, 0, :]
+        return proj
+
+    def _residuals(self, x: np.ndarray) -> np.ndarray:
+        """Weighted residuals of all the observations."""
+        eo, _, pts, gcps = self._unpack(x)
+        res = [
+            (
+                (self._project(x, self._obs_cam, pts[self._obs_point]) - self._obs_xy)
+                / self._tie_sigma
+            ).ravel()
+        ]
+        if len(self._gcp_cam):
+            proj = self._project(x, self._gcp_cam, gcps[self._gcp_point])
+            res.append(((proj - self._gcp_obs_xy) / self._collimation_sigma).ravel())
+            res.append(((gcps - self._gcp_xyz) / self._gcp_sigma).ravel())
+        if len(self._prior_cams):
+            centers = eo[self._prior_cams, 3:]
+            res.append(((centers - self._prior_centers) / self._camera_sigma).ravel())
+        if self._baseline is not None:
+            baseline = np.linalg.norm(eo[1, 3:] - eo[0, 3:])
+            res.append(
+                [(baseline - self._baseline) / (BASELINE_ACCURACY * self._baseline)]
+            )
+        return np.concatenate(res)
+
+    def _jacobian_sparsity(self) -> coo_matrix:
+        """Sparsity pattern of the Jacobian of the residuals."""
+        n_cam, n_free = self.num_cameras, len(self.free_params)
+        io_start = 6 * n_cam
+        pts_start = io_start + n_cam * n_free
+        gcp_start = pts_start + 3 * len(self.points)
+        n_x = gcp_start + 3 * len(self._gcp_xyz)
+
+        rows, cols = [], []
+
+        def add_image_obs(
+            row0: int, cam_idx: np.ndarray, point_cols: np.ndarray
+        ) -> int:
+            # Each observation (2 rows) depends on its camera EO and IO and on its point
+            n = len(cam_idx)
+            obs_rows = row0 + 2 * np.arange(n)
+            obs_cols = np.hstack(
+                [
+                    6 * cam_idx[:, None] + np.arange(6),
+                    io_start + n_free * cam_idx[:, None] + np.arange(n_free),
+                    point_cols[:, None] + np.arange(3),
+                ]
+            )
+            for k in range(2):
+                rows.append(np.repeat(obs_rows + k, obs_cols.shape[1]))
+                cols.append(obs_cols.ravel())
+            return row0 + 2 * n
+
+        row = add_image_obs(0, self._obs_cam, pts_start + 3 * self._obs_point)
+        if len(self._gcp_cam):
+            row = add_image_obs(row, self._gcp_cam, gcp_start + 3 * self._gcp_point)
+            n = 3 * len(self._gcp_xyz)
+            rows.append(row + np.arange(n))
+            cols.append(gcp_start + np.arange(n))
+            row += n
+        if len(self._prior_cams):
+            prior_cols = (
+                6 * np.array(self._prior_cams)[:, None] + 3 + np.arange(3)
+            ).ravel()
+            rows.append(row + np.arange(len(prior_cols)))
+            cols.append(prior_cols)
+            row += len(prior_cols)
+        if self._baseline is not None:
+            # The baseline depends on the centers of the first two cameras
+            rows.append(np.full(6, row))
+            cols.append(np.array([3, 4, 5, 9, 10, 11]))
+            row += 1
+
+        rows, cols = np.concatenate(rows), np.concatenate(cols)
+        return coo_matrix((np.ones(len(rows)), (rows, cols)), shape=(row, n_x))
+
+    def _tie_rms(self, x: np.ndarray) -> float:
+        n = len(self._obs_cam)
+        if n == 0:
+            return np.nan
+        res = self._residuals(x)[: 2 * n] * self._tie_sigma
+        return float(np.sqrt(np.mean(np.sum(res.reshape(-1, 2) ** 2, axis=1))))
+
+    def run(
+        self,
+        max_nfev: int = 100,
+        loss: str = "linear",
+        f_scale: float = 1.0,
+        ftol: float = 1e-6,
+        update: bool = True,
+        verbose: int = 0,
+    ) -> BundleAdjustmentResult:
+        """
+        run Run the bundle adjustment and (optionally) update the cameras and the points with the adjusted values. The surveyed coordinates of the targets are not modified: the differences between the adjusted and the surveyed GCPs are reported in BundleAdjustmentResult.gcp_errors.
+
+        Args:
+            max_nfev (int, optional): Maximum number of evaluations of the residuals. Defaults to 100.
+            loss (str, optional): The loss function of scipy.optimize.least_squares (e.g., "huber" or "soft_l1" to reduce the influence of outliers). Defaults to "linear".
+            f_scale (float, optional): The soft margin between inlier and outlier residuals (in units of a priori accuracy) for robust loss functions. Defaults to 1.0.
+            ftol (float, optional): Tolerance on the relative change of the cost function. Defaults to 1e-6.
+            update (bool, optional): Update the cameras and the points in place. Defaults to True.
+            verbose (int, optional): Verbosity level of scipy.optimize.least_squares. Defaults to 0.
+
+        Returns:
+            BundleAdjustmentResult: The summary of the adjustment.
+        """
+        self._base_intrinsics = [
+            self._intrinsics(self.cameras[cam]) for cam in self.cams
+        ]
+        self._free_index = [INTRINSIC_PARAMS.index(p) for p in self.free_params]
+
+        x0 = self._pack()
+        sparsity = self._jacobian_sparsity()
+        initial_rms = self._tie_rms(x0)
+
+        # Fix the first camera by removing its exterior orientation from the unknowns
+        free = np.ones(len(x0), dtype=bool)
+        if self._fix_first_camera:
+            free[:6] = False
+        sparsity = sparsity.tocsc()[:, free]
+
+        def fun(x_free: np.ndarray) -> np.ndarray:
+            x = x0.copy()
+            x[free] = x_free
+            return self._residuals(x)
+
+        logger.info(
+            f"Bundle adjustment: {self.num_cameras} cameras, {len(self.points)} tie points, {len(self._gcp_xyz)} GCPs, {self.num_observations} image observations, {np.count_nonzero(free)} unknowns"
+        )
+        t0 = time.time()
+        sol = least_squares(
+            fun,
+            x0[free],
+            jac_sparsity=sparsity,
+            method="trf",
+            tr_solver="lsmr",
+            x_scale="jac",
+            loss=loss,
+            f_scale=f_scale,
+            ftol=ftol,
+            max_nfev=max_nfev,
+            verbose=verbose,
+        )
+        x = x0.copy()
+        x[free] = sol.x
+
+        _, _, _, gcps = self._unpack(x)
+        result = BundleAdjustmentResult(
+            success=sol.success,
+            message=sol.message,
+            num_iterations=sol.nfev,
+            initial_rms=initial_rms,
+            final_rms=self._tie_rms(x),
+            gcp_errors={
+                label: gcps[i] - self._gcp_xyz[i]
+                for i, label in enumerate(self.gcp_labels)
+            },
+            elapsed=time.time() - t0,
+        )
+        logger.info(str(result))
+        if update:
+            self._update(x)
+        return result
+
+    def _update(self, x: np.ndarray) -> None:
+        """Write the adjusted values to the cameras and the points."""
+        eo, io, pts, _ = self._unpack(x)
+        for c, cam in enumerate(self.cams):
+            camera = self.cameras[cam]
+            rvec, tvec, K, dist = self._camera_model(c, eo, io)
+            R, _ = cv2.Rodrigues(rvec)
+            camera.update_extrinsics(camera.Rt_to_extrinsics(R, tvec.reshape(3, 1)))
+            if self.free_params:
+                camera.update_K(K)
+                if camera.dist is not None or any(
+                    p in DIST_INDEX for p in self.free_params
+                ):
+                    camera.update_dist(dist)
+        self.points.set_coordinates(pts)
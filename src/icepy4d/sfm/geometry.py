@@ -87,17 +87,7 @@ def project_points(points3d, camera: Camera):
     Returns:
         np.ndarray: A Nx2 array of 2D projected points in image coordinates.
     """
-    rvec, _ = cv2.Rodrigues(camera.R)
-    tvec = camera.t
-    m, jacobian = cv2.projectPoints(
-        np.expand_dims(points3d, 1),
-        rvec,
-        tvec,
-        camera.K,
-        camera.dist,
-    )
-    m = m[:, 0, :]
-    return m.astype("float32")
+    return camera.project_point(points3d)
 
 
 def undistort_points(pts, camera: Camera):
@@ -114,12 +104,11 @@ def undistort_points(pts, camera: Camera):
     pts : nx2 array of float32
         Array of undistorted image points.
     """
-    pts_und = cv2.undistortPoints(pts, camera.K, camera.dist, None, camera.K)[:, 0, :]
-    return pts_und.astype("float32")
+    return camera.undistort_points(pts)
 
 
 def undistort_image(image, camera: Camera, out_path: str = None):
-    """Wrapper around OpenCV cv2.undistort function for simply undistorting an image
+    """Undistort an image with the cached undistortion maps of the camera (see Camera.undistort_image)
     Parameters
     ----------
     image : 2D numpy array with BRG color channels (as default in OpenCV)
@@ -136,7 +125,7 @@ def undistort_image(image, camera: Camera, out_path: str = None):
         Undistorted image.
 
     """
-    image_und = cv2.undistort(image, camera.K, camera.dist, None, camera.K)
+    image_und = camera.undistort_image(image)
     if out_path is not None:
         cv2.imwrite(out_path, image_und)
 
@@ -0,0 +1,225 @@
+import logging
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Tuple
+
+import cv2
+import numpy as np
+
+from ..core.camera import Camera
+from ..core.features import Features
+from .triangulation import triangulate_nviews_batch
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TrackTable:
+    """
+    Observations of a set of tracks in several views (e.g., the cameras of one or more epochs), stored as a long table with one row per observation.
+
+    Attributes:
+        track_ids (np.ndarray): The track_id of each observation (k,).
+        views (np.ndarray): The index of the view of each observation in view_keys (k,).
+        xy (np.ndarray): The image coordinates of each observation (kx2).
+        view_keys (List[Hashable]): The keys of the views (e.g., camera names or (epoch, camera) tuples), used to look up their Camera objects.
+    """
+
+    track_ids: np.ndarray
+    views: np.ndarray
+    xy: np.ndarray
+    view_keys: List[Hashable]
+
+    def __len__(self) -> int:
+        return len(self.track_ids)
+
+    @classmethod
+    def from_features(cls, features: Dict[Hashable, Features]) -> "TrackTable":
+        """
+        from_features Build the track table from the Features of each view (features with the same track_id in different views are observations of the same track).
+
+        Args:
+            features (Dict[Hashable, Features]): dictionary mapping each view key to its Features.
+
+        Returns:
+            TrackTable: The track table.
+        """
+        view_keys = list(features.keys())
+        track_ids, views, xy = [], [], []
+        for i, key in enumerate(view_keys):
+            f = features[key]
+            track_ids.append(np.asarray(f.track_ids, dtype=np.int64))
+            views.append(np.full(len(f), i, dtype=np.int64))
+            xy.append(f.kpts_to_numpy().reshape(-1, 2))
+        return cls(
+            track_ids=np.concatenate(track_ids) if track_ids else np.empty(0, int),
+            views=np.concatenate(views) if views else np.empty(0, int),
+            xy=np.concatenate(xy).astype(float) if xy else np.empty((0, 2)),
+            view_keys=view_keys,
+        )
+
+    @classmethod
+    def from_dict(
+        cls, tracks: Dict[int, List[Tuple[Hashable, float, float]]]
+    ) -> "TrackTable":
+        """
+        from_dict Build the track table from a dictionary mapping each track_id to the list of its observations, as (view_key, x, y) tuples.
+
+        Args:
+            tracks (Dict[int, List[Tuple[Hashable, float, float]]]): The observations of each track.
+
+        Returns:
+            TrackTable: The track table.
+        """
+        view_keys, view_index = [], {}
+        track_ids, views, xy = [], [], []
+        for track_id, observations in tracks.items():
+            for key, x, y in observations:
+                if key not in view_index:
+                    view_index[key] = len(view_keys)
+                    view_keys.append(key)
+                track_ids.append(track_id)
+                views.append(view_index[key])
+                xy.append((x, y))
+        return cls(
+            track_ids=np.asarray(track_ids, dtype=np.int64),
+            views=np.asarray(views, dtype=np.int64),
+            xy=np.asarray(xy, dtype=float).reshape(-1, 2),
+            view_keys=view_keys,
+        )
+
+
+@dataclass
+class TriangulatedTracks:
+    """
+    Result of the triangulation of a TrackTable. All the arrays have one entry per track (sorted by track_id); tracks observed in less than min_views views are not triangulated and their values are NaN.
+
+    Attributes:
+        track_ids (np.ndarray): The track_id of each track (n,).
+        points (np.ndarray): The triangulated 3D points (nx3).
+        reprojection_rms (np.ndarray): The RMS of the reprojection errors (in pixels, on undistorted image coordinates) of each point over its views (n,).
+        triangulation_angle (np.ndarray): The maximum angle (in degrees) between the rays of any two views of each point (n,).
+        num_views (np.ndarray): The number of views of each track (n,).
+        in_front (np.ndarray): True if the point is in front of all its cameras (n,).
+    """
+
+    track_ids: np.ndarray
+    points: np.ndarray
+    reprojection_rms: np.ndarray
+    triangulation_angle: np.ndarray
+    num_views: np.ndarray
+    in_front: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.track_ids)
+
+    @property
+    def triangulated(self) -> np.ndarray:
+        """Boolean mask of the tracks that were triangulated."""
+        return ~np.isnan(self.points[:, 0])
+
+
+def _undistort(xy: np.ndarray, camera: Camera) -> np.ndarray:
+    if camera.dist is None:
+        return xy
+    return cv2.undistortPoints(
+        xy.reshape(-1, 1, 2), camera.K, camera.dist, None, camera.K
+    ).reshape(-1, 2)
+
+
+def triangulate_tracks(
+    cameras: Dict[Hashable, Camera],
+    tracks: TrackTable,
+    min_views: int = 2,
+    undistort: bool = True,
+) -> TriangulatedTracks:
+    """
+    triangulate_tracks Triangulate the tracks observed in N views (e.g., several cameras and/or epochs). Tracks are grouped by their set of views, so that each group is solved with a single batched DLT (see triangulate_nviews_batch), and the reprojection RMS and the triangulation angle of all the points are computed with vectorized operations.
+
+    Args:
+        cameras (Dict[Hashable, Camera]): dictionary mapping each view key of the track table to its Camera.
+        tracks (TrackTable): The observations of the tracks. If a track has more than one observation in the same view, only the first one is used.
+        min_views (int, optional): The minimum number of views to triangulate a track. Defaults to 2.
+        undistort (bool, optional): Undistort the image coordinates with the camera distortion parameters before triangulating. Defaults to True.
+
+    Returns:
+        TriangulatedTracks: The triangulated points and their quality metrics, one entry per track.
+
+    Raises:
+        KeyError: If a view of the track table has no camera.
+    """
+    missing = [key for key in tracks.view_keys if key not in cameras]
+    if missing:
+        raise KeyError(f"Cameras not available for views {missing}")
+    view_cams = [cameras[key] for key in tracks.view_keys]
+
+    # Undistort the observations of each view
+    xy = np.asarray(tracks.xy, dtype=float).reshape(-1, 2).copy()
+    if undistort:
+        for v in np.unique(tracks.views):
+            rows = tracks.views == v
+            xy[rows] = _undistort(xy[rows], view_cams[v])
+
+    # Sort the observations by track and view, and keep one observation per track and view
+    order = np.lexsort((tracks.views, tracks.track_ids))
+    track_ids = np.asarray(tracks.track_ids)[order]
+    views = np.asarray(tracks.views)[order]
+    xy = xy[order]
+    keep = np.ones(len(order), dtype=bool)
+    keep[1:] = (track_ids[1:] != track_ids[:-1]) | (views[1:] != views[:-1])
+    track_ids, views, xy = track_ids[keep], views[keep], xy[keep]
+
+    # First observation and number of views of each track
+    starts = np.flatnonzero(np.r_[True, track_ids[1:] != track_ids[:-1]])
+    unique_ids = track_ids[starts]
+    num_views = np.diff(np.r_[starts, len(track_ids)])
+    n = len(unique_ids)
+
+    points = np.full((n, 3), np.nan)
+    rms = np.full(n, np.nan)
+    angles = np.full(n, np.nan)
+    in_front = np.zeros(n, dtype=bool)
+    if n == 0:
+        return TriangulatedTracks(unique_ids, points, rms, angles, num_views, in_front)
+
+    # Group the tracks by view-set
+    membership = np.zeros((n, len(view_cams)), dtype=bool)
+    membership[np.repeat(np.arange(n), num_views), views] = True
+    view_sets, group = np.unique(
+        np.packbits(membership, axis=1), axis=0, return_inverse=True
+    )
+    group = group.reshape(-1)
+
+    P = np.stack([cam.P for cam in view_cams])
+    C = np.stack([cam.C.reshape(3) for cam in view_cams])
+    for g in range(len(view_sets)):
+        members = np.flatnonzero(group == g)
+        set_views = np.flatnonzero(membership[members[0]])
+        nv = len(set_views)
+        if nv < min_views:
+            continue
+
+        # Observations of the group as a (nv, m, 3) array of homogeneous coordinates
+        rows = starts[members][:, None] + np.arange(nv)
+        obs = np.concatenate([xy[rows], np.ones((len(members), nv, 1))], axis=2)
+        obs = obs.transpose(1, 0, 2)
+        X = triangulate_nviews_batch(list(P[set_views]), obs)
+
+        # Reprojection errors
+        proj = np.einsum("vij,mj->vmi", P[set_views], X)
+        residuals = proj[:, :, :2] / proj[:, :, 2:] - obs[:, :, :2]
+        rms[members] = np.sqrt(np.mean(np.sum(residuals**2, axis=2), axis=0))
+        in_front[members] = np.all(proj[:, :, 2] > 0, axis=0)
+
+        # Maximum angle between the rays of any two views
+        rays = X[None, :, :3] - C[set_views][:, None, :]
+        rays /= np.linalg.norm(rays, axis=2, keepdims=True)
+        i, j = np.triu_indices(nv, k=1)
+        cos = np.clip(np.sum(rays[i] * rays[j], axis=2), -1, 1)
+        angles[members] = np.degrees(np.arccos(cos.min(axis=0)))
+
+        points[members] = X[:, :3]
+
+    logger.info(
+        f"Triangulated {np.count_nonzero(~np.isnan(points[:, 0]))}/{n} tracks in {len(view_sets)} view-set groups"
+    )
+    return TriangulatedTracks(unique_ids, points, rms, angles, num_views, in_front)
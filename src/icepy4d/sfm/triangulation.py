@@ -36,6 +36,9 @@ from ..utils.math import (
 )
 from ..thirdparty.triangulation import iterative_LS_triangulation
 
+# Number of points whose DLT systems are solved together by triangulate_nviews_batch (to bound the memory of the batched SVD)
+TRIANGULATION_CHUNK_SIZE = 100000
+
 """ Triangulation class """
 
 
@@ -117,18 +120,19 @@ class Triangulate:
 
     def triangulate_nviews(self):
         """
-        Triangulate a point visible in n camera views.
-        P is a list of camera projection matrices.
-        ip is a list of homogenised image points. eg [ [x, y, 1], [x, y, 1] ], OR,
-        ip is a 2d array - shape nx3 - [ [x, y, 1], [x, y, 1] ]
-        len of ip must be the same as le~n of P
+        Triangulate points visible in n camera views.
+        The image points of each camera can be a single homogenised image point [x, y, 1] (the triangulated point is returned as homogeneous coordinates [X, Y, Z, 1], as done by triangulate_nviews), or a nx2 or nx3 array of (homogenised) image points (the triangulated points are stored in self.points3d and returned as a nx3 array).
         """
         P = [cam.P for cam in self.cameras]
         ip = self.image_points
+        if all(np.ndim(x) == 1 for x in ip):
+            return triangulate_nviews(P, ip)
 
-        points3d = triangulate_nviews(P, ip)
+        ip = [np.atleast_2d(x) for x in ip]
+        ip = [convert_to_homogeneous(x.T).T if x.shape[1] == 2 else x for x in ip]
+        self.points3d = triangulate_nviews_batch(P, ip)[:, :3]
 
-        return points3d
+        return self.points3d
 
     def interpolate_colors_from_image(
         self, image: np.ndarray, camera: Camera, convert_BRG2RGB: bool = True
@@ -159,8 +163,7 @@ def triangulate_points_linear(P1, P2, x1, x2):
     """
     if not len(x2) == len(x1):
         raise ValueError("Number of points don't match.")
-    X = [triangulate_nviews([P1, P2], [x[0], x[1]]) for x in zip(x1, x2)]
-    return np.array(X)
+    return triangulate_nviews_batch([P1, P2], [x1, x2])
 
 
 def triangulate_nviews(P, ip):
@@ -183,5 +186,36 @@ def triangulate_nviews(P, ip):
     return X / X[3]
 
 
+def triangulate_nviews_batch(P, ip, chunk_size=TRIANGULATION_CHUNK_SIZE):
+    """
+    Triangulate many points visible in n camera views at once, with the same DLT of triangulate_nviews: the systems of all the points are stacked and solved with a batched SVD.
+    P is a list of n camera projection matrices.
+    ip is a list of n arrays of homogenised image points (mx3), one for each camera, OR, an array of shape (n, m, 3).
+    Returns the homogeneous coordinates of the m points (mx4).
+    """
+    if not len(ip) == len(P):
+        raise ValueError("Number of points and number of cameras not equal.")
+    ip = np.asarray(ip, dtype=float)
+    m = ip.shape[1]
+    X = np.empty((m, 4))
+    for start in range(0, m, chunk_size):
+        M = _build_nviews_system(P, ip[:, start : start + chunk_size])
+        V = np.linalg.svd(M)[-1]
+        X[start : start + chunk_size] = V[:, -1, :4]
+    return X / X[:, 3:4]
+
+
+def _build_nviews_system(P, ip):
+    """
+    Build the DLT systems of triangulate_nviews for a batch of m points, as a (m, 3n, 4+n) array. ip is an array of homogenised image points of shape (n, m, 3).
+    """
+    n, m = ip.shape[:2]
+    M = np.zeros([m, 3 * n, 4 + n])
+    for i, p in enumerate(P):
+        M[:, 3 * i : 3 * i + 3, :4] = p
+        M[:, 3 * i : 3 * i + 3, 4 + i] = -ip[i]
+    return M
+
+
 if __name__ == "__main__":
     print("Test class")
@@ -149,19 +149,33 @@ class AttentionalGNN(nn.Module):
         return desc0, desc1
 
 
+# Number of Sinkhorn iterations between two convergence checks (with early stopping)
+SINKHORN_CHECK_EVERY = 5
+
+
 def log_sinkhorn_iterations(
-    Z: torch.Tensor, log_mu: torch.Tensor, log_nu: torch.Tensor, iters: int
+    Z: torch.Tensor,
+    log_mu: torch.Tensor,
+    log_nu: torch.Tensor,
+    iters: int,
+    tol: float = None,
 ) -> torch.Tensor:
-    """Perform Sinkhorn Normalization in Log-space for stability"""
+    """Perform Sinkhorn Normalization in Log-space for stability.
+    If tol is given, stop as soon as the (log) row marginals are within tol
+    of the target ones (the column marginals are exact after each iteration)"""
     u, v = torch.zeros_like(log_mu), torch.zeros_like(log_nu)
-    for _ in range(iters):
+    for i in range(iters):
         u = log_mu - torch.logsumexp(Z + v.unsqueeze(1), dim=2)
         v = log_nu - torch.logsumexp(Z + u.unsqueeze(2), dim=1)
+        if tol is not None and (i + 1) % SINKHORN_CHECK_EVERY == 0:
+            row = u + torch.logsumexp(Z + v.unsqueeze(1), dim=2)
+            if (row - log_mu).abs().max() < tol:
+                break
     return Z + u.unsqueeze(2) + v.unsqueeze(1)
 
 
 def log_optimal_transport(
-    scores: torch.Tensor, alpha: torch.Tensor, iters: int
+    scores: torch.Tensor, alpha: torch.Tensor, iters: int, tol: float = None
 ) -> torch.Tensor:
     """Perform Differentiable Optimal Transport in Log-space for stability"""
     b, m, n = scores.shape
@@ -181,7 +195,7 @@ def log_optimal_transport(
     log_nu = torch.cat([norm.expand(n), ms.log()[None] + norm])
     log_mu, log_nu = log_mu[None].expand(b, -1), log_nu[None].expand(b, -1)
 
-    Z = log_sinkhorn_iterations(couplings, log_mu, log_nu, iters)
+    Z = log_sinkhorn_iterations(couplings, log_mu, log_nu, iters, tol)
     Z = Z - norm  # multiply probabilities by M+N
     return Z
 
@@ -215,6 +229,7 @@ class SuperGlue(nn.Module):
         "keypoint_encoder": [32, 64, 128, 256],
         "GNN_layers": ["self", "cross"] * 9,
         "sinkhorn_iterations": 100,
+        "sinkhorn_tolerance": None,  # early stopping of the Sinkhorn iterations
         "match_threshold": 0.2,
     }
 
@@ -279,9 +294,16 @@ class SuperGlue(nn.Module):
         scores = torch.einsum("bdn,bdm->bnm", mdesc0, mdesc1)
         scores = scores / self.config["descriptor_dim"] ** 0.5
 
+        # Optionally restrict the candidate matches (e.g., to an epipolar band).
+        if "mask" in data:
+            scores = scores.masked_fill(~data["mask"], float("-inf"))
+
         # Run the optimal transport.
         scores = log_optimal_transport(
-            scores, self.bin_score, iters=self.config["sinkhorn_iterations"]
+            scores,
+            self.bin_score,
+            iters=self.config["sinkhorn_iterations"],
+            tol=self.config["sinkhorn_tolerance"],
         )
 
         # Get the matches with score above "match_threshold".
@@ -1,14 +1,19 @@
 import numpy as np
 import matplotlib.pyplot as plt
-import pandas as pd
 import rasterio
 
 from pathlib import Path
 from rasterio.transform import Affine
-from scipy.interpolate import LinearNDInterpolator
 
 from ..core.camera import Camera
 from ..sfm.interpolate_colors import interpolate_point_colors
+from .rasterize import (
+    DEFAULT_FILL_RADIUS,
+    DEFAULT_TILE_SIZE,
+    RasterGrid,
+    rasterize_points,
+    write_geotiff,
+)
 
 
 # ---- DSM and orthophotos ---##
@@ -33,12 +38,33 @@ def build_dsm(
     fill_value=np.nan,
     save_path=None,
     make_dsm_plot=False,
+    statistic="mean",
+    fill_radius=DEFAULT_FILL_RADIUS,
+    tile_size=DEFAULT_TILE_SIZE,
+    return_dsm=True,
+    crs=None,
 ):
-    # TODO: Use Numpy binning instead of pandas grouping.
-
-    def round_to_val(a, round_val):
-        return np.round(np.array(a, dtype="float32") / round_val) * round_val
-
+    """
+    build_dsm Build a DSM from a point cloud. The elevation of each cell is a statistic of the points falling in it (binned by integer cell index) and the empty cells closer than fill_radius cells to a non-empty cell are interpolated. The grid is processed in tiles that are streamed to a tiled GeoTIFF, so that large extents never need the whole DSM in memory (with return_dsm=False).
+
+    Args:
+        points3d (np.ndarray): nx3 (or 3xn) array of points.
+        dsm_step (float, optional): The size of the cells. Defaults to 1.
+        xlim (List[float], optional): The limits of the cell centres in x (the upper limit is excluded). Defaults to None (from the points).
+        ylim (List[float], optional): The limits of the cell centres in y (the upper limit is excluded). Defaults to None (from the points).
+        interp_method (str, optional): The method to fill the holes: "linear" (local TIN) or "idw" (inverse distance weighting), or None not to fill them. Defaults to "linear".
+        fill_value (float, optional): The value of the cells that are still empty after the interpolation, or "mean" for the mean elevation of the points. Defaults to np.nan.
+        save_path (Union[str, Path], optional): The path of the GeoTIFF. Defaults to None (not saved).
+        make_dsm_plot (bool, optional): Plot the DSM and the points (requires return_dsm). Defaults to False.
+        statistic (str, optional): The statistic of the elevation of the points in each cell ("mean", "min", "max", "median", "count" or "std"). Defaults to "mean".
+        fill_radius (float, optional): The maximum distance [cells] of the filled cells from the nearest non-empty cell. Defaults to DEFAULT_FILL_RADIUS.
+        tile_size (int, optional): The size of the tiles [cells]. Defaults to DEFAULT_TILE_SIZE.
+        return_dsm (bool, optional): Assemble the DSM in memory and return it. Defaults to True.
+        crs (str, optional): The coordinate reference system of the GeoTIFF (e.g., "EPSG:32632"). Defaults to None.
+
+    Returns:
+        DSM: The DSM (None if return_dsm is False).
+    """
     # Check dimensions of input array
     assert np.any(np.array(points3d.shape) == 3), "Invalid size of input points"
     if points3d.shape[0] == points3d.shape[1]:
@@ -47,57 +73,47 @@ def build_dsm(
         )
     if points3d.shape[0] == 3:
         points3d = points3d.T
+    assert (
+        return_dsm or save_path is not None
+    ), "Either return_dsm must be True or save_path must be given."
 
-    if save_path is not None:
-        save_path = Path(save_path)
-        save_fld = save_path.parent
-        save_stem = save_path.stem
-
-    # retrieve points and limits
-    x, y, z = points3d[:, 0], points3d[:, 1], points3d[:, 2]
+    # Grid limits
+    x, y = points3d[:, 0], points3d[:, 1]
     if xlim is None:
         xlim = [np.floor(x.min()), np.ceil(x.max())]
     if ylim is None:
         ylim = [np.floor(y.min()), np.ceil(y.max())]
-
-    n_pts = len(x)
-    d_round = np.empty([n_pts, 3])
-    d_round[:, 0] = round_to_val(points3d[:, 0], dsm_step)
-    d_round[:, 1] = round_to_val(points3d[:, 1], dsm_step)
-    d_round[:, 2] = points3d[:, 2]
-
-    # sorting data
-    ind = np.lexsort((d_round[:, 1], d_round[:, 2]))
-    d_sort = d_round[ind]
-
-    # making dataframes and grouping stuff
-    df_cols = ["x_round", "y_round", "z"]
-    df = pd.DataFrame(d_sort, columns=df_cols)
-    group_xy = df.groupby(["x_round", "y_round"])
-    group_mean = group_xy.mean()
-    binned_df = group_mean.index.to_frame()
-    binned_df["z"] = group_mean
-
-    # Move again to numpy array for interpolation
-    binned_arr = binned_df.to_numpy()
-    x = binned_arr[:, 0].astype("float32")
-    y = binned_arr[:, 1].astype("float32")
-    z = binned_arr[:, 2].astype("float32")
-
-    # Interpolate dsm
-    xq = np.arange(xlim[0], xlim[1], dsm_step)
-    yq = np.arange(ylim[0], ylim[1], dsm_step)
-    grid_x, grid_y = np.meshgrid(xq, yq)
+    grid = RasterGrid.from_limits(xlim, ylim, dsm_step)
 
     if fill_value == "mean":
-        fill_value = z.mean()
+        fill_value = points3d[:, 2].mean()
+
+    dsm_grid = np.full(grid.shape, np.nan, dtype="float32") if return_dsm else None
+
+    def tiles():
+        for (r0, r1, c0, c1), z in rasterize_points(
+            points3d,
+            grid,
+            statistic=statistic,
+            fill_method=interp_method,
+            fill_radius=fill_radius,
+            tile_size=tile_size,
+        ):
+            if fill_value is not None and not np.isnan(fill_value):
+                z[np.isnan(z)] = fill_value
+            if dsm_grid is not None:
+                dsm_grid[r0:r1, c0:c1] = z
+            yield (r0, r1, c0, c1), z
 
-    interp = LinearNDInterpolator(
-        list(zip(x, y)),
-        z,
-        fill_value=fill_value,
-    )
-    dsm_grid = interp(grid_x, grid_y)
+    if save_path is not None:
+        write_geotiff(save_path, grid, tiles(), crs=crs)
+    else:
+        for _ in tiles():
+            pass
+
+    if not return_dsm:
+        return None
+    grid_x, grid_y = grid.nodes()
 
     # plot dsm
     if make_dsm_plot:
@@ -124,51 +140,10 @@ def build_dsm(
         fig.tight_layout()
         # plt.show()
         if save_path is not None:
-            plt.savefig(save_fld.joinpath(save_stem + "_plot.png"), bbox_inches="tight")
-
-    # Save dsm as GeoTIff
-    if save_path is not None:
-        save_path = Path(save_path)
-        save_path.parent.mkdir(parents=True, exist_ok=True)
-        rater_origin = [xlim[0] - dsm_step / 2, ylim[0] - dsm_step / 2]
-        transform = Affine.translation(rater_origin[0], rater_origin[1]) * Affine.scale(
-            dsm_step, -dsm_step
-        )
-        mask = np.invert(np.isnan(dsm_grid))
-        rater_origin = [grid_x[0, 0], grid_y[0, 0]]
-        transform = Affine.translation(rater_origin[0], rater_origin[1]) * Affine.scale(
-            dsm_step, -dsm_step
-        )
-        with rasterio.open(
-            save_path,
-            "w",
-            driver="GTiff",
-            height=dsm_grid.shape[0],
-            width=dsm_grid.shape[1],
-            count=1,
-            dtype="float32",
-            # crs="EPSG:32632",
-            transform=transform,
-        ) as dst:
-            dst.write(dsm_grid, 1)
-            if fill_value is not None:
-                mask = np.invert(np.isnan(dsm_grid))
-                dst.write_mask(mask)
-
-        if fill_value is not None:
-            # mask = np.invert(np.isnan(dsm_grid))
-            with rasterio.open(
-                save_path.parent / (save_path.stem + "_msk.tif"),
-                "w",
-                driver="GTiff",
-                height=dsm_grid.shape[0],
-                width=dsm_grid.shape[1],
-                count=1,
-                dtype="float32",
-                # crs="EPSG:32632",
-                transform=transform,
-            ) as dst:
-                dst.write(mask, 1)
+            save_path = Path(save_path)
+            plt.savefig(
+                save_path.parent / (save_path.stem + "_plot.png"), bbox_inches="tight"
+            )
 
     # Return a DSM object
     dsm = DSM(grid_x, grid_y, dsm_grid, dsm_step)
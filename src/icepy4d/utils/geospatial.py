@@ -117,6 +117,22 @@ def point_in_volume(point: np.ndarray, volume: np.array) -> bool:
     return x_min <= x <= x_max and y_min <= y <= y_max and z_min <= z <= z_max
 
 
+def points_in_volume(points: np.ndarray, volume: np.ndarray) -> np.ndarray:
+    """
+    points_in_volume checks which points are within the bounding box of a volume (vectorized version of point_in_volume)
+
+    Args:
+        points (np.ndarray): numpy array with 3D X,Y,Z coordinates of shape (n,3)
+        volume (np.ndarray): numpy array with the 3D coordinates of the vertices of the volume
+
+    Returns:
+        np.ndarray: boolean numpy array of shape (n,) indicating whether each point is within the volume
+    """
+    vmin, vmax = np.min(volume[:, :3], axis=0), np.max(volume[:, :3], axis=0)
+    logic = np.all(points >= vmin, axis=1) & np.all(points <= vmax, axis=1)
+    return logic
+
+
 def point3D_in_volume(point3D: Point, volume: np.array) -> bool:
     """Wrapper around point_in_rect function to deal with Point object"""
     pt = point3D.coordinates.squeeze()
@@ -1,5 +1,4 @@
 import logging
-from copy import deepcopy
 from pathlib import Path
 from typing import Union
 
@@ -20,24 +19,16 @@ def homography_warping(
         out_path = Path(out_path)
         out_path.parent.mkdir(parents=True, exist_ok=True)
 
-    # Create deepcopies to not modify original data
-    cam_0_ = deepcopy(cam_0)
-    cam_1_ = deepcopy(cam_1)
-
     # Convert colors to OpenCV format
     image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
 
     if undistort:
-        image = cv2.undistort(image, cam_1_.K, cam_1_.dist, None, cam_1_.K)
+        image = cam_1.undistort_image(image)
         logging.info(f"Distortion corrected.")
 
-    T = np.linalg.inv(cam_0_.pose)
-    cam_0_.update_extrinsics(cam_0_.pose_to_extrinsics(T @ cam_0_.pose))
-    cam_1_.update_extrinsics(cam_1_.pose_to_extrinsics(T @ cam_1_.pose))
-
-    R = cam_1_.R
-    K = cam_1_.K
-    H = (cam_0_.K @ R) @ np.linalg.inv(K)
+    # Rotation of cam_1 with respect to cam_0 (i.e., cam_1 rotation after moving cam_0 to the origin)
+    R = cam_1.R @ cam_0.R.T
+    H = (cam_0.K @ R) @ np.linalg.inv(cam_1.K)
 
     h, w = image.shape[:2]
     warped_image = cv2.warpPerspective(image, H, (w, h))
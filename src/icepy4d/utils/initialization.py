@@ -64,12 +64,15 @@ def print_welcome_msg() -> None:
     print("================================================================\n")
 
 
-def parse_cfg(cfg_file: Union[str, Path], ignore_errors: bool = False) -> edict:
+def parse_cfg(
+    cfg_file: Union[str, Path], ignore_errors: bool = False, clean_results: bool = True
+) -> edict:
     """
     Parse a YAML configuration file and return it as an easydict.
 
     Args:
         cfg_file (Union[str, Path]): The path to the configuration file in YAML format.
+        clean_results (bool, optional): Remove the result files written by the previous runs, if load_existing_results is False. Set it to False to inspect the configuration without side effects. Defaults to True.
 
     Raises:
         ValueError: If the input of epochs to process is invalid.
@@ -118,16 +121,12 @@ def parse_cfg(cfg_file: Union[str, Path], ignore_errors: bool = False) -> edict:
     # - Result paths
     cfg.camera_estimated_fname = cfg.paths.results_dir / "camera_info_est.txt"
     cfg.residuals_fname = cfg.paths.results_dir / "residuals_image.txt"
+    cfg.residuals_ts_fname = cfg.paths.results_dir / "residuals_image.h5"
     cfg.matching_stats_fname = cfg.paths.results_dir / "matching_tracking_results.txt"
 
     # remove files if they already exist
-    if not cfg.proc.load_existing_results:
-        if cfg.camera_estimated_fname.exists():
-            cfg.camera_estimated_fname.unlink()
-        if cfg.residuals_fname.exists():
-            cfg.residuals_fname.unlink()
-        if cfg.matching_stats_fname.exists():
-            cfg.matching_stats_fname.unlink()
+    if clean_results and not cfg.proc.load_existing_results:
+        remove_result_files(cfg)
 
     # - Image-realted options
     # cfg.images.mask_bounding_box = np.array(cfg.images.mask_bounding_box).astype("int")
@@ -166,6 +165,23 @@ def parse_cfg(cfg_file: Union[str, Path], ignore_errors: bool = False) -> edict:
     return cfg
 
 
+def remove_result_files(cfg: edict) -> None:
+    """
+    Remove the result files shared by all the epochs (estimated cameras, residuals and matching statistics), that are appended epoch by epoch during the processing.
+
+    Args:
+        cfg (edict): The configuration returned by parse_cfg().
+    """
+    for fname in [
+        cfg.camera_estimated_fname,
+        cfg.residuals_fname,
+        cfg.residuals_ts_fname,
+        cfg.matching_stats_fname,
+    ]:
+        if fname.exists():
+            fname.unlink()
+
+
 def initialize_epoch(
     cfg: edict, epoch_timestamp: datetime.datetime, images: dict, epoch_dir: Path
 ):
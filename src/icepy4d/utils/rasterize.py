@@ -0,0 +1,386 @@
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Sequence, Tuple, Union
+
+import numpy as np
+from scipy import ndimage
+from scipy.interpolate import LinearNDInterpolator
+from scipy.signal import fftconvolve
+
+logger = logging.getLogger(__name__)
+
+# Statistics of the elevation of the points in each cell supported by binned_statistics()
+STATISTICS = ("mean", "min", "max", "median", "count", "std")
+
+# Methods to fill the empty cells: inverse distance weighting or linear interpolation on a local Delaunay triangulation (TIN)
+FILL_METHODS = ("idw", "linear")
+
+# Maximum distance [cells] of an empty cell from the nearest non-empty cell to be filled
+DEFAULT_FILL_RADIUS = 5
+
+# Power of the distance used for the inverse distance weighting
+IDW_POWER = 2
+
+# Size of the blocks [cells] in which the holes are filled with the linear method: each block is triangulated with the non-empty cells within the fill radius from it. The blocks are aligned to the grid (not to the tiles), so that the triangulations do not depend on the tiling.
+FILL_BLOCK_SIZE = 64
+
+# Size of the tiles [cells] processed at once (a multiple of GEOTIFF_BLOCK_SIZE, so that the tiles are aligned to the blocks of the GeoTIFF)
+DEFAULT_TILE_SIZE = 2048
+
+# Size of the blocks of the tiled GeoTIFF [pixels]
+GEOTIFF_BLOCK_SIZE = 256
+
+# (row start, row end, column start, column end) of a tile in the grid
+Window = Tuple[int, int, int, int]
+
+
+class RasterGrid:
+    """
+    RasterGrid Regular grid of square cells. The centre of the cell (i, j) is at x0 + j * step, y0 + i * step, therefore the rows are ordered by increasing y (the GeoTIFFs are written north-up, see write_geotiff()).
+
+    Args:
+        x0 (float): The x coordinate of the centre of the first cell.
+        y0 (float): The y coordinate of the centre of the first cell.
+        step (float): The size of the cells.
+        shape (Tuple[int, int]): The number of rows and columns.
+    """
+
+    def __init__(
+        self, x0: float, y0: float, step: float, shape: Tuple[int, int]
+    ) -> None:
+        assert step > 0, "Invalid grid step. It must be positive."
+        self.x0 = float(x0)
+        self.y0 = float(y0)
+        self.step = float(step)
+        self.shape = (int(shape[0]), int(shape[1]))
+
+    def __repr__(self) -> str:
+        return f"RasterGrid(x0={self.x0}, y0={self.y0}, step={self.step}, shape={self.shape})"
+
+    @classmethod
+    def from_limits(
+        cls, xlim: Sequence[float], ylim: Sequence[float], step: float
+    ) -> "RasterGrid":
+        """
+        from_limits Build the grid whose cell centres are np.arange(xlim[0], xlim[1], step) and np.arange(ylim[0], ylim[1], step).
+        """
+        shape = (
+            int(np.ceil((ylim[1] - ylim[0]) / step)),
+            int(np.ceil((xlim[1] - xlim[0]) / step)),
+        )
+        return cls(xlim[0], ylim[0], step, shape)
+
+    @classmethod
+    def from_points(cls, points: np.ndarray, step: float) -> "RasterGrid":
+        """
+        from_points Build the grid covering all the points, with the first cell centre at the floor of their minimum coordinates.
+        """
+        xmin, ymin = np.floor(points[:, :2].min(axis=0))
+        xmax, ymax = np.ceil(points[:, :2].max(axis=0))
+        return cls.from_limits([xmin, xmax + step], [ymin, ymax + step], step)
+
+    def subgrid(self, row: int, col: int, shape: Tuple[int, int]) -> "RasterGrid":
+        """
+        subgrid Get the grid starting at the cell (row, col) of this grid (it may extend outside of it).
+        """
+        return RasterGrid(
+            self.x0 + col * self.step, self.y0 + row * self.step, self.step, shape
+        )
+
+    def cell_index(self, xy: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        cell_index Get the row and column of the cells containing the points (they may be outside the grid).
+
+        Args:
+            xy (np.ndarray): nx2 array with the x and y coordinates of the points.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The rows and the columns (int64).
+        """
+        rows = np.floor((xy[:, 1] - self.y0) / self.step + 0.5).astype(np.int64)
+        cols = np.floor((xy[:, 0] - self.x0) / self.step + 0.5).astype(np.int64)
+        return rows, cols
+
+    def nodes(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        nodes Get the coordinates of the cell centres, as returned by np.meshgrid().
+        """
+        x = self.x0 + np.arange(self.shape[1]) * self.step
+        y = self.y0 + np.arange(self.shape[0]) * self.step
+        return np.meshgrid(x, y)
+
+
+def binned_statistics(
+    points: np.ndarray,
+    grid: RasterGrid,
+    statistics: Sequence[str] = ("mean",),
+) -> Dict[str, np.ndarray]:
+    """
+    binned_statistics Compute statistics of the elevation of the points falling in each cell of a grid. The points are assigned to the cells by their integer cell index and the statistics are accumulated with np.bincount (mean, count, std) and ufunc.at (min, max), while the median is computed from the points sorted by cell. The points outside the grid are ignored.
+
+    Args:
+        points (np.ndarray): nx3 array of points.
+        grid (RasterGrid): The grid.
+        statistics (Sequence[str], optional): The statistics to compute, among STATISTICS. std is the population standard deviation. Defaults to ("mean",).
+
+    Raises:
+        ValueError: If a statistic is not supported.
+
+    Returns:
+        Dict[str, np.ndarray]: The statistics as arrays with the shape of the grid (float32, int64 for count). The empty cells are NaN (0 for count).
+    """
+    unknown = set(statistics) - set(STATISTICS)
+    if unknown:
+        raise ValueError(
+            f"Invalid statistics {sorted(unknown)}. Supported statistics are {STATISTICS}."
+        )
+    nrows, ncols = grid.shape
+    rows, cols = grid.cell_index(points)
+    inside = (rows >= 0) & (rows < nrows) & (cols >= 0) & (cols < ncols)
+    idx = rows[inside] * ncols + cols[inside]
+    z = points[inside, 2].astype(np.float64)
+    ncells = nrows * ncols
+
+    count = np.bincount(idx, minlength=ncells)
+    empty = count == 0
+    out = {}
+    if "count" in statistics:
+        out["count"] = count.reshape(grid.shape)
+    if "mean" in statistics or "std" in statistics:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.bincount(idx, weights=z, minlength=ncells) / count
+        if "mean" in statistics:
+            out["mean"] = mean
+        if "std" in statistics:
+            # Two passes, to avoid the loss of precision of E[z^2] - E[z]^2 with large elevations
+            dev = z - mean[idx]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                out["std"] = np.sqrt(
+                    np.bincount(idx, weights=dev * dev, minlength=ncells) / count
+                )
+    if "min" in statistics:
+        out["min"] = np.full(ncells, np.inf)
+        np.minimum.at(out["min"], idx, z)
+    if "max" in statistics:
+        out["max"] = np.full(ncells, -np.inf)
+        np.maximum.at(out["max"], idx, z)
+    if "median" in statistics:
+        z_sorted = z[np.lexsort((z, idx))]
+        start = np.cumsum(count) - count
+        lo = np.where(empty, 0, start + (count - 1) // 2)
+        hi = np.where(empty, 0, start + count // 2)
+        if len(z):
+            out["median"] = (z_sorted[lo] + z_sorted[hi]) / 2
+        else:
+            out["median"] = np.full(ncells, np.nan)
+
+    for name in out:
+        if name != "count":
+            values = out[name].astype(np.float32)
+            values[empty] = np.nan
+            out[name] = values.reshape(grid.shape)
+    return out
+
+
+def fill_holes(
+    z: np.ndarray,
+    radius: float = DEFAULT_FILL_RADIUS,
+    method: str = "idw",
+    origin: Tuple[int, int] = (0, 0),
+) -> np.ndarray:
+    """
+    fill_holes Interpolate the empty (NaN) cells of a raster closer than radius to a non-empty cell. Only these cells and the non-empty cells around them are used, so that large empty areas (e.g., outside the point cloud) cost nothing.
+
+    Args:
+        z (np.ndarray): The raster.
+        radius (float, optional): The maximum distance [cells] of the filled cells from the nearest non-empty cell. Defaults to DEFAULT_FILL_RADIUS.
+        method (str, optional): "idw" for inverse distance weighting of all the non-empty cells within radius (computed as a convolution), or "linear" for linear interpolation on the Delaunay triangulation of the non-empty cells within radius from each block of FILL_BLOCK_SIZE cells containing holes (the cells outside the triangulation are not filled). Defaults to "idw".
+        origin (Tuple[int, int], optional): The (row, column) of the first cell of the raster in the whole grid, to align the blocks of the linear method to the grid when the raster is a tile. Defaults to (0, 0).
+
+    Raises:
+        ValueError: If the method is not supported.
+
+    Returns:
+        np.ndarray: The filled raster (a copy).
+    """
+    if method not in FILL_METHODS:
+        raise ValueError(
+            f"Invalid fill method {method}. Supported methods are {FILL_METHODS}."
+        )
+    z = z.copy()
+    valid = ~np.isnan(z)
+    if valid.all() or not valid.any():
+        return z
+
+    # Holes close to a valid cell, and valid cells close to a hole
+    holes = ~valid & (ndimage.distance_transform_edt(~valid) <= radius)
+    if not holes.any():
+        return z
+
+    if method == "idw":
+        # Weights 1 / d^p of the cells within radius, then sum(w * z) / sum(w) over the valid cells as two convolutions (z is shifted by its mean for precision)
+        r = int(np.floor(radius))
+        dy, dx = np.mgrid[-r : r + 1, -r : r + 1]
+        dist = np.hypot(dx, dy)
+        kernel = np.zeros(dist.shape)
+        inside = (dist > 0) & (dist <= radius)
+        kernel[inside] = 1 / dist[inside] ** IDW_POWER
+        offset = np.nanmean(z)
+        values = np.where(valid, z - offset, 0).astype(np.float64)
+        num = fftconvolve(values, kernel, mode="same")
+        den = fftconvolve(valid.astype(np.float64), kernel, mode="same")
+        z[holes] = num[holes] / den[holes] + offset
+        return z
+
+    # Triangulate each block of the grid with holes, with the non-empty cells of the block extended by radius (in block coordinates, so that the triangulation is the same in any tile containing the extended block)
+    r = int(np.ceil(radius))
+    holes_rc = np.column_stack(np.nonzero(holes))
+    blocks = (holes_rc + np.asarray(origin)) // FILL_BLOCK_SIZE
+    order = np.lexsort((blocks[:, 1], blocks[:, 0]))
+    holes_rc, blocks = holes_rc[order], blocks[order]
+    starts = np.flatnonzero(np.any(np.diff(blocks, axis=0), axis=1)) + 1
+    for idx in np.split(np.arange(len(blocks)), starts):
+        corner = blocks[idx[0]] * FILL_BLOCK_SIZE - np.asarray(origin) - r
+        r0, c0 = np.maximum(corner, 0)
+        r1, c1 = np.minimum(corner + FILL_BLOCK_SIZE + 2 * r, z.shape)
+        support_rc = np.column_stack(np.nonzero(valid[r0:r1, c0:c1]))
+        if len(support_rc) < 3:
+            continue
+        values = z[r0:r1, c0:c1][valid[r0:r1, c0:c1]].astype(np.float64)
+        offset = np.array([r0, c0]) - corner
+        try:
+            interp = LinearNDInterpolator(support_rc + offset, values)
+        except Exception as err:
+            # Degenerate triangulation (e.g., collinear cells)
+            logger.debug(f"Unable to triangulate the cells around the holes: {err}")
+            continue
+        rows, cols = holes_rc[idx].T
+        z[rows, cols] = interp(holes_rc[idx] - corner)
+
+    return z
+
+
+def iter_tiles(
+    points: np.ndarray,
+    grid: RasterGrid,
+    tile_size: int = DEFAULT_TILE_SIZE,
+    halo: int = 0,
+) -> Iterator[Tuple[Window, np.ndarray]]:
+    """
+    iter_tiles Split the grid in square tiles and yield the points falling in each tile (extended by halo cells on each side). The tiles are ordered from the top (largest y) row of tiles, left to right, and aligned to the top-left corner of the grid, so that they match the blocks of a north-up GeoTIFF. The points are sorted once by row and, for each row of tiles, by column.
+
+    Args:
+        points (np.ndarray): nx3 array of points.
+        grid (RasterGrid): The grid.
+        tile_size (int, optional): The size of the tiles [cells]. Defaults to DEFAULT_TILE_SIZE.
+        halo (int, optional): The number of cells added on each side of the tiles to select the points. Defaults to 0.
+
+    Yields:
+        Tuple[Window, np.ndarray]: The window (row start, row end, column start, column end) of the tile in the grid and its points.
+    """
+    assert tile_size > 0, "Invalid tile size. It must be positive."
+    nrows, ncols = grid.shape
+    rows, cols = grid.cell_index(points)
+    by_row = np.argsort(rows, kind="stable")
+    rows_sorted = rows[by_row]
+    for top in range(0, nrows, tile_size):
+        r1 = nrows - top
+        r0 = max(r1 - tile_size, 0)
+        a, b = np.searchsorted(rows_sorted, [r0 - halo, r1 + halo])
+        band = by_row[a:b]
+        band = band[np.argsort(cols[band], kind="stable")]
+        band_cols = cols[band]
+        for c0 in range(0, ncols, tile_size):
+            c1 = min(c0 + tile_size, ncols)
+            a, b = np.searchsorted(band_cols, [c0 - halo, c1 + halo])
+            yield (r0, r1, c0, c1), points[band[a:b]]
+
+
+def rasterize_points(
+    points: np.ndarray,
+    grid: RasterGrid,
+    statistic: str = "mean",
+    fill_method: str = "idw",
+    fill_radius: float = DEFAULT_FILL_RADIUS,
+    tile_size: int = DEFAULT_TILE_SIZE,
+) -> Iterator[Tuple[Window, np.ndarray]]:
+    """
+    rasterize_points Rasterize a point cloud tile by tile: compute a statistic of the elevation of the points in each cell (see binned_statistics()) and fill the holes (see fill_holes()). The tiles are extended by the fill radius (plus a block for the linear method) while filling the holes, so that the result does not depend on the tiling.
+
+    Args:
+        points (np.ndarray): nx3 array of points.
+        grid (RasterGrid): The grid.
+        statistic (str, optional): The statistic of the elevation, among STATISTICS. Defaults to "mean".
+        fill_method (str, optional): The method to fill the holes, among FILL_METHODS, or None not to fill them. Defaults to "idw".
+        fill_radius (float, optional): The maximum distance [cells] of the filled cells from the nearest non-empty cell. Defaults to DEFAULT_FILL_RADIUS.
+        tile_size (int, optional): The size of the tiles [cells]. Defaults to DEFAULT_TILE_SIZE.
+
+    Yields:
+        Tuple[Window, np.ndarray]: The window of the tile in the grid (see iter_tiles()) and its values (float32).
+    """
+    halo = 0
+    if fill_method is not None:
+        halo = int(np.ceil(fill_radius))
+    if fill_method == "linear":
+        halo += FILL_BLOCK_SIZE - 1
+    for (r0, r1, c0, c1), tile_points in iter_tiles(points, grid, tile_size, halo):
+        shape = (r1 - r0 + 2 * halo, c1 - c0 + 2 * halo)
+        if len(tile_points) == 0:
+            yield (r0, r1, c0, c1), np.full((r1 - r0, c1 - c0), np.nan, np.float32)
+            continue
+        subgrid = grid.subgrid(r0 - halo, c0 - halo, shape)
+        z = binned_statistics(tile_points, subgrid, (statistic,))[statistic]
+        z = z.astype(np.float32)
+        if fill_method is not None:
+            z = fill_holes(z, fill_radius, fill_method, (r0 - halo, c0 - halo))
+        yield (r0, r1, c0, c1), z[halo : halo + r1 - r0, halo : halo + c1 - c0]
+
+
+def write_geotiff(
+    path: Union[str, Path],
+    grid: RasterGrid,
+    tiles: Iterable[Tuple[Window, np.ndarray]],
+    crs: str = None,
+    compress: str = "deflate",
+) -> None:
+    """
+    write_geotiff Write the tiles of a raster (e.g., from rasterize_points()) to a tiled, compressed, north-up GeoTIFF as they are produced, so that the whole raster is never kept in memory. The empty cells are NaN (the nodata value).
+
+    Args:
+        path (Union[str, Path]): The path of the GeoTIFF.
+        grid (RasterGrid): The grid of the raster.
+        tiles (Iterable[Tuple[Window, np.ndarray]]): The windows and the values of the tiles.
+        crs (str, optional): The coordinate reference system (e.g., "EPSG:32632"). Defaults to None.
+        compress (str, optional): The compression. Defaults to "deflate".
+    """
+    import rasterio
+    from rasterio.transform import Affine
+    from rasterio.windows import Window as RasterWindow
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    nrows, ncols = grid.shape
+    transform = Affine.translation(
+        grid.x0 - grid.step / 2, grid.y0 + (nrows - 0.5) * grid.step
+    ) * Affine.scale(grid.step, -grid.step)
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        height=nrows,
+        width=ncols,
+        count=1,
+        dtype="float32",
+        nodata=np.nan,
+        crs=crs,
+        transform=transform,
+        tiled=True,
+        blockxsize=GEOTIFF_BLOCK_SIZE,
+        blockysize=GEOTIFF_BLOCK_SIZE,
+        compress=compress,
+        BIGTIFF="IF_SAFER",
+    ) as dst:
+        for (r0, r1, c0, c1), values in tiles:
+            window = RasterWindow(c0, nrows - r1, c1 - c0, r1 - r0)
+            dst.write(values[::-1].astype(np.float32), 1, window=window)
+    logger.info(f"Raster written to {path}")
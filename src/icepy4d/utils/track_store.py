@@ -0,0 +1,469 @@
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+from icepy4d.core.constants import DATETIME_FMT
+from icepy4d.core.epoch_io import EpochReader
+from icepy4d.core.features import Features
+from icepy4d.core.points import Points
+from icepy4d.utils.geospatial import points_in_rect, points_in_volume
+
+logger = logging.getLogger(__name__)
+
+TRACK_STORE_FORMAT = "icepy4d-track-store"
+TRACK_STORE_VERSION = 1
+POINTS_TABLE = "points"
+
+# Columns stored for each table (name: (dtype, number of columns))
+POINTS_COLUMNS = {"xyz": ("float32", 3), "colors": ("float32", 3)}
+FEATURES_COLUMNS = {"xy": ("float32", 2)}
+INDEX_COLUMNS = {"track_ids": ("int32", 1), "epochs": ("int32", 1)}
+
+
+def _table_name(cam: str = None) -> str:
+    """Name of the table of the features of a camera (or of the points if cam is None)"""
+    return POINTS_TABLE if cam is None else f"features_{cam}"
+
+
+def group_epochs_by_track(
+    track_ids: np.ndarray,
+    epochs: np.ndarray,
+    epoch_keys: List = None,
+    min_tracked_epoches: int = 1,
+) -> dict:
+    """
+    group_epochs_by_track Group the epochs in which each track_id is observed, given one row per observation.
+
+    Args:
+        track_ids (np.ndarray): (n,) array with the track_id of each observation.
+        epochs (np.ndarray): (n,) array with the epoch (index) of each observation. Observations must be ordered by epoch.
+        epoch_keys (List, optional): the keys of the epochs, used to translate the epoch indexes of the output. Defaults to None (return epoch indexes).
+        min_tracked_epoches (int, optional): the minimum number of epochs in which a track_id must be observed to be returned. Defaults to 1.
+
+    Returns:
+        dict: A dictionary with track IDs as keys and the corresponding list of epochs in which the track_id was observed as values.
+    """
+    if len(track_ids) == 0:
+        return {}
+    order = np.argsort(track_ids, kind="stable")
+    sorted_ids = track_ids[order]
+    sorted_epochs = epochs[order]
+    tracks, starts, counts = np.unique(
+        sorted_ids, return_index=True, return_counts=True
+    )
+    if epoch_keys is not None:
+        sorted_epochs = np.asarray(epoch_keys)[sorted_epochs]
+    sorted_epochs = sorted_epochs.tolist()
+    return {
+        tracks[i]: sorted_epochs[starts[i] : starts[i] + counts[i]]
+        for i in np.flatnonzero(counts >= max(min_tracked_epoches, 1))
+    }
+
+
+class TrackStoreWriter:
+    """
+    Class for writing a TrackStore, i.e., an on-disk store of the points and of the features (keypoint coordinates only) of all the epochs, that can be memory-mapped by TrackStore.
+
+    Every table (points and the features of each camera) is stored as a set of binary files, one per column, to which the data of each epoch are appended as a contiguous segment. The metadata are written atomically after every epoch, so that a writer that is interrupted leaves a store that can be reopened to append the following epochs. The global track_id index is built when the writer is closed (TrackStore only reads the epochs indexed). A store can be reopened to append new epochs.
+
+    Example:
+        with TrackStoreWriter("res/track_store") as writer:
+            for ep, epoch in epoches.items():
+                writer.add_epoch(ep, points=epoch.points, features=epoch.features)
+
+    Attributes:
+        path (Path): The path to the store directory.
+    """
+
+    def __init__(self, path: Union[str, Path], overwrite: bool = False) -> None:
+        """
+        __init__ Open a TrackStore for writing. If the store already exists, new epochs are appended to it (unless overwrite is True).
+
+        Args:
+            path (Union[str, Path]): The path to the store directory.
+            overwrite (bool, optional): remove the existing data. Defaults to False.
+        """
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        meta_path = self.path / "meta.json"
+        if meta_path.exists() and not overwrite:
+            with open(meta_path, "r") as f:
+                self._meta = json.load(f)
+            self._truncate()
+        else:
+            for file in list(self.path.glob("*/*")) + [meta_path]:
+                if file.is_file():
+                    file.unlink()
+            self._meta = {
+                "format": TRACK_STORE_FORMAT,
+                "version": TRACK_STORE_VERSION,
+                "epochs": [],
+                "tables": {},
+            }
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    @property
+    def epochs(self) -> List:
+        """Keys of the epochs stored"""
+        return self._meta["epochs"]
+
+    def _truncate(self) -> None:
+        """Truncate the binary files of every table to the rows in the metadata, discarding the rows of an epoch interrupted before its metadata were written."""
+        for name, table in self._meta["tables"].items():
+            for col, (dtype, ncols) in table["columns"].items():
+                file = self.path / name / f"{col}.bin"
+                size = table["num_rows"] * ncols * np.dtype(dtype).itemsize
+                if file.exists() and file.stat().st_size > size:
+                    logger.warning(f"Discarding incomplete rows of {file}")
+                    os.truncate(file, size)
+
+    def flush(self) -> None:
+        """Write the store metadata atomically (to a temporary file which then replaces meta.json)."""
+        meta_path = self.path / "meta.json"
+        tmp = meta_path.with_name(f".meta.json.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self._meta, f, indent=2)
+        os.replace(tmp, meta_path)
+
+    def _append_table(self, name: str, columns: dict, data: Dict[str, np.ndarray]):
+        """Append the rows of an epoch to the binary files of a table."""
+        table_dir = self.path / name
+        table_dir.mkdir(exist_ok=True)
+        table = self._meta["tables"].setdefault(
+            name,
+            {
+                "num_rows": 0,
+                "columns": {
+                    k: list(v) for k, v in {**INDEX_COLUMNS, **columns}.items()
+                },
+            },
+        )
+        for col, (dtype, _) in table["columns"].items():
+            with open(table_dir / f"{col}.bin", "ab") as f:
+                f.write(np.ascontiguousarray(data[col], dtype=dtype).tobytes())
+        table["num_rows"] += len(data["track_ids"])
+
+    def add_epoch(
+        self,
+        epoch_key: Union[int, str],
+        points: Points = None,
+        features: Dict[str, Features] = None,
+    ) -> None:
+        """
+        add_epoch Append the points and the features of a new epoch to the store. Epochs must be added in chronological order.
+
+        Args:
+            epoch_key (Union[int, str]): key of the epoch (e.g., the epoch id or its timestamp).
+            points (Points, optional): the points of the epoch. Defaults to None.
+            features (Dict[str, Features], optional): dictionary mapping each camera name to the features of the epoch. Defaults to None.
+        """
+        assert not self._closed, "TrackStoreWriter already closed"
+        if isinstance(epoch_key, np.integer):
+            epoch_key = int(epoch_key)
+        assert (
+            epoch_key not in self.epochs
+        ), f"Epoch {epoch_key} already present in the store"
+        ep = len(self.epochs)
+        self.epochs.append(epoch_key)
+
+        if points is not None:
+            self._append_table(
+                _table_name(),
+                POINTS_COLUMNS,
+                {
+                    "track_ids": points.track_ids,
+                    "epochs": np.full(len(points), ep, dtype=np.int32),
+                    "xyz": points.to_numpy(),
+                    "colors": points.colors_to_numpy(),
+                },
+            )
+        if features is not None:
+            for cam, feats in features.items():
+                self._append_table(
+                    _table_name(cam),
+                    FEATURES_COLUMNS,
+                    {
+                        "track_ids": feats.track_ids,
+                        "epochs": np.full(len(feats), ep, dtype=np.int32),
+                        "xy": feats.kpts_to_numpy(),
+                    },
+                )
+        self.flush()
+
+    def add_epoch_file(
+        self, path: Union[str, Path], epoch_key: Union[int, str] = None
+    ) -> None:
+        """
+        add_epoch_file Append an epoch saved with Epoch.save_h5 to the store. Only points and keypoints are read from the file (descriptors are never loaded).
+
+        Args:
+            path (Union[str, Path]): The path to the epoch file.
+            epoch_key (Union[int, str], optional): key of the epoch. Defaults to None (use the epoch timestamp as string).
+        """
+        with EpochReader(path) as reader:
+            if epoch_key is None:
+                epoch_key = reader.timestamp.strftime(DATETIME_FMT)
+            self.add_epoch(
+                epoch_key,
+                points=reader.read_points(),
+                features=reader.read_features(read_descriptors=False),
+            )
+
+    def close(self) -> None:
+        """Build the epoch segments and the global track_id index of every table and write the store metadata."""
+        if self._closed:
+            return
+        n_epochs = len(self.epochs)
+        for name, table in self._meta["tables"].items():
+            table_dir = self.path / name
+            n = table["num_rows"]
+            track_ids = np.fromfile(table_dir / "track_ids.bin", dtype=np.int32)
+            epochs = np.fromfile(table_dir / "epochs.bin", dtype=np.int32)
+            assert len(track_ids) == n and len(epochs) == n, f"Corrupted table {name}"
+
+            # Epoch segments: rows of epoch i are offsets[i]:offsets[i+1]
+            offsets = np.searchsorted(epochs, np.arange(n_epochs + 1)).astype(np.int64)
+
+            # Global track index: rows of track tracks[j] are order[track_offsets[j]:track_offsets[j+1]], sorted by epoch
+            order = np.argsort(track_ids, kind="stable").astype(np.int64)
+            tracks, starts = np.unique(track_ids[order], return_index=True)
+            track_offsets = np.append(starts, n).astype(np.int64)
+
+            np.save(table_dir / "offsets.npy", offsets)
+            np.save(table_dir / "order.npy", order)
+            np.save(table_dir / "tracks.npy", tracks)
+            np.save(table_dir / "track_offsets.npy", track_offsets)
+            table["indexed_rows"] = n
+
+        self._meta["indexed_epochs"] = n_epochs
+        self.flush()
+        self._closed = True
+        logger.info(f"TrackStore with {n_epochs} epochs written to {self.path}")
+
+
+class TrackStore:
+    """
+    Class for querying a store written by TrackStoreWriter. All the data are memory-mapped and only the rows needed by each query are read from disk.
+
+    The data of an epoch are a contiguous segment of each table, so that they are returned as numpy views (see segment()). Queries by track_id use the global track_id index.
+
+    Attributes:
+        path (Path): The path to the store directory.
+        epochs (List): The keys of the epochs stored.
+        cams (List[str]): The cameras whose features are stored.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        """
+        __init__ Open a TrackStore for reading.
+
+        Args:
+            path (Union[str, Path]): The path to the store directory.
+
+        Raises:
+            FileNotFoundError: If the store does not exist.
+            ValueError: If the store was written with an unsupported version.
+        """
+        self.path = Path(path)
+        meta_path = self.path / "meta.json"
+        if not meta_path.exists():
+            msg = f"TrackStore {self.path} does not exist."
+            logger.error(msg)
+            raise FileNotFoundError(msg)
+        with open(meta_path, "r") as f:
+            self._meta = json.load(f)
+        if self._meta.get("format") != TRACK_STORE_FORMAT:
+            raise ValueError(f"{self.path} is not a valid TrackStore.")
+        if self._meta["version"] > TRACK_STORE_VERSION:
+            raise ValueError(
+                f"TrackStore {self.path} was written with version {self._meta['version']}, while the maximum supported version is {TRACK_STORE_VERSION}."
+            )
+        # Only the epochs indexed when the writer was last closed are read (a writer may be appending new epochs)
+        if "indexed_epochs" in self._meta:
+            self._meta["epochs"] = self._meta["epochs"][: self._meta["indexed_epochs"]]
+            self._meta["tables"] = {
+                name: {**table, "num_rows": table["indexed_rows"]}
+                for name, table in self._meta["tables"].items()
+                if "indexed_rows" in table
+            }
+        self.epochs = self._meta["epochs"]
+        self._epoch_index = {ep: i for i, ep in enumerate(self.epochs)}
+        self._tables = {}
+
+    def __repr__(self) -> str:
+        return f"TrackStore with {len(self.epochs)} epochs"
+
+    def __len__(self) -> int:
+        return len(self.epochs)
+
+    @property
+    def cams(self) -> List[str]:
+        """Cameras whose features are stored"""
+        prefix = _table_name("")
+        return [t[len(prefix) :] for t in self._meta["tables"] if t.startswith(prefix)]
+
+    def _table(self, cam: str = None) -> dict:
+        """Memory-map (once) and return the arrays of a table."""
+        name = _table_name(cam)
+        if name not in self._tables:
+            if name not in self._meta["tables"]:
+                raise KeyError(f"Table {name} not present in TrackStore {self.path}")
+            meta = self._meta["tables"][name]
+            table_dir = self.path / name
+            table = {}
+            for col, (dtype, ncols) in meta["columns"].items():
+                shape = (meta["num_rows"], ncols) if ncols > 1 else (meta["num_rows"],)
+                if meta["num_rows"] == 0:
+                    table[col] = np.empty(shape, dtype=dtype)
+                else:
+                    table[col] = np.memmap(
+                        table_dir / f"{col}.bin", dtype=dtype, mode="r", shape=shape
+                    )
+            mmap_mode = "r" if meta["num_rows"] > 0 else None
+            for idx in ["offsets", "order", "tracks", "track_offsets"]:
+                table[idx] = np.load(table_dir / f"{idx}.npy", mmap_mode=mmap_mode)
+            self._tables[name] = table
+        return self._tables[name]
+
+    def _track_rows(self, table: dict, track_id: np.int32) -> np.ndarray:
+        """Rows of a track_id in a table (sorted by epoch), as a view of the index."""
+        j = np.searchsorted(table["tracks"], track_id)
+        if j == len(table["tracks"]) or table["tracks"][j] != track_id:
+            return table["order"][0:0]
+        return table["order"][table["track_offsets"][j] : table["track_offsets"][j + 1]]
+
+    def segment(
+        self, epoch_key: Union[int, str], cam: str = None
+    ) -> Dict[str, np.ndarray]:
+        """
+        segment Get the data of an epoch.
+
+        Args:
+            epoch_key (Union[int, str]): key of the epoch.
+            cam (str, optional): camera of the features. Defaults to None (get the points).
+
+        Returns:
+            Dict[str, np.ndarray]: dictionary of read-only views on the memory-mapped columns ("track_ids" and "xyz", "colors" for points; "track_ids" and "xy" for features).
+        """
+        table = self._table(cam)
+        ep = self._epoch_index[epoch_key]
+        start, stop = table["offsets"][ep], table["offsets"][ep + 1]
+        return {
+            col: table[col][start:stop]
+            for col in self._meta["tables"][_table_name(cam)]["columns"]
+            if col != "epochs"
+        }
+
+    def epochs_of_track(self, track_id: np.int32, cam: str = None) -> List:
+        """
+        epochs_of_track Get all the epochs in which a track_id is present.
+
+        Args:
+            track_id (np.int32): the track_id.
+            cam (str, optional): camera of the features. Defaults to None (search the points).
+
+        Returns:
+            List: keys of the epochs, in chronological order.
+        """
+        table = self._table(cam)
+        rows = self._track_rows(table, track_id)
+        return [self.epochs[i] for i in table["epochs"][rows]]
+
+    def trajectory(
+        self, track_id: np.int32, cam: str = None
+    ) -> Tuple[List, np.ndarray]:
+        """
+        trajectory Get the trajectory of a track_id, i.e., its coordinates in all the epochs in which it is present. Only the rows of the track_id are read from disk.
+
+        Args:
+            track_id (np.int32): the track_id.
+            cam (str, optional): camera of the features. Defaults to None (get the 3D points).
+
+        Returns:
+            Tuple[List, np.ndarray]: keys of the epochs and (n,3) array of XYZ coordinates (or (n,2) array of xy keypoint coordinates if cam is given).
+        """
+        table = self._table(cam)
+        rows = self._track_rows(table, track_id)
+        coords = table["xyz" if cam is None else "xy"][rows]
+        return [self.epochs[i] for i in table["epochs"][rows]], coords
+
+    def tracks_alive(
+        self,
+        epoch_a: Union[int, str],
+        epoch_b: Union[int, str],
+        cam: str = None,
+        min_tracked_epoches: int = 1,
+    ) -> np.ndarray:
+        """
+        tracks_alive Get the track_ids observed between two epochs (included). Only the segments of the epochs in the interval are read.
+
+        Args:
+            epoch_a (Union[int, str]): key of the first epoch.
+            epoch_b (Union[int, str]): key of the last epoch.
+            cam (str, optional): camera of the features. Defaults to None (search the points).
+            min_tracked_epoches (int, optional): minimum number of epochs of the interval in which a track_id must be present. Defaults to 1.
+
+        Returns:
+            np.ndarray: sorted array of track_ids.
+        """
+        table = self._table(cam)
+        a, b = self._epoch_index[epoch_a], self._epoch_index[epoch_b]
+        assert a <= b, "epoch_a must precede epoch_b"
+        start, stop = table["offsets"][a], table["offsets"][b + 1]
+        tracks, counts = np.unique(table["track_ids"][start:stop], return_counts=True)
+        return tracks[counts >= min_tracked_epoches]
+
+    def tracked_time_series(
+        self,
+        cam: str = None,
+        min_tracked_epoches: int = 1,
+        rect: np.ndarray = None,
+        volume: np.ndarray = None,
+    ) -> dict:
+        """
+        tracked_time_series Get the epochs in which each track_id is present. Coordinates are read one epoch segment at a time for filtering.
+
+        Args:
+            cam (str, optional): camera of the features. Defaults to None (use the points).
+            min_tracked_epoches (int, optional): The minimum number of tracked epochs to be included in the time series. Defaults to 1.
+            rect (np.ndarray, optional): bounding box [xmin, ymin, xmax, ymax] used to filter the features (only if cam is given). Defaults to None.
+            volume (np.ndarray, optional): volume used to filter the points (only if cam is None). Defaults to None.
+
+        Returns:
+            dict: A dictionary with track IDs as keys and the corresponding list of epochs in which the track_id is present as values.
+        """
+        table = self._table(cam)
+        keep = None
+        if (cam is not None and rect is not None) or (
+            cam is None and volume is not None
+        ):
+            keep = np.zeros(len(table["track_ids"]), dtype=bool)
+            offsets = table["offsets"]
+            for ep in range(len(self.epochs)):
+                start, stop = offsets[ep], offsets[ep + 1]
+                if cam is None:
+                    keep[start:stop] = points_in_volume(
+                        table["xyz"][start:stop], volume
+                    )
+                else:
+                    keep[start:stop] = points_in_rect(table["xy"][start:stop], rect)
+
+        track_ids, epochs = table["track_ids"], table["epochs"]
+        if keep is not None:
+            track_ids, epochs = track_ids[keep], epochs[keep]
+        return group_epochs_by_track(
+            np.asarray(track_ids),
+            np.asarray(epochs),
+            epoch_keys=self.epochs,
+            min_tracked_epoches=min_tracked_epoches,
+        )
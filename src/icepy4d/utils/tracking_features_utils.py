@@ -1,13 +1,14 @@
 import numpy as np
 import pandas as pd
 
-from typing import TypedDict, List, Union
+from typing import Callable, TypedDict, List, Union
 from pathlib import Path
 from itertools import groupby
 
 import icepy4d.core as icepy4d_classes
 
 from icepy4d.utils.geospatial import *
+from icepy4d.utils.track_store import TrackStore
 from icepy4d.utils.timer import timeit
 
 
@@ -75,62 +76,72 @@ def sort_features_by_cam(
 
 @timeit
 def tracked_features_time_series(
-    fdict: FeaturesDictByCam,
+    fdict: Union[FeaturesDictByCam, TrackStore],
     min_tracked_epoches: int = 1,
     rect: np.ndarray = None,
+    cam: str = None,
 ) -> dict:
     """
     Calculates the time series of features that have been tracked.
 
+    The presence of every track_id in every epoch is computed with one vectorized lookup per epoch (Features.take), instead of checking each track_id in each epoch separately. If a TrackStore is given, the features are read from the memory-mapped store instead of being kept in memory.
+
     Args:
-    fdict (FeaturesDictByCam): A dictionary containing features of each camera at different epochs.
+    fdict (Union[FeaturesDictByCam, TrackStore]): A dictionary containing features of each camera at different epochs, or a TrackStore.
     min_tracked_epoches (int, optional): The minimum number of tracked epochs to be included in the time series. Defaults to 1.
     rect (np.ndarray, optional): An optional rectangle used to filter the tracked features. Defaults to None.
+    cam (str, optional): The camera of the features, required only if fdict is a TrackStore. Defaults to None.
 
     Returns:
     dict: A dictionary with track IDs as keys and the corresponding list of epochs in which the feature was tracked as values.
 
     """
+    if isinstance(fdict, TrackStore):
+        assert cam is not None, "Camera name required to read features from TrackStore"
+        return fdict.tracked_time_series(
+            cam=cam, min_tracked_epoches=min_tracked_epoches, rect=rect
+        )
 
     epoches = list(fdict.keys())
-    fts = {}
-    for i, epoch in enumerate(epoches):
-        track_ids = fdict[epoch].get_track_ids()
-        for track_id in track_ids:
-            if rect is None:
-                out = [ep for ep in epoches if track_id in fdict[ep]]
-            else:
-                out = [
-                    ep
-                    for ep in epoches[i:]
-                    if (
-                        track_id in fdict[ep]
-                        and point_in_rect(fdict[ep][track_id].xy.squeeze(), rect)
-                    )
-                ]
-            if not out:
-                continue
-            if len(out) < min_tracked_epoches:
-                continue
-            if track_id not in fts.keys():
-                fts[track_id] = out
-            else:
-                fts[track_id].extend(x for x in out if x not in fts[track_id])
+    if not epoches:
+        return {}
+
+    # All the track_ids, in order of first appearance
+    track_ids = pd.unique(np.concatenate([fdict[ep].track_ids for ep in epoches]))
+
+    # Boolean matrix (track_id x epoch) with the presence of each feature
+    tracked = np.zeros((len(track_ids), len(epoches)), dtype=bool)
+    for j, ep in enumerate(epoches):
+        rows = fdict[ep].take(track_ids)
+        found = rows > -1
+        if rect is not None:
+            kpts = fdict[ep].kpts_to_numpy()[rows[found]]
+            found[found] = points_in_rect(kpts, rect)
+        tracked[:, j] = found
+
+    num_tracked = tracked.sum(axis=1)
+    valid = (num_tracked > 0) & (num_tracked >= min_tracked_epoches)
+    fts = {
+        track_ids[i]: [epoches[j] for j in np.flatnonzero(tracked[i])]
+        for i in np.flatnonzero(valid)
+    }
 
     return fts
 
 
 @timeit
 def tracked_points_time_series(
-    points: icepy4d_classes.PointsDict,
+    points: Union[icepy4d_classes.PointsDict, TrackStore],
     min_tracked_epoches: int = 1,
     volume: np.ndarray = None,
 ) -> dict:
     """
     Calculates the time series of features that have been tracked.
 
+    As in tracked_features_time_series(), the presence of every track_id in every epoch is computed with one vectorized lookup per epoch (Points.take). If a TrackStore is given, the points are read from the memory-mapped store instead of being kept in memory.
+
     Args:
-    points (PointsDict): A dictionary containing points at different epochs.
+    points (Union[PointsDict, TrackStore]): A dictionary containing points at different epochs, or a TrackStore.
     min_tracked_epoches (int, optional): The minimum number of tracked epochs to be included in the time series. Defaults to 1.
     volume (np.ndarray, optional): An optional volume used to filter the tracked points. Defaults to None.
 
@@ -138,33 +149,34 @@ def tracked_points_time_series(
     dict: A dictionary with track IDs as keys and the corresponding list of epochs in which the point was tracked as values.
 
     """
+    if isinstance(points, TrackStore):
+        return points.tracked_time_series(
+            min_tracked_epoches=min_tracked_epoches, volume=volume
+        )
 
     epoches = list(points.keys())
-
-    # Get a list of tuples containing (track_id, epoch) for each point
-    point_epochs = [
-        (track_id, epoch)
-        for epoch in epoches
-        for track_id in points[epoch].get_track_ids()
-    ]
-
-    # Filter the points based on the given volume, if any
-    if volume is not None:
-        point_epochs = [
-            (track_id, epoch)
-            for track_id, epoch in point_epochs
-            if point_in_volume(points[epoch][track_id].coordinates, volume)
-        ]
-
-    # Group the points by track ID
-    point_groups = groupby(sorted(point_epochs), key=lambda x: x[0])
-
-    # Construct the output dictionary
-    pts = {}
-    for track_id, point_group in point_groups:
-        epoch_list = [epoch for _, epoch in point_group]
-        if len(epoch_list) >= min_tracked_epoches:
-            pts[track_id] = epoch_list
+    if not epoches:
+        return {}
+
+    # All the track_ids, sorted
+    track_ids = np.unique(np.concatenate([points[ep].track_ids for ep in epoches]))
+
+    # Boolean matrix (track_id x epoch) with the presence of each point
+    tracked = np.zeros((len(track_ids), len(epoches)), dtype=bool)
+    for j, ep in enumerate(epoches):
+        rows = points[ep].take(track_ids)
+        found = rows > -1
+        if volume is not None:
+            xyz = points[ep].to_numpy()[rows[found]]
+            found[found] = points_in_volume(xyz, volume)
+        tracked[:, j] = found
+
+    num_tracked = tracked.sum(axis=1)
+    valid = (num_tracked > 0) & (num_tracked >= min_tracked_epoches)
+    pts = {
+        track_ids[i]: [epoches[j] for j in np.flatnonzero(tracked[i])]
+        for i in np.flatnonzero(valid)
+    }
 
     return pts
 
@@ -216,6 +228,35 @@ def tracked_points_time_series_old(
     return pts
 
 
+def _take_by_epoch(
+    containers: dict,
+    epochs: List,
+    track_ids: np.ndarray,
+    get_values: Callable,
+    ncols: int,
+) -> np.ndarray:
+    """Gather the values of the given track_ids, each one from the container (Features or Points) of a different epoch. Lookups are grouped by epoch, so that a single vectorized take() is run for each epoch.
+
+    Args:
+        containers (dict): A dictionary {epoch: Features or Points}.
+        epochs (List): The epoch of each track_id.
+        track_ids (np.ndarray): The track_ids to look for.
+        get_values (Callable): A function that returns the numpy array of values of a container (e.g., lambda p: p.to_numpy()).
+        ncols (int): The number of values of each track_id (e.g., 3 for the coordinates of the points).
+
+    Returns:
+        np.ndarray: The values of each track_id. Rows of track_ids not found are set to NaN.
+    """
+    epochs = pd.Series(epochs, dtype=object)
+    out = np.full((len(track_ids), ncols), np.nan, dtype=float)
+    for ep, sel in epochs.groupby(epochs, sort=False).indices.items():
+        rows = containers[ep].take(track_ids[sel])
+        values = get_values(containers[ep])
+        found = rows > -1
+        out[sel[found]] = values[rows[found]]
+    return out
+
+
 @timeit
 def tracked_dict_to_df(
     features: icepy4d_classes.FeaturesDict,
@@ -243,29 +284,28 @@ def tracked_dict_to_df(
 
     """
     cams = list(features[list(features.keys())[0]].keys())
+    fids = np.array(list(fts.keys()), dtype=np.int32)
+    ep_ini = [eps[0] for eps in fts.values()]
+    ep_fin = [eps[-1] for eps in fts.values()]
     dict = {
-        "fid": [fid for fid in fts.keys()],
-        "num_tracked_eps": [len(fts[fid]) for fid in fts.keys()],
-        "ep_ini": [fts[fid][0] for fid in fts.keys()],
-        "ep_fin": [fts[fid][-1] for fid in fts.keys()],
-        "date_ini": [epoch_dict[fts[fid][0]] for fid in fts.keys()],
-        "date_fin": [epoch_dict[fts[fid][-1]] for fid in fts.keys()],
+        "fid": fids,
+        "num_tracked_eps": [len(eps) for eps in fts.values()],
+        "ep_ini": ep_ini,
+        "ep_fin": ep_fin,
+        "date_ini": [epoch_dict[ep] for ep in ep_ini],
+        "date_fin": [epoch_dict[ep] for ep in ep_fin],
     }
     for cam in cams:
-        dict[f"x_{cam}_ini"] = [features[fts[fid][0]][cam][fid].x for fid in fts.keys()]
-        dict[f"y_{cam}_ini"] = [features[fts[fid][0]][cam][fid].y for fid in fts.keys()]
-        dict[f"x_{cam}_fin"] = [
-            features[fts[fid][-1]][cam][fid].x for fid in fts.keys()
-        ]
-        dict[f"y_{cam}_fin"] = [
-            features[fts[fid][-1]][cam][fid].y for fid in fts.keys()
-        ]
-    dict["X_ini"] = [points[fts[fid][0]][fid].X for fid in fts.keys()]
-    dict["Y_ini"] = [points[fts[fid][0]][fid].Y for fid in fts.keys()]
-    dict["Z_ini"] = [points[fts[fid][0]][fid].Z for fid in fts.keys()]
-    dict["X_fin"] = [points[fts[fid][-1]][fid].X for fid in fts.keys()]
-    dict["Y_fin"] = [points[fts[fid][-1]][fid].Y for fid in fts.keys()]
-    dict["Z_fin"] = [points[fts[fid][-1]][fid].Z for fid in fts.keys()]
+        f_by_cam = {ep: features[ep][cam] for ep in features.keys()}
+        for s, eps in zip(["ini", "fin"], [ep_ini, ep_fin]):
+            xy = _take_by_epoch(f_by_cam, eps, fids, lambda f: f.kpts_to_numpy(), 2)
+            dict[f"x_{cam}_{s}"] = xy[:, 0]
+            dict[f"y_{cam}_{s}"] = xy[:, 1]
+    for s, eps in zip(["ini", "fin"], [ep_ini, ep_fin]):
+        xyz = _take_by_epoch(points, eps, fids, lambda p: p.to_numpy(), 3)
+        dict[f"X_{s}"] = xyz[:, 0]
+        dict[f"Y_{s}"] = xyz[:, 1]
+        dict[f"Z_{s}"] = xyz[:, 2]
 
     fts_df = pd.DataFrame.from_dict(dict)
     fts_df["date_ini"] = pd.to_datetime(fts_df["date_ini"], format="%Y_%m_%d")
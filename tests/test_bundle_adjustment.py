@@ -0,0 +1,153 @@
+import cv2
+import numpy as np
+import pandas as pd
+import pytest
+
+from icepy4d.core.camera import Camera
+from icepy4d.core.features import Features
+from icepy4d.core.points import Points
+from icepy4d.core.targets import Targets
+from icepy4d.sfm.bundle_adjustment import BundleAdjustment
+
+PRM_TO_FIX = ["Cx", "Cy", "B1", "B2", "K1", "K2", "K3", "K4", "P1", "P2"]
+
+
+@pytest.fixture
+def scene():
+    rng = np.random.default_rng(0)
+    K = np.array([[6000.0, 0, 3000], [0, 6000, 2000], [0, 0, 1]])
+    dist = np.array([0.01, -0.02, 0.0, 0.0, 0.0])
+    X = rng.uniform([-50, -50, 200], [50, 50, 300], (200, 3))
+    gcp = rng.uniform([-50, -50, 200], [50, 50, 300], (5, 3))
+    labels = [f"T{i}" for i in range(5)]
+
+    targets = Targets()
+    targets.obj_coor = pd.DataFrame(
+        {"label": labels, "X": gcp[:, 0], "Y": gcp[:, 1], "Z": gcp[:, 2]}
+    )
+    cameras, features = {}, {}
+    for cam, (rvec, C) in {
+        "p1": ([0, 0.1, 0], [-20, 0, 0]),
+        "p2": ([0, -0.1, 0], [20, 0, 0]),
+    }.items():
+        R, _ = cv2.Rodrigues(np.array(rvec, dtype=float))
+        t = -R @ np.array(C, dtype=float).reshape(3, 1)
+        camera = Camera(6000, 4000, K=K.copy(), dist=dist.copy(), R=R, t=t)
+        uv = camera.project_point(X) + rng.normal(0, 0.3, (len(X), 2))
+        feat = Features()
+        feat.append_features_from_numpy(
+            uv[:, 0].astype(np.float32),
+            uv[:, 1].astype(np.float32),
+            track_ids=list(range(len(X))),
+        )
+        g = camera.project_point(gcp)
+        targets.im_coor.append(
+            pd.DataFrame({"label": labels, "x": g[:, 0], "y": g[:, 1]})
+        )
+        cameras[cam], features[cam] = camera, feat
+
+    points = Points()
+    points.append_points_from_numpy(
+        (X + rng.normal(0, 0.5, X.shape)).astype(np.float32)
+    )
+
+    # Perturb the exterior orientation and the focal length
+    for camera in cameras.values():
+        ext = camera.extrinsics.copy()
+        ext[:3, 3] += rng.normal(0, 0.3, 3)
+        camera.update_extrinsics(ext)
+        K_pert = camera.K.copy()
+        K_pert[0, 0] *= 1.01
+        K_pert[1, 1] *= 1.01
+        camera.update_K(K_pert)
+    return cameras, features, points, targets, labels, X
+
+
+def test_bundle_adjustment_with_gcps(scene):
+    cameras, features, points, targets, labels, X = scene
+    ba = BundleAdjustment(
+        cameras,
+        features,
+        points,
+        targets=targets,
+        target_labels=labels,
+        camera_prm_to_fix=PRM_TO_FIX,
+        gcp_accuracy=[0.01, 0.01, 0.01],
+    )
+    result = ba.run()
+    assert result.success
+    assert result.initial_rms > 10.0
+    assert result.final_rms < 0.5
+    assert set(result.gcp_errors) == set(labels)
+    for cam in cameras.values():
+        assert cam.K[0, 0] == pytest.approx(6000.0, rel=1e-3)
+        assert cam.K[0, 2] == 3000.0
+        assert np.allclose(cam.dist, [0.01, -0.02, 0.0, 0.0, 0.0])
+    assert np.abs(points.to_numpy() - X).max() < 2.0
+
+
+def test_bundle_adjustment_jacobian_sparsity(scene):
+    cameras, features, points, targets, labels, _ = scene
+    ba = BundleAdjustment(
+        cameras,
+        features,
+        points[np.arange(10)],
+        targets=targets,
+        target_labels=labels,
+        camera_prm_to_fix=["Cx", "Cy", "B1", "B2", "K3", "K4", "P1", "P2"],
+        camera_centers={"p1": [-20, 0, 0]},
+        camera_accuracy=[0.1, 0.1, 0.1],
+    )
+    ba._base_intrinsics = [ba._intrinsics(cameras[cam]) for cam in ba.cams]
+    ba._free_index = [0, 3, 4]
+    x0 = ba._pack()
+    r0 = ba._residuals(x0)
+    jac = np.zeros((len(r0), len(x0)))
+    for j in range(len(x0)):
+        x = x0.copy()
+        x[j] += 1e-6 * max(1.0, abs(x[j]))
+        jac[:, j] = ba._residuals(x) - r0
+    sparsity = ba._jacobian_sparsity().toarray() > 0
+    assert sparsity.shape == jac.shape
+    assert not np.any((jac != 0) & ~sparsity)
+
+
+def test_bundle_adjustment_without_datum(scene):
+    cameras, features, points, _, _, _ = scene
+    ext = cameras["p1"].extrinsics.copy()
+    ba = BundleAdjustment(cameras, features, points)
+    assert ba.free_params == []
+    result = ba.run()
+    assert result.final_rms < result.initial_rms
+    assert np.allclose(cameras["p1"].extrinsics, ext)
+    with pytest.raises(ValueError):
+        BundleAdjustment(cameras, features, points, camera_prm_to_fix=["F", "X"])
+
+
+def test_bundle_adjustment_scale_datum(scene):
+    cameras, features, points, _, _, _ = scene
+    baseline = np.linalg.norm(cameras["p2"].C - cameras["p1"].C)
+    ba = BundleAdjustment(cameras, features, points[np.arange(10)])
+    ba._base_intrinsics = [ba._intrinsics(cameras[cam]) for cam in ba.cams]
+    ba._free_index = []
+    x0 = ba._pack()
+
+    # Scaling the scene about the first camera center (the gauge freedom left by fixing the first camera)
+    eo, _, pts, _ = ba._unpack(x0)
+    scale = np.zeros_like(x0)
+    scale[9:12] = eo[1, 3:] - eo[0, 3:]
+    scale[12:] = (pts - eo[0, 3:]).ravel()
+    r0 = ba._residuals(x0)
+    dr = (ba._residuals(x0 + 1e-6 * scale) - r0) / 1e-6
+    # does not change the reprojections, only the baseline
+    assert np.abs(dr[:-1]).max() < 1e-3
+    assert abs(dr[-1]) > 1e5
+    baseline_cols = np.nonzero(ba._jacobian_sparsity().toarray()[-1])[0]
+    assert list(baseline_cols) == [3, 4, 5, 9, 10, 11]
+
+    # The baseline is kept by the adjustment
+    result = BundleAdjustment(cameras, features, points).run()
+    assert result.final_rms < result.initial_rms
+    assert np.linalg.norm(cameras["p2"].C - cameras["p1"].C) == pytest.approx(
+        baseline, rel=1e-5
+    )
@@ -0,0 +1,76 @@
+import pickle
+
+import cv2
+import numpy as np
+import pytest
+
+from icepy4d.core.camera import Camera
+
+
+@pytest.fixture
+def camera():
+    K = np.array([[800.0, 0, 320], [0, 800, 240], [0, 0, 1]])
+    dist = np.array([-0.1, 0.02, 0.001, -0.001, 0.0])
+    R, _ = cv2.Rodrigues(np.array([0.1, -0.2, 0.05]))
+    return Camera(640, 480, K=K, dist=dist, R=R, t=np.array([[1.0], [-0.5], [2.0]]))
+
+
+def test_camera_cached_projection(camera):
+    P = camera.P
+    assert camera.P is P
+    assert not P.flags.writeable
+    assert np.allclose(camera.rvec, cv2.Rodrigues(camera.R)[0])
+
+    points3d = np.random.default_rng(0).uniform(-1, 1, (50, 3)) + [0, 0, 10]
+    expected, _ = cv2.projectPoints(
+        points3d, cv2.Rodrigues(camera.R)[0], camera.t, camera.K, camera.dist
+    )
+    assert np.allclose(camera.project_point(points3d), expected[:, 0], atol=1e-3)
+
+    # Updating the extrinsics invalidates P, rvec and pose
+    version = camera.version
+    pose = camera.pose
+    ext = camera.extrinsics.copy()
+    ext[:3, 3] += 1.0
+    camera.update_extrinsics(ext)
+    assert camera.version != version
+    assert not np.allclose(camera.P, P)
+    assert not np.allclose(camera.pose, pose)
+    assert np.allclose(camera.P, camera.K @ camera.extrinsics[:3])
+
+    # Updating the intrinsics invalidates P
+    K = camera.K.copy()
+    K[0, 0] = K[1, 1] = 900.0
+    camera.update_K(K)
+    assert np.allclose(camera.P, K @ camera.extrinsics[:3])
+
+
+def test_camera_undistortion_maps(camera):
+    image = np.random.default_rng(0).integers(0, 255, (480, 640, 3), dtype=np.uint8)
+    maps = camera.undistortion_maps()
+    assert camera.undistortion_maps((640, 480)) is maps
+    und = camera.undistort_image(image)
+    expected = cv2.undistort(image, camera.K, camera.dist, None, camera.K)
+    diff = np.abs(und.astype(int) - expected.astype(int))
+    assert np.mean(diff) < 1.0
+
+    pts = np.array([[10.0, 20.0], [320.0, 240.0], [600.0, 400.0]])
+    expected = cv2.undistortPoints(
+        pts.reshape(-1, 1, 2), camera.K, camera.dist, None, camera.K
+    )[:, 0]
+    assert np.allclose(camera.undistort_points(pts), expected, atol=1e-3)
+
+    # Updating the distortion invalidates the maps, but not P
+    P = camera.P
+    camera.update_dist(np.zeros(5))
+    assert camera.undistortion_maps() is not maps
+    assert camera.P is P
+    assert np.array_equal(camera.undistort_image(image), image)
+
+
+def test_camera_pickle(camera):
+    camera.undistortion_maps()
+    restored = pickle.loads(pickle.dumps(camera))
+    assert restored._cache == {}
+    assert np.allclose(restored.P, camera.P)
+    assert restored.version != camera.version
@@ -0,0 +1,25 @@
+import pytest
+
+from icepy4d.cli import build_parser, parse_epochs
+
+
+def test_parse_epochs():
+    assert parse_epochs("all", 4) == [0, 1, 2, 3]
+    assert parse_epochs("0-2,5, 7", 10) == [0, 1, 2, 5, 7]
+    assert parse_epochs("3-4,4", 10) == [3, 4]
+    for spec in ["4-2", "a", "1-", "0-10"]:
+        with pytest.raises(ValueError):
+            parse_epochs(spec, 10)
+
+
+def test_build_parser():
+    parser = build_parser()
+    args = parser.parse_args(
+        ["run", "config.yaml", "--epochs", "0-9", "-w", "4", "--from-stage", "georef"]
+    )
+    assert args.command == "run"
+    assert args.epochs == "0-9" and args.workers == 4
+    assert args.from_stage == "georef" and args.to_stage is None
+    assert not args.resume and not args.dry_run
+    with pytest.raises(SystemExit):
+        parser.parse_args(["run"])
@@ -0,0 +1,71 @@
+import pytest
+import torch
+from torch import nn
+
+from icepy4d.matching.model_registry import (
+    PointwiseLinear,
+    _replace_pointwise_convs,
+    quantize_model,
+    set_num_threads,
+)
+from icepy4d.thirdparty.SuperGlue.models.superglue import log_optimal_transport
+
+
+@pytest.mark.parametrize("tol", [1e-2, 1e-3, 1e-4])
+def test_sinkhorn_early_stopping(tol):
+    torch.manual_seed(0)
+    scores = torch.randn(2, 50, 40) * 3
+    alpha = torch.tensor(1.0)
+    fixed = log_optimal_transport(scores, alpha, iters=200)
+    early = log_optimal_transport(scores, alpha, iters=200, tol=tol)
+
+    # Stopped before the last iteration, with the same assignment within tol
+    assert not torch.equal(fixed, early)
+    assert (fixed.exp() - early.exp()).abs().max() < tol
+    assert torch.equal(
+        fixed[:, :-1, :-1].argmax(dim=2), early[:, :-1, :-1].argmax(dim=2)
+    )
+
+
+def test_pointwise_linear():
+    torch.manual_seed(0)
+    x = torch.randn(2, 64, 17)
+    conv = nn.Conv1d(64, 32, kernel_size=1)
+    assert torch.allclose(PointwiseLinear(conv)(x), conv(x), atol=1e-5)
+    conv = nn.Conv1d(64, 32, kernel_size=1, bias=False)
+    assert torch.allclose(PointwiseLinear(conv)(x), conv(x), atol=1e-5)
+
+
+def test_replace_pointwise_convs():
+    torch.manual_seed(0)
+    net = nn.Sequential(
+        nn.Conv1d(64, 128, kernel_size=1),
+        nn.ReLU(),
+        nn.Sequential(nn.Conv1d(128, 64, kernel_size=3, padding=1)),
+        nn.Conv1d(64, 32, kernel_size=1),
+    ).eval()
+    x = torch.randn(2, 64, 17)
+    with torch.inference_mode():
+        expected = net(x)
+        _replace_pointwise_convs(net)
+        assert isinstance(net[0], PointwiseLinear)
+        assert isinstance(net[3], PointwiseLinear)
+        # Only 1x1 convolutions are replaced
+        assert isinstance(net[2][0], nn.Conv1d)
+        assert torch.allclose(net(x), expected, atol=1e-5)
+
+        # int8 quantization changes the outputs only slightly
+        quantized = quantize_model(net)
+        out = quantized(x)
+    assert not any(isinstance(m, nn.Linear) for m in quantized.modules())
+    assert (out - expected).abs().max() < 0.05 * expected.abs().max()
+
+
+def test_cpu_inference_keeps_num_threads():
+    from icepy4d.matching.matchers import CPU_INFERENCE_OPTIONS
+
+    # The threads set for each pipeline worker are not overridden
+    assert CPU_INFERENCE_OPTIONS["num_threads"] is None
+    num_threads = torch.get_num_threads()
+    set_num_threads(None)
+    assert torch.get_num_threads() == num_threads
@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from icepy4d.core.camera import Camera
+from icepy4d.core.epoch import Epoch
+from icepy4d.core.epoch_io import EpochReader, convert_pickle_to_h5
+from icepy4d.core.features import Features
+from icepy4d.core.points import Points
+from icepy4d.core.targets import Targets
+
+
+@pytest.fixture
+def epoch(tmp_path):
+    rng = np.random.default_rng(0)
+    cams = ["p1", "p2"]
+    cameras = {}
+    features = {}
+    for i, cam in enumerate(cams):
+        K = np.array([[6000.0, 0, 3000], [0, 6000, 2000], [0, 0, 1]])
+        extrinsics = np.eye(4)
+        extrinsics[0, 3] = i
+        cameras[cam] = Camera(6000, 4000, K=K, dist=np.zeros(5), extrinsics=extrinsics)
+        feats = Features()
+        feats.append_features_from_numpy(
+            rng.random(50) * 6000,
+            rng.random(50) * 4000,
+            descr=rng.random((256, 50)).astype(np.float32),
+            scores=rng.random(50).astype(np.float32),
+            track_ids=list(range(10, 60)),
+            epoch=3,
+        )
+        features[cam] = feats
+    points = Points()
+    points.append_points_from_numpy(
+        rng.random((30, 3)), track_ids=list(range(10, 40)), colors=rng.random((30, 3))
+    )
+    targets = Targets()
+    for cam in cams:
+        targets.im_coor.append(
+            pd.DataFrame({"label": ["F1", "F2"], "x": [10.5, 20.0], "y": [1.0, 2.0]})
+        )
+    targets.obj_coor = pd.DataFrame(
+        {"label": ["F1", "F2"], "X": [1.0, 2.0], "Y": [3.0, 4.0], "Z": [5.0, 6.0]}
+    )
+    return Epoch(
+        "2022-05-01_14-01-15",
+        epoch_dir=tmp_path / "epoch",
+        cameras=cameras,
+        features=features,
+        points=points,
+        targets=targets,
+    )
+
+
+def test_epoch_h5_roundtrip(epoch, tmp_path):
+    path = tmp_path / "epoch.h5"
+    assert epoch.save_h5(path)
+
+    loaded = Epoch.read_h5(path)
+    assert loaded.timestamp == epoch.timestamp
+    assert loaded.epoch_dir == epoch.epoch_dir
+    for cam in ["p1", "p2"]:
+        assert np.array_equal(loaded.cameras[cam].K, epoch.cameras[cam].K)
+        assert np.array_equal(loaded.cameras[cam].dist, epoch.cameras[cam].dist)
+        assert np.array_equal(
+            loaded.cameras[cam].extrinsics, epoch.cameras[cam].extrinsics
+        )
+        assert loaded.cameras[cam].width == 6000
+
+        f0, f1 = epoch.features[cam], loaded.features[cam]
+        assert np.array_equal(f0.kpts_to_numpy(), f1.kpts_to_numpy())
+        assert np.array_equal(f0.descr_to_numpy(), f1.descr_to_numpy())
+        assert np.array_equal(f0.scores_to_numpy(), f1.scores_to_numpy())
+        assert f0.get_track_ids() == f1.get_track_ids()
+        assert f1.last_track_id == 59
+        assert f1[10].epoch == 3
+
+    assert np.array_equal(loaded.points.to_numpy(), epoch.points.to_numpy())
+    assert np.array_equal(
+        loaded.points.colors_to_numpy(), epoch.points.colors_to_numpy()
+    )
+    assert np.array_equal(loaded.points.track_ids, epoch.points.track_ids)
+
+    assert loaded.targets.get_target_labels(cam_id=1) == ["F1", "F2"]
+    assert np.allclose(loaded.targets.get_im_coord(0), epoch.targets.get_im_coord(0))
+    assert np.allclose(loaded.targets.get_obj_coord(), epoch.targets.get_obj_coord())
+
+
+def test_epoch_h5_partial_read(epoch, tmp_path):
+    path = tmp_path / "epoch.h5"
+    epoch.save_h5(path)
+
+    loaded = Epoch.read_h5(path, include=["cameras", "points"])
+    assert set(loaded.cameras.keys()) == {"p1", "p2"}
+    assert len(loaded.points) == 30
+    assert loaded.features is None
+    assert loaded.targets is None
+
+    with EpochReader(path) as reader:
+        assert reader.version == 1
+        assert reader.cams == ["p1", "p2"]
+        feats = reader.read_features(cams=["p2"], read_descriptors=False)
+    assert list(feats.keys()) == ["p2"]
+    assert feats["p2"]._descr is None
+    assert np.array_equal(
+        feats["p2"].kpts_to_numpy(), epoch.features["p2"].kpts_to_numpy()
+    )
+
+
+def test_convert_pickle_to_h5(epoch, tmp_path):
+    pickle_path = tmp_path / "epoch.pickle"
+    epoch.save_pickle(pickle_path)
+    h5_path = convert_pickle_to_h5(pickle_path)
+    assert h5_path == tmp_path / "epoch.h5"
+
+    loaded = Epoch.read_h5(h5_path)
+    assert np.array_equal(
+        loaded.features["p1"].kpts_to_numpy(), epoch.features["p1"].kpts_to_numpy()
+    )
+    assert np.array_equal(loaded.points.to_numpy(), epoch.points.to_numpy())
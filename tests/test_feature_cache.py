@@ -0,0 +1,100 @@
+import multiprocessing
+
+import numpy as np
+
+from icepy4d.matching.feature_cache import FeatureCache
+
+
+def make_features(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        "keypoints": rng.random((n, 2), dtype=np.float32),
+        "descriptors": rng.random((256, n), dtype=np.float32),
+        "scores": rng.random(n, dtype=np.float32),
+    }
+
+
+def put_features(cache_dir, worker, n_puts):
+    cache = FeatureCache(cache_dir)
+    for i in range(n_puts):
+        cache.put(f"{worker:02d}{i:04d}", make_features(10, seed=i))
+
+
+def test_feature_cache_concurrent_processes(tmp_path):
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=put_features, args=(tmp_path, w, 50)) for w in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    assert all(p.exitcode == 0 for p in procs)
+
+    cache = FeatureCache(tmp_path)
+    for w in range(4):
+        for i in (0, 49):
+            features = cache.get(f"{w:02d}{i:04d}")
+            np.testing.assert_array_equal(
+                features["scores"], make_features(10, seed=i)["scores"]
+            )
+    assert not list(tmp_path.glob("*/*.tmp"))
+
+
+def test_feature_cache_lru():
+    size = sum(v.nbytes for v in make_features(10).values())
+    cache = FeatureCache(max_memory=2 * size)
+    for i, key in enumerate(["a", "b"]):
+        cache.put(key, make_features(10, seed=i))
+    assert cache.get("a") is not None  # "a" becomes the most recently used
+    cache.put("c", make_features(10, seed=2))
+
+    # The least recently used entry is evicted, and it is not on disk
+    assert len(cache) == 2
+    assert "b" not in cache and "a" in cache and "c" in cache
+    assert cache.get("b") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Entries larger than the memory limit are not kept in memory
+    cache.put("d", make_features(100))
+    assert "d" not in cache and len(cache) == 2
+
+
+def test_feature_cache_disk(tmp_path):
+    features = make_features(10)
+    cache = FeatureCache(tmp_path, max_memory=0)
+    cache.put("abcd", features)
+    assert len(cache) == 0 and "abcd" in cache
+    assert (tmp_path / "ab" / "abcd.npz").exists()
+
+    # A new cache reads the entry from disk and keeps it in memory
+    cache = FeatureCache(tmp_path)
+    assert len(cache) == 0
+    cached = cache.get("abcd")
+    for k, v in features.items():
+        np.testing.assert_array_equal(cached[k], v)
+    assert len(cache) == 1 and cache.hits == 1
+
+    cache.clear()
+    assert len(cache) == 0 and "abcd" in cache
+    cache.clear(disk=True)
+    assert "abcd" not in cache and cache.get("abcd") is None
+
+    # Unreadable entries are misses
+    (tmp_path / "ef").mkdir()
+    (tmp_path / "ef" / "efgh.npz").write_bytes(b"not a npz file")
+    assert cache.get("efgh") is None and cache.misses == 2
+
+
+def test_feature_cache_make_key(tmp_path):
+    image = tmp_path / "image.jpg"
+    image.write_bytes(b"0" * 10)
+    config = {"max_keypoints": 4096}
+    key = FeatureCache.make_key(image, config, shape=(100, 100))
+    assert key == FeatureCache.make_key(image, dict(config), shape=(100, 100))
+    assert key != FeatureCache.make_key(
+        image, {"max_keypoints": 2048}, shape=(100, 100)
+    )
+    assert key != FeatureCache.make_key(image, config, shape=(100, 50))
+
+    # The features are re-extracted if the image changes
+    image.write_bytes(b"1" * 11)
+    assert key != FeatureCache.make_key(image, config, shape=(100, 100))
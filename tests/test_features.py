@@ -229,6 +229,81 @@ def test_to_numpy():
     assert np.allclose(output["kpts"], expected_output["kpts"])
 
 
+def test_features_columnar_storage():
+    rng = np.random.default_rng()
+    n_feat = 50
+    x = rng.random(n_feat, dtype=np.float32) * 100
+    y = rng.random(n_feat, dtype=np.float32) * 100
+    descr = rng.random((256, n_feat), dtype=np.float32)
+    scores = rng.random(n_feat, dtype=np.float32)
+    features = Features()
+    features.append_features_from_numpy(x, y, descr, scores, epoch=3)
+    features.append_features_from_numpy(x, y, descr, scores, epoch=4)
+    assert len(features) == 2 * n_feat
+    assert features.last_track_id == 2 * n_feat - 1
+
+    # Exported arrays are views on the internal storage
+    kpts = features.kpts_to_numpy()
+    assert kpts.shape == (2 * n_feat, 2) and kpts.dtype == np.float32
+    assert np.shares_memory(kpts, features.kpts_to_numpy())
+    assert np.shares_memory(features.descr_to_numpy(), features.descr_to_numpy())
+    assert np.allclose(features.descr_to_numpy()[:, n_feat:], descr)
+    assert np.allclose(features.scores_to_numpy()[:n_feat], scores)
+
+    # Feature objects are built on access
+    f = features[n_feat + 1]
+    assert isinstance(f, Feature)
+    assert f.track_id == n_feat + 1
+    assert f.epoch == 4
+    assert np.allclose(f.xy, [[x[1], y[1]]])
+    assert np.allclose(f.descr, descr[:, 1:2])
+
+    # Deleting a feature keeps the track_id index consistent
+    del features[0]
+    assert 0 not in features
+    assert features[1].track_id == 1
+    assert len(features) == 2 * n_feat - 1
+
+
+def test_features_pickle(tmp_path):
+    import pickle
+
+    features = Features()
+    features.append_features_from_numpy(
+        np.array([1.0, 2.0, 3.0]),
+        np.array([4.0, 5.0, 6.0]),
+        descr=np.ones((128, 3)),
+        scores=np.array([0.1, 0.2, 0.3]),
+        track_ids=[10, 11, 12],
+    )
+    features.save_as_pickle(tmp_path / "features.pickle")
+    with open(tmp_path / "features.pickle", "rb") as f:
+        loaded = pickle.load(f)
+    assert len(loaded) == 3
+    assert 11 in loaded
+    assert np.allclose(loaded.kpts_to_numpy(), features.kpts_to_numpy())
+    assert np.allclose(loaded.descr_to_numpy(), features.descr_to_numpy())
+
+    # Features pickled with the former dict-based storage
+    legacy = Features.__new__(Features)
+    legacy.__setstate__(
+        {
+            "_values": {
+                5: Feature(1.0, 2.0, track_id=5, score=np.float32(0.5)),
+                7: Feature(3.0, 4.0, track_id=7, score=np.float32(0.7)),
+            },
+            "_last_id": 7,
+            "_iter": 0,
+            "_descriptor_size": 256,
+        }
+    )
+    assert len(legacy) == 2
+    assert legacy.last_track_id == 7
+    assert legacy.get_track_ids() == (5, 7)
+    assert np.allclose(legacy.kpts_to_numpy(), [[1.0, 2.0], [3.0, 4.0]])
+    assert np.allclose(legacy.scores_to_numpy(), [0.5, 0.7])
+
+
 if __name__ == "__main__":
     test_feature_creation()
     test_features()
@@ -0,0 +1,144 @@
+import cv2
+import numpy as np
+import pytest
+
+from icepy4d.matching import GeometricVerification
+from icepy4d.matching.geometric_verification import (
+    ESTIMATORS,
+    MIN_MATCHES,
+    geometric_verification,
+    lo_ransac_estimator,
+    register_estimator,
+    verify_matches,
+)
+from icepy4d.matching.guided_matching import epipolar_distance
+
+
+def skew(t):
+    x, y, z = t.ravel()
+    return np.array([[0, -z, y], [z, 0, -x], [-y, x, 0]])
+
+
+def make_matches(n=300, outlier_ratio=0.3, noise=0.3, seed=0):
+    """Synthetic matches of two views of a 3D scene, with a fraction of random outliers."""
+    rng = np.random.default_rng(seed)
+    K = np.array([[1000.0, 0, 640], [0, 1000, 480], [0, 0, 1]])
+    R, _ = cv2.Rodrigues(np.array([0.02, -0.25, 0.01]))
+    t = np.array([[-2.0], [0.1], [0.3]])
+    points3d = rng.uniform([-10, -8, 20], [10, 8, 50], (n, 3))
+
+    def project(R, t):
+        x = (K @ (R @ points3d.T + t)).T
+        return x[:, :2] / x[:, 2:]
+
+    pts0 = project(np.eye(3), np.zeros((3, 1))) + rng.normal(0, noise, (n, 2))
+    pts1 = project(R, t) + rng.normal(0, noise, (n, 2))
+    outliers = rng.random(n) < outlier_ratio
+    pts1[outliers] = rng.uniform([0, 0], [1280, 960], (outliers.sum(), 2))
+    # Outliers that happen to fall close to their epipolar line are inliers as well
+    F_true = np.linalg.inv(K).T @ skew(t) @ R @ np.linalg.inv(K)
+    inliers = ~outliers | (epipolar_distance(F_true, pts0, pts1) < 1)
+    return pts0, pts1, inliers
+
+
+@pytest.mark.parametrize("use_mconf", [False, True])
+def test_lo_ransac_estimator(use_mconf):
+    pts0, pts1, inliers = make_matches()
+    mconf = None
+    if use_mconf:
+        # Confidence correlated with the inliers, as the SuperGlue matching scores
+        mconf = (
+            np.where(inliers, 0.8, 0.3)
+            + np.random.default_rng(1).random(len(pts0)) * 0.3
+        )
+    F, mask = lo_ransac_estimator(pts0, pts1, threshold=1.5, mconf=mconf)
+    assert F.shape == (3, 3) and np.linalg.norm(F) == pytest.approx(1)
+    assert mask.dtype == bool and mask.shape == (len(pts0),)
+    recall = (mask & inliers).sum() / inliers.sum()
+    precision = (mask & inliers).sum() / mask.sum()
+    assert recall > 0.95 and precision > 0.95
+    assert np.median(epipolar_distance(F, pts0[inliers], pts1[inliers])) < 1
+
+    # Deterministic for a given seed
+    F2, mask2 = lo_ransac_estimator(pts0, pts1, threshold=1.5, mconf=mconf)
+    assert np.array_equal(mask, mask2) and np.allclose(F, F2)
+
+
+def test_lo_ransac_estimator_few_matches():
+    pts0, pts1, _ = make_matches(n=MIN_MATCHES - 1, outlier_ratio=0)
+    F, mask = lo_ransac_estimator(pts0, pts1)
+    assert F is None
+    assert not mask.any() and len(mask) == MIN_MATCHES - 1
+
+
+def test_estimators_registry(monkeypatch):
+    for method in GeometricVerification:
+        if method != GeometricVerification.NONE:
+            assert method in ESTIMATORS
+    assert ESTIMATORS[GeometricVerification.LO_RANSAC] is lo_ransac_estimator
+
+    # A registered estimator is used by geometric_verification
+    calls = []
+
+    def estimator(mkpts0, mkpts1, threshold, confidence, max_iters, mconf=None, **kw):
+        calls.append(mconf)
+        return np.eye(3), np.arange(len(mkpts0)) % 2 == 0
+
+    monkeypatch.setitem(ESTIMATORS, GeometricVerification.USAC_ACCURATE, None)
+    register_estimator(GeometricVerification.USAC_ACCURATE)(estimator)
+    pts0, pts1, _ = make_matches(n=20)
+    mconf = np.ones(20)
+    F, mask = geometric_verification(
+        pts0, pts1, GeometricVerification.USAC_ACCURATE, mconf=mconf
+    )
+    assert np.array_equal(F, np.eye(3))
+    assert mask.sum() == 10
+    assert calls[0] is mconf
+
+
+def test_geometric_verification_fallback(monkeypatch):
+    def failing(*args, **kwargs):
+        raise RuntimeError("estimator failure")
+
+    monkeypatch.setitem(ESTIMATORS, GeometricVerification.LO_RANSAC, failing)
+    pts0, pts1, inliers = make_matches()
+    F, mask = geometric_verification(
+        pts0, pts1, GeometricVerification.LO_RANSAC, threshold=1.5
+    )
+    # Falls back to MAGSAC++
+    assert F is not None
+    assert (mask & inliers).sum() / inliers.sum() > 0.9
+
+    # Not enough matches: all the matches are kept
+    F, mask = geometric_verification(pts0[:3], pts1[:3], GeometricVerification.MAGSAC)
+    assert F is None and mask.all()
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_verify_matches_by_tiles(n_workers):
+    pts0, pts1, inliers = make_matches(n=600)
+    tile_ids = (pts0[:, 0] // 640).astype(int) * 2 + (pts0[:, 1] // 480).astype(int)
+    # A tile pair with less than MIN_MATCHES matches is left to the global check
+    tile_ids[:3] = 99
+    F, mask, stages = verify_matches(
+        pts0,
+        pts1,
+        method=GeometricVerification.LO_RANSAC,
+        threshold=1.5,
+        tile_ids=tile_ids,
+        n_workers=n_workers,
+    )
+    assert [s.name for s in stages] == ["tiles", "global"]
+    assert stages[0].n_matches == 600
+    assert stages[1].n_matches == stages[0].n_inliers
+    assert stages[1].n_inliers == mask.sum()
+    recall = (mask & inliers).sum() / inliers.sum()
+    precision = (mask & inliers).sum() / mask.sum()
+    assert recall > 0.9 and precision > 0.95
+
+    # Without tiles, only the global stage is run
+    F, mask, stages = verify_matches(
+        pts0, pts1, method=GeometricVerification.LO_RANSAC, threshold=1.5
+    )
+    assert [s.name for s in stages] == ["global"]
+    assert (mask & inliers).sum() / inliers.sum() > 0.95
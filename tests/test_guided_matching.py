@@ -0,0 +1,80 @@
+import cv2
+import numpy as np
+import pytest
+
+from icepy4d.core.camera import Camera
+from icepy4d.matching import guided_matching
+from icepy4d.matching.guided_matching import (
+    epipolar_band_mask,
+    epipolar_distance,
+    epipolar_filter,
+    fundamental_from_cameras,
+)
+
+# Fundamental matrix of a rectified stereo pair (horizontal translation): the epipolar lines are the image rows
+F_RECTIFIED = np.array([[0.0, 0, 0], [0, 0, -1], [0, 1, 0]])
+
+
+def make_cameras():
+    K = np.array([[800.0, 0, 320], [0, 800, 240], [0, 0, 1]])
+    R1, _ = cv2.Rodrigues(np.array([0.05, -0.3, 0.02]))
+    camera0 = Camera(640, 480, K=K, R=np.eye(3), t=np.zeros((3, 1)))
+    camera1 = Camera(640, 480, K=K, R=R1, t=np.array([[-1.0], [0.1], [0.2]]))
+    return camera0, camera1
+
+
+def project(camera, points3d):
+    x = (camera.K @ (camera.R @ points3d.T + camera.t)).T
+    return x[:, :2] / x[:, 2:]
+
+
+def test_epipolar_distance_rectified():
+    rng = np.random.default_rng(0)
+    pts0 = rng.uniform(0, 500, (100, 2))
+    dy = rng.uniform(-10, 10, 100)
+    pts1 = pts0 + np.column_stack([rng.uniform(-50, 0, 100), dy])
+    assert np.allclose(epipolar_distance(F_RECTIFIED, pts0, pts1), np.abs(dy))
+    # The distance does not depend on the scale of F
+    assert np.allclose(epipolar_distance(3 * F_RECTIFIED, pts0, pts1), np.abs(dy))
+
+    mask = epipolar_filter(F_RECTIFIED, pts0, pts1, threshold=5)
+    assert np.array_equal(mask, np.abs(dy) <= 5)
+    assert epipolar_filter(
+        F_RECTIFIED, np.empty((0, 2)), np.empty((0, 2)), 5
+    ).shape == (0,)
+
+
+def test_fundamental_from_cameras():
+    camera0, camera1 = make_cameras()
+    F = fundamental_from_cameras(camera0, camera1)
+    assert np.linalg.norm(F) == pytest.approx(1)
+    assert np.linalg.matrix_rank(F) == 2
+
+    rng = np.random.default_rng(0)
+    points3d = rng.uniform([-5, -5, 15], [5, 5, 30], (200, 3))
+    pts0, pts1 = project(camera0, points3d), project(camera1, points3d)
+    assert epipolar_distance(F, pts0, pts1).max() < 1e-6
+
+    # Wrong correspondences are far from the epipolar lines
+    assert np.median(epipolar_distance(F, pts0, pts1[::-1])) > 10
+
+
+@pytest.mark.parametrize("chunk_size", [guided_matching.EPIPOLAR_MASK_CHUNK_SIZE, 7])
+def test_epipolar_band_mask(chunk_size, monkeypatch):
+    monkeypatch.setattr(guided_matching, "EPIPOLAR_MASK_CHUNK_SIZE", chunk_size)
+    camera0, camera1 = make_cameras()
+    F = fundamental_from_cameras(camera0, camera1)
+    rng = np.random.default_rng(1)
+    points3d = rng.uniform([-5, -5, 15], [5, 5, 30], (40, 3))
+    pts0 = project(camera0, points3d)
+    pts1 = project(camera1, points3d[:30]) + rng.normal(0, 1, (30, 2))
+
+    mask = epipolar_band_mask(F, pts0, pts1, threshold=5)
+    assert mask.shape == (40, 30)
+    # Same as the symmetric epipolar distance of every pair
+    i, j = np.meshgrid(np.arange(40), np.arange(30), indexing="ij")
+    dist = epipolar_distance(F, pts0[i.ravel()], pts1[j.ravel()]).reshape(40, 30)
+    assert np.array_equal(mask, dist <= 5)
+    # The true correspondences are in the band, and the band is selective
+    assert mask[np.arange(30), np.arange(30)].all()
+    assert mask.mean() < 0.5
@@ -0,0 +1,159 @@
+import shutil
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from icepy4d.core.epoch import EpochDataMap, find_closest_timestamp
+from icepy4d.core.image_index import (
+    ImageIndex,
+    pair_timestamps,
+    read_image_metadata,
+)
+from icepy4d.core.images import Image
+
+
+@pytest.fixture
+def image_dir(data_dir, tmp_path):
+    for cam in ["cam1", "cam2"]:
+        shutil.copytree(data_dir / "img" / cam, tmp_path / cam)
+    return tmp_path
+
+
+def test_read_image_metadata(data_dir):
+    path = data_dir / "img/cam1/IMG_2637.jpg"
+    metadata = read_image_metadata(path)
+    image = Image(path)
+    assert metadata["timestamp"] == image.timestamp
+    assert metadata["width"] == image.width
+    assert metadata["height"] == image.height
+
+
+def test_pair_timestamps():
+    t0 = datetime(2022, 7, 1)
+    ref = np.array([t0 + timedelta(seconds=s) for s in [0, 100, 1000, 5000]])
+    timestamps = [t0 + timedelta(seconds=s) for s in [-30, 90, 130, 980, 4000]]
+    closest, tdiffs = pair_timestamps(ref, timestamps, timedelta(seconds=60))
+    assert list(closest) == [0, 1, 3, -1]
+    assert tdiffs[1].item() == timedelta(seconds=10)
+
+    # Same result as the linear search
+    for i, ts in enumerate(ref):
+        _, idx, _ = find_closest_timestamp(ts, timestamps, timedelta(seconds=60))
+        assert closest[i] == (-1 if idx is None else idx)
+
+    closest, _ = pair_timestamps(ref, timestamps[:1], timedelta(seconds=60))
+    assert list(closest) == [0, -1, -1, -1]
+    closest, _ = pair_timestamps(ref, [], timedelta(seconds=60))
+    assert list(closest) == [-1, -1, -1, -1]
+
+
+def test_image_index_incremental_update(image_dir):
+    index_file = image_dir / "image_index_cam1.json"
+    index = ImageIndex(image_dir / "cam1", index_file)
+    assert len(index) == 4
+    assert index_file.exists()
+
+    # Reloaded index: no image is read again
+    index = ImageIndex(image_dir / "cam1", index_file)
+    assert index.update() == (0, 0)
+
+    # New and removed images
+    shutil.copy(image_dir / "cam1/IMG_2637.jpg", image_dir / "cam1/IMG_9999.jpg")
+    (image_dir / "cam1/IMG_2658.jpg").unlink()
+    assert index.update() == (1, 1)
+    assert "IMG_9999.jpg" in index and "IMG_2658.jpg" not in index
+
+    timestamps, paths = index.timestamps()
+    assert np.all(np.diff(timestamps) >= np.timedelta64(0))
+    assert len(paths) == 4
+
+
+def test_epoch_data_map_with_index(image_dir):
+    epoch_map = EpochDataMap(image_dir, time_tolerance_sec=1200)
+    assert (image_dir / "image_index_cam2.json").exists()
+    assert (image_dir / "epoch_map.csv").exists()
+    assert len(epoch_map) > 0
+    for ep in range(len(epoch_map)):
+        images = epoch_map.get_images(ep)
+        assert set(images) == {"cam1", "cam2"}
+        assert images["cam1"].datetime == epoch_map.get_timestamp(ep)
+        diff = abs(images["cam2"].datetime - images["cam1"].datetime)
+        assert diff < timedelta(seconds=1200)
+
+    # Same epochs without the persistent index
+    epoch_map_no_index = EpochDataMap(
+        image_dir, time_tolerance_sec=1200, use_index=False
+    )
+    assert len(epoch_map_no_index) == len(epoch_map)
+    for ep in range(len(epoch_map)):
+        assert (
+            epoch_map_no_index.get_images(ep)["cam2"].name
+            == epoch_map.get_images(ep)["cam2"].name
+        )
+
+
+def test_epoch_data_map_update(data_dir, tmp_path):
+    src = data_dir / "img"
+
+    def add_images(cam, names):
+        (tmp_path / cam).mkdir(exist_ok=True)
+        for name in names:
+            shutil.copy2(src / cam / name, tmp_path / cam / name)
+
+    add_images("cam1", ["IMG_2637.jpg", "IMG_2658.jpg"])
+    add_images("cam2", ["IMG_1112.jpg"])
+    epoch_map = EpochDataMap(tmp_path, time_tolerance_sec=1200)
+    assert len(epoch_map) == 1
+    assert epoch_map.update() == []
+
+    # The second epoch becomes ready when its cam2 image arrives
+    add_images("cam1", ["IMG_2671.jpg"])
+    add_images("cam2", ["IMG_1133.jpg"])
+    assert epoch_map.update() == [1]
+    assert epoch_map.get_images(1)["cam2"].name == "IMG_1133.jpg"
+    assert epoch_map.get_images(0)["cam2"].name == "IMG_1112.jpg"
+
+    add_images("cam2", ["IMG_1146.jpg"])
+    new_epochs = list(
+        epoch_map.watch(poll_interval=0, timeout=0, include_existing=True)
+    )
+    assert [ep for ep, _ in new_epochs] == [0, 1, 2]
+    assert new_epochs[2][1]["images"]["cam1"].name == "IMG_2671.jpg"
+
+    with open(tmp_path / "epoch_map.csv") as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 4
+    assert lines[-1].startswith("2,")
+
+
+def test_epoch_data_map_ids_are_stable(data_dir, tmp_path):
+    src = data_dir / "img"
+
+    def add_images(cam, names):
+        (tmp_path / cam).mkdir(exist_ok=True)
+        for name in names:
+            shutil.copy2(src / cam / name, tmp_path / cam / name)
+
+    add_images("cam1", ["IMG_2658.jpg", "IMG_2671.jpg"])
+    add_images("cam2", ["IMG_1133.jpg", "IMG_1146.jpg"])
+    epoch_map = EpochDataMap(tmp_path, time_tolerance_sec=1200)
+    assert [epoch_map.get_images(ep)["cam1"].name for ep in range(2)] == [
+        "IMG_2658.jpg",
+        "IMG_2671.jpg",
+    ]
+    with open(tmp_path / "epoch_map.csv") as f:
+        first_run = f.read()
+
+    # An earlier epoch found by a later run gets a new id, the others keep theirs
+    add_images("cam1", ["IMG_2637.jpg"])
+    add_images("cam2", ["IMG_1112.jpg"])
+    epoch_map = EpochDataMap(tmp_path, time_tolerance_sec=1200)
+    assert len(epoch_map) == 3
+    assert epoch_map.get_images(0)["cam1"].name == "IMG_2658.jpg"
+    assert epoch_map.get_images(1)["cam1"].name == "IMG_2671.jpg"
+    assert epoch_map.get_images(2)["cam1"].name == "IMG_2637.jpg"
+    with open(tmp_path / "epoch_map.csv") as f:
+        second_run = f.read()
+    assert second_run.startswith(first_run)
+    assert second_run.splitlines()[-1].startswith("2,")
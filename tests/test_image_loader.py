@@ -0,0 +1,111 @@
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from icepy4d.core import image_loader
+from icepy4d.core.image_loader import (
+    ImageLoader,
+    decode_image,
+    get_image_loader,
+    set_image_loader,
+)
+from icepy4d.core.images import Image
+
+
+@pytest.fixture
+def image_files(tmp_path):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"img_{i}.png"
+        cv2.imwrite(str(path), rng.integers(0, 255, (64, 96, 3), dtype=np.uint8))
+        paths.append(path)
+    return paths
+
+
+def test_decode_image(image_files):
+    image = decode_image(image_files[0])
+    expected = cv2.cvtColor(cv2.imread(str(image_files[0])), cv2.COLOR_BGR2RGB)
+    assert np.array_equal(image, expected)
+    assert decode_image(image_files[0], color=False).shape == (64, 96)
+    assert decode_image(image_files[0], reduction=2).shape == (32, 48, 3)
+    with pytest.raises(ValueError):
+        decode_image(image_files[0], reduction=3)
+
+
+def test_image_loader_cache(image_files):
+    loader = ImageLoader(num_workers=1)
+    image = loader.get(image_files[0])
+    assert image_files[0] in loader
+    assert not image.flags.writeable
+    assert loader.get(image_files[0]) is image
+    assert loader.hits == 1 and loader.misses == 1
+    assert loader.get(image_files[0], reduction=2).shape == (32, 48, 3)
+
+    loader.evict(image_files[0])
+    assert len(loader) == 0 and loader.cache_bytes == 0
+    loader.shutdown()
+
+
+def test_image_loader_lru_bound(image_files):
+    image_bytes = 64 * 96 * 3
+    loader = ImageLoader(max_bytes=2 * image_bytes, num_workers=1)
+    for path in image_files:
+        loader.get(path)
+    assert len(loader) == 2
+    assert loader.cache_bytes <= loader.max_bytes
+    assert image_files[0] not in loader
+    assert image_files[2] in loader
+    loader.shutdown()
+
+
+def test_image_loader_prefetch(image_files):
+    loader = ImageLoader(num_workers=2)
+    futures = loader.prefetch(image_files)
+    assert len(futures) == 3
+    for future in futures:
+        future.result()
+    assert all(path in loader for path in image_files)
+    assert loader.prefetch(image_files) == []
+    loader.get(image_files[1])
+    assert loader.misses == 0
+    loader.shutdown()
+
+
+def test_image_value_with_loader(data_dir):
+    path = data_dir / "img/cam1/IMG_2637.jpg"
+    loader = set_image_loader(ImageLoader(num_workers=1))
+    try:
+        img = Image(path)
+        assert get_image_loader() is loader
+        assert img.value is loader.get(path)
+        assert img._value_array is None
+        h, w = img.value.shape[:2]
+        assert img.get_reduced(8).shape[:2] == ((h + 7) // 8, (w + 7) // 8)
+    finally:
+        set_image_loader(None)
+    img = Image(path)
+    assert img.value.shape == (h, w, 3)
+    assert img._value_array is not None
+
+
+def test_image_loader_shutdown_cancels_prefetches(image_files, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_decode(*args):
+        started.set()
+        release.wait(5)
+        return np.zeros((4, 4, 3), dtype=np.uint8)
+
+    monkeypatch.setattr(image_loader, "decode_image", slow_decode)
+    loader = ImageLoader(num_workers=1)
+    futures = loader.prefetch(image_files)
+    started.wait(5)
+    loader.shutdown(wait=False)
+    # The prefetch being decoded completes, the others are cancelled
+    assert [f.cancelled() for f in futures] == [False, True, True]
+    release.set()
+    futures[0].result()
+    assert image_files[0] in loader and image_files[1] not in loader
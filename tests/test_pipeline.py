@@ -0,0 +1,316 @@
+import os
+
+import numpy as np
+import pytest
+
+from icepy4d.pipeline.cache import StageCache
+from icepy4d.pipeline.manifest import (
+    ManifestWriter,
+    build_manifest,
+    completed_epochs,
+    mean_stage_times,
+    read_manifests,
+    write_manifest,
+)
+from icepy4d.pipeline.runner import (
+    DONE,
+    FAILED,
+    HIT,
+    MISS,
+    MISSING,
+    SKIPPED,
+    UNCACHED,
+    EpochState,
+    Pipeline,
+    PipelineReport,
+    SkipEpoch,
+    Stage,
+    StageResult,
+    neighbors,
+)
+
+
+def load(state, linked):
+    if state.epoch_id == 3:
+        raise SkipEpoch("no images")
+    state.data["value"] = state.epoch_id
+
+
+def track(state, linked):
+    # Previous value of the track (as tracking features from the previous epoch)
+    prev = [s.data.get("track", 0) for s in linked.values()]
+    state.data["track"] = state.data["value"] + sum(prev)
+
+
+def square(state, linked):
+    if state.epoch_id == 5:
+        raise RuntimeError("broken epoch")
+    state.data["square"] = state.data["value"] ** 2
+
+
+def allocate(state, linked):
+    # Up to 2 GB, in chunks of 64 MB
+    state.data["buffer"] = [np.ones(64 * 1024**2, dtype=np.uint8) for _ in range(32)]
+
+
+def read_input(state, linked):
+    state.data["value"] = int(state.data["path"].read_text())
+
+
+def scale(state, linked):
+    state.data["scaled"] = state.data["value"] * state.cfg["scale"]
+
+
+def offset(state, linked):
+    state.data["result"] = state.data["scaled"] + state.cfg["offset"]
+
+
+def write(state, linked):
+    state.data["path"].with_suffix(".out").write_text(str(state.data["result"]))
+
+
+def make_stages(track_links=None):
+    return [
+        Stage("load", load),
+        Stage("track", track, requires=("load",), links=track_links),
+        Stage("square", square, requires=("load",)),
+    ]
+
+
+def test_pipeline_independent_epochs():
+    pipeline = Pipeline(make_stages())
+    report = pipeline.run([EpochState(ep) for ep in range(6)], keep_states=True)
+
+    assert report.epochs_with_status(DONE) == [0, 1, 2, 4]
+    assert report.status(3) == SKIPPED
+    assert report.status(5) == FAILED
+    assert "broken epoch" in str(report)
+    assert report.states[4].data == {"value": 4, "track": 4, "square": 16}
+    assert set(report.stage_times()) == {"load", "track", "square"}
+    # The stages after a skipped stage are skipped too
+    assert {r.stage for r in report.results if r.epoch_id == 3} == {
+        "load",
+        "track",
+        "square",
+    }
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_pipeline_linked_epochs(workers):
+    pipeline = Pipeline(
+        make_stages(neighbors("track", -1)), workers=workers, start_method="fork"
+    )
+    epoch_ids = [10, 11, 12, 13]
+    graph = pipeline.task_graph(epoch_ids)
+    assert graph[(11, "track")] == [(11, "load"), (10, "track")]
+    assert graph[(10, "track")] == [(10, "load")]
+
+    report = pipeline.run([EpochState(ep) for ep in epoch_ids], keep_states=True)
+    assert sorted(report.epochs_with_status(DONE)) == epoch_ids
+    tracks = [report.states[ep].data["track"] for ep in epoch_ids]
+    assert tracks == list(np.cumsum(epoch_ids))
+
+
+def test_pipeline_invalid_graph():
+    with pytest.raises(ValueError):
+        Pipeline([Stage("a", load, requires=("b",))])
+    with pytest.raises(ValueError):
+        Pipeline([Stage("a", load, requires=("b",)), Stage("b", load, requires=("a",))])
+    pipeline = Pipeline(make_stages(neighbors("track", -1, 1)))
+    with pytest.raises(ValueError):
+        pipeline.task_graph([0, 1])
+
+
+def test_pipeline_memory_limit():
+    with open("/proc/self/statm") as f:
+        rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    pipeline = Pipeline(
+        [Stage("load", load), Stage("allocate", allocate, requires=("load",))],
+        memory_limits={"allocate": rss + 256},
+    )
+    report = pipeline.run([EpochState(0)])
+    assert report.status(0) == FAILED
+    assert "MemoryError" in report.results[-1].message
+
+    # The limit applies only to the stage
+    assert np.ones(512 * 1024**2, dtype=np.uint8).sum() == 512 * 1024**2
+
+
+def test_pipeline_cache(tmp_path):
+    cfg = {"scale": 2, "offset": 1}
+    for ep in range(3):
+        (tmp_path / f"{ep}.txt").write_text(str(ep))
+    stages = [
+        Stage("read", read_input, inputs=lambda s: [s.data["path"]]),
+        Stage("scale", scale, requires=("read",), config_keys=("scale",)),
+        Stage("offset", offset, requires=("scale",), config_keys=("offset",)),
+        Stage("write", write, requires=("offset",), cacheable=False),
+    ]
+
+    def states():
+        return [
+            EpochState(ep, cfg, data={"path": tmp_path / f"{ep}.txt"})
+            for ep in range(3)
+        ]
+
+    def outputs():
+        return [int((tmp_path / f"{ep}.out").read_text()) for ep in range(3)]
+
+    pipeline = Pipeline(stages, cache=StageCache(tmp_path / "cache"))
+    report = pipeline.run(states())
+    assert outputs() == [1, 3, 5]
+    assert [r.cached for r in report.results if r.epoch_id == 0] == [
+        False,
+        False,
+        False,
+        None,
+    ]
+
+    # Nothing changed: all the cacheable stages are restored
+    status = pipeline.cache_status(states())
+    assert {status[(ep, "offset")] for ep in range(3)} == {HIT}
+    assert {status[(ep, "write")] for ep in range(3)} == {UNCACHED}
+    report = pipeline.run(states())
+    assert outputs() == [1, 3, 5]
+    assert "9 hits, 0 misses, 3 not cached" in report.cache_report()
+
+    # Changing the offset invalidates only the offset stage
+    cfg["offset"] = 10
+    status = pipeline.cache_status(states())
+    assert status[(1, "scale")] == HIT and status[(1, "offset")] == MISS
+    report = pipeline.run(states())
+    assert outputs() == [10, 12, 14]
+    assert "6 hits, 3 misses" in report.cache_report()
+
+    # Changing an input file invalidates all the stages of its epoch
+    (tmp_path / "2.txt").write_text("5")
+    status = pipeline.cache_status(states())
+    assert [status[(2, name)] for name in pipeline.stages] == [
+        MISS,
+        MISS,
+        MISS,
+        UNCACHED,
+    ]
+    assert status[(1, "offset")] == HIT
+    pipeline = Pipeline(
+        stages, workers=2, start_method="fork", cache=StageCache(tmp_path / "cache")
+    )
+    pipeline.run(states())
+    assert outputs() == [10, 12, 20]
+
+
+def test_pipeline_select(tmp_path):
+    cfg = {"scale": 2, "offset": 1}
+    (tmp_path / "0.txt").write_text("3")
+    stages = [
+        Stage("read", read_input, inputs=lambda s: [s.data["path"]]),
+        Stage("scale", scale, requires=("read",), config_keys=("scale",)),
+        Stage("offset", offset, requires=("scale",), config_keys=("offset",)),
+        Stage("write", write, requires=("offset",), cacheable=False),
+    ]
+    pipeline = Pipeline(stages, cache=StageCache(tmp_path / "cache"))
+
+    def states(epoch_ids=(0,)):
+        return [
+            EpochState(ep, cfg, data={"path": tmp_path / f"{ep}.txt"})
+            for ep in epoch_ids
+        ]
+
+    with pytest.raises(ValueError):
+        pipeline.select(to_stage="unknown")
+    with pytest.raises(ValueError):
+        pipeline.select(from_stage="write", to_stage="scale")
+    with pytest.raises(ValueError):
+        Pipeline(stages, from_stage="scale")
+
+    partial = pipeline.select(to_stage="scale")
+    assert partial.stages == ["read", "scale"]
+    report = partial.run(states(), keep_states=True)
+    assert report.states[0].data["scaled"] == 6
+    assert not (tmp_path / "0.out").exists()
+
+    # The stages before from_stage are restored, the others are computed again
+    partial = pipeline.select(from_stage="scale")
+    status = partial.cache_status(states())
+    assert [status[(0, name)] for name in partial.stages] == [HIT, MISS, MISS, UNCACHED]
+    report = partial.run(states())
+    assert (tmp_path / "0.out").read_text() == "7"
+    assert [r.cached for r in report.results] == [True, False, False, None]
+
+    # Epochs whose previous stages are not in the cache are skipped
+    (tmp_path / "1.txt").write_text("1")
+    partial = pipeline.select(from_stage="offset")
+    status = partial.cache_status(states([0, 1]))
+    assert status[(1, "read")] == MISSING
+    report = partial.run(states([0, 1]))
+    assert report.status(0) == DONE and report.status(1) == SKIPPED
+    assert not (tmp_path / "1.out").exists()
+
+
+def test_pipeline_manifest(tmp_path):
+    pipeline = Pipeline(make_stages())
+    report = pipeline.run([EpochState(ep) for ep in range(6)])
+    manifest = build_manifest(report, stages=pipeline.stages, workers=1)
+    assert manifest["epochs"][5] == FAILED
+    assert manifest["stage_summary"]["square"]["computed"] == 4
+    assert manifest["stage_summary"]["square"]["failed"] == 1
+    write_manifest(tmp_path / "run_20220101_000000.json", manifest)
+
+    # A later run completed epoch 5
+    results = [StageResult(5, name, DONE, elapsed=0.1) for name in pipeline.stages]
+    report = PipelineReport(results, elapsed=0.3)
+    write_manifest(
+        tmp_path / "run_20220102_000000.json",
+        build_manifest(report, stages=pipeline.stages),
+    )
+    manifests = read_manifests(tmp_path)
+    assert len(manifests) == 2
+    assert completed_epochs(manifests, pipeline.stages) == [0, 1, 2, 4, 5]
+    assert completed_epochs(manifests, ["load"]) == [0, 1, 2, 4, 5]
+    assert set(mean_stage_times(manifests)) == {"load", "track", "square"}
+
+
+def test_manifest_writer(tmp_path):
+    pipeline = Pipeline(make_stages())
+    path = tmp_path / "run_20220101_000000.json"
+    written = []
+
+    class Writer(ManifestWriter):
+        def write(self, report=None, finished=False):
+            super().write(report, finished)
+            written.append(completed_epochs(read_manifests(tmp_path), self.stages))
+
+    writer = Writer(path, pipeline.stages)
+    report = pipeline.run([EpochState(ep) for ep in range(6)], callback=writer)
+    # The manifest is rewritten once per finished epoch (3 is skipped and 5 fails)
+    assert len(written) == 6
+    assert written[-1] == [0, 1, 2, 4]
+    assert [len(w) for w in written] == [1, 2, 3, 3, 4, 4]
+    writer.write(report, finished=True)
+    manifest = read_manifests(tmp_path)[0]
+    assert manifest["finished"]
+    assert completed_epochs([manifest], pipeline.stages) == [0, 1, 2, 4]
+
+
+@pytest.mark.parametrize("guided_matching", ["none", "filter"])
+def test_build_pipeline_guided_matching(guided_matching):
+    from easydict import EasyDict as edict
+
+    from icepy4d.matching import GuidedMatching
+    from icepy4d.pipeline.stages import build_pipeline, matching_options
+
+    cfg = edict(
+        {
+            "proc": {"do_tracking": True, "do_homography_warping": False},
+            "matching": {"guided_matching": guided_matching},
+        }
+    )
+    match = build_pipeline(cfg)._stages["match"]
+    opt = matching_options(cfg)
+    # The matching waits for the previous epoch only if its F is used as prior
+    if guided_matching == "none":
+        assert opt["guided_matching"] == GuidedMatching.NONE
+        assert match.links is None
+    else:
+        assert opt["guided_matching"] == GuidedMatching.FILTER
+        assert match.links(1, [3, 4, 5]) == [(3, "verify")]
@@ -0,0 +1,111 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from icepy4d.core.points import Point, Points
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(0)
+    n_pts = 20
+    pts = Points()
+    pts.append_points_from_numpy(
+        rng.random((n_pts, 3)),
+        track_ids=list(range(100, 100 + n_pts)),
+        colors=rng.random((n_pts, 3)),
+    )
+    return pts
+
+
+def test_append_points_from_numpy(points):
+    assert len(points) == 20
+    assert points.last_track_id == 119
+    assert 105 in points
+    assert 5 not in points
+    p = points[105]
+    assert isinstance(p, Point)
+    assert p.track_id == 105
+    assert np.allclose(p.coordinates, points.to_numpy()[5])
+    assert np.allclose(p.color, points.colors_to_numpy()[5])
+
+    # Exported arrays are views on the internal storage
+    assert points.to_numpy().shape == (20, 3)
+    assert np.shares_memory(points.to_numpy(), points.to_numpy())
+    assert points.colors_to_numpy(as_uint8=True).dtype == np.uint8
+
+
+def test_filter_points(points):
+    mask = np.zeros(len(points), dtype=bool)
+    mask[::2] = True
+    xyz = points.to_numpy()[mask].copy()
+    points.filter_point_by_mask(mask)
+    assert len(points) == 10
+    assert np.allclose(points.to_numpy(), xyz)
+    assert points.get_track_ids() == tuple(range(100, 120, 2))
+    assert points[102].track_id == 102
+
+    points.filter_points_by_index([100, 104, 118])
+    assert points.get_track_ids() == (100, 104, 118)
+    assert points.last_track_id == 118
+    assert list(points.get_points_by_index([104]).keys()) == [104]
+
+    del points[104]
+    assert points.get_track_ids() == (100, 118)
+    assert points[118].track_id == 118
+
+
+def test_slicing_and_concatenation(points):
+    first = points[:5]
+    assert isinstance(first, Points)
+    assert first.get_track_ids() == tuple(range(100, 105))
+    last = points[points.track_ids >= 115]
+    assert last.get_track_ids() == tuple(range(115, 120))
+
+    merged = Points.concatenate([first, last])
+    assert len(merged) == 10
+    assert 117 in merged
+    assert np.allclose(merged.to_numpy()[5:], points.to_numpy()[15:])
+    with pytest.raises(ValueError):
+        merged.append_points(first)
+
+
+def test_transform(points):
+    xyz = points.to_numpy().astype(np.float64)
+    T = np.eye(4)
+    T[:3, :3] = np.array([[0, -1, 0], [1, 0, 0], [0, 0, 1]])
+    T[:3, 3] = [10, 20, 30]
+    points.transform(T)
+    assert np.allclose(points.to_numpy(), xyz @ T[:3, :3].T + T[:3, 3], atol=1e-5)
+
+
+def test_points_pickle(points):
+    loaded = pickle.loads(pickle.dumps(points))
+    assert loaded.get_track_ids() == points.get_track_ids()
+    assert np.allclose(loaded.to_numpy(), points.to_numpy())
+    assert loaded[110].track_id == 110
+
+    # Points pickled with the former dict-based storage
+    color = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+    legacy = Points.__new__(Points)
+    legacy.__setstate__(
+        {
+            "_values": {
+                3: Point(np.array([1.0, 2.0, 3.0]), 3, color),
+                8: Point(np.array([4.0, 5.0, 6.0]), 8, color),
+            },
+            "_last_id": 8,
+            "_iter": 0,
+        }
+    )
+    assert legacy.get_track_ids() == (3, 8)
+    assert legacy.last_track_id == 8
+    assert np.allclose(legacy.to_numpy(), [[1, 2, 3], [4, 5, 6]])
+    assert np.allclose(legacy.colors_to_numpy(), [color, color])
+
+
+def test_to_point_cloud(points):
+    pcd = points.to_point_cloud()
+    assert len(pcd) == len(points)
+    assert np.allclose(pcd.get_points(), points.to_numpy(), atol=1e-6)
@@ -0,0 +1,152 @@
+import cv2
+import numpy as np
+import pytest
+
+from icepy4d.matching import TileSelection
+from icepy4d.matching.matchers import (
+    FeaturesBase,
+    ImageMatcherBase,
+    Preselection,
+    SuperGlueMatcher,
+    _reduction_levels,
+    count_matches_in_tile_pairs,
+    points_in_tiles,
+)
+from icepy4d.matching.tiling import Tiler
+
+
+def make_matcher():
+    """Matcher whose networks are replaced by a stub matching the two keypoints [10, 5] and [20, 15] of each image."""
+    matcher = SuperGlueMatcher.__new__(SuperGlueMatcher)
+    ImageMatcherBase.__init__(matcher, {})
+    matcher.inputs = []
+
+    def match_images(image0, image1):
+        matcher.inputs.append((image0, image1))
+        kpts = np.array([[10.0, 5.0], [20.0, 15.0]])
+        return (
+            FeaturesBase(kpts),
+            FeaturesBase(kpts[::-1]),
+            np.array([1, 0]),
+            np.array([0.9, 0.8]),
+        )
+
+    matcher._match_images = match_images
+    return matcher
+
+
+def test_reduction_levels():
+    assert _reduction_levels((101, 77), (101, 77)) == 0
+    # Rounded up (JPEG, cv2.pyrDown) or down (other formats)
+    assert _reduction_levels((101, 77, 3), (51, 39)) == 1
+    assert _reduction_levels((101, 77), (50, 38)) == 1
+    assert _reduction_levels((101, 77), (13, 10)) == 3
+    assert _reduction_levels((101, 77), (40, 30)) is None
+    assert _reduction_levels((101, 77), (7, 5)) is None
+
+
+def test_preselect_reduced_images():
+    rng = np.random.default_rng(0)
+    image0 = rng.integers(0, 255, (2400, 1600), dtype=np.uint8)
+    image1 = rng.integers(0, 255, (2400, 1600), dtype=np.uint8)
+
+    # Without reduced images, two pyramid levels are computed (image height > 2000)
+    matcher = make_matcher()
+    presel = matcher.preselect(image0, image1)
+    i0, i1 = matcher.inputs[-1]
+    assert i0.shape == (600, 400) and i1.shape == (600, 400)
+    assert presel.n_down == 2 and len(presel) == 2
+    assert np.array_equal(presel.keypoints0, [[40, 20], [80, 60]])
+    assert np.array_equal(presel.keypoints1, [[40, 20], [80, 60]])
+
+    # Images reduced by 2: only the last pyramid level is computed
+    reduced = tuple(cv2.resize(i, (800, 1200)) for i in (image0, image1))
+    presel = matcher.preselect(image0, image1, reduced=reduced)
+    i0, _ = matcher.inputs[-1]
+    assert np.array_equal(i0, cv2.pyrDown(reduced[0]))
+    assert presel.n_down == 2
+
+    # Color images reduced by 4 are used as they are, converted to grayscale
+    reduced = tuple(
+        cv2.cvtColor(cv2.resize(i, (400, 600)), cv2.COLOR_GRAY2RGB)
+        for i in (image0, image1)
+    )
+    matcher.preselect(image0, image1, reduced=reduced)
+    i0, _ = matcher.inputs[-1]
+    assert i0.shape == (600, 400)
+    assert np.array_equal(i0, cv2.cvtColor(reduced[0], cv2.COLOR_RGB2GRAY))
+
+
+@pytest.mark.parametrize("shape", [(300, 200), (1000, 700), (75, 50)])
+def test_preselect_reduced_images_mismatch(shape):
+    image = np.zeros((2400, 1600), dtype=np.uint8)
+    reduced = np.zeros(shape, dtype=np.uint8)
+    matcher = make_matcher()
+    # Not a reduction of the images, or reduced more than the preselection pyramid
+    matcher.preselect(image, image, reduced=(reduced, reduced))
+    i0, _ = matcher.inputs[-1]
+    assert i0.shape == (600, 400)
+
+
+def test_points_in_tiles():
+    lims, _ = Tiler(grid=[2, 2], overlap=20).compute_limits_by_grid(
+        np.zeros((200, 300))
+    )
+    assert list(lims) == [0, 2, 1, 3]
+    points = np.array([[50, 50], [150, 50], [150, 100], [250, 150], [0, 50]])
+    inside = points_in_tiles(points, lims)
+    # Columns in the order of lims; the overlaps belong to more tiles, the borders to none
+    expected = [
+        [True, False, False, False],
+        [True, False, True, False],
+        [True, True, True, True],
+        [False, False, False, True],
+        [False, False, False, False],
+    ]
+    assert np.array_equal(inside, expected)
+    assert points_in_tiles(np.empty((0, 2)), lims).shape == (0, 4)
+
+
+def test_count_matches_in_tile_pairs():
+    lims, _ = Tiler(grid=[2, 2], overlap=20).compute_limits_by_grid(
+        np.zeros((200, 300))
+    )
+    rng = np.random.default_rng(0)
+    kpts0 = rng.uniform(-10, 310, (200, 2))
+    kpts1 = rng.uniform(-10, 310, (200, 2))
+    counts = count_matches_in_tile_pairs(kpts0, kpts1, lims, lims)
+    assert counts.shape == (4, 4)
+
+    # Same as counting the matches of each tile pair one by one
+    def inside(pt, lim):
+        return lim[0] < pt[0] < lim[2] and lim[1] < pt[1] < lim[3]
+
+    for i, lim0 in enumerate(lims.values()):
+        for j, lim1 in enumerate(lims.values()):
+            n = sum(
+                inside(p0, lim0) and inside(p1, lim1) for p0, p1 in zip(kpts0, kpts1)
+            )
+            assert counts[i, j] == n
+    # Matches in the overlaps are counted in more than one tile pair
+    in_tiles = points_in_tiles(kpts0, lims).any(axis=1) & points_in_tiles(
+        kpts1, lims
+    ).any(axis=1)
+    assert counts.sum() > in_tiles.sum()
+
+
+def test_tile_selection_by_preselection(monkeypatch):
+    image = np.zeros((200, 300), dtype=np.uint8)
+    lims, _ = Tiler(grid=[2, 2]).compute_limits_by_grid(image)
+    # Preselected matches: 3 from tile 0 to tile 3, 5 from tile 2 to tile 2, 2 from tile 1 to tile 1
+    kpts0 = np.array([[50, 50]] * 3 + [[50, 150]] * 5 + [[250, 50]] * 2)
+    kpts1 = np.array([[250, 150]] * 3 + [[50, 150]] * 5 + [[250, 50]] * 2)
+    presel = Preselection(kpts0, kpts1, np.ones(len(kpts0)), n_down=1)
+    matcher = make_matcher()
+    monkeypatch.setattr(matcher, "preselect", lambda *args, **kwargs: presel)
+
+    pairs = matcher._tile_selection(
+        image, image, lims, lims, TileSelection.PRESELECTION
+    )
+    # Only the tile pairs with more than 2 preselected matches are matched
+    assert pairs == [(0, 3), (2, 2)]
+    assert matcher._preselection is presel
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+from scipy.stats import binned_statistic_2d
+
+from icepy4d.utils.rasterize import (
+    RasterGrid,
+    binned_statistics,
+    fill_holes,
+    rasterize_points,
+)
+
+
+def random_points(n=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform([0, 0], [20, 10], size=(n, 2))
+    z = 100 + xy[:, 0] + 0.5 * xy[:, 1] + rng.normal(0, 0.1, n)
+    return np.column_stack([xy, z])
+
+
+def test_binned_statistics():
+    points = random_points()
+    grid = RasterGrid.from_limits([0, 21], [0, 11], 1)
+    assert grid.shape == (11, 21)
+    stats = binned_statistics(
+        points, grid, ("mean", "min", "max", "median", "count", "std")
+    )
+
+    xx, yy = grid.nodes()
+    edges_x = np.append(xx[0] - 0.5, xx[0, -1] + 0.5)
+    edges_y = np.append(yy[:, 0] - 0.5, yy[-1, 0] + 0.5)
+    for name in ["mean", "min", "max", "median", "count", "std"]:
+        expected = binned_statistic_2d(
+            points[:, 0], points[:, 1], points[:, 2], name, bins=[edges_x, edges_y]
+        ).statistic.T
+        if name == "count":
+            np.testing.assert_array_equal(stats[name], expected)
+        else:
+            np.testing.assert_allclose(stats[name], expected, rtol=1e-6, equal_nan=True)
+    # Cells on the border contain only half of their area
+    assert np.isnan(stats["mean"][-1, -1]) or stats["count"][-1, -1] > 0
+
+    with pytest.raises(ValueError):
+        binned_statistics(points, grid, ("mode",))
+
+
+@pytest.mark.parametrize("method", ["idw", "linear"])
+def test_fill_holes(method):
+    xx, yy = np.meshgrid(np.arange(30.0), np.arange(20.0))
+    z = (xx + 2 * yy).astype(np.float32)
+    z[5:8, 5:8] = np.nan
+    z[:, 20:] = np.nan
+    filled = fill_holes(z, radius=3, method=method)
+
+    # Small holes are filled, cells farther than the radius from valid cells are not
+    assert not np.isnan(filled[5:8, 5:8]).any()
+    assert np.isnan(filled[:, 23:]).all()
+    assert np.array_equal(filled[~np.isnan(z)], z[~np.isnan(z)])
+    if method == "linear":
+        np.testing.assert_allclose(filled[5:8, 5:8], (xx + 2 * yy)[5:8, 5:8], atol=1e-4)
+        # No extrapolation outside the triangulation
+        assert np.isnan(filled[:, 20:]).all()
+    else:
+        assert filled[6, 6] == pytest.approx(6 + 2 * 6, abs=0.5)
+        assert not np.isnan(filled[:, 20:23]).any()
+
+
+@pytest.mark.parametrize("method", ["idw", "linear"])
+def test_rasterize_points_tiles(method):
+    points = random_points(20000)
+    # Remove a stripe of points, to have holes across the tiles
+    points = points[(points[:, 0] < 9) | (points[:, 0] > 11)]
+    grid = RasterGrid.from_points(points, 0.25)
+
+    def assemble(tile_size):
+        dsm = np.full(grid.shape, -1.0)
+        for (r0, r1, c0, c1), z in rasterize_points(
+            points, grid, fill_method=method, fill_radius=3, tile_size=tile_size
+        ):
+            assert z.shape == (r1 - r0, c1 - c0)
+            dsm[r0:r1, c0:c1] = z
+        return dsm
+
+    whole = assemble(10000)
+    for tile_size in (16, 37):
+        tiled = assemble(tile_size)
+        assert (tiled != -1).all()
+        np.testing.assert_allclose(tiled, whole, rtol=1e-5, equal_nan=True)
+    # The stripe is wider than the fill radius: its centre is not filled
+    rows, cols = grid.cell_index(np.array([[10.0, 5.0]]))
+    assert np.isnan(whole[rows[0], cols[0]])
+    assert np.isfinite(whole[rows[0], cols[0] - 5])
@@ -0,0 +1,125 @@
+import cv2
+import numpy as np
+import pandas as pd
+import pytest
+
+from icepy4d.core.camera import Camera
+from icepy4d.core.epoch import Epoch
+from icepy4d.core.features import Features
+from icepy4d.core.points import Points
+from icepy4d.core.residuals import DESCRIBE_STATS, ResidualTimeSeries
+from icepy4d.io import write_reprojection_error_to_file
+
+
+@pytest.fixture
+def epoch(tmp_path):
+    rng = np.random.default_rng(0)
+    K = np.array([[1000.0, 0, 500], [0, 1000, 400], [0, 0, 1]])
+    dist = np.array([0.01, -0.001, 0, 0, 0])
+    xyz = rng.uniform([-5, -5, 10], [5, 5, 30], (200, 3)).astype(np.float32)
+    points = Points()
+    points.append_points_from_numpy(xyz)
+
+    cameras, features = {}, {}
+    for cam, (rvec, t) in {
+        "p1": ([0, 0, 0], [0, 0, 0]),
+        "p2": ([0.02, -0.1, 0.01], [-2.0, 0.1, 0.2]),
+    }.items():
+        R, _ = cv2.Rodrigues(np.array(rvec, dtype=float))
+        camera = Camera(1000, 800, K=K, dist=dist, R=R, t=np.array(t).reshape(3, 1))
+        # Each camera observes a subset of the points, with some noise
+        observed = np.sort(rng.choice(200, 150, replace=False))
+        kpts = camera.project_point(xyz[observed].astype(np.float64))
+        kpts = kpts + rng.normal(0, 0.5, kpts.shape).astype(np.float32)
+        feat = Features()
+        feat.append_features_from_numpy(
+            kpts[:, 0], kpts[:, 1], track_ids=observed.tolist()
+        )
+        cameras[cam], features[cam] = camera, feat
+    return Epoch(
+        "2022-07-01_12-00-00",
+        epoch_dir=tmp_path / "epoch",
+        cameras=cameras,
+        features=features,
+        points=points,
+    )
+
+
+def test_residuals_cache(epoch):
+    res = epoch.residuals.get("p1")
+    assert epoch.residuals is epoch.residuals
+    assert epoch.residuals.get("p1") is res
+    assert len(res) == 150
+    rows = epoch.points.take(res.track_ids)
+    expected = epoch.cameras["p1"].project_point(epoch.points.to_numpy()[rows])
+    assert np.allclose(res.projected, expected, atol=1e-3)
+    assert np.allclose(res.norm, np.linalg.norm(res.projected - res.observed, axis=1))
+
+    # Changes of the points, of the features or of the camera invalidate the cache
+    epoch.points.transform(np.eye(4))
+    res_new = epoch.residuals.get("p1")
+    assert res_new is not res
+    epoch.features["p1"].filter_feature_by_mask(np.arange(150) < 100)
+    assert len(epoch.residuals.get("p1")) == 100
+    ext = epoch.cameras["p1"].extrinsics.copy()
+    ext[0, 3] += 0.1
+    epoch.cameras["p1"].update_extrinsics(ext)
+    assert not np.allclose(
+        epoch.residuals.get("p1").projected[:100], res.projected[:100]
+    )
+
+
+def test_residuals_stats(epoch):
+    track_ids, columns, values = epoch.residuals.table()
+    assert columns == [
+        "x_p1",
+        "y_p1",
+        "norm_p1",
+        "x_p2",
+        "y_p2",
+        "norm_p2",
+        "global_norm",
+    ]
+    df = pd.DataFrame(values, columns=columns)
+    df.insert(0, "track_id", track_ids)
+    expected = df.describe()
+    stats = epoch.residuals.stats()
+    assert list(stats) == DESCRIBE_STATS
+    for stat in DESCRIBE_STATS:
+        for col in expected.columns:
+            assert np.isclose(stats[stat][col], expected.loc[stat, col])
+
+    # Global norm is the mean of the norms in the cameras observing the point
+    assert np.allclose(
+        df["global_norm"], df[["norm_p1", "norm_p2"]].mean(axis=1, skipna=True)
+    )
+
+
+def test_residuals_outliers(epoch):
+    outliers = epoch.residuals.outliers(1.0)
+    _, _, values = epoch.residuals.table()
+    assert len(outliers) == np.count_nonzero(values[:, -1] > 1.0)
+    removed = epoch.residuals.filter_outliers(1.0)
+    assert np.array_equal(removed, outliers)
+    assert not epoch.points.contains_many(outliers).any()
+    assert len(epoch.residuals.outliers(1.0)) == 0
+
+
+def test_residuals_export(epoch, tmp_path):
+    path = tmp_path / "residuals.txt"
+    write_reprojection_error_to_file(path, epoch)
+    write_reprojection_error_to_file(path, epoch)
+    lines = path.read_text().splitlines()
+    assert len(lines) == 3
+    assert lines[0].split(",")[:3] == ["ep", "count-track_id", "count-x_p1"]
+    assert len(lines[0].split(",")) == len(lines[1].split(","))
+
+    ts = ResidualTimeSeries(tmp_path / "residuals.h5")
+    ts.append(epoch)
+    epoch.residuals.filter_outliers(1.0)
+    ts.append(epoch)
+    timestamps, columns = ts.read()
+    assert len(ts) == 2
+    assert timestamps[0] == np.datetime64("2022-07-01T12:00:00")
+    assert columns["count_p1"][1] < columns["count_p1"][0]
+    assert columns["max_global"][1] <= 1.0
@@ -0,0 +1,222 @@
+import numpy as np
+import pytest
+import torch
+
+from icepy4d.matching import TileSelection
+from icepy4d.matching.matchers import (
+    ImageMatcherBase,
+    Preselection,
+    SuperGlueMatcher,
+)
+from icepy4d.matching.tiling import Tiler, allocate_keypoint_budget
+from icepy4d.thirdparty.SuperGlue.models.matching import Matching
+
+
+def make_image(h=400, w=400, textured_cols=(0, 150)):
+    """Image uniform everywhere, except for random noise in the given columns."""
+    rng = np.random.default_rng(0)
+    image = np.full((h, w), 128, dtype=np.uint8)
+    c0, c1 = textured_cols
+    image[:, c0:c1] = rng.integers(0, 255, (h, c1 - c0), dtype=np.uint8)
+    return image
+
+
+def make_matcher(tiler, preselection=None):
+    # The budget does not use the networks, so they are not loaded
+    matcher = SuperGlueMatcher.__new__(SuperGlueMatcher)
+    ImageMatcherBase.__init__(matcher, {})
+    matcher._tiler = tiler
+    matcher._preselection = preselection
+    return matcher
+
+
+@pytest.mark.parametrize("budget", [1000, 1001, 8191])
+def test_allocate_keypoint_budget(budget):
+    scores = {0: 10.0, 1: 30.0, 2: 0.0, 3: 60.0}
+    alloc = allocate_keypoint_budget(scores, budget, min_keypoints=100)
+    assert list(alloc) == [0, 1, 2, 3]
+    assert sum(alloc.values()) == budget
+    assert min(alloc.values()) >= 100
+    # A zero-score tile gets the minimum only, the others in order of score
+    assert alloc[2] == 100
+    assert alloc[3] > alloc[1] > alloc[0] > alloc[2]
+    # The keypoints above the minimum are shared proportionally to the scores
+    assert alloc[3] - 100 == pytest.approx(0.6 * (budget - 400), abs=1)
+
+
+def test_allocate_keypoint_budget_edge_cases():
+    assert allocate_keypoint_budget({}, 1000) == {}
+
+    # All zero (or negative) scores: equal shares
+    alloc = allocate_keypoint_budget({0: 0, 1: -5, 2: 0}, 900, min_keypoints=10)
+    assert alloc == {0: 300, 1: 300, 2: 300}
+
+    # Budget smaller than the minimum of all the tiles: equal shares of the budget
+    alloc = allocate_keypoint_budget({0: 1, 1: 100}, 101, min_keypoints=128)
+    assert sum(alloc.values()) == 101
+    assert min(alloc.values()) == 50
+
+
+def test_tiler_texture_scores():
+    image = make_image()
+    tiler = Tiler(grid=[2, 2])
+    lims, _ = tiler.compute_limits_by_grid(image)
+    scores = tiler.texture_scores(image)
+    assert set(scores) == set(lims)
+
+    # Tiles 0 and 2 (left column) are textured, 1 and 3 are uniform
+    assert scores[1] == 0 and scores[3] == 0
+    assert scores[0] > 0 and scores[2] > 0
+
+    budget = tiler.keypoint_budget(image, 2000, min_keypoints=100)
+    assert sum(budget.values()) == 2000
+    assert budget[1] == budget[3] == 100
+    assert budget[0] + budget[2] == 1800
+
+    # Given scores are used instead of the texture, for the given tiles only
+    budget = tiler.keypoint_budget(
+        image, 1000, limits={1: lims[1], 3: lims[3]}, scores={1: 1, 3: 3}
+    )
+    assert budget == {1: 128 + 186, 3: 128 + 558}
+
+
+def test_matcher_tile_keypoint_budget():
+    image = make_image()
+    tiler = Tiler(grid=[2, 2])
+    lims, _ = tiler.compute_limits_by_grid(image)
+
+    # Texture: the uniform tile gets the minimum only
+    matcher = make_matcher(tiler)
+    budget = matcher._tile_keypoint_budget(image, lims, [0, 1], 1000, 0)
+    assert budget == {0: 1000 - 128, 1: 128}
+
+    # Preselection: shared by the number of preselected keypoints in each tile
+    kpts = np.array([[250, 50]] * 3 + [[50, 50]])
+    presel = Preselection(kpts, kpts[::-1], np.ones(len(kpts)), n_down=2)
+    matcher = make_matcher(tiler, presel)
+    budget = matcher._tile_keypoint_budget(
+        image, lims, [0, 1], 1000, 0, min_keypoints=100
+    )
+    assert budget == {0: 100 + 200, 1: 100 + 600}
+    assert matcher._tile_keypoint_budget(
+        image, lims, [0, 1], 1000, 0, score="texture"
+    ) == {0: 1000 - 128, 1: 128}
+
+    with pytest.raises(ValueError):
+        matcher._tile_keypoint_budget(image, lims, [0, 1], 1000, 0, score="random")
+
+
+def test_matcher_top_keypoints():
+    scores = torch.tensor([0.1, 0.9, 0.5, 0.7, 0.2])
+    pred = {
+        "keypoints": torch.arange(10.0).reshape(5, 2),
+        "scores": scores,
+        "descriptors": torch.arange(5.0).repeat(3, 1),
+    }
+    top = SuperGlueMatcher._top_keypoints(pred, 3)
+    assert sorted(top["scores"].tolist()) == pytest.approx([0.5, 0.7, 0.9])
+    # Keypoints and descriptors follow the selected scores
+    idx = top["descriptors"][0].long()
+    assert torch.equal(top["keypoints"], pred["keypoints"][idx])
+    assert torch.equal(top["scores"], scores[idx])
+
+    assert SuperGlueMatcher._top_keypoints(pred, 5) is pred
+
+
+class FakeSuperPoint:
+    """SuperPoint stub: the keypoints are the non-zero pixels, described by their value."""
+
+    def __call__(self, data):
+        pred = {"keypoints": [], "scores": [], "descriptors": []}
+        for image in data["image"][:, 0]:
+            y, x = torch.nonzero(image > 0, as_tuple=True)
+            values = image[y, x]
+            pred["keypoints"].append(torch.stack([x, y], 1).float())
+            pred["scores"].append(values)
+            pred["descriptors"].append(torch.stack([values, torch.ones_like(values)]))
+        return pred
+
+
+class FakeSuperGlue:
+    """SuperGlue stub: the keypoints with the same descriptor are matched."""
+
+    def __call__(self, data):
+        d0, d1 = data["descriptors0"][:, 0], data["descriptors1"][:, 0]
+        same = d0[:, :, None] == d1[:, None, :]
+        matches0 = torch.where(same.any(2), same.int().argmax(2), -1)
+        matches1 = torch.where(same.any(1), same.int().argmax(1), -1)
+        return {
+            "matches0": matches0,
+            "matches1": matches1,
+            "matching_scores0": same.any(2).float() * d0,
+            "matching_scores1": same.any(1).float() * d1,
+        }
+
+
+def make_stub_matching():
+    matching = Matching.__new__(Matching)
+    torch.nn.Module.__init__(matching)
+    matching.superpoint = FakeSuperPoint()
+    matching.superglue = FakeSuperGlue()
+    return matching
+
+
+def make_dots_images(n=60, shift=(7, -4)):
+    """Two black images with the same dots (each with a distinct value), shifted."""
+    rng = np.random.default_rng(0)
+    image0 = np.zeros((200, 300), dtype=np.uint8)
+    image1 = np.zeros((200, 300), dtype=np.uint8)
+    x = rng.choice(np.arange(10, 280), n, replace=False)
+    y = rng.integers(10, 190, n)
+    image0[y, x] = np.arange(1, n + 1) * 4
+    image1[y + shift[1], x + shift[0]] = np.arange(1, n + 1) * 4
+    return image0, image1
+
+
+@pytest.mark.parametrize("tile_batch_size", [1, 3, None])
+def test_batched_tile_matching_equivalence(tile_batch_size):
+    image0, image1 = make_dots_images()
+    matcher = make_matcher(Tiler(grid=[2, 2], overlap=20))
+    matcher.matcher = make_stub_matching()
+    matcher.feature_cache = None
+    t0_lims, _ = matcher._tiler.compute_limits_by_grid(image0)
+    t1_lims, _ = matcher._tiler.compute_limits_by_grid(image1)
+    tile_pairs = sorted((i, j) for i in t0_lims for j in t1_lims)
+
+    sequential = list(
+        matcher._match_tile_pairs_sequential(
+            image0, image1, t0_lims, t1_lims, tile_pairs
+        )
+    )
+    batched = list(
+        matcher._match_tile_pairs_batched(
+            image0, image1, t0_lims, t1_lims, tile_pairs, tile_batch_size
+        )
+    )
+    assert len(batched) == len(sequential) == len(tile_pairs)
+    for pred_b, pred_s in zip(batched, sequential):
+        assert set(pred_b) == set(pred_s)
+        for key in pred_s:
+            assert np.array_equal(pred_b[key], pred_s[key]), key
+    # The stub finds the matches of the dots
+    assert sum((p["matches0"] > -1).sum() for p in sequential) > 60
+
+    # Same keypoints and matches after merging the tile pairs
+    results = [
+        matcher._match_tiles(
+            image0,
+            image1,
+            TileSelection.GRID,
+            grid=[2, 2],
+            overlap=20,
+            batch_tiles=batch_tiles,
+            tile_batch_size=tile_batch_size,
+        )
+        for batch_tiles in [False, True]
+    ]
+    (f0_s, f1_s, m_s, conf_s), (f0_b, f1_b, m_b, conf_b) = results
+    assert np.array_equal(f0_b.keypoints, f0_s.keypoints)
+    assert np.array_equal(f1_b.keypoints, f1_s.keypoints)
+    assert np.array_equal(f0_b.descriptors, f0_s.descriptors)
+    assert np.array_equal(m_b, m_s) and np.array_equal(conf_b, conf_s)
+    assert np.array_equal(f1_s.keypoints - f0_s.keypoints, [[7, -4]] * len(m_s))
@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+
+from icepy4d.core.features import Features
+from icepy4d.core.points import Points
+from icepy4d.utils.track_store import TrackStore, TrackStoreWriter
+from icepy4d.utils.tracking_features_utils import (
+    tracked_features_time_series,
+    tracked_points_time_series,
+)
+
+
+def make_epoch(track_ids, offset):
+    n = len(track_ids)
+    xy = np.stack([np.arange(n) + offset, np.arange(n) + offset], axis=1) * 10.0
+    features = Features()
+    features.append_features_from_numpy(xy[:, 0] + 1, xy[:, 1] + 1, track_ids=track_ids)
+    points = Points()
+    points.append_points_from_numpy(
+        np.hstack([xy + 1, np.full((n, 1), offset, dtype=float)]),
+        track_ids=track_ids,
+    )
+    return {"p1": features}, points
+
+
+@pytest.fixture
+def epochs():
+    ids = {0: [0, 1, 2], 1: [1, 2, 3], 2: [2, 3, 4], 3: [4, 2]}
+    return {ep: make_epoch(track_ids, ep) for ep, track_ids in ids.items()}
+
+
+@pytest.fixture
+def store(epochs, tmp_path):
+    with TrackStoreWriter(tmp_path / "store") as writer:
+        for ep, (features, points) in epochs.items():
+            writer.add_epoch(ep, points=points, features=features)
+    return TrackStore(tmp_path / "store")
+
+
+def test_track_store_queries(store, epochs):
+    assert store.epochs == [0, 1, 2, 3]
+    assert store.cams == ["p1"]
+
+    seg = store.segment(2)
+    assert isinstance(seg["xyz"], np.memmap)
+    assert np.array_equal(seg["track_ids"], [2, 3, 4])
+    assert np.array_equal(seg["xyz"], epochs[2][1].to_numpy())
+    assert np.array_equal(
+        store.segment(1, cam="p1")["xy"], epochs[1][0]["p1"].kpts_to_numpy()
+    )
+
+    assert store.epochs_of_track(2) == [0, 1, 2, 3]
+    assert store.epochs_of_track(4, cam="p1") == [2, 3]
+    assert store.epochs_of_track(99) == []
+
+    eps, xyz = store.trajectory(4)
+    assert eps == [2, 3]
+    assert np.allclose(xyz, [[41, 41, 2], [31, 31, 3]])
+
+    assert store.tracks_alive(1, 2).tolist() == [1, 2, 3, 4]
+    assert store.tracks_alive(1, 3, min_tracked_epoches=2).tolist() == [2, 3, 4]
+
+
+def test_track_store_time_series(store, epochs):
+    pdict = {ep: points for ep, (_, points) in epochs.items()}
+    fdict = {ep: features["p1"] for ep, (features, _) in epochs.items()}
+
+    assert tracked_points_time_series(store, min_tracked_epoches=2) == (
+        tracked_points_time_series(pdict, min_tracked_epoches=2)
+    )
+    volume = np.array([[0, 0, 0], [100, 100, 1]])
+    assert tracked_points_time_series(store, volume=volume) == (
+        tracked_points_time_series(pdict, volume=volume)
+    )
+    rect = np.array([0, 0, 25, 25])
+    assert tracked_features_time_series(store, rect=rect, cam="p1") == (
+        tracked_features_time_series(fdict, rect=rect)
+    )
+
+
+def test_track_store_append(epochs, tmp_path):
+    items = list(epochs.items())
+    with TrackStoreWriter(tmp_path / "store") as writer:
+        for ep, (features, points) in items[:2]:
+            writer.add_epoch(ep, points=points, features=features)
+    assert TrackStore(tmp_path / "store").epochs_of_track(2) == [0, 1]
+
+    with TrackStoreWriter(tmp_path / "store") as writer:
+        for ep, (features, points) in items[2:]:
+            writer.add_epoch(ep, points=points, features=features)
+    store = TrackStore(tmp_path / "store")
+    assert store.epochs_of_track(2) == [0, 1, 2, 3]
+    assert store.tracks_alive(0, 0).tolist() == [0, 1, 2]
+
+
+def test_track_store_interrupted_writer(epochs, tmp_path):
+    items = list(epochs.items())
+    with TrackStoreWriter(tmp_path / "store") as writer:
+        for ep, (features, points) in items[:2]:
+            writer.add_epoch(ep, points=points, features=features)
+
+    # A writer killed after adding an epoch, and while adding the next one
+    writer = TrackStoreWriter(tmp_path / "store")
+    writer.add_epoch(items[2][0], points=items[2][1][1], features=items[2][1][0])
+    with open(tmp_path / "store" / "points" / "xyz.bin", "ab") as f:
+        f.write(b"\0" * 10)
+    del writer
+
+    # Readers only see the epochs indexed when the writer was last closed
+    assert TrackStore(tmp_path / "store").epochs == [0, 1]
+
+    # The flushed epoch is kept, the incomplete rows are discarded
+    with TrackStoreWriter(tmp_path / "store") as writer:
+        assert writer.epochs == [0, 1, 2]
+        writer.add_epoch(items[3][0], points=items[3][1][1], features=items[3][1][0])
+    store = TrackStore(tmp_path / "store")
+    assert store.epochs == [0, 1, 2, 3]
+    assert store.epochs_of_track(2) == [0, 1, 2, 3]
+    assert np.array_equal(store.segment(3)["xyz"], epochs[3][1].to_numpy())
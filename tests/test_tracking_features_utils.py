@@ -0,0 +1,88 @@
+import numpy as np
+
+from icepy4d.core.features import Features
+from icepy4d.core.points import Points
+from icepy4d.utils.tracking_features_utils import (
+    tracked_dict_to_df,
+    tracked_features_time_series,
+    tracked_points_time_series,
+)
+
+
+def make_epoch(track_ids, offset):
+    n = len(track_ids)
+    xy = np.stack([np.arange(n) + offset, np.arange(n) + offset], axis=1) * 10.0
+    features = {}
+    for cam in ["p1", "p2"]:
+        features[cam] = Features()
+        features[cam].append_features_from_numpy(
+            xy[:, 0] + 1, xy[:, 1] + 1, track_ids=list(track_ids)
+        )
+    points = Points()
+    points.append_points_from_numpy(
+        np.hstack([xy + 1, np.full((n, 1), offset, dtype=float)]),
+        track_ids=list(track_ids),
+    )
+    return features, points
+
+
+def test_contains_many_and_take():
+    features, points = make_epoch([5, 2, 9], 0)
+    mask = features["p1"].contains_many([9, 3, 5])
+    assert mask.tolist() == [True, False, True]
+    assert features["p1"].take(np.array([9, 3, 5, 2])).tolist() == [2, -1, 0, 1]
+    assert points.take([2]).tolist() == [1]
+    assert not points.contains_many([]).any()
+
+
+def test_tracked_features_time_series():
+    epochs = {0: [0, 1, 2], 1: [1, 2, 3], 2: [2, 3, 4]}
+    fdict = {ep: make_epoch(ids, ep)[0]["p1"] for ep, ids in epochs.items()}
+
+    fts = tracked_features_time_series(fdict)
+    assert fts == {0: [0], 1: [0, 1], 2: [0, 1, 2], 3: [1, 2], 4: [2]}
+
+    fts = tracked_features_time_series(fdict, min_tracked_epoches=2)
+    assert fts == {1: [0, 1], 2: [0, 1, 2], 3: [1, 2]}
+
+    # Only features with x and y in (0, 25)
+    fts = tracked_features_time_series(fdict, rect=np.array([0, 0, 25, 25]))
+    assert fts == {0: [0], 1: [0, 1], 2: [0, 1, 2]}
+
+
+def test_tracked_points_time_series():
+    epochs = {0: [0, 1, 2], 1: [1, 2, 3], 2: [2, 3, 4]}
+    pdict = {ep: make_epoch(ids, ep)[1] for ep, ids in epochs.items()}
+
+    pts = tracked_points_time_series(pdict, min_tracked_epoches=2)
+    assert pts == {1: [0, 1], 2: [0, 1, 2], 3: [1, 2]}
+
+    # Only points with Z in [0, 1]
+    volume = np.array([[0, 0, 0], [100, 100, 1]])
+    pts = tracked_points_time_series(pdict, volume=volume)
+    assert pts == {0: [0], 1: [0, 1], 2: [0, 1], 3: [1]}
+
+
+def test_tracked_dict_to_df():
+    epochs = {0: [0, 1, 2], 1: [1, 2, 3], 2: [2, 3, 4]}
+    features, points = {}, {}
+    for ep, ids in epochs.items():
+        features[ep], points[ep] = make_epoch(ids, ep)
+    epoch_dict = {0: "2022_07_01", 1: "2022_07_02", 2: "2022_07_04"}
+    fts = tracked_features_time_series(
+        {ep: f["p1"] for ep, f in features.items()}, min_tracked_epoches=2
+    )
+    df = tracked_dict_to_df(features, points, epoch_dict, fts)
+    assert df["fid"].tolist() == [1, 2, 3]
+    assert df["ep_ini"].tolist() == [0, 0, 1]
+    assert df["ep_fin"].tolist() == [1, 2, 2]
+    assert np.allclose(df["x_p1_ini"], [11, 21, 31])
+    assert np.allclose(df["x_p2_fin"], [11, 21, 31])
+    assert np.allclose(df["Z_ini"], [0, 0, 1])
+    assert np.allclose(df["dZ"], [1, 2, 1])
+    assert df["dt"].dt.days.tolist() == [1, 3, 2]
+
+    # No track: empty dataframe with all the columns
+    df = tracked_dict_to_df(features, points, epoch_dict, {})
+    assert len(df) == 0
+    assert {"x_p1_ini", "X_fin", "vZ"} <= set(df.columns)
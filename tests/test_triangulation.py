@@ -0,0 +1,172 @@
+import cv2
+import numpy as np
+import pytest
+
+from icepy4d.core.camera import Camera
+from icepy4d.sfm.track_triangulation import TrackTable, triangulate_tracks
+from icepy4d.sfm.triangulation import (
+    triangulate_nviews,
+    triangulate_nviews_batch,
+    triangulate_points_linear,
+)
+from icepy4d.thirdparty.triangulation import (
+    iterative_LS_triangulation,
+    linear_LS_triangulation,
+)
+
+
+def _iterative_LS_reference(u1, P1, u2, P2, tolerance=3.0e-5):
+    # Per-point implementation of the iterative LS triangulation, with cv2.solve
+    x = np.ones((4, len(u1)))
+    x_status = np.empty(len(u1), dtype=int)
+    for xi in range(len(u1)):
+        C1, C2 = -np.eye(2, 3), -np.eye(2, 3)
+        C1[:, 2], C2[:, 2] = u1[xi], u2[xi]
+        A = np.vstack([C1 @ P1[:3, :3], C2 @ P2[:3, :3]])
+        b = -np.vstack([C1 @ P1[:3, 3:4], C2 @ P2[:3, 3:4]])
+        d1 = d2 = 1.0
+        for _ in range(10):
+            cv2.solve(A, b, x[0:3, xi : xi + 1], cv2.DECOMP_SVD)
+            d1_new, d2_new = P1[2] @ x[:, xi], P2[2] @ x[:, xi]
+            if abs(d1_new - d1) <= tolerance and abs(d2_new - d2) <= tolerance:
+                break
+            A[0:2] *= 1 / d1_new
+            A[2:4] *= 1 / d2_new
+            b[0:2] *= 1 / d1_new
+            b[2:4] *= 1 / d2_new
+            d1, d2 = d1_new, d2_new
+        x_status[xi] = d1_new > 0 and d2_new > 0
+        x_status[xi] -= (d1_new <= 0) + 2 * (d2_new <= 0)
+    return x[0:3].T, x_status
+
+
+@pytest.fixture
+def two_views():
+    rng = np.random.default_rng(0)
+    X = rng.uniform([-5, -5, 10], [5, 5, 30], (500, 3))
+    X[:5, 2] *= -1  # points behind the cameras
+    R, _ = cv2.Rodrigues(np.array([0.02, -0.1, 0.01]))
+    P1 = np.hstack([np.eye(3), np.zeros((3, 1))])
+    P2 = np.hstack([R, np.array([[-2.0], [0.1], [0.2]])])
+    Xh = np.hstack([X, np.ones((len(X), 1))])
+    u1 = (Xh @ P1.T)[:, :2] / (Xh @ P1.T)[:, 2:]
+    u2 = (Xh @ P2.T)[:, :2] / (Xh @ P2.T)[:, 2:]
+    u1 += rng.normal(0, 1e-4, u1.shape)
+    u2 += rng.normal(0, 1e-4, u2.shape)
+    return X, u1, P1, u2, P2
+
+
+def test_iterative_LS_triangulation(two_views):
+    X, u1, P1, u2, P2 = two_views
+    pts3d, status = iterative_LS_triangulation(u1, P1, u2, P2)
+    ref_pts3d, ref_status = _iterative_LS_reference(u1, P1, u2, P2)
+    assert np.allclose(pts3d, ref_pts3d, rtol=1e-9, atol=1e-9)
+    assert np.array_equal(status, ref_status)
+    assert np.all(status[5:] == 1)
+    assert np.all(status[:5] < 1)
+
+
+def test_linear_LS_triangulation(two_views):
+    X, u1, P1, u2, P2 = two_views
+    pts3d, status = linear_LS_triangulation(u1, P1, u2, P2)
+    ref = np.zeros((3, len(u1)))
+    for i in range(len(u1)):
+        C1, C2 = -np.eye(2, 3), -np.eye(2, 3)
+        C1[:, 2], C2[:, 2] = u1[i], u2[i]
+        A = np.vstack([C1 @ P1[:3, :3], C2 @ P2[:3, :3]])
+        b = -np.vstack([C1 @ P1[:3, 3:4], C2 @ P2[:3, 3:4]])
+        cv2.solve(A, b, ref[:, i : i + 1], cv2.DECOMP_SVD)
+    assert np.allclose(pts3d, ref.T, rtol=1e-9, atol=1e-9)
+    assert status.all()
+
+
+def test_triangulate_nviews_batch(two_views):
+    X, u1, P1, u2, P2 = two_views
+    x1 = np.hstack([u1, np.ones((len(u1), 1))])
+    x2 = np.hstack([u2, np.ones((len(u2), 1))])
+    ref = np.array([triangulate_nviews([P1, P2], [a, b]) for a, b in zip(x1, x2)])
+    assert np.allclose(triangulate_points_linear(P1, P2, x1, x2), ref)
+    assert np.allclose(triangulate_nviews_batch([P1, P2], [x1, x2], chunk_size=64), ref)
+    assert np.allclose(ref[5:, :3], X[5:], atol=0.5)
+    with pytest.raises(ValueError):
+        triangulate_nviews_batch([P1, P2], [x1])
+
+
+@pytest.fixture
+def n_views():
+    rng = np.random.default_rng(1)
+    X = rng.uniform([-5, -5, 10], [5, 5, 30], (300, 3))
+    K = np.array([[1000.0, 0, 500], [0, 1000, 400], [0, 0, 1]])
+    cameras = {}
+    for i, (rvec, t) in enumerate(
+        [
+            ([0, 0, 0], [0, 0, 0]),
+            ([0.02, -0.1, 0.01], [-2.0, 0.1, 0.2]),
+            ([-0.01, 0.08, 0.0], [1.5, -0.2, 0.1]),
+            ([0.05, 0.0, -0.02], [0.3, 1.8, -0.1]),
+        ]
+    ):
+        R, _ = cv2.Rodrigues(np.array(rvec, dtype=float))
+        cameras[f"cam{i}"] = Camera(1000, 800, K=K, R=R, t=np.array(t).reshape(3, 1))
+    return X, cameras
+
+
+def _track_table(X, cameras, rng):
+    # Each track is observed in a random subset of the views
+    tracks = {}
+    Xh = np.hstack([X, np.ones((len(X), 1))])
+    views = list(cameras)
+    for track_id, x in enumerate(Xh):
+        n = rng.integers(1, len(views) + 1)
+        tracks[track_id] = []
+        for key in rng.choice(views, n, replace=False):
+            u = cameras[key].P @ x
+            tracks[track_id].append((key, u[0] / u[2], u[1] / u[2]))
+    return tracks
+
+
+def test_triangulate_tracks(n_views):
+    X, cameras = n_views
+    rng = np.random.default_rng(2)
+    tracks = _track_table(X, cameras, rng)
+    table = TrackTable.from_dict(tracks)
+    assert len(table) == sum(len(obs) for obs in tracks.values())
+
+    res = triangulate_tracks(cameras, table)
+    assert np.array_equal(res.track_ids, np.arange(len(X)))
+    single = res.num_views < 2
+    assert np.all(np.isnan(res.points[single]))
+    assert np.all(res.triangulated == ~single)
+    assert np.allclose(res.points[~single], X[~single], atol=1e-6)
+    assert np.all(res.reprojection_rms[~single] < 1e-6)
+    assert np.all(res.in_front[~single])
+
+    # Same points and angles as the per-track triangulation
+    for track_id in np.flatnonzero(~single)[:20]:
+        P = [cameras[key].P for key, _, _ in tracks[track_id]]
+        ip = [np.array([x, y, 1.0]) for _, x, y in tracks[track_id]]
+        ref = triangulate_nviews(P, ip)
+        assert np.allclose(res.points[track_id], ref[:3])
+        C = [cameras[key].C.ravel() for key, _, _ in tracks[track_id]]
+        rays = [(ref[:3] - c) / np.linalg.norm(ref[:3] - c) for c in C]
+        angle = max(
+            np.degrees(np.arccos(np.clip(a @ b, -1, 1)))
+            for i, a in enumerate(rays)
+            for b in rays[i + 1 :]
+        )
+        assert np.isclose(res.triangulation_angle[track_id], angle)
+
+    # A stricter view requirement leaves the two-view tracks out
+    res = triangulate_tracks(cameras, table, min_views=3)
+    assert np.all(res.triangulated == (res.num_views >= 3))
+
+    with pytest.raises(KeyError):
+        triangulate_tracks({"cam0": cameras["cam0"]}, table)
+
+
+def test_track_table_duplicate_observations(n_views):
+    X, cameras = n_views
+    tracks = _track_table(X[:10], cameras, np.random.default_rng(3))
+    tracks = {k: obs + [(obs[0][0], 0.0, 0.0)] for k, obs in tracks.items()}
+    res = triangulate_tracks(cameras, TrackTable.from_dict(tracks))
+    assert np.all(res.num_views == [len(obs) - 1 for obs in tracks.values()])